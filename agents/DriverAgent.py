@@ -10,6 +10,7 @@ sys.path.append(str(Path(__file__).resolve().parent.parent))
 from typing import Dict, List, Optional, Any, TypedDict, Annotated, Union
 
 from utils.modelRelated import invoke_model, invoke_model_with_tools
+from utils.llm_metrics import set_metrics_session, write_session_report
 
 from pathlib import Path
 # Create an interactive chatbox using gradio
@@ -476,6 +477,7 @@ class FrontdeskAgent:
         """This function will run the frontdesk agent using stream method with interrupt handling"""
         print("\n🚀 启动 FrontdeskAgent")
         print("=" * 60)
+        set_metrics_session(session_id)
         
         initial_state = self._create_initial_state(session_id, village_name)
         config = {"configurable": {"thread_id": session_id}}
@@ -502,6 +504,8 @@ class FrontdeskAgent:
                 print("-" * 50)
                 break
 
+        write_session_report(session_id)
+
             
 
 frontdesk_agent = FrontdeskAgent()
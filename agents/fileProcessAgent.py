@@ -8,14 +8,17 @@ sys.path.append(str(Path(__file__).resolve().parent.parent))
 
 from typing import Dict, List, Optional, Any, TypedDict, Annotated
 from datetime import datetime
-from utils.modelRelated import invoke_model, invoke_model_with_screenshot
-from utils.file_process import (retrieve_file_content, save_original_file,
+from utils.modelRelated import invoke_model, invoke_model_with_screenshot, ensure_client_pool_capacity
+from utils.file_process import (iter_ingest_files, print_ingest_stats,
                                     extract_filename, 
                                     ensure_location_structure, check_file_exists_in_data,
                                     get_available_locations, move_template_files_to_final_destination,
                                     move_supplement_files_to_final_destination, delete_files_from_staging_area,
                                     reconstruct_csv_with_headers)
+from utils.artifact_cache import get_artifact_cache, file_digest
+from utils.cpu_pool import print_cpu_pool_stats
 
+import contextvars
 import json
 
 from langgraph.graph import StateGraph, END, START
@@ -163,22 +166,23 @@ class FileProcessAgent:
             staging_dir = project_root / "conversations" / state["session_id"] / "user_uploaded_files"
             staging_dir.mkdir(parents=True, exist_ok=True)
             
-            # Process the files to get .txt versions
-            processed_files = retrieve_file_content(detected_files, state["session_id"])
-            
-            # Save original files separately
+            # Copy originals and produce the .txt versions in one pipeline; files come back as they finish
+            processed_files = []
             original_files = []
-            for file_path in detected_files:
-                try:
-                    source_path = Path(file_path)
-                    original_file_saved_path = save_original_file(source_path, staging_dir)
-                    if original_file_saved_path:
-                        original_files.append(original_file_saved_path)
-                        print(f"💾 原始文件已保存: {Path(original_file_saved_path).name}")
-                    else:
-                        print(f"⚠️ 原始文件保存失败: {source_path.name}")
-                except Exception as e:
-                    print(f"❌ 保存原始文件时出错 {file_path}: {e}")
+            ingest_stats = {}
+            for result in iter_ingest_files(detected_files, staging_dir, original_files_dir=staging_dir, stats=ingest_stats):
+                source_name = Path(result["source_path"]).name
+                if result["original_path"]:
+                    original_files.append(result["original_path"])
+                    print(f"💾 原始文件已保存: {Path(result['original_path']).name}")
+                else:
+                    print(f"⚠️ 原始文件保存失败: {source_name}")
+                if result["txt_path"]:
+                    processed_files.append(result["txt_path"])
+                else:
+                    print(f"❌ 文件处理失败 {source_name}: {result['error']}")
+            print_ingest_stats(ingest_stats)
+            print_cpu_pool_stats()
             
             print(f"✅ 文件处理完成: {len(processed_files)} 个处理文件, {len(original_files)} 个原始文件")
             print("✅ _file_upload 执行完成")
@@ -305,11 +309,12 @@ class FileProcessAgent:
         # Use ThreadPoolExecutor for parallel processing
         max_workers = min(len(new_files_to_process), 5)  # Limit to 5 concurrent requests
         print(f"🚀 开始并行处理文件，使用 {max_workers} 个工作线程")
+        ensure_client_pool_capacity(max_workers)
         
         with ThreadPoolExecutor(max_workers=max_workers) as executor:
-            # Submit all file analysis tasks
+            # Submit all file analysis tasks (each in a copy of this context, so LLM metrics keep the session)
             future_to_file = {
-                executor.submit(analyze_single_file, file_path): file_path 
+                executor.submit(contextvars.copy_context().run, analyze_single_file, file_path): file_path 
                 for file_path in new_files_to_process
             }
             
@@ -445,7 +450,25 @@ class FileProcessAgent:
 
         # The parallel nodes will automatically converge, then continue to summary
         return sends if sends else [Send("summary_file_upload", state)]  # Fallback
-    
+
+    def _analyze_table_structure(self, original_excel_file: Path) -> str:
+        """对原始表格截图做结构分析；同一文件（按内容哈希）之前分析过则直接复用结果"""
+        vision_model = "Qwen/Qwen2.5-VL-72B-Instruct"
+        # The prompt uses the file name as the JSON root key, so it is part of the cache version
+        cache_version = f"{vision_model}:{original_excel_file.name}"
+        cache = get_artifact_cache()
+        digest = file_digest(original_excel_file) if cache else None
+        if cache:
+            cached = cache.get(digest, "table_analysis", cache_version)
+            if cached is not None:
+                print(f"⚡ 命中表格结构分析缓存: {original_excel_file.name}")
+                return cached["content"]
+
+        analysis_response = invoke_model_with_screenshot(model_name=vision_model, file_path=original_excel_file)
+        if cache and isinstance(analysis_response, str) and analysis_response.strip():
+            cache.put(digest, "table_analysis", cache_version, analysis_response, source_name=original_excel_file.name)
+        return analysis_response
+
     def _process_supplement(self, state: FileProcessState) -> FileProcessState:
         """This node will process the supplement files, it will analyze the supplement files and summarize the content of the files as well as stored the summary in data.json"""
         print("\n🔍 开始执行: _process_supplement")
@@ -513,7 +536,7 @@ class FileProcessAgent:
                     
                     if original_excel_file and original_excel_file.exists():
                         print(f"🔍 找到原始Excel文件: {original_excel_file}")
-                        analysis_response = invoke_model_with_screenshot(model_name="Qwen/Qwen2.5-VL-72B-Instruct", file_path=original_excel_file)
+                        analysis_response = self._analyze_table_structure(original_excel_file)
                         print("📥 表格分析响应接收成功")
                     else:
                         print(f"⚠️ 未找到对应的原始Excel文件: {table_file_stem}")
@@ -673,16 +696,17 @@ class FileProcessAgent:
         
         max_workers = min(total_files, 5)  # Limit to 4 concurrent requests for supplement processing
         print(f"🚀 开始并行处理补充文件，使用 {max_workers} 个工作线程")
+        ensure_client_pool_capacity(max_workers)
         
         with ThreadPoolExecutor(max_workers=max_workers) as executor:
-            # Submit all file processing tasks
+            # Submit all file processing tasks (each in a copy of this context, so LLM metrics keep the session)
             future_to_file = {}
             for file_path, file_type in all_files:
                 if file_type == "table":
-                    future = executor.submit(process_table_file, file_path)
+                    future = executor.submit(contextvars.copy_context().run, process_table_file, file_path)
                     # Implement the logic for 
                 else:  # document
-                    future = executor.submit(process_document_file, file_path)
+                    future = executor.submit(contextvars.copy_context().run, process_document_file, file_path)
                 future_to_file[future] = (file_path, file_type)
             
             # Process completed tasks as they finish
@@ -733,6 +757,8 @@ class FileProcessAgent:
                     new_messages.append(AIMessage(content=fallback_response))
         
         print(f"🎉 并行文件处理完成，共处理 {total_files} 个文件")
+        # excel_to_csv inside reconstruct_csv_with_headers ran on the shared CPU process pool
+        print_cpu_pool_stats()
         
         # Move supplement files to their final destinations and update data.json with new paths
         original_files = state.get("original_files_path", [])
@@ -12,8 +12,14 @@ from typing import Dict, List, Optional, Any, TypedDict, Annotated
 
 from utils.file_process import (read_txt_file, 
                                 process_excel_files_for_integration,
-                                process_excel_files_for_merge)
-from utils.modelRelated import invoke_model
+                                process_excel_files_for_merge,
+                                astream_final_answer_rows, agather_chunks)
+from utils.local_fill import build_local_fill, local_fill_prompt_note, merge_llm_rows
+from utils.local_merge import build_local_merge
+from utils.modelRelated import invoke_model, run_async, print_client_pool_stats
+from utils.llm_cache import print_llm_cache_stats
+from utils.llm_metrics import set_metrics_session, write_session_report
+from utils.token_estimator import estimate_tokens
 from utils.html_generator import (
     extract_empty_row_html_code_based,
     extract_headers_html_code_based,
@@ -23,6 +29,7 @@ from utils.html_generator import (
 )
 
 import os
+import asyncio
 import pandas as pd
 from bs4 import BeautifulSoup
 from pathlib import Path
@@ -47,6 +54,10 @@ from agents.processUserInput import ProcessUserInputAgent
 
 load_dotenv()
 
+# Fixed instructions of the CSV generation prompt (headers_mapping is added per session)
+FILLOUT_SYSTEM_PROMPT_TOKENS = 2500
+FILLOUT_MODEL = "deepseek-ai/DeepSeek-V3"
+
 class FilloutTableState(TypedDict):
     messages: Annotated[list[BaseMessage], add_messages]
     session_id: str
@@ -71,6 +82,8 @@ class FilloutTableState(TypedDict):
     modify_after_first_fillout: bool
     village_name: str
     strategy_for_data_combination: str
+    local_fill: dict
+    failed_chunks: list[int]
 
 class FilloutTableAgent:
     def __init__(self):
@@ -144,7 +157,9 @@ class FilloutTableAgent:
             "combined_html": "",
             "modify_after_first_fillout": False,
             "village_name": village_name,
-            "strategy_for_data_combination": ""
+            "strategy_for_data_combination": "",
+            "local_fill": {},
+            "failed_chunks": []
         }
     def _determine_strategy_for_data_combination(self, state: FilloutTableState) -> FilloutTableState:
         """Determine data integration strategy based on table structure"""
@@ -200,7 +215,11 @@ class FilloutTableAgent:
             return "combine_data_for_multitable_merge"
         else:
             return "combine_data_for_multitable_integration"  # default fallback
-    
+
+    def _fillout_prompt_tokens(self, state: FilloutTableState) -> int:
+        """生成CSV时每个数据块都会附带的系统提示词 token 数（固定指令 + 表头映射）"""
+        return FILLOUT_SYSTEM_PROMPT_TOKENS + estimate_tokens(str(state["headers_mapping"]), FILLOUT_MODEL)
+
     def _combine_data_for_multitable_integration(self, state: FilloutTableState) -> FilloutTableState:
         """Integrate multiple tables"""
         # return
@@ -248,7 +267,9 @@ class FilloutTableAgent:
                                                                 session_id=state["session_id"],
                                                                 chunk_nums=15, largest_file=None,  # Let function auto-detect
                                                                 data_json_path="agents/data.json",
-                                                                village_name=state["village_name"])
+                                                                village_name=state["village_name"],
+                                                                model_name=FILLOUT_MODEL,
+                                                                reserved_prompt_tokens=self._fillout_prompt_tokens(state))
                 
                 # Extract chunks and row count from the result
                 chunked_data = chunked_result["combined_chunks"]
@@ -261,12 +282,22 @@ class FilloutTableAgent:
 
                 print(f"✅ 成功生成 {len(chunked_data)} 个数据块")
                 print(f"📊 最大文件行数: {largest_file_row_count}")
+                
+                # Columns with a direct "文件: 字段" source are filled locally; only the rest go to the model
+                try:
+                    local_fill = build_local_fill(state["headers_mapping"], chunked_result.get("largest_file"),
+                                                  excel_file_paths, state["village_name"])
+                except Exception as e:
+                    print(f"⚠️ 本地填充失败，全部交给模型: {e}")
+                    local_fill = {}
+                
                 print("✅ _combine_data_split_into_chunks 执行完成")
                 print("=" * 50)
                 
                 return {
                     "combined_data_array": chunked_data,
-                    "largest_file_row_num": largest_file_row_count
+                    "largest_file_row_num": largest_file_row_count,
+                    "local_fill": local_fill
                 }
                 
             except Exception as e:
@@ -320,13 +351,32 @@ class FilloutTableAgent:
                 
                 print(f"📊 准备处理 {len(excel_file_paths)} 个Excel文件进行合并（全部作为核心数据）")
                 
+                # Rows are stacked locally; only the columns that need inference go to the model
+                try:
+                    local_fill = build_local_merge(state["headers_mapping"], excel_file_paths, state["village_name"])
+                except Exception as e:
+                    print(f"⚠️ 本地合并失败，全部交给模型: {e}")
+                    local_fill = {}
+                if local_fill and not local_fill["llm_columns"]:
+                    print("✅ 所有列都已在本地合并，无需生成数据块")
+                    print("✅ _combine_data_for_multitable_merge 执行完成")
+                    print("=" * 50)
+                    return {
+                        "combined_data_array": [],
+                        "largest_file_row_num": len(local_fill["rows"]),
+                        "local_fill": local_fill
+                    }
+                
                 # For multitable merge, we treat all files as core data and combine them together
                 # Rather than chunking based on one largest file, we merge all files row by row
                 combined_data_result = process_excel_files_for_merge(
                     excel_file_paths=excel_file_paths,
                     session_id=state["session_id"],
                     village_name=state["village_name"],
-                    chunk_nums=15
+                    chunk_nums=15,
+                    model_name=FILLOUT_MODEL,
+                    reserved_prompt_tokens=self._fillout_prompt_tokens(state),
+                    keep_columns=local_fill.get("context_columns")
                 )
                 
                 # Extract chunks and row count from the result
@@ -344,7 +394,8 @@ class FilloutTableAgent:
                 
                 return {
                     "combined_data_array": chunked_data,
-                    "largest_file_row_num": total_row_count
+                    "largest_file_row_num": total_row_count,
+                    "local_fill": local_fill
                 }
                 
             except Exception as e:
@@ -390,6 +441,23 @@ class FilloutTableAgent:
             print("\n🔄 开始执行: _generate_CSV_based_on_combined_data")
             print("=" * 50)
             
+            local_fill = state.get("local_fill") or {}
+            if local_fill and not local_fill["llm_columns"]:
+                # Every column has a direct source: no model call at all
+                sorted_results = ["\n".join(merge_llm_rows(local_fill, []))]
+                try:
+                    from utils.file_process import save_csv_to_output
+                    saved_file_path = save_csv_to_output(sorted_results, state["session_id"], rows_only=True)
+                    print(f"✅ CSV数据已保存到输出文件夹: {saved_file_path}")
+                except Exception as e:
+                    print(f"❌ 保存CSV文件时发生错误: {e}")
+                print("✅ _generate_CSV_based_on_combined_data 执行完成(本地填充)")
+                print("=" * 50)
+                return {"CSV_data": sorted_results}
+            # Only the columns that could not be filled locally are described to the model
+            mapping_for_prompt = (local_fill["llm_mapping"] + local_fill_prompt_note(local_fill)
+                                  if local_fill else state["headers_mapping"])
+            
     #         system_prompt = f"""
     # 你是一名专业且严谨的结构化数据填报专家，具备逻辑推理和计算能力。你的任务是根据原始数据和模板映射规则，将数据准确转换为目标 CSV 格式，输出结构化、干净的数据行。
 
@@ -556,13 +624,22 @@ class FilloutTableAgent:
    每个字段的推理过程都必须基于新的结构化表头映射
 
 模板表头映射：
-{state["headers_mapping"]}
+{mapping_for_prompt}
 """
 
             print("📋 系统提示准备完成")
             print("系统提示词：", system_prompt)
             
-            def process_single_chunk(chunk_data):
+            streamed_row_count = 0
+            
+            def report_row(row: str):
+                """Progress sink: rows arrive here while the model is still generating"""
+                nonlocal streamed_row_count
+                streamed_row_count += 1
+                if streamed_row_count % 20 == 0:
+                    print(f"📈 已流式解析 {streamed_row_count} 行数据")
+            
+            async def process_single_chunk(chunk_data):
                 """处理单个chunk的函数"""
                 chunk, index = chunk_data
                 try:
@@ -572,16 +649,18 @@ class FilloutTableAgent:
                     """             
                     # print("用户输入提示词", system_prompt)
                     print(f"🤖 Processing chunk {index + 1}/{len(state['combined_data_array'])}...")
-                    response = invoke_model(
-                        model_name="deepseek-ai/DeepSeek-V3", 
+                    # Only the final-answer rows are kept; reasoning text is dropped line by line
+                    rows = await astream_final_answer_rows(
+                        model_name=FILLOUT_MODEL, 
                         messages=[SystemMessage(content=system_prompt), HumanMessage(content=user_input)],
-                        temperature=0.2, silent_mode=True
+                        temperature=0.2, on_row=report_row,
+                        strip_row_ids=False if local_fill else None
                     )
-                    print(f"✅ Completed chunk {index + 1}")
-                    return (index, response)
+                    print(f"✅ Completed chunk {index + 1} ({len(rows)} 行)")
+                    return "\n".join(rows)
                 except Exception as e:
                     print(f"❌ Error processing chunk {index + 1}: {e}")
-                    return (index, f"Error processing chunk {index + 1}: {e}")
+                    return None  # failed: retried by agather_chunks
             
             # Prepare chunk data with indices
             chunks_with_indices = [(chunk, i) for i, chunk in enumerate(state["combined_data_array"])]
@@ -592,43 +671,33 @@ class FilloutTableAgent:
                 print("=" * 50)
                 return {"CSV_data": []}
             
-            # Dynamically adjust max_workers based on actual data size
-            max_workers = min(15, len(chunks_with_indices))  # Use fewer workers if we have less data
-            print(f"🚀 开始并发处理 {len(chunks_with_indices)} 个数据块...")
-            print(f"👥 使用 {max_workers} 个并发工作者")
-            
-            # Use ThreadPoolExecutor for concurrent processing
-            from concurrent.futures import ThreadPoolExecutor, as_completed
+            # All chunks are dispatched at once; per-provider semaphores in astream_model cap real concurrency
+            print(f"🚀 开始异步并发处理 {len(chunks_with_indices)} 个数据块...")
             
-            results = {}
-            with ThreadPoolExecutor(max_workers=max_workers) as executor:
-                # Submit all tasks
-                future_to_index = {executor.submit(process_single_chunk, chunk_data): chunk_data[1] 
-                                for chunk_data in chunks_with_indices}
-                print(f"✅ 已提交 {len(future_to_index)} 个并发任务")
-                
-                # Collect results as they complete
-                completed_count = 0
-                for future in as_completed(future_to_index):
-                    try:
-                        index, response = future.result()
-                        results[index] = response
-                        completed_count += 1
-                        print(f"✅ 完成第 {completed_count}/{len(chunks_with_indices)} 个任务")
-                    except Exception as e:
-                        index = future_to_index[future]
-                        print(f"❌ 第 {index + 1} 个数据块处理异常: {e}")
-                        results[index] = f"数据块 {index + 1} 处理异常: {e}"
+            # Failed chunks are retried; if any still fails the partial result is reported, not saved
+            results, failed_chunks = run_async(agather_chunks(
+                lambda i: process_single_chunk(chunks_with_indices[i]), len(chunks_with_indices)))
+            if failed_chunks:
+                print(f"❌ {len(failed_chunks)} 个数据块重试后仍失败，不保存不完整的CSV: {[i + 1 for i in failed_chunks]}")
+                print("✅ _generate_CSV_based_on_combined_data 执行完成(部分数据块失败)")
+                print("=" * 50)
+                return {"CSV_data": [], "failed_chunks": failed_chunks}
             
             # Sort results by index to maintain order
             sorted_results = [results[i] for i in sorted(results.keys())]
+            if local_fill:
+                # Model rows carry row IDs: place them next to the locally filled columns
+                llm_rows = [row for result in sorted_results for row in result.split("\n") if row.strip()]
+                sorted_results = ["\n".join(merge_llm_rows(local_fill, llm_rows))]
             
             print(f"🎉 成功并发处理 {len(sorted_results)} 个数据块")
+            print_client_pool_stats()
+            print_llm_cache_stats()
             
             # Save CSV data to output folder using helper function
             try:
                 from utils.file_process import save_csv_to_output
-                saved_file_path = save_csv_to_output(sorted_results, state["session_id"])
+                saved_file_path = save_csv_to_output(sorted_results, state["session_id"], rows_only=True)
                 print(f"✅ CSV数据已保存到输出文件夹: {saved_file_path}")
             except Exception as e:
                 print(f"❌ 保存CSV文件时发生错误: {e}")
@@ -765,6 +834,7 @@ class FilloutTableAgent:
         print("\n🚀 启动 FilloutTableAgent")
         print("=" * 60)
         print("模板文件：", template_file)
+        set_metrics_session(session_id)
         
         initial_state = self.create_initialize_state(
             session_id = session_id,
@@ -822,6 +892,8 @@ class FilloutTableAgent:
                 print(f"错误详情: {traceback.format_exc()}")
                 print("-" * 50)
                 break
+        
+        write_session_report(session_id)
     
 
 
@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""
+Benchmark: prompt tokens of the compact chunk encoding vs repeated header+data pairs.
+
+Writes 城保名册 / 农保名册 style reconstructed CSVs (the 14-column header of agents/data.json, one header line
+before every data row, as reconstruct_csv_with_headers produces them) into a temporary village and builds
+the 多表整合 and 多表合并 chunks with COMPACT_CHUNK_ENCODING=0, compact, and compact + CHUNK_COLUMN_LEGEND=1.
+Reports the estimated prompt tokens of all chunks (token_estimator) and the number of chunks.
+
+    python benchmark_chunk_encoding.py --rows 400 --reference-rows 150
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import random
+import sys
+import tempfile
+from pathlib import Path
+
+# Set console encoding for Windows
+if sys.platform == 'win32':
+    import subprocess
+    subprocess.run(['chcp', '65001'], shell=True, capture_output=True)
+
+# Add root project directory to sys.path
+sys.path.append(str(Path(__file__).resolve().parent))
+
+from utils.file_process import process_excel_files_for_integration, process_excel_files_for_merge
+from utils.token_estimator import estimate_tokens
+
+MODEL = "deepseek-ai/DeepSeek-V3"
+HEADER = ("序号,户主姓名,低保证号,身份证号码,保障人数,重点保障人数,残疾人数,领取金额,家庭补差,"
+          "重点救助60元,重点救助100元,残疾人救助,领款人签字(章),领款时间")
+SURNAMES = "王李张刘陈杨黄赵吴周徐孙马朱胡郭何高林罗"
+GIVEN = "伟芳娜秀英敏静丽强磊军洋勇艳杰娟涛明超秀兰霞平刚桂英"
+
+MODES = {
+    "repeated header": {"COMPACT_CHUNK_ENCODING": "0", "CHUNK_COLUMN_LEGEND": "0"},
+    "compact": {"COMPACT_CHUNK_ENCODING": "1", "CHUNK_COLUMN_LEGEND": "0"},
+    "compact + legend": {"COMPACT_CHUNK_ENCODING": "1", "CHUNK_COLUMN_LEGEND": "1"},
+}
+
+
+def roster_row(rng: random.Random, no: int) -> str:
+    name = rng.choice(SURNAMES) + "".join(rng.choice(GIVEN) for _ in range(rng.choice((1, 2))))
+    key, disabled = rng.randint(0, 3), rng.randint(0, 2)
+    difference, aid60, aid100, disabled_aid = rng.randrange(100, 900, 10), 60 * (key > 0), 100 * (key > 1), 80 * disabled
+    id_number = f"{rng.randint(110101, 659004)}{rng.randint(1940, 2010)}{rng.randint(1, 12):02d}{rng.randint(1, 28):02d}{rng.randint(0, 9999):04d}"
+    return (f"{no},{name},{rng.randint(1, 9999):04d},{id_number},{key + disabled},{key},{disabled},"
+            f"{difference + aid60 + aid100 + disabled_aid},{difference},{aid60},{aid100},{disabled_aid},,2024-0{rng.randint(1, 9)}-10")
+
+
+def write_village(root: Path, rows: int, reference_rows: int, seed: int) -> list[str]:
+    rng = random.Random(seed)
+    csv_dir = root / "files" / "七田村" / "table_files" / "CSV_files"
+    csv_dir.mkdir(parents=True)
+    for name, count in (("城保名册", rows), ("农保名册", reference_rows)):
+        (csv_dir / f"{name}.csv").write_text(
+            "\n".join(f"{HEADER}\n{roster_row(rng, i + 1)}" for i in range(count)) + "\n", encoding="utf-8")
+
+    source = Path(__file__).resolve().parent / "agents" / "data.json"
+    with open(source, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    (root / "data.json").write_text(json.dumps(data, ensure_ascii=False), encoding="utf-8")
+    return ["x/城保名册.xls", "x/农保名册.xls"]
+
+
+def measure(root: Path, excel_paths: list[str]) -> dict:
+    cwd = os.getcwd()
+    os.chdir(root)
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            integration = process_excel_files_for_integration(excel_paths, data_json_path="data.json",
+                                                              village_name="七田村", model_name=MODEL)
+            merge = process_excel_files_for_merge(excel_paths, village_name="七田村", model_name=MODEL)
+    finally:
+        os.chdir(cwd)
+    return {name: (sum(estimate_tokens(chunk, MODEL) for chunk in result["combined_chunks"]), len(result["combined_chunks"]))
+            for name, result in (("多表整合", integration), ("多表合并", merge))}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=400, help="rows of the core roster (城保名册)")
+    parser.add_argument("--reference-rows", type=int, default=150, help="rows of the second roster (农保名册)")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    saved = {name: os.environ.get(name) for name in ("COMPACT_CHUNK_ENCODING", "CHUNK_COLUMN_LEGEND")}
+    results = {}
+    try:
+        for mode, env in MODES.items():
+            os.environ.update(env)
+            with tempfile.TemporaryDirectory() as tmp:
+                excel_paths = write_village(Path(tmp), args.rows, args.reference_rows, args.seed)
+                results[mode] = measure(Path(tmp), excel_paths)
+    finally:
+        for name, value in saved.items():
+            if value is None:
+                os.environ.pop(name, None)
+            else:
+                os.environ[name] = value
+
+    print(f"城保名册 {args.rows} 行 + 农保名册 {args.reference_rows} 行, {MODEL}")
+    for task in ("多表整合", "多表合并"):
+        baseline = results["repeated header"][task][0]
+        for mode in MODES:
+            tokens, chunks = results[mode][task]
+            print(f"  {task} {mode:<17} {tokens:>9,} tokens in {chunks:>2} chunks  ({tokens / baseline:6.1%})")
+
+
+if __name__ == "__main__":
+    main()
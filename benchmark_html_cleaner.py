@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+"""
+Benchmark: streaming HTML cleaner vs the previous BeautifulSoup pipeline.
+
+Generates a LibreOffice-style HTML export (font wrappers, inline styles, sdval/sdnum attributes,
+comments between sheets) and cleans it with both implementations, reporting wall time,
+peak Python memory (tracemalloc) and whether the outputs are identical.
+
+    python benchmark_html_cleaner.py --rows 10000 --sheets 2 --repeat 3
+"""
+
+import argparse
+import re
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+# Set console encoding for Windows
+if sys.platform == 'win32':
+    import subprocess
+    subprocess.run(['chcp', '65001'], shell=True, capture_output=True)
+
+# Add root project directory to sys.path
+sys.path.append(str(Path(__file__).resolve().parent))
+
+from bs4 import BeautifulSoup
+from utils.html_cleaner import KEEP, ATTR_ALWAYS, ATTR_EXTRA, clean_html_file
+
+
+def clean_html_bs4(html: str) -> str:
+    """The BeautifulSoup implementation _clean_html_in_memory used before the streaming cleaner"""
+    html = re.sub(r'<!DOCTYPE[^>]*?>',           '', html, flags=re.I | re.S)
+    html = re.sub(r'<\?xml[^>]*?\?>',            '', html, flags=re.I)
+    html = re.sub(r'<\?mso-application[^>]*?\?>','', html, flags=re.I)
+
+    soup = BeautifulSoup(html, "html.parser")
+
+    for t in soup.find_all(["style", "meta", "link", "script", "noscript"]):
+        t.decompose()
+
+    for t in soup.find_all(True):
+        if t.name not in KEEP:
+            t.unwrap()
+            continue
+        allowed = ATTR_ALWAYS | ATTR_EXTRA.get(t.name, set())
+        for attr in [a for a in t.attrs.keys() if a not in allowed]:
+            del t.attrs[attr]
+
+    shell = BeautifulSoup("<html><body></body></html>", "html.parser")
+    if soup.body:
+        for element in soup.body.children:
+            if element.name or (hasattr(element, 'strip') and element.strip()):
+                shell.body.append(element)
+    else:
+        for element in soup.children:
+            if element.name or (hasattr(element, 'strip') and element.strip()):
+                shell.body.append(element)
+    return str(shell)
+
+
+def generate_libreoffice_html(rows: int, sheets: int = 1, columns: int = 12) -> str:
+    """LibreOffice 'HTML (StarCalc)' export shape for a 低保 roster"""
+    parts = [
+        '<!DOCTYPE HTML PUBLIC "-//W3C//DTD HTML 4.0 Transitional//EN">\n\n<html>\n<head>\n\t\n'
+        '\t<meta http-equiv="content-type" content="text/html; charset=utf-8"/>\n\t<title></title>\n'
+        '\t<meta name="generator" content="LibreOffice 7.6.4.1 (Windows)"/>\n'
+        '\t<style type="text/css">\n\t\tbody,div,table,thead,tbody,tfoot,tr,th,td,p { font-family:"宋体"; font-size:x-small }\n'
+        '\t\ta.comment-indicator:hover + comment { background:#ffd; position:absolute; display:block; border:1px solid black; padding:0.5em;  } \n'
+        '\t</style>\n\t\n</head>\n\n<body>\n'
+    ]
+    for sheet in range(sheets):
+        parts.append(f'<A NAME="table{sheet}"><h1>Sheet {sheet + 1}: <em>Sheet{sheet + 1}</em></h1></A>\n')
+        parts.append('<table cellspacing="0" border="0">\n')
+        parts.append(f'\t<colgroup width="44"></colgroup>\n\t<colgroup span="{columns - 1}" width="85"></colgroup>\n')
+        parts.append(f'\t<tr>\n\t\t<td colspan={columns} height="35" align="center" valign=middle><b><font face="宋体" size=4>燕云村2024年低保补贴汇总表</font></b></td>\n\t\t</tr>\n')
+        for r in range(rows):
+            cells = [f'\t\t<td height="20" align="center" valign=middle sdval="{r + 1}" sdnum="2052;"><font face="宋体">{r + 1}</font></td>\n',
+                     f'\t\t<td align="center" valign=middle><font face="宋体">张{r % 100}&amp;李</font></td>\n',
+                     f'\t\t<td align="left" valign=middle><font face="宋体">11010119{r % 90 + 10}0101{r % 10000:04d}</font></td>\n']
+            for c in range(columns - 3):
+                cells.append(f'\t\t<td style="border-top: 1px solid #000000" align="right" valign=middle sdval="{c * 60}" sdnum="2052;0;0.00"><font face="宋体">{c * 60}.00</font></td>\n')
+            parts.append("\t<tr>\n" + "".join(cells) + "\t</tr>\n")
+        parts.append('</table>\n<!-- ************************************************************************** -->\n')
+    parts.append('</body>\n\n</html>\n')
+    return "".join(parts)
+
+
+def _measure(func, repeat: int):
+    timings = []
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        timings.append(time.perf_counter() - start)
+    tracemalloc.start()
+    func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, min(timings), peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=10000)
+    parser.add_argument("--sheets", type=int, default=1)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / "export.html"
+        path.write_text(generate_libreoffice_html(args.rows, args.sheets), encoding="utf-8")
+        size_mb = path.stat().st_size / 1024 / 1024
+        print(f"📄 测试文件: {args.rows} 行 x {args.sheets} 个工作表, {size_mb:.1f}MB")
+
+        old_output, old_time, old_peak = _measure(lambda: clean_html_bs4(path.read_text(encoding="utf-8")), args.repeat)
+        new_output, new_time, new_peak = _measure(lambda: clean_html_file(path), args.repeat)
+
+    print(f"🐢 BeautifulSoup: {old_time:.2f}s, 峰值内存 {old_peak / 1024 / 1024:.1f}MB")
+    print(f"🚀 流式清洗:      {new_time:.2f}s, 峰值内存 {new_peak / 1024 / 1024:.1f}MB")
+    print(f"📈 加速 {old_time / new_time:.1f}x, 内存降低 {old_peak / new_peak:.1f}x")
+    print(f"✅ 输出一致: {old_output == new_output} (输出 {len(new_output) / 1024 / 1024:.1f}MB)")
+
+
+if __name__ == "__main__":
+    main()
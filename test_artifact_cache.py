@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+
+import sys
+import tempfile
+from pathlib import Path
+
+# Set console encoding for Windows
+if sys.platform == 'win32':
+    import subprocess
+    subprocess.run(['chcp', '65001'], shell=True, capture_output=True)
+
+# Add root project directory to sys.path
+sys.path.append(str(Path(__file__).resolve().parent))
+
+from utils.artifact_cache import FileArtifactCache, file_digest
+
+
+def test_lookup_by_content_hash():
+    """Renamed copies of the same bytes share one entry; other versions miss"""
+    print("Testing content-hash lookup...")
+    with tempfile.TemporaryDirectory() as tmp:
+        first = Path(tmp) / "低保名单.xls"
+        second = Path(tmp) / "低保名单(1).xls"
+        first.write_bytes(b"roster-bytes")
+        second.write_bytes(b"roster-bytes")
+        assert file_digest(first) == file_digest(second)
+
+        cache = FileArtifactCache(str(Path(tmp) / "cache.sqlite3"))
+        cache.put(file_digest(first), "csv", "1", "姓名,年龄\n张三,30\n", row_count=1, source_name=first.name)
+        hit = cache.get(file_digest(second), "csv", "1")
+        assert hit == {"content": "姓名,年龄\n张三,30\n", "row_count": 1, "source_name": "低保名单.xls"}
+        assert cache.get(file_digest(second), "csv", "2") is None
+        assert cache.get(file_digest(second), "text", "1") is None
+        assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 2
+        cache.close()
+    print("content-hash lookup test completed")
+
+
+def test_lru_eviction():
+    """Least recently read entries are dropped once the size budget is exceeded"""
+    print("Testing LRU eviction...")
+    with tempfile.TemporaryDirectory() as tmp:
+        cache = FileArtifactCache(str(Path(tmp) / "cache.sqlite3"), max_bytes=250)
+        cache.put("a", "text", "1", "x" * 100)
+        cache.put("b", "text", "1", "y" * 100)
+        cache.get("a", "text", "1")  # "b" is now the least recently used
+        cache.put("c", "text", "1", "z" * 100)
+
+        assert cache.get("a", "text", "1") is not None
+        assert cache.get("b", "text", "1") is None
+        assert cache.get("c", "text", "1") is not None
+        assert cache.stats()["evictions"] == 1
+        cache.close()
+    print("LRU eviction test completed")
+
+
+if __name__ == "__main__":
+    print("Starting artifact cache test...")
+    print("=" * 50)
+
+    try:
+        test_lookup_by_content_hash()
+        test_lru_eviction()
+        print("Test completed successfully!")
+
+    except Exception as e:
+        print(f"Test failed: {e}")
+        import traceback
+        print(f"Error details: {traceback.format_exc()}")
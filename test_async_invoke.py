@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+
+import asyncio
+import json
+import sys
+from pathlib import Path
+
+# Set console encoding for Windows
+if sys.platform == 'win32':
+    import subprocess
+    subprocess.run(['chcp', '65001'], shell=True, capture_output=True)
+
+# Add root project directory to sys.path
+sys.path.append(str(Path(__file__).resolve().parent))
+
+import httpx
+from langchain_core.messages import HumanMessage
+from langchain_core.tools import tool
+
+import utils.modelRelated as modelRelated
+from utils.modelRelated import ainvoke_model, ainvoke_model_with_tools, run_async
+
+
+# Its own model name: the stub's token usage and latencies must not calibrate the real models' estimates
+STUB_MODEL = "stub/slow-model"
+
+
+class _SlowServer(httpx.AsyncBaseTransport):
+    """OpenAI-compatible stub that records how many requests are in flight at once"""
+
+    def __init__(self, latency: float = 0.05):
+        self.latency = latency
+        self.active = 0
+        self.max_active = 0
+        self.requests = 0
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        self.active += 1
+        self.requests += 1
+        self.max_active = max(self.max_active, self.active)
+        try:
+            await asyncio.sleep(self.latency)
+        finally:
+            self.active -= 1
+        body = json.loads(request.content)
+        message = {"role": "assistant", "content": f"收到: {body['messages'][-1]['content']}"}
+        if body.get("tools"):
+            message = {"role": "assistant", "content": "", "tool_calls": [
+                {"id": "call_1", "type": "function", "function": {"name": "lookup", "arguments": "{\"name\": \"张三\"}"}}]}
+        return httpx.Response(200, json={
+            "id": "chatcmpl-test", "object": "chat.completion", "created": 0, "model": body["model"],
+            "choices": [{"index": 0, "message": message, "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": 10, "completion_tokens": 5, "total_tokens": 15},
+        })
+
+
+@tool
+def lookup(name: str) -> str:
+    """按姓名查询户籍信息"""
+    return name
+
+
+def _use_stub(monkeypatch, limit: int) -> _SlowServer:
+    server = _SlowServer()
+    monkeypatch.setenv("SILICONFLOW_API_KEY", "sk-test")
+    monkeypatch.setenv("LLM_MAX_CONCURRENCY_SILICONFLOW", str(limit))
+    monkeypatch.setenv("LLM_CACHE_ENABLED", "0")
+    monkeypatch.setattr(modelRelated, "wrap_async_transport", lambda transport: server)
+    return server
+
+
+def test_provider_semaphore_caps_concurrency(monkeypatch):
+    """Ten concurrent calls through run_async never have more than the provider limit in flight"""
+    print("Testing async provider concurrency...")
+    server = _use_stub(monkeypatch, limit=3)
+
+    async def fan_out():
+        return await asyncio.gather(*(ainvoke_model(STUB_MODEL, [HumanMessage(content=f"第{i}块")],
+                                                    silent_mode=True) for i in range(10)))
+
+    results = run_async(fan_out())
+    assert results == [f"收到: 第{i}块" for i in range(10)]
+    assert server.requests == 10 and server.max_active == 3
+    print("async provider concurrency test completed")
+
+
+def test_tool_calls_share_the_limit(monkeypatch):
+    """ainvoke_model_with_tools goes through the same per-provider semaphore"""
+    print("Testing async tool calls...")
+    server = _use_stub(monkeypatch, limit=2)
+
+    async def fan_out():
+        return await asyncio.gather(*(ainvoke_model_with_tools(STUB_MODEL, [HumanMessage(content="查张三")],
+                                                               [lookup]) for _ in range(6)))
+
+    responses = run_async(fan_out())
+    assert all(response.tool_calls[0]["args"] == {"name": "张三"} for response in responses)
+    assert server.requests == 6 and server.max_active == 2
+    print("async tool calls test completed")
+
+
+if __name__ == "__main__":
+    import pytest
+
+    print("Starting async invoke test...")
+    print("=" * 50)
+
+    try:
+        with pytest.MonkeyPatch.context() as monkeypatch:
+            test_provider_semaphore_caps_concurrency(monkeypatch)
+        with pytest.MonkeyPatch.context() as monkeypatch:
+            test_tool_calls_share_the_limit(monkeypatch)
+        print("Test completed successfully!")
+
+    except Exception as e:
+        print(f"Test failed: {e}")
+        import traceback
+        print(f"Error details: {traceback.format_exc()}")
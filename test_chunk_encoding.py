@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+# Set console encoding for Windows
+if sys.platform == 'win32':
+    import subprocess
+    subprocess.run(['chcp', '65001'], shell=True, capture_output=True)
+
+# Add root project directory to sys.path
+sys.path.append(str(Path(__file__).resolve().parent))
+
+from utils.chunk_encoding import build_column_legend, decode_records, encode_records, render_legend, row_id
+from utils.file_process import FinalAnswerCSVParser, process_excel_files_for_merge
+
+
+HEADER = "序号,户主姓名,身份证号码,保障人数,重点保障人数,残疾人数"
+OTHER_HEADER = "序号,户主姓名,身份证号码,领取金额"
+
+
+def test_round_trip_with_legend():
+    """Header once per run of equal headers; IDs and full column names come back"""
+    print("Testing compact encoding round trip...")
+    pairs = [(HEADER, "1,张三,110101199001051234,2,1,1"), (HEADER, '2,"李,四",11010119850709123X,1,1,0'),
+             (OTHER_HEADER, "1,王五,110101197001010011,600")]
+    ids = [row_id(i) for i in range(7, 10)]
+
+    plain = encode_records(pairs, ids)
+    assert plain.count(HEADER) == 1 and plain.split("\n")[1] == "R8,1,张三,110101199001051234,2,1,1"
+    assert decode_records(plain) == [(i, header, data) for i, (header, data) in zip(ids, pairs)]
+
+    legend = build_column_legend([header for header, _ in pairs])
+    assert list(legend.values()) == ["C1", "C2", "C3", "C4", "C5", "C6", "C7"]
+    compact = render_legend(legend) + "\n" + encode_records(pairs, ids, legend)
+    assert "行号,C1,C2,C3,C4,C5,C6" in compact
+    assert decode_records(compact) == [(i, header, data) for i, (header, data) in zip(ids, pairs)]
+    print("compact encoding round trip test completed")
+
+
+def test_merge_chunks_and_tagged_answers():
+    """Merge chunks decode to every row once with stable IDs; answers echoing the IDs are accepted"""
+    print("Testing compact merge chunks...")
+    with tempfile.TemporaryDirectory() as tmp:
+        csv_dir = Path(tmp) / "files" / "村" / "table_files" / "CSV_files"
+        csv_dir.mkdir(parents=True)
+        (csv_dir / "城保名册.csv").write_text(
+            "\n".join(f"{HEADER}\n{i},张{i},1101{i:014d},2,1,1" for i in range(30)) + "\n", encoding="utf-8")
+        (csv_dir / "农保名册.csv").write_text(
+            "\n".join(f"{OTHER_HEADER}\n{i},李{i},3201{i:014d},{100 + i}" for i in range(12)) + "\n", encoding="utf-8")
+        cwd = os.getcwd()
+        os.chdir(tmp)
+        try:
+            chunks = process_excel_files_for_merge(["x/城保名册.xls", "x/农保名册.xls"], village_name="村",
+                                                   chunk_nums=4)["combined_chunks"]
+        finally:
+            os.chdir(cwd)
+
+    records = [record for chunk in chunks for record in decode_records(chunk)]
+    assert [record_id for record_id, _, _ in records] == [row_id(i) for i in range(42)]
+    assert records[31] == ("R32", OTHER_HEADER, "1,李1,320100000000000001,101")
+    assert all(chunk.count(HEADER) <= 1 for chunk in chunks)
+
+    parser = FinalAnswerCSVParser(strip_row_ids=True)
+    rows = parser.feed("=== 推理过程 ===\nR1 是张0\n=== 最终答案 ===\nR1,张0,2\nR2，张1,2\n张2,2\n")
+    assert rows == ["张0,2", "张1,2", "张2,2"] and parser.row_ids == ["R1", "R2", None]
+    print("compact merge chunks test completed")
+
+
+if __name__ == "__main__":
+    print("Starting chunk encoding test...")
+    print("=" * 50)
+
+    try:
+        test_round_trip_with_legend()
+        test_merge_chunks_and_tagged_answers()
+        print("Test completed successfully!")
+
+    except Exception as e:
+        print(f"Test failed: {e}")
+        import traceback
+        print(f"Error details: {traceback.format_exc()}")
@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+
+import sys
+from pathlib import Path
+
+# Set console encoding for Windows
+if sys.platform == 'win32':
+    import subprocess
+    subprocess.run(['chcp', '65001'], shell=True, capture_output=True)
+
+# Add root project directory to sys.path
+sys.path.append(str(Path(__file__).resolve().parent))
+
+from utils.chunk_planner import plan_chunks
+from utils.token_estimator import TokenEstimator, estimate_tokens
+
+
+ROW = "姓名,身份证号码,户主姓名,低保证号,家庭人口,金额\n张三,110101199001011234,张三,DB2023001,3,1200.50"
+
+
+def test_chunks_respect_token_budget():
+    """Wide rows are split into more chunks than requested so no chunk exceeds the budget"""
+    print("Testing token-budget chunking...")
+    items = [ROW * 20] * 60
+    plan = plan_chunks(items, "deepseek-ai/DeepSeek-V3", shared_prompt_tokens=3000, min_chunks=5)
+
+    assert len(plan.boundaries) > 5
+    assert max(plan.estimated_tokens) <= plan.budget
+    # chunks cover every item exactly once, in order
+    assert [i for chunk in plan.split(list(range(60))) for i in chunk] == list(range(60))
+    print(f"Chunks: {len(plan.boundaries)}, largest: {max(plan.estimated_tokens)} tokens")
+
+
+def test_min_chunks_for_parallelism():
+    """Narrow rows are still spread over chunk_nums evenly sized chunks"""
+    print("Testing min chunks...")
+    plan = plan_chunks([ROW] * 100, "deepseek-ai/DeepSeek-V3", min_chunks=15)
+    sizes = [end - start for start, end in plan.boundaries]
+    assert len(sizes) == 15 and max(sizes) - min(sizes) <= 1
+
+
+def test_estimator_calibration():
+    """Reported prompt tokens pull the per-model estimate towards the real tokenizer"""
+    print("Testing estimator calibration...")
+    estimator = TokenEstimator(smoothing=0.5)
+    estimated = estimator.estimate_text(ROW, "deepseek-ai/DeepSeek-V3")
+    assert abs(estimated - estimate_tokens(ROW, "deepseek-ai/DeepSeek-V3")) <= 1
+    for _ in range(10):
+        estimator.observe("deepseek-ai/DeepSeek-V3", estimator.estimate_text(ROW, "deepseek-ai/DeepSeek-V3"), estimated * 2)
+    assert abs(estimator.estimate_text(ROW, "deepseek-ai/DeepSeek-V3") - estimated * 2) <= 2
+    print("Calibration test completed")
+
+
+if __name__ == "__main__":
+    print("Starting chunk planner test...")
+    print("=" * 50)
+
+    try:
+        test_chunks_respect_token_budget()
+        test_min_chunks_for_parallelism()
+        test_estimator_calibration()
+        print("Test completed successfully!")
+
+    except Exception as e:
+        print(f"Test failed: {e}")
+        import traceback
+        print(f"Error details: {traceback.format_exc()}")
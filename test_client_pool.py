@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+
+import sys
+from pathlib import Path
+
+# Set console encoding for Windows
+if sys.platform == 'win32':
+    import subprocess
+    subprocess.run(['chcp', '65001'], shell=True, capture_output=True)
+
+# Add root project directory to sys.path
+sys.path.append(str(Path(__file__).resolve().parent))
+
+import httpx
+from utils.modelRelated import LLMClientPool, _DrainingTransport
+
+
+class _Body(httpx.SyncByteStream):
+    """Streamed body, like a real connection's (a content= response is read and closed up front)"""
+
+    def __iter__(self):
+        yield "户主姓名,身份证号码".encode("utf-8")
+
+
+class _RecordingTransport(httpx.MockTransport):
+    closed = False
+
+    def close(self) -> None:
+        self.closed = True
+
+
+def test_retired_transport_closes_after_draining():
+    """A retired transport keeps an open response alive and closes when its body is closed"""
+    print("Testing retired transport draining...")
+    inner = _RecordingTransport(lambda request: httpx.Response(200, stream=_Body()))
+    transport = _DrainingTransport(inner)
+    client = httpx.Client(transport=transport)
+    with client.stream("POST", "http://llm.local/v1/chat/completions") as response:
+        transport.retire()
+        assert transport.in_flight == 1 and not inner.closed
+        assert response.read().decode("utf-8") == "户主姓名,身份证号码"
+    assert transport.in_flight == 0 and inner.closed
+
+    idle = _RecordingTransport(lambda request: httpx.Response(200))
+    _DrainingTransport(idle).retire()
+    assert idle.closed
+    print("retired transport draining test completed")
+
+
+def test_capacity_bump_does_not_keep_old_pools(monkeypatch):
+    """Idle pools replaced by ensure_capacity are closed at once instead of piling up until close()"""
+    print("Testing capacity bump...")
+    monkeypatch.setenv("SILICONFLOW_API_KEY", "sk-test")
+    pool = LLMClientPool(max_connections=2)
+    first = pool.get_chat_model("deepseek-ai/DeepSeek-V3")
+    old_transports = list(pool._transports.values())
+    pool.ensure_capacity(8)
+    assert old_transports and all(transport.closed for transport in old_transports)
+    assert pool.get_chat_model("deepseek-ai/DeepSeek-V3") is not first
+    pool.ensure_capacity(16)
+    assert len(pool._retired_transports) == 1  # closed ones are pruned
+    pool.close()
+    print("capacity bump test completed")
+
+
+if __name__ == "__main__":
+    print("Starting client pool test...")
+    print("=" * 50)
+
+    try:
+        test_retired_transport_closes_after_draining()
+        import pytest
+        with pytest.MonkeyPatch.context() as monkeypatch:
+            test_capacity_bump_does_not_keep_old_pools(monkeypatch)
+        print("Test completed successfully!")
+
+    except Exception as e:
+        print(f"Test failed: {e}")
+        import traceback
+        print(f"Error details: {traceback.format_exc()}")
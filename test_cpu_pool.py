@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+
+import sys
+from pathlib import Path
+
+# Set console encoding for Windows
+if sys.platform == 'win32':
+    import subprocess
+    subprocess.run(['chcp', '65001'], shell=True, capture_output=True)
+
+# Add root project directory to sys.path
+sys.path.append(str(Path(__file__).resolve().parent))
+
+from utils.cpu_pool import CpuPool
+
+
+def _square(value: int) -> int:
+    if value < 0:
+        raise ValueError("negative")
+    return value * value
+
+
+def test_process_pool_keeps_order_and_isolates_failures():
+    """Results come back in submission order; a failing job's exception reaches the caller without aborting the batch"""
+    print("Testing process pool...")
+    pool = CpuPool(workers=2, start_method="spawn")
+    try:
+        results = pool.map(_square, [(n,) for n in [3, -1, 5, 7, 2]], chunksize=2, return_exceptions=True)
+        assert [results[i] for i in (0, 2, 3, 4)] == [9, 25, 49, 4]
+        assert isinstance(results[1], ValueError) and str(results[1]) == "negative"
+        try:
+            pool.map(_square, [(2,), (-3,)])
+            assert False, "the job's exception must propagate"
+        except ValueError:
+            pass
+        stats = pool.stats()
+        assert stats["jobs"] == 7 and stats["failures"] == 2 and stats["inline_jobs"] == 0
+    finally:
+        pool.shutdown()
+    print("process pool test completed")
+
+
+def test_inline_mode():
+    """CPU_POOL_WORKERS=0/1 runs jobs in the calling thread"""
+    print("Testing inline mode...")
+    pool = CpuPool(workers=1, start_method="spawn")
+    results = pool.map(_square, [(4,), (-2,)], return_exceptions=True)
+    assert results[0] == 16 and isinstance(results[1], ValueError)
+    assert pool.stats()["inline_jobs"] == 2 and not pool.stats()["started"]
+    print("inline mode test completed")
+
+
+if __name__ == "__main__":
+    print("Starting CPU pool test...")
+    print("=" * 50)
+
+    try:
+        test_process_pool_keeps_order_and_isolates_failures()
+        test_inline_mode()
+        print("Test completed successfully!")
+
+    except Exception as e:
+        print(f"Test failed: {e}")
+        import traceback
+        print(f"Error details: {traceback.format_exc()}")
@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+
+import sys
+import tempfile
+from pathlib import Path
+
+# Set console encoding for Windows
+if sys.platform == 'win32':
+    import subprocess
+    subprocess.run(['chcp', '65001'], shell=True, capture_output=True)
+
+# Add root project directory to sys.path
+sys.path.append(str(Path(__file__).resolve().parent))
+
+from utils.csv_index import index_paths, load_csv_index, read_csv_records, write_csv_index
+from utils.file_process import detect_csv_format, parse_header_data_pairs
+
+
+HEADER = "序号,户主姓名,身份证号码"
+
+
+def _expected(path: Path):
+    csv_lines = path.read_text(encoding="utf-8").strip().split('\n')
+    is_repeated_header, data_rows = detect_csv_format(csv_lines)
+    return is_repeated_header, data_rows, parse_header_data_pairs(csv_lines, is_repeated_header)
+
+
+def test_index_matches_full_read():
+    """Row count, format and records are what detect_csv_format / parse_header_data_pairs give"""
+    print("Testing CSV sidecar index...")
+    with tempfile.TemporaryDirectory() as tmp:
+        repeated = Path(tmp) / "重构.csv"
+        repeated.write_text("\n" + "\n".join(f"{HEADER}\n{i},张{i},1101{i:014d}" for i in range(10)) + "\n\n",
+                            encoding="utf-8")
+        standard = Path(tmp) / "标准.csv"
+        standard.write_text(HEADER + "\r\n1,李四,x\r\n\r\n2,王五,\"a,b\"\r\n", encoding="utf-8")
+
+        for path in (repeated, standard):
+            is_repeated_header, data_rows, pairs = _expected(path)
+            meta = write_csv_index(path)
+            assert (meta["repeated_header"], meta["row_count"]) == (is_repeated_header, data_rows)
+            assert meta["columns"] == ["序号", "户主姓名", "身份证号码"]
+            assert read_csv_records(path) == pairs
+            assert read_csv_records(path, 3, 5, meta=meta) == pairs[3:5]
+            assert all(p.exists() for p in index_paths(path))
+    print("sidecar index test completed")
+
+
+def test_stale_index_is_rebuilt():
+    """A rewritten CSV is re-indexed instead of trusting old offsets"""
+    print("Testing stale index...")
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / "表.csv"
+        path.write_text(f"{HEADER}\n1,张三,x\n", encoding="utf-8")
+        write_csv_index(path)
+        path.write_text(f"{HEADER}\n1,张三,x\n2,李四,y\n", encoding="utf-8")
+
+        assert load_csv_index(path)["row_count"] == 2
+        assert read_csv_records(path)[-1] == (HEADER, "2,李四,y")
+    print("stale index test completed")
+
+
+if __name__ == "__main__":
+    print("Starting CSV index test...")
+    print("=" * 50)
+
+    try:
+        test_index_matches_full_read()
+        test_stale_index_is_rebuilt()
+        print("Test completed successfully!")
+
+    except Exception as e:
+        print(f"Test failed: {e}")
+        import traceback
+        print(f"Error details: {traceback.format_exc()}")
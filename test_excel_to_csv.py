@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+
+import sys
+import tempfile
+from datetime import datetime
+from pathlib import Path
+
+# Set console encoding for Windows
+if sys.platform == 'win32':
+    import subprocess
+    subprocess.run(['chcp', '65001'], shell=True, capture_output=True)
+
+# Add root project directory to sys.path
+sys.path.append(str(Path(__file__).resolve().parent))
+
+import pandas as pd
+from utils.file_process import excel_to_csv, normalise_excel_dates
+from utils.sheet_reader import count_data_rows
+from benchmark_excel_to_csv import generate_roster, normalise_per_cell
+
+
+def test_matches_per_cell_cleaning():
+    """Same CSV as applying clean_date_string cell by cell"""
+    print("Testing column-wise date normalisation...")
+    tricky = ["2024-01-05 00:00:00", "2024-1-5", "2024/01/05", "01/05/2024", "31/12/2024", "20240105",
+              "2024-02-30", "00001031", "2024-01-05 13:04:05", "2024-01-05.00.00.00", "600.00", "2023.0",
+              "2024- 1- 5", "１９９０-01-05", "19900105 ", "2024-01-05  12:00:00", "张三", "", None, 12.5]
+    df = generate_roster(200, seed=1)
+    df["混合"] = (tricky * 10)[:200]
+    df["对象日期"] = pd.Series([datetime(2024, 1, n % 28 + 1) if n % 3 else "2024/3/4" for n in range(200)], dtype=object)
+
+    assert normalise_excel_dates(df).to_csv(index=False) == normalise_per_cell(df).to_csv(index=False)
+    print("per-cell comparison test completed")
+
+
+def test_excel_to_csv_end_to_end():
+    """Datetime columns and date strings come out as YYYY-MM-DD"""
+    print("Testing excel_to_csv...")
+    with tempfile.TemporaryDirectory() as tmp:
+        excel_path = Path(tmp) / "花名册.xlsx"
+        csv_path = Path(tmp) / "花名册.csv"
+        pd.DataFrame({
+            "户主姓名": ["张三", "李四"],
+            "出生日期": ["1990-01-05 00:00:00", "1985/7/9"],
+            "发证日期": [datetime(2024, 3, 1), None],
+        }).to_excel(excel_path, index=False)
+
+        excel_to_csv(str(excel_path), str(csv_path))
+        lines = csv_path.read_text(encoding="utf-8").splitlines()
+
+    assert lines == ["户主姓名,出生日期,发证日期", "张三,1990-01-05,2024-03-01", "李四,1985-07-09,"]
+    print("excel_to_csv test completed")
+
+
+def test_streaming_mode():
+    """Row-by-row conversion keeps ID numbers as text and matches the whole-sheet layout"""
+    print("Testing streaming excel_to_csv...")
+    with tempfile.TemporaryDirectory() as tmp:
+        excel_path = Path(tmp) / "花名册.xlsx"
+        csv_path = Path(tmp) / "花名册.csv"
+        pd.DataFrame([
+            ["张三", "110101199001051234", datetime(2024, 3, 1), 2],
+            [None, None, None, None],
+            ["李四", "#N/A", "1985/7/9 00:00:00", 3.5],
+            ["王五", None, None, None],
+        ], columns=["户主姓名", "身份证号码", "日期", "户主姓名"]).to_excel(excel_path, index=False)
+
+        excel_to_csv(str(excel_path), str(csv_path), streaming=True)
+        lines = csv_path.read_text(encoding="utf-8").splitlines()
+        rows = count_data_rows(excel_path)
+
+    assert lines == ["户主姓名,身份证号码,日期,户主姓名.1", "张三,110101199001051234,2024-03-01,2",
+                     ",,,", "李四,,1985-07-09,3.5", "王五,,,"]
+    assert rows == 3
+    print("streaming test completed")
+
+def test_modes_agree_on_id_columns():
+    """Whole-sheet and streaming modes write the same ID numbers when the column has a blank"""
+    print("Testing ID columns in both modes...")
+    with tempfile.TemporaryDirectory() as tmp:
+        excel_path = Path(tmp) / "花名册.xlsx"
+        pd.DataFrame({
+            "户主姓名": ["张三", "李四", "王五"],
+            "身份证号码": ["110101199001051234", None, "110101198507091236"],
+            "低保证号": ["0012", None, "0345"],
+        }).to_excel(excel_path, index=False)
+
+        outputs = {}
+        for streaming in (False, True):
+            csv_path = Path(tmp) / f"花名册_{streaming}.csv"
+            excel_to_csv(str(excel_path), str(csv_path), streaming=streaming)
+            outputs[streaming] = csv_path.read_text(encoding="utf-8").splitlines()
+
+    assert outputs[False] == outputs[True]
+    assert outputs[False] == ["户主姓名,身份证号码,低保证号", "张三,110101199001051234,0012", "李四,,",
+                              "王五,110101198507091236,0345"]
+    print("ID column test completed")
+
+
+if __name__ == "__main__":
+    print("Starting excel_to_csv test...")
+    print("=" * 50)
+
+    try:
+        test_matches_per_cell_cleaning()
+        test_excel_to_csv_end_to_end()
+        test_streaming_mode()
+        test_modes_agree_on_id_columns()
+        print("Test completed successfully!")
+
+    except Exception as e:
+        print(f"Test failed: {e}")
+        import traceback
+        print(f"Error details: {traceback.format_exc()}")
@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+
+import asyncio
+import sys
+from pathlib import Path
+
+# Set console encoding for Windows
+if sys.platform == 'win32':
+    import subprocess
+    subprocess.run(['chcp', '65001'], shell=True, capture_output=True)
+
+# Add root project directory to sys.path
+sys.path.append(str(Path(__file__).resolve().parent))
+
+import utils.file_process as file_process
+from utils.file_process import FinalAnswerCSVParser, agather_chunks, astream_final_answer_rows
+
+
+RESPONSE = ('=== 推理过程 ===\n张三,110101199001051234 是第一条记录，"引号"也不算数据\n'
+            '=== 最终答案 ===\n序号,户主姓名,家庭住址\n1,张三,"一组,\n5号"\n2,李四,二组\n')
+
+
+def _feed_in_pieces(parser: FinalAnswerCSVParser, text: str, size: int) -> list[str]:
+    rows = []
+    for start in range(0, len(text), size):
+        rows += parser.feed(text[start:start + size])
+    return rows + parser.close()
+
+
+def test_rows_split_across_deltas():
+    """Reasoning before the marker is dropped; rows split at any point, quoted newlines included, come out whole"""
+    print("Testing final answer parser...")
+    expected = ["序号,户主姓名,家庭住址", '1,张三,"一组,\n5号"', "2,李四,二组"]
+    for size in (1, 3, 7, len(RESPONSE)):
+        assert _feed_in_pieces(FinalAnswerCSVParser(strip_row_ids=False), RESPONSE, size) == expected
+
+    parser = FinalAnswerCSVParser(strip_row_ids=True)
+    rows = _feed_in_pieces(parser, "=== 最终答案 ===\nR1,张三,\"a\nb\"\nR2,李四,c", 2)
+    assert rows == ['张三,"a\nb"', "李四,c"] and parser.row_ids == ["R1", "R2"]
+    print("final answer parser test completed")
+
+
+def test_stream_rows_and_chunk_retries(monkeypatch):
+    """Streamed rows reach on_row in order; a chunk that fails once is retried, one that keeps failing is reported"""
+    print("Testing streamed rows and chunk retries...")
+
+    async def fake_stream(model_name, messages, temperature, on_dispatch=None):
+        for start in range(0, len(RESPONSE), 5):
+            yield RESPONSE[start:start + 5]
+
+    monkeypatch.setattr(file_process, "astream_model", fake_stream)
+    seen = []
+    rows = asyncio.run(astream_final_answer_rows("m", [], on_row=seen.append, hedge=False, strip_row_ids=False))
+    assert rows == seen and len(rows) == 3
+
+    calls = []
+
+    async def process(i):
+        calls.append(i)
+        if i == 1 and calls.count(1) == 1:
+            raise RuntimeError("timeout")
+        return None if i == 2 else f"块{i}"
+
+    results, failed = asyncio.run(agather_chunks(process, 4, retries=2))
+    assert results == {0: "块0", 1: "块1", 3: "块3"} and failed == [2]
+    assert calls.count(0) == 1 and calls.count(1) == 2 and calls.count(2) == 3
+    print("streamed rows and chunk retries test completed")
+
+
+if __name__ == "__main__":
+    import pytest
+
+    print("Starting final answer parser test...")
+    print("=" * 50)
+
+    try:
+        test_rows_split_across_deltas()
+        with pytest.MonkeyPatch.context() as monkeypatch:
+            test_stream_rows_and_chunk_retries(monkeypatch)
+        print("Test completed successfully!")
+
+    except Exception as e:
+        print(f"Test failed: {e}")
+        import traceback
+        print(f"Error details: {traceback.format_exc()}")
@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+
+import asyncio
+import sys
+from pathlib import Path
+
+# Set console encoding for Windows
+if sys.platform == 'win32':
+    import subprocess
+    subprocess.run(['chcp', '65001'], shell=True, capture_output=True)
+
+# Add root project directory to sys.path
+sys.path.append(str(Path(__file__).resolve().parent))
+
+import utils.file_process as file_process
+import utils.modelRelated as modelRelated
+from utils.file_process import astream_final_answer_rows
+from utils.modelRelated import HedgePolicy, ainvoke_model_hedged
+
+
+def _policy(latency: float = 0.05) -> HedgePolicy:
+    """Five samples of `latency` seconds: the hedge threshold is `latency`"""
+    policy = HedgePolicy()
+    for _ in range(5):
+        policy.observe("m", latency)
+    return policy
+
+
+def _fake_ainvoke(plan: list[tuple[float, float, object]], calls: list[str]):
+    """Each call takes the next (queue seconds, request seconds, result or exception) of the plan"""
+    async def fake(model_name, messages, temperature=0.2, silent_mode=False, use_cache=True, on_dispatch=None):
+        queue, latency, result = plan[len(calls)]
+        calls.append(model_name)
+        await asyncio.sleep(queue)  # waiting on the rate limiter / provider semaphore
+        if on_dispatch is not None:
+            on_dispatch()
+        await asyncio.sleep(latency)
+        if isinstance(result, Exception):
+            raise result
+        return result
+    return fake
+
+
+def test_hedge_fires_and_wins(monkeypatch):
+    """A slow dispatched primary is hedged and the faster hedge wins; a failed primary falls back to the hedge"""
+    print("Testing hedge firing...")
+    for primary_result in ("primary", RuntimeError("502")):
+        policy, calls = _policy(), []
+        monkeypatch.setattr(modelRelated, "_HEDGE_POLICY", policy)
+        monkeypatch.setattr(modelRelated, "ainvoke_model",
+                            _fake_ainvoke([(0, 0.3, primary_result), (0, 0.02, "hedge")], calls))
+        assert asyncio.run(ainvoke_model_hedged("m", [])) == "hedge"
+        assert len(calls) == 2 and policy.stats()["hedges"] == 1 and policy.hedge_wins == 1
+    print("hedge firing test completed")
+
+
+def test_queue_wait_and_primary_failure(monkeypatch):
+    """Time spent queued does not count towards the threshold; a primary failing before the threshold is final"""
+    print("Testing hedge clock...")
+    policy, calls = _policy(), []
+    monkeypatch.setattr(modelRelated, "_HEDGE_POLICY", policy)
+    monkeypatch.setattr(modelRelated, "ainvoke_model", _fake_ainvoke([(0.3, 0.01, "primary")], calls))
+    assert asyncio.run(ainvoke_model_hedged("m", [])) == "primary"
+    assert calls == ["m"] and policy.stats()["hedges"] == 0
+
+    calls.clear()
+    monkeypatch.setattr(modelRelated, "ainvoke_model", _fake_ainvoke([(0, 0.01, ValueError("bad request"))], calls))
+    try:
+        asyncio.run(ainvoke_model_hedged("m", []))
+        assert False, "the primary's error must propagate"
+    except ValueError:
+        pass
+    assert calls == ["m"] and policy.stats()["hedges"] == 0
+    print("hedge clock test completed")
+
+def test_stream_takes_over_from_failed_owner(monkeypatch):
+    """A hedge stream that emits the first row and then fails hands the output to the primary"""
+    print("Testing streaming hedge takeover...")
+    policy, calls = _policy(), []
+    monkeypatch.setattr(modelRelated, "_HEDGE_POLICY", policy)
+
+    async def fake_stream(model_name, messages, temperature, on_dispatch=None):
+        calls.append(model_name)
+        if on_dispatch is not None:
+            on_dispatch()
+        if len(calls) == 1:  # primary: slow but complete
+            await asyncio.sleep(0.3)
+            yield "=== 最终答案 ===\nR1,张三\nR2,李四\n"
+        else:  # hedge: owns the output with its first row, then the connection drops
+            yield "=== 最终答案 ===\nR1,王五\n"
+            await asyncio.sleep(0.05)
+            raise ConnectionError("stream reset")
+
+    monkeypatch.setattr(file_process, "astream_model", fake_stream)
+    seen = []
+    rows = asyncio.run(astream_final_answer_rows("m", [], on_row=seen.append, strip_row_ids=False))
+    assert rows == ["R1,张三", "R2,李四"]
+    assert seen == ["R1,王五", "R1,张三", "R2,李四"]
+    assert len(calls) == 2 and policy.hedge_wins == 0
+
+    # Both streams failing raises the last owner's error instead of a TypeError
+    calls.clear()
+
+    async def failing_stream(model_name, messages, temperature, on_dispatch=None):
+        calls.append(model_name)
+        if on_dispatch is not None:
+            on_dispatch()
+        if len(calls) == 1:
+            await asyncio.sleep(0.3)
+            raise TimeoutError("primary timeout")
+        yield "=== 最终答案 ===\nR1,王五\n"
+        raise ConnectionError("stream reset")
+
+    monkeypatch.setattr(file_process, "astream_model", failing_stream)
+    try:
+        asyncio.run(astream_final_answer_rows("m", [], strip_row_ids=False))
+        assert False, "the failure must propagate"
+    except TimeoutError:
+        pass
+    print("streaming hedge takeover test completed")
+
+
+if __name__ == "__main__":
+    import pytest
+
+    print("Starting hedging test...")
+    print("=" * 50)
+
+    try:
+        with pytest.MonkeyPatch.context() as monkeypatch:
+            test_hedge_fires_and_wins(monkeypatch)
+        with pytest.MonkeyPatch.context() as monkeypatch:
+            test_queue_wait_and_primary_failure(monkeypatch)
+        with pytest.MonkeyPatch.context() as monkeypatch:
+            test_stream_takes_over_from_failed_owner(monkeypatch)
+        print("Test completed successfully!")
+
+    except Exception as e:
+        print(f"Test failed: {e}")
+        import traceback
+        print(f"Error details: {traceback.format_exc()}")
@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+
+import sys
+import tempfile
+from pathlib import Path
+
+# Set console encoding for Windows
+if sys.platform == 'win32':
+    import subprocess
+    subprocess.run(['chcp', '65001'], shell=True, capture_output=True)
+
+# Add root project directory to sys.path
+sys.path.append(str(Path(__file__).resolve().parent))
+
+from utils.html_cleaner import clean_html, clean_html_file
+from benchmark_html_cleaner import clean_html_bs4, generate_libreoffice_html
+
+
+def test_matches_beautifulsoup_pipeline():
+    """Same bytes as the previous BeautifulSoup implementation on a LibreOffice export"""
+    print("Testing streaming cleaner against BeautifulSoup...")
+    html = generate_libreoffice_html(rows=50, sheets=2)
+    html = html.replace("<body>\n", "<body>\n<noscript><p>x</p></noscript>\n<pre>  a\n\n</pre>\n<!---->\n", 1)
+    html = html.replace("张1&amp;李", "<span class=x ROWSPAN=2 colspan='3'>&lt;张1&gt; &nbsp;</span><br>", 1)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        # Small chunks so tags, entities and multi-byte characters straddle block boundaries
+        path = Path(tmp) / "export.html"
+        path.write_bytes(html.encode("gbk"))
+        streamed = clean_html_file(path, chunk_size=7)
+
+    assert streamed == clean_html_bs4(html)
+    assert '<span colspan="3" rowspan="2">&lt;张1&gt; \xa0</span><br/>' in streamed
+    assert "<style" not in streamed and "<p>x</p>" not in streamed
+    print("BeautifulSoup comparison test completed")
+
+
+def test_top_level_siblings_are_kept():
+    """Nodes right after a top-level element are no longer skipped"""
+    print("Testing top-level siblings...")
+    cleaned = clean_html('<body><a href="#table0" name="x">Sheet1</a><br><font>尾部</font></body>')
+    assert cleaned == '<html><body><a href="#table0">Sheet1</a><br/>尾部</body></html>'
+    print("top-level siblings test completed")
+
+
+if __name__ == "__main__":
+    print("Starting HTML cleaner test...")
+    print("=" * 50)
+
+    try:
+        test_matches_beautifulsoup_pipeline()
+        test_top_level_siblings_are_kept()
+        print("Test completed successfully!")
+
+    except Exception as e:
+        print(f"Test failed: {e}")
+        import traceback
+        print(f"Error details: {traceback.format_exc()}")
@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+
+import sys
+import tempfile
+import threading
+from pathlib import Path
+from types import SimpleNamespace
+
+# Set console encoding for Windows
+if sys.platform == 'win32':
+    import subprocess
+    subprocess.run(['chcp', '65001'], shell=True, capture_output=True)
+
+# Add root project directory to sys.path
+sys.path.append(str(Path(__file__).resolve().parent))
+
+import pytest
+
+import utils.libreoffice_pool as libreoffice_pool
+from utils.libreoffice_pool import LibreOfficeConversionError, LibreOfficePool, LibreOfficeWorker
+
+
+# Stands in for `soffice --headless --convert-to <format> <file> --outdir <dir>`; files named *hang* never finish
+FAKE_SOFFICE = f"""#!{sys.executable}
+import sys, time
+from pathlib import Path
+args = sys.argv[1:]
+source = Path(args[args.index("--convert-to") + 2])
+if "hang" in source.name:
+    time.sleep(60)
+extension = args[args.index("--convert-to") + 1].split(":")[0]
+outdir = Path(args[args.index("--outdir") + 1])
+(outdir / f"{{source.stem}}.{{extension}}").write_text("<table>" + source.read_text(encoding="utf-8") + "</table>", encoding="utf-8")
+"""
+
+
+@pytest.mark.skipif(sys.platform == "win32", reason="the fake soffice is a shebang script")
+def test_cli_fallback_and_timeout(monkeypatch):
+    """Without UNO every worker runs --convert-to with its own profile; a hung conversion is killed and reported"""
+    print("Testing LibreOffice CLI mode...")
+    monkeypatch.setattr(libreoffice_pool, "UNO_AVAILABLE", False)
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        soffice = tmp / "soffice"
+        soffice.write_text(FAKE_SOFFICE, encoding="utf-8")
+        soffice.chmod(0o755)
+        (tmp / "低保.xls").write_text("张三", encoding="utf-8")
+        (tmp / "hang.xls").write_text("李四", encoding="utf-8")
+
+        pool = LibreOfficePool(1, str(soffice), timeout=30)
+        try:
+            assert pool.convert(tmp / "低保.xls", "html", tmp / "out").read_text(encoding="utf-8") == "<table>张三</table>"
+            with pytest.raises(LibreOfficeConversionError, match="timed out"):
+                pool.convert(tmp / "hang.xls", "html", tmp / "out", timeout=0.5)
+            # The worker went back to the pool and keeps serving
+            assert pool.convert(tmp / "低保.xls", "txt:Text (encoded):UTF8", tmp / "out").name == "低保.txt"
+            stats = pool.stats()
+        finally:
+            pool.shutdown()
+
+    assert stats["mode"] == "cli" and stats["conversions"] == 2 and stats["failures"] == 1
+    print("LibreOffice CLI mode test completed")
+
+
+class _FakeProcess:
+    def __init__(self):
+        self.killed = threading.Event()
+
+    def poll(self):
+        return -9 if self.killed.is_set() else None
+
+    def kill(self):
+        self.killed.set()
+
+    def wait(self, timeout=None):
+        return -9
+
+
+class _FakeDocument:
+    def supportsService(self, name):
+        return name == "com.sun.star.sheet.SpreadsheetDocument"
+
+    def storeToURL(self, url, props):
+        Path(url).write_text("<table></table>", encoding="utf-8")
+
+    def close(self, deliver):
+        pass
+
+
+class _FakeDesktop:
+    """loadComponentFromURL hangs on *hang* files until the instance is killed, like a stuck soffice"""
+
+    def __init__(self, process: _FakeProcess):
+        self.process = process
+
+    def loadComponentFromURL(self, url, frame, flags, props):
+        if "hang" in url:
+            self.process.killed.wait(10)
+            raise RuntimeError("Binary URP bridge disposed during call")
+        return _FakeDocument()
+
+
+def test_uno_watchdog_kills_and_restarts(monkeypatch):
+    """A UNO conversion past its timeout kills the instance; the worker is restarted before its next file"""
+    print("Testing LibreOffice UNO watchdog...")
+    monkeypatch.setattr(libreoffice_pool, "UNO_AVAILABLE", True)
+    monkeypatch.setattr(libreoffice_pool, "uno", SimpleNamespace(systemPathToFileUrl=str), raising=False)
+    monkeypatch.setattr(libreoffice_pool, "PropertyValue", SimpleNamespace, raising=False)
+    starts = []
+
+    def fake_start(worker):
+        starts.append(worker.index)
+        worker.profile_dir.mkdir(parents=True, exist_ok=True)
+        worker.process = _FakeProcess()
+        worker.desktop = _FakeDesktop(worker.process)
+
+    monkeypatch.setattr(LibreOfficeWorker, "start", fake_start)
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        (tmp / "低保.xlsx").write_bytes(b"")
+        (tmp / "hang.xlsx").write_bytes(b"")
+
+        pool = LibreOfficePool(1, "soffice", timeout=30)
+        try:
+            assert pool.convert(tmp / "低保.xlsx", "html", tmp / "out").exists()
+            with pytest.raises(LibreOfficeConversionError, match="timed out"):
+                pool.convert(tmp / "hang.xlsx", "html", tmp / "out", timeout=0.2)
+            assert pool.convert(tmp / "低保.xlsx", "html", tmp / "out").exists()
+            stats = pool.stats()
+        finally:
+            pool.shutdown()
+
+    assert starts == [0, 0]  # first use, then the restart after the watchdog kill
+    assert stats["mode"] == "uno" and stats["restarts"] == 1 and stats["failures"] == 1 and stats["conversions"] == 2
+    print("LibreOffice UNO watchdog test completed")
+
+
+if __name__ == "__main__":
+    print("Starting LibreOffice pool test...")
+    print("=" * 50)
+
+    try:
+        if sys.platform != "win32":
+            with pytest.MonkeyPatch.context() as monkeypatch:
+                test_cli_fallback_and_timeout(monkeypatch)
+        with pytest.MonkeyPatch.context() as monkeypatch:
+            test_uno_watchdog_kills_and_restarts(monkeypatch)
+        print("Test completed successfully!")
+
+    except Exception as e:
+        print(f"Test failed: {e}")
+        import traceback
+        print(f"Error details: {traceback.format_exc()}")
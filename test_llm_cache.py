@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+
+import asyncio
+import sys
+import time
+import tempfile
+import threading
+from pathlib import Path
+
+# Set console encoding for Windows
+if sys.platform == 'win32':
+    import subprocess
+    subprocess.run(['chcp', '65001'], shell=True, capture_output=True)
+
+# Add root project directory to sys.path
+sys.path.append(str(Path(__file__).resolve().parent))
+
+from langchain_core.messages import HumanMessage, SystemMessage
+from utils.llm_cache import LLMResponseCache, make_cache_key
+
+
+def test_cache_key_is_canonical():
+    """Same content in different message formats must map to the same key"""
+    print("Testing cache key canonicalisation...")
+    as_objects = [SystemMessage(content="你是助手"), HumanMessage(content="七田村低保名册")]
+    as_tuples = [("system", "你是助手"), ("user", "七田村低保名册")]
+
+    assert make_cache_key("deepseek-ai/DeepSeek-V3", as_objects, 0.2) == make_cache_key("deepseek-ai/DeepSeek-V3", as_tuples, 0.2)
+    assert make_cache_key("deepseek-ai/DeepSeek-V3", as_objects, 0.2) != make_cache_key("deepseek-ai/DeepSeek-V3", as_objects, 0.5)
+    assert make_cache_key("deepseek-ai/DeepSeek-V3", as_objects, 0.2) != make_cache_key("gpt-4o", as_objects, 0.2)
+    print("Cache key test completed")
+
+
+def test_single_flight_and_persistence():
+    """Concurrent identical requests hit the network once, and survive a reopen"""
+    print("Testing single-flight and persistence...")
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = Path(tmp) / "cache.sqlite3"
+        cache = LLMResponseCache(str(db_path))
+        calls = []
+
+        def slow_call():
+            calls.append(1)
+            time.sleep(0.2)
+            return "户主姓名,身份证号码"
+
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(cache.get_or_compute("k", slow_call))) for _ in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        assert len(calls) == 1
+        assert all(value == "户主姓名,身份证号码" for value, _ in results)
+        stats = cache.stats()
+        assert stats["misses"] == 1 and stats["shared_in_flight"] == 7
+        cache.close()
+
+        reopened = LLMResponseCache(str(db_path))
+        value, from_cache = reopened.get_or_compute("k", slow_call)
+        assert from_cache and value == "户主姓名,身份证号码" and len(calls) == 1
+        reopened.close()
+    print("Single-flight test completed")
+
+
+def test_size_eviction():
+    """Least recently used entries are dropped once the size budget is exceeded"""
+    print("Testing size based eviction...")
+    with tempfile.TemporaryDirectory() as tmp:
+        cache = LLMResponseCache(str(Path(tmp) / "cache.sqlite3"), max_bytes=250)
+        for i in range(5):
+            cache.put(f"k{i}", "x" * 100)
+            time.sleep(0.01)
+        assert cache.get("k0") is None
+        assert cache.get("k4") == "x" * 100
+        assert cache.stats()["size_bytes"] <= 250
+        cache.close()
+    print("Eviction test completed")
+
+def test_late_arrival_never_recomputes():
+    """A lookup whose cache miss races with the leader's completion must not call the model again"""
+    print("Testing lookup racing with completion...")
+    with tempfile.TemporaryDirectory() as tmp:
+        cache = LLMResponseCache(str(Path(tmp) / "cache.sqlite3"))
+        release = threading.Event()
+        leader_done = threading.Event()
+        calls = []
+
+        def call():
+            calls.append(1)
+            release.wait(2)
+            return "户主姓名,身份证号码"
+
+        def leader():
+            cache.get_or_compute("k", call)
+            leader_done.set()
+
+        stored_get = cache.get
+
+        def get_then_let_leader_finish(key):
+            # Worst interleaving: the miss is read, then the leader stores its value and leaves
+            value = stored_get(key)
+            if threading.current_thread().name == "late":
+                release.set()
+                leader_done.wait(2)
+            return value
+
+        cache.get = get_then_let_leader_finish
+        first = threading.Thread(target=leader)
+        first.start()
+        while not calls:
+            time.sleep(0.01)
+        late_results = []
+        late = threading.Thread(target=lambda: late_results.append(cache.get_or_compute("k", call)), name="late")
+        late.start()
+        time.sleep(0.1)
+        release.set()
+        first.join()
+        late.join()
+
+        assert len(calls) == 1
+        assert late_results == [("户主姓名,身份证号码", True)]
+        cache.close()
+    print("Late arrival test completed")
+
+
+def test_async_waiters_and_cancelled_leader():
+    """Waiters on the leader's loop hold no executor thread; a cancelled leader hands over to a waiter"""
+    print("Testing async single-flight...")
+
+    async def fan_out(cache):
+        loop = asyncio.get_running_loop()
+        executor_calls = []
+        run_in_executor = loop.run_in_executor
+        loop.run_in_executor = lambda *args: executor_calls.append(args) or run_in_executor(*args)
+        calls = []
+
+        async def call():
+            calls.append(1)
+            await asyncio.sleep(0.2 if len(calls) == 1 else 0.01)
+            return "户主姓名,身份证号码"
+
+        leader = asyncio.create_task(cache.aget_or_compute("k", call))
+        await asyncio.sleep(0.01)
+        waiters = [asyncio.create_task(cache.aget_or_compute("k", call)) for _ in range(20)]
+        await asyncio.sleep(0.05)
+        leader.cancel()
+        results = await asyncio.gather(*waiters)
+        try:
+            await leader
+            assert False, "the leader was cancelled"
+        except asyncio.CancelledError:
+            pass
+        return results, calls, executor_calls
+
+    with tempfile.TemporaryDirectory() as tmp:
+        cache = LLMResponseCache(str(Path(tmp) / "cache.sqlite3"))
+        results, calls, executor_calls = asyncio.run(fan_out(cache))
+        cache.close()
+
+    assert len(calls) == 2  # the cancelled leader's call, then one retry for all 20 waiters
+    assert results.count(("户主姓名,身份证号码", False)) == 1
+    assert results.count(("户主姓名,身份证号码", True)) == 19
+    assert executor_calls == []
+    print("Async single-flight test completed")
+
+
+if __name__ == "__main__":
+    print("Starting LLM response cache test...")
+    print("=" * 50)
+
+    try:
+        test_cache_key_is_canonical()
+        test_single_flight_and_persistence()
+        test_size_eviction()
+        test_late_arrival_never_recomputes()
+        test_async_waiters_and_cancelled_leader()
+        print("Test completed successfully!")
+
+    except Exception as e:
+        print(f"Test failed: {e}")
+        import traceback
+        print(f"Error details: {traceback.format_exc()}")
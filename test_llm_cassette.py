@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+
+import sys
+import json
+import tempfile
+from pathlib import Path
+
+# Set console encoding for Windows
+if sys.platform == 'win32':
+    import subprocess
+    subprocess.run(['chcp', '65001'], shell=True, capture_output=True)
+
+# Add root project directory to sys.path
+sys.path.append(str(Path(__file__).resolve().parent))
+
+import httpx
+from utils.llm_cassette import LLMCassette, CassetteTransport
+
+
+COMPLETION = {
+    "choices": [{"message": {"role": "assistant", "content": "",
+                             "tool_calls": [{"id": "call_1", "type": "function",
+                                             "function": {"name": "f", "arguments": "{\"a\": 1}"}}]}}],
+    "usage": {"prompt_tokens": 12, "completion_tokens": 3, "total_tokens": 15},
+}
+
+
+def _post(client: httpx.Client, content: str) -> httpx.Response:
+    return client.post("http://llm.local/v1/chat/completions",
+                       json={"model": "deepseek-ai/DeepSeek-V3", "messages": [{"role": "user", "content": content}]})
+
+
+def test_record_then_replay_offline():
+    """Recorded responses (tool calls + usage) are served back without touching the network"""
+    print("Testing cassette record/replay...")
+    upstream_calls = []
+
+    def upstream(request: httpx.Request) -> httpx.Response:
+        upstream_calls.append(request)
+        return httpx.Response(200, json=COMPLETION, headers={"x-ratelimit-limit-tokens": "50000"})
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = str(Path(tmp) / "cassette.jsonl.gz")
+        recorder = LLMCassette(path, "record")
+        with httpx.Client(transport=CassetteTransport(httpx.MockTransport(upstream), recorder)) as client:
+            assert _post(client, "你好").json() == COMPLETION
+        recorder.close()
+        assert len(upstream_calls) == 1 and recorder.stats()["recorded"] == 1
+
+        def offline(request: httpx.Request) -> httpx.Response:
+            raise AssertionError("replay must not reach the network")
+
+        player = LLMCassette(path, "replay", latency_mode="none")
+        with httpx.Client(transport=CassetteTransport(httpx.MockTransport(offline), player)) as client:
+            replayed = _post(client, "你好")
+            assert replayed.json() == COMPLETION
+            assert replayed.headers["x-ratelimit-limit-tokens"] == "50000"
+            # unknown prompts fail fast instead of silently going live
+            missed = _post(client, "另一个问题")
+            assert missed.status_code == 404 and json.loads(missed.text)["error"]["type"] == "cassette_miss"
+        assert player.stats()["hits"] == 1 and player.stats()["misses"] == 1
+    print("Cassette test completed")
+
+
+if __name__ == "__main__":
+    print("Starting LLM cassette test...")
+    print("=" * 50)
+
+    try:
+        test_record_then_replay_offline()
+        print("Test completed successfully!")
+
+    except Exception as e:
+        print(f"Test failed: {e}")
+        import traceback
+        print(f"Error details: {traceback.format_exc()}")
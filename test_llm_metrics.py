@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+
+import sys
+import json
+import tempfile
+import threading
+from pathlib import Path
+
+# Set console encoding for Windows
+if sys.platform == 'win32':
+    import subprocess
+    subprocess.run(['chcp', '65001'], shell=True, capture_output=True)
+
+# Add root project directory to sys.path
+sys.path.append(str(Path(__file__).resolve().parent))
+
+from utils.llm_metrics import (get_metrics_registry, set_metrics_session, start_llm_call, note_http_response,
+                               write_session_report)
+
+
+def test_session_report():
+    """Calls are grouped per model and per node, with retries and 429s counted"""
+    print("Testing LLM metrics session report...")
+    set_metrics_session("metrics-test")
+
+    for i in range(4):
+        call = start_llm_call("deepseek-ai/DeepSeek-V3")
+        if i == 0:
+            note_http_response(429)
+        note_http_response(200)
+        call.set_usage({"input_tokens": 100, "output_tokens": 20, "output_token_details": {"reasoning": 5}})
+        call.finish()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        json_path = write_session_report("metrics-test", base_dir=tmp)
+        report = json.loads(json_path.read_text(encoding="utf-8"))
+        assert (Path(tmp) / "metrics-test" / "llm_metrics.csv").exists()
+
+    model_summary = report["by_model"]["deepseek-ai/DeepSeek-V3"]
+    assert model_summary["calls"] == 4
+    assert model_summary["prompt_tokens"] == 400 and model_summary["reasoning_tokens"] == 20
+    assert model_summary["retries"] == 1 and model_summary["rate_limited"] == 1
+    assert model_summary["latency_p50"] is not None
+    assert sum(node["calls"] for node in report["by_node"].values()) == 4
+    print("Metrics report test completed")
+
+def test_concurrent_sessions_and_cap(monkeypatch):
+    """Sessions running at the same time in different threads keep their own labels; old records are dropped"""
+    print("Testing concurrent metrics sessions...")
+    monkeypatch.setenv("LLM_METRICS_MAX_CALLS", "30")
+    started = threading.Barrier(2)
+
+    def run_session(session_id):
+        set_metrics_session(session_id)
+        started.wait()  # both sessions are set before either records a call
+        for _ in range(10):
+            start_llm_call("deepseek-ai/DeepSeek-V3").finish()
+
+    threads = [threading.Thread(target=run_session, args=(f"会话{i}",)) for i in range(2)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    registry = get_metrics_registry()
+    assert len(registry.calls("会话0")) == 10 and len(registry.calls("会话1")) == 10
+
+    set_metrics_session("会话2")
+    for _ in range(20):
+        start_llm_call("deepseek-ai/DeepSeek-V3").finish()
+    assert len(registry.calls()) == 30 and len(registry.calls("会话2")) == 20
+    print("Concurrent metrics sessions test completed")
+
+
+if __name__ == "__main__":
+    import pytest
+
+    print("Starting LLM metrics test...")
+    print("=" * 50)
+
+    try:
+        test_session_report()
+        with pytest.MonkeyPatch.context() as monkeypatch:
+            test_concurrent_sessions_and_cap(monkeypatch)
+        print("Test completed successfully!")
+
+    except Exception as e:
+        print(f"Test failed: {e}")
+        import traceback
+        print(f"Error details: {traceback.format_exc()}")
@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+# Set console encoding for Windows
+if sys.platform == 'win32':
+    import subprocess
+    subprocess.run(['chcp', '65001'], shell=True, capture_output=True)
+
+# Add root project directory to sys.path
+sys.path.append(str(Path(__file__).resolve().parent))
+
+from utils.local_fill import build_local_fill, merge_llm_rows, parse_headers_mapping
+
+
+CORE_HEADER = "序号,户主姓名,身份证号码,保障人数,重点保障人数,残疾人数"
+AID_HEADER = "序号,姓名,公民身份号码,领取金额,领款时间"
+
+HEADERS_MAPPING = """{
+  "表格结构": {
+    "基本信息": [
+      "城保名册.xls: 序号",
+      "城保名册.xls: 户主姓名",
+      "城保名册.xls/补贴发放.xls: 身份证号码",
+      "推理规则: 居民类型(城保/农保) - 城保名册中的记录均为'城保'"
+    ],
+    "保障人数": {"值": [], "分解": {"重点保障人数": ["城保名册.xls: 保障人数.分解.重点保障人数"]}, "规则": ""},
+    "领取金额": ["补贴发放.xls: 领取金额"],
+    "领款时间": ["补贴发放.xls: 领款时间"]
+  }
+}"""
+
+
+def _build(tmp: Path) -> dict:
+    csv_dir = tmp / "files" / "村" / "table_files" / "CSV_files"
+    csv_dir.mkdir(parents=True)
+    (csv_dir / "城保名册.csv").write_text(
+        "\n".join(f"{CORE_HEADER}\n{i + 1},张{i},1101{i:014d},2,{i % 3},1" for i in range(5)) + "\n", encoding="utf-8")
+    # Reference rows in another order, one ID written with a space, person 3 missing
+    (csv_dir / "补贴发放.csv").write_text(
+        AID_HEADER + "\n4,张4,1101 00000000000004,600.00,2024-01-10\n"
+        "1,张0,110100000000000000,450.50,2024-01-10\n2,张1,110100000000000001,\"1,200\",\n3,张2,110100000000000002,300,2024-01-11\n",
+        encoding="utf-8")
+    cwd = os.getcwd()
+    os.chdir(tmp)
+    try:
+        return build_local_fill(HEADERS_MAPPING, "x/城保名册.xls", ["x/城保名册.xls", "x/补贴发放.xls"], "村")
+    finally:
+        os.chdir(cwd)
+
+
+def test_direct_sources_are_joined_locally():
+    """Core columns are copied, reference columns joined by ID, the rule column is left to the model"""
+    print("Testing local fill of direct sources...")
+    assert [column.name for column in parse_headers_mapping(HEADERS_MAPPING)] == \
+        ["序号", "户主姓名", "身份证号码", "居民类型", "重点保障人数", "领取金额", "领款时间"]
+    with tempfile.TemporaryDirectory() as tmp:
+        local_fill = _build(Path(tmp))
+
+    assert local_fill["llm_columns"] == ["居民类型"]
+    assert local_fill["row_ids"] == ["R1", "R2", "R3", "R4", "R5"]
+    assert local_fill["rows"][1] == ["2", "张1", "110100000000000001", None, "1", "1,200", ""]
+    assert local_fill["rows"][3][5:] == [None, None]  # nobody to join with
+    assert local_fill["rows"][4][5:] == ["600.00", "2024-01-10"]
+    assert "居民类型" in local_fill["llm_mapping"] and "户主姓名" not in local_fill["llm_mapping"]
+    print("local fill test completed")
+
+
+def test_model_rows_are_placed_by_row_id():
+    """Rows come back out of order; untagged, unknown and duplicate IDs are never placed by position"""
+    print("Testing merge of model rows...")
+    with tempfile.TemporaryDirectory() as tmp:
+        local_fill = _build(Path(tmp))
+
+    rows = merge_llm_rows(local_fill, ["R3,城保", "R1,城保", "农保", "R9,农保", "R3,农保", "R5,城保"])
+    assert rows[0] == "1,张0,110100000000000000,城保,0,450.50,2024-01-10"
+    assert rows[2] == '3,张2,110100000000000002,城保,2,300,2024-01-11'  # the duplicate R3 is dropped
+    assert [row.split(",")[3] for row in rows] == ["城保", "", "城保", "", "城保"]  # no positional fallback
+    print("merge of model rows test completed")
+
+def test_needs_row_ids_for_model_columns(monkeypatch):
+    """Without the compact encoding the chunks carry no row IDs, so everything goes to the model"""
+    print("Testing local fill without row IDs...")
+    monkeypatch.setenv("COMPACT_CHUNK_ENCODING", "0")
+    with tempfile.TemporaryDirectory() as tmp:
+        assert _build(Path(tmp)) == {}
+    print("local fill without row IDs test completed")
+
+
+if __name__ == "__main__":
+    import pytest
+
+    print("Starting local fill test...")
+    print("=" * 50)
+
+    try:
+        test_direct_sources_are_joined_locally()
+        test_model_rows_are_placed_by_row_id()
+        with pytest.MonkeyPatch.context() as monkeypatch:
+            test_needs_row_ids_for_model_columns(monkeypatch)
+        print("Test completed successfully!")
+
+    except Exception as e:
+        print(f"Test failed: {e}")
+        import traceback
+        print(f"Error details: {traceback.format_exc()}")
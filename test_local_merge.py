@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+# Set console encoding for Windows
+if sys.platform == 'win32':
+    import subprocess
+    subprocess.run(['chcp', '65001'], shell=True, capture_output=True)
+
+# Add root project directory to sys.path
+sys.path.append(str(Path(__file__).resolve().parent))
+
+from utils.chunk_encoding import decode_records
+from utils.file_process import process_excel_files_for_merge
+from utils.local_fill import merge_llm_rows
+from utils.local_merge import build_local_merge, file_rule_values
+
+
+CITY_HEADER = "序号,户主姓名,身份证号码,重点保障人数,残疾人数,家庭住址"
+RURAL_HEADER = "序号,姓名,身份证号码,重点保障人数,残疾人数,家庭住址"
+
+HEADERS_MAPPING = """{
+  "表格结构": {
+    "基本信息": [
+      "城保名册.xls/农保名册.xls: 序号",
+      "城保名册.xls/农保名册.xls: 户主姓名",
+      "城保名册.xls/农保名册.xls: 身份证号码",
+      "推理规则: 居民类型(城保/农保) - 根据文件名自动判断，城保名册.xls对应'城保'，农保名册.xls对应'农保'"
+    ],
+    "保障人数": {"值": [], "分解": {
+      "重点保障人数": ["城保名册.xls/农保名册.xls: 重点保障人数"],
+      "残疾人数": ["城保名册.xls/农保名册.xls: 残疾人数"]}, "规则": "重点保障人数 + 残疾人数"},
+    "所属组": ["推理规则: 根据家庭住址判断所属村民小组"]
+  }
+}"""
+
+
+def _write_village(tmp: Path) -> None:
+    csv_dir = tmp / "files" / "村" / "table_files" / "CSV_files"
+    csv_dir.mkdir(parents=True)
+    (csv_dir / "城保名册.csv").write_text(
+        "\n".join(f"{CITY_HEADER}\n{i + 1},张{i},1101{i:014d},{i},1,一组{i}号" for i in range(3)) + "\n", encoding="utf-8")
+    (csv_dir / "农保名册.csv").write_text(
+        "\n".join(f"{RURAL_HEADER}\n{i + 1},李{i},3201{i:014d},2,0,二组{i}号" for i in range(2)) + "\n", encoding="utf-8")
+
+
+def test_rows_are_stacked_locally():
+    """Columns align across files, the filename rule and the formula are filled, the rest is left to the model"""
+    print("Testing local merge...")
+    assert file_rule_values("居民类型(城保/农保) - 城保名册中的记录均为'城保'", ["城保名册", "农保名册"]) == \
+        {"城保名册": "城保", "农保名册": "农保"}
+    assert file_rule_values("根据家庭住址判断所属村民小组", ["城保名册", "农保名册"]) is None
+
+    with tempfile.TemporaryDirectory() as tmp:
+        _write_village(Path(tmp))
+        cwd = os.getcwd()
+        os.chdir(tmp)
+        try:
+            local_fill = build_local_merge(HEADERS_MAPPING, ["x/城保名册.xls", "x/农保名册.xls"], "村")
+        finally:
+            os.chdir(cwd)
+
+    assert local_fill["columns"] == ["序号", "户主姓名", "身份证号码", "居民类型", "保障人数", "重点保障人数", "残疾人数", "所属组"]
+    # 农保名册 calls the column 姓名: aligning it is left to the model together with 所属组
+    assert local_fill["llm_columns"] == ["户主姓名", "所属组"] and list(local_fill["computed"]) == ["保障人数"]
+    assert local_fill["rows"][3] == ["1", None, "320100000000000000", "农保", None, "2", "0", None]
+    assert local_fill["context_columns"] == {"城保名册": ["户主姓名", "身份证号码", "家庭住址"],
+                                             "农保名册": ["姓名", "身份证号码", "家庭住址"]}
+
+    names = ["张0", "张1", "张2", "李0", "李1"]
+    rows = merge_llm_rows(local_fill, [f"R{i + 1},{names[i]},{group}" for i, group in enumerate("一一一二二")])
+    assert rows[0] == "1,张0,110100000000000000,城保,1,0,1,一"
+    assert rows[4] == "2,李1,320100000000000001,农保,2,2,0,二"
+    print("local merge test completed")
+
+
+def test_merge_chunks_carry_only_context_columns():
+    """Chunks for the remaining columns keep the row IDs of the local merge and drop the other fields"""
+    print("Testing projected merge chunks...")
+    with tempfile.TemporaryDirectory() as tmp:
+        _write_village(Path(tmp))
+        cwd = os.getcwd()
+        os.chdir(tmp)
+        try:
+            chunks = process_excel_files_for_merge(
+                ["x/城保名册.xls", "x/农保名册.xls"], village_name="村", chunk_nums=2,
+                keep_columns={"城保名册": ["户主姓名", "家庭住址"], "农保名册": ["身份证号码", "家庭住址"]})["combined_chunks"]
+        finally:
+            os.chdir(cwd)
+
+    records = [record for chunk in chunks for record in decode_records(chunk)]
+    assert [record_id for record_id, _, _ in records] == ["R1", "R2", "R3", "R4", "R5"]
+    assert records[0][1:] == ("户主姓名,家庭住址", "张0,一组0号")
+    assert records[4][1:] == ("身份证号码,家庭住址", "320100000000000001,二组1号")
+    print("projected merge chunks test completed")
+
+
+if __name__ == "__main__":
+    print("Starting local merge test...")
+    print("=" * 50)
+
+    try:
+        test_rows_are_stacked_locally()
+        test_merge_chunks_carry_only_context_columns()
+        print("Test completed successfully!")
+
+    except Exception as e:
+        print(f"Test failed: {e}")
+        import traceback
+        print(f"Error details: {traceback.format_exc()}")
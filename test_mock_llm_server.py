@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+
+import json
+import sys
+import tempfile
+from pathlib import Path
+
+# Set console encoding for Windows
+if sys.platform == 'win32':
+    import subprocess
+    subprocess.run(['chcp', '65001'], shell=True, capture_output=True)
+
+# Add root project directory to sys.path
+sys.path.append(str(Path(__file__).resolve().parent))
+
+from fastapi.testclient import TestClient
+from utils.mock_llm_server import MockLLMConfig, create_app, load_script_file
+
+
+FILLOUT_PROMPT = [
+    {"role": "system", "content": "按表头映射填写表格，先写推理过程，再以 === 最终答案 === 开始输出CSV"},
+    {"role": "user", "content": "--- 数据条目 1 ---\n数据: 张三,110101199001051234\n--- 数据条目 2 ---\n数据: 李四,110101198507091236"},
+]
+
+
+def _client(**options) -> TestClient:
+    return TestClient(create_app(MockLLMConfig(ttft=0, ttft_jitter=0, tps=100000, seed=1, **options)))
+
+
+def _events(response) -> list[dict]:
+    lines = [line for line in response.iter_lines() if line.startswith("data: ")]
+    assert lines[-1] == "data: [DONE]"
+    return [json.loads(line[len("data: "):]) for line in lines[:-1]]
+
+
+def test_replies_and_streamed_tool_calls():
+    """Scripted non-streaming reply with usage; a streamed reply carries the tool call as SSE deltas"""
+    print("Testing mock LLM replies...")
+    with tempfile.TemporaryDirectory() as tmp:
+        script_path = Path(tmp) / "script.json"
+        script_path.write_text(json.dumps([{"match": "请核对名单", "tool_calls": [
+            {"name": "request_user_clarification", "arguments": {"question": "是否包含农保名册？"}}]}],
+            ensure_ascii=False), encoding="utf-8")
+        scripts = load_script_file(str(script_path))
+
+    with _client(scripts=scripts) as client:
+        reply = client.post("/v1/chat/completions", json={"model": "mock", "messages": FILLOUT_PROMPT}).json()
+        content = reply["choices"][0]["message"]["content"]
+        assert content.split("=== 最终答案 ===\n")[1].splitlines() == ["张三,110101199001051234", "李四,110101198507091236"]
+        assert reply["usage"]["total_tokens"] == reply["usage"]["prompt_tokens"] + reply["usage"]["completion_tokens"]
+
+        with client.stream("POST", "/v1/chat/completions", json={
+                "model": "mock", "stream": True, "stream_options": {"include_usage": True},
+                "messages": [{"role": "user", "content": "请核对名单"}],
+                "tools": [{"type": "function", "function": {"name": "request_user_clarification", "parameters": {}}}]}) as response:
+            assert response.headers["content-type"].startswith("text/event-stream")
+            events = _events(response)
+        stats = client.get("/stats").json()
+
+    calls = [call for event in events for choice in event["choices"] for call in choice["delta"].get("tool_calls", [])]
+    assert [call["function"]["name"] for call in calls] == ["request_user_clarification"]
+    assert json.loads(calls[0]["function"]["arguments"]) == {"question": "是否包含农保名册？"}
+    assert events[-2]["choices"][0]["finish_reason"] == "tool_calls"
+    assert events[-1]["usage"]["completion_tokens"] >= 1
+    assert stats["requests"] == 2 and stats["in_flight"] == 0
+    print("mock LLM replies test completed")
+
+
+def test_rate_limit_injection():
+    """Injected and RPM 429s carry retry-after and x-ratelimit headers"""
+    print("Testing mock LLM 429 injection...")
+    with _client(rate_429=1.0, retry_after=2.5) as client:
+        response = client.post("/v1/chat/completions", json={"model": "mock", "messages": FILLOUT_PROMPT})
+    assert response.status_code == 429
+    assert response.headers["retry-after"] == "2.5"
+    assert response.json()["error"]["type"] == "rate_limit_exceeded"
+
+    with _client(rpm=1) as client:
+        first = client.post("/v1/chat/completions", json={"model": "mock", "messages": FILLOUT_PROMPT})
+        second = client.post("/v1/chat/completions", json={"model": "mock", "messages": FILLOUT_PROMPT})
+        stats = client.get("/stats").json()
+    assert first.status_code == 200 and first.headers["x-ratelimit-remaining-requests"] == "0"
+    assert second.status_code == 429 and float(second.headers["retry-after"]) > 0
+    assert second.headers["x-ratelimit-limit-requests"] == "1"
+    assert stats["rate_limited"] == 1
+    print("mock LLM 429 injection test completed")
+
+
+if __name__ == "__main__":
+    print("Starting mock LLM server test...")
+    print("=" * 50)
+
+    try:
+        test_replies_and_streamed_tool_calls()
+        test_rate_limit_injection()
+        print("Test completed successfully!")
+
+    except Exception as e:
+        print(f"Test failed: {e}")
+        import traceback
+        print(f"Error details: {traceback.format_exc()}")
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+
+import sys
+import tempfile
+from pathlib import Path
+
+# Set console encoding for Windows
+if sys.platform == 'win32':
+    import subprocess
+    subprocess.run(['chcp', '65001'], shell=True, capture_output=True)
+
+# Add root project directory to sys.path
+sys.path.append(str(Path(__file__).resolve().parent))
+
+import openpyxl
+from utils.native_converters import convert_natively
+from utils.file_process import _read_text_auto
+
+
+def test_xlsx_merged_cells():
+    """Merged ranges become colspan/rowspan and covered cells are dropped"""
+    print("Testing xlsx conversion...")
+    workbook = openpyxl.Workbook()
+    sheet = workbook.active
+    sheet.title = "低保"
+    sheet["A1"] = "燕云村低保名单"
+    sheet.merge_cells("A1:C1")
+    sheet.append(["户主姓名", "身份证号码", "人数"])
+    sheet.append(["张三", "110101199001011234", 3.0])
+    sheet["B5"].number_format = "0.00"  # formatted but empty cell must not add rows
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / "低保.xlsx"
+        workbook.save(path)
+        html = convert_natively(path, _read_text_auto)
+
+    assert '<td colspan="3">燕云村低保名单</td>' in html
+    assert "<td>3</td>" in html
+    assert html.count("<tr>") == 3
+    print("xlsx conversion test completed")
+
+
+def test_xlsx_number_formats():
+    """Fixed-decimal, thousands and percent formats render the way LibreOffice shows them"""
+    print("Testing xlsx number formats...")
+    workbook = openpyxl.Workbook()
+    sheet = workbook.active
+    sheet.append(["人数", "补助金额", "比例", "编号"])
+    sheet.append([3, 1234.565, 0.125, 2.5])
+    sheet["A2"].number_format = "0.00"
+    sheet["B2"].number_format = "#,##0.00"
+    sheet["C2"].number_format = "0.0%"
+    sheet["D2"].number_format = "0"
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / "补助.xlsx"
+        workbook.save(path)
+        html = convert_natively(path, _read_text_auto)
+
+    assert "<td>3.00</td>\n<td>1,234.57</td>\n<td>12.5%</td>\n<td>3</td>" in html
+    print("xlsx number formats test completed")
+
+
+def test_csv_and_unsupported():
+    """CSV goes through the csv module; formats without a native converter return None"""
+    print("Testing csv conversion...")
+    with tempfile.TemporaryDirectory() as tmp:
+        csv_path = Path(tmp) / "名单.csv"
+        csv_path.write_text("姓名,年龄\n张三,30\n", encoding="gbk")
+        html = convert_natively(csv_path, _read_text_auto)
+        assert "<td>张三</td>" in html and html.count("<tr>") == 2
+
+        ods_path = Path(tmp) / "名单.ods"
+        ods_path.write_bytes(b"")
+        assert convert_natively(ods_path, _read_text_auto) is None
+    print("csv conversion test completed")
+
+
+if __name__ == "__main__":
+    print("Starting native converter test...")
+    print("=" * 50)
+
+    try:
+        test_xlsx_merged_cells()
+        test_xlsx_number_formats()
+        test_csv_and_unsupported()
+        print("Test completed successfully!")
+
+    except Exception as e:
+        print(f"Test failed: {e}")
+        import traceback
+        print(f"Error details: {traceback.format_exc()}")
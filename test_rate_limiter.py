@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+
+import sys
+from pathlib import Path
+
+# Set console encoding for Windows
+if sys.platform == 'win32':
+    import subprocess
+    subprocess.run(['chcp', '65001'], shell=True, capture_output=True)
+
+# Add root project directory to sys.path
+sys.path.append(str(Path(__file__).resolve().parent))
+
+import httpx
+from utils.modelRelated import LLMRateLimiter, _parse_reset_duration
+
+
+def test_tpm_budget_spaces_out_chunks():
+    """Chunks beyond the per-minute token budget are delayed instead of sent at once"""
+    print("Testing TPM reservation...")
+    limiter = LLMRateLimiter()
+    waits = [limiter.reserve("siliconflow", "deepseek-ai/DeepSeek-V3", 20000) for _ in range(4)]
+
+    # default siliconflow budget is 50k tokens/minute: two chunks go immediately, the rest wait
+    assert waits[0] == 0 and waits[1] == 0
+    assert 10 < waits[2] < waits[3] <= 60
+    print(f"Waits: {[round(w, 1) for w in waits]}")
+
+
+def test_learns_limits_from_headers():
+    """x-ratelimit-* and retry-after headers adjust the limiter for every caller"""
+    print("Testing header learning...")
+    limiter = LLMRateLimiter()
+    limiter.observe_headers("openai", "gpt-4o", httpx.Headers({
+        "x-ratelimit-limit-requests": "60",
+        "x-ratelimit-limit-tokens": "10000",
+    }), 200)
+    assert limiter.stats()["limits"]["openai/gpt-4o"] == {"rpm": 60.0, "tpm": 10000.0}
+
+    limiter.observe_headers("openai", "gpt-4o", httpx.Headers({"retry-after": "5"}), 429)
+    assert 4 < limiter.reserve("openai", "gpt-4o", 10) <= 5
+
+    assert _parse_reset_duration("6m0s") == 360
+    assert abs(_parse_reset_duration("120ms") - 0.12) < 1e-9
+    print("Header learning test completed")
+
+
+if __name__ == "__main__":
+    print("Starting LLM rate limiter test...")
+    print("=" * 50)
+
+    try:
+        test_tpm_budget_spaces_out_chunks()
+        test_learns_limits_from_headers()
+        print("Test completed successfully!")
+
+    except Exception as e:
+        print(f"Test failed: {e}")
+        import traceback
+        print(f"Error details: {traceback.format_exc()}")
@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+
+import json
+import os
+import re
+import sys
+import tempfile
+from pathlib import Path
+
+# Set console encoding for Windows
+if sys.platform == 'win32':
+    import subprocess
+    subprocess.run(['chcp', '65001'], shell=True, capture_output=True)
+
+# Add root project directory to sys.path
+sys.path.append(str(Path(__file__).resolve().parent))
+
+from utils.file_process import process_excel_files_for_integration
+
+
+CORE_HEADER = "序号,户主姓名,身份证号码,家庭人口"
+AID_HEADER = "序号,姓名,公民身份号码,补贴金额"
+NOTE_HEADER = "序号,事项,备注"
+
+
+def _write_village(root: Path) -> None:
+    csv_dir = root / "files" / "村" / "table_files" / "CSV_files"
+    csv_dir.mkdir(parents=True)
+    (csv_dir / "花名册.csv").write_text(
+        "\n".join(f"{CORE_HEADER}\n{i},张{i},1101{i:014d},{i % 5 + 1}" for i in range(40)) + "\n", encoding="utf-8")
+    # Every 4th core person receives aid; ID written with a space and a lowercase x must still match
+    aid_rows = [f"{i},张{i},1101 {i:014d},{100 + i}" for i in range(0, 40, 4)] + ["99,外村人,3201000000000000x,50"]
+    (csv_dir / "补贴.csv").write_text(AID_HEADER + "\n" + "\n".join(aid_rows) + "\n", encoding="utf-8")
+    (csv_dir / "说明.csv").write_text(NOTE_HEADER + "\n1,发放时间,每月10日\n", encoding="utf-8")
+    (root / "data.json").write_text(json.dumps({"村": {"表格": {}}}), encoding="utf-8")
+
+
+def _integrate(root: Path) -> list[str]:
+    cwd = os.getcwd()
+    os.chdir(root)
+    try:
+        result = process_excel_files_for_integration(
+            ["x/花名册.xlsx", "x/补贴.xlsx", "x/说明.xlsx"], "补充", chunk_nums=4,
+            data_json_path="data.json", village_name="村")
+    finally:
+        os.chdir(cwd)
+    return result["combined_chunks"]
+
+
+def test_chunks_carry_only_matching_reference_rows():
+    """Each chunk gets the aid rows of its own people; the unkeyed file is still attached in full"""
+    print("Testing join-key filtered reference data...")
+    with tempfile.TemporaryDirectory() as tmp:
+        _write_village(Path(tmp))
+        chunks = _integrate(Path(tmp))
+
+    assert len(chunks) == 4
+    for chunk in chunks:
+        core_section, aid_section = chunk.split("补贴.xlsx 的表格数据 ===\n", 1)
+        aid_section = aid_section.split("\n\n", 1)[0]
+        core_ids = set(re.findall(r"1101\d{14}", core_section))
+        aid_ids = set(re.findall(r"1101\d{14}", aid_section.replace(" ", "")))
+        assert aid_ids and aid_ids <= core_ids
+        assert AID_HEADER in aid_section and "外村人" not in chunk
+        assert "发放时间,每月10日" in chunk
+    print("filtered reference data test completed")
+
+
+def test_filter_can_be_disabled():
+    """REFERENCE_JOIN_FILTER=0 attaches every reference file in full"""
+    print("Testing disabled reference filter...")
+    os.environ["REFERENCE_JOIN_FILTER"] = "0"
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            _write_village(Path(tmp))
+            chunks = _integrate(Path(tmp))
+    finally:
+        del os.environ["REFERENCE_JOIN_FILTER"]
+
+    assert all("外村人" in chunk and "【关联筛选】" not in chunk for chunk in chunks)
+    print("disabled reference filter test completed")
+
+
+if __name__ == "__main__":
+    print("Starting reference join test...")
+    print("=" * 50)
+
+    try:
+        test_chunks_carry_only_matching_reference_rows()
+        test_filter_can_be_disabled()
+        print("Test completed successfully!")
+
+    except Exception as e:
+        print(f"Test failed: {e}")
+        import traceback
+        print(f"Error details: {traceback.format_exc()}")
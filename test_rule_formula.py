@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+import pandas as pd
+
+# Set console encoding for Windows
+if sys.platform == 'win32':
+    import subprocess
+    subprocess.run(['chcp', '65001'], shell=True, capture_output=True)
+
+# Add root project directory to sys.path
+sys.path.append(str(Path(__file__).resolve().parent))
+
+from utils.local_fill import build_local_fill, merge_llm_rows
+from utils.rule_formula import compile_formula, try_compile_formula
+
+
+NAMES = ["户主姓名", "家庭补差", "重点救助60元", "重点救助100元", "残疾人救助", "领取金额", "领款人签字(章)"]
+
+HEADERS_MAPPING = """{
+  "表格结构": {
+    "户主姓名": ["城保名册.xls: 户主姓名"],
+    "重点保障人数": ["城保名册.xls: 重点保障人数"],
+    "残疾人数": ["城保名册.xls: 残疾人数"],
+    "保障人数": {"值": [], "分解": {}, "规则": "重点保障人数 + 残疾人数"},
+    "家庭规模": {"值": [], "分解": {}, "规则": "如果 保障人数 > 2 则 \\"多人\\" 否则 \\"单人\\""},
+    "居民类型": ["推理规则: 城保名册中的记录均为'城保'"]
+  }
+}"""
+
+
+def test_formulas_evaluate_over_columns():
+    """Sums skip thousands separators and treat blanks as 0; conditionals and full-width operators work"""
+    print("Testing rule formulas...")
+    frame = pd.DataFrame({"户主姓名": ["张三", "李四", "王五"], "家庭补差": ["1,200", "300元", ""],
+                          "重点救助60元": ["60", "", "60"], "重点救助100元": ["100", "", ""],
+                          "残疾人救助": ["80", "0", "x"], "领取金额": ["", "", ""], "领款人签字(章)": ["", "", ""]})
+    total = compile_formula("领取金额 = 家庭补差 + 重点救助60元 + 重点救助100元 + 残疾人救助", NAMES, "领取金额")
+    assert total.references == ["家庭补差", "重点救助60元", "重点救助100元", "残疾人救助"]
+    assert total.evaluate(frame).tolist() == ["1440", "300", ""]
+    assert compile_formula("（家庭补差 － 重点救助60元）÷ 2", NAMES).evaluate(frame).tolist() == ["570", "150", "-30"]
+    assert compile_formula("如果 家庭补差 >= 1000 则 户主姓名 否则 \"无\"", NAMES).evaluate(frame).tolist() == \
+        ["张三", "无", "无"]
+    assert compile_formula("ROUND(家庭补差 * 10%, 0)", NAMES).evaluate(frame).tolist() == ["120", "30", "0"]
+
+    assert try_compile_formula("低保证号 + 1", NAMES) is None  # not a column of the table
+    assert try_compile_formula("__import__('os').system('x')", NAMES) is None
+    assert try_compile_formula("城保名册中的记录均为'城保'", NAMES) is None
+    print("rule formulas test completed")
+
+
+def test_computed_columns_skip_the_model():
+    """规则 columns are computed after the model's rows are merged, from each other in dependency order"""
+    print("Testing computed columns in local fill...")
+    with tempfile.TemporaryDirectory() as tmp:
+        csv_dir = Path(tmp) / "files" / "村" / "table_files" / "CSV_files"
+        csv_dir.mkdir(parents=True)
+        (csv_dir / "城保名册.csv").write_text(
+            "\n".join(f"户主姓名,重点保障人数,残疾人数\n张{i},{i},1" for i in range(4)) + "\n", encoding="utf-8")
+        cwd = os.getcwd()
+        os.chdir(tmp)
+        try:
+            local_fill = build_local_fill(HEADERS_MAPPING, "x/城保名册.xls", ["x/城保名册.xls"], "村")
+        finally:
+            os.chdir(cwd)
+
+    assert local_fill["llm_columns"] == ["居民类型"]
+    assert list(local_fill["computed"]) == ["保障人数", "家庭规模"]
+    assert "保障人数" not in local_fill["llm_mapping"]
+    rows = merge_llm_rows(local_fill, ["R1,城保", "R2,城保", "R3,城保", "R4,城保"])
+    assert rows == ["张0,0,1,1,单人,城保", "张1,1,1,2,单人,城保", "张2,2,1,3,多人,城保", "张3,3,1,4,多人,城保"]
+    print("computed columns test completed")
+
+
+if __name__ == "__main__":
+    print("Starting rule formula test...")
+    print("=" * 50)
+
+    try:
+        test_formulas_evaluate_over_columns()
+        test_computed_columns_skip_the_model()
+        print("Test completed successfully!")
+
+    except Exception as e:
+        print(f"Test failed: {e}")
+        import traceback
+        print(f"Error details: {traceback.format_exc()}")
@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+
+import sys
+import threading
+import time
+from pathlib import Path
+
+# Set console encoding for Windows
+if sys.platform == 'win32':
+    import subprocess
+    subprocess.run(['chcp', '65001'], shell=True, capture_output=True)
+
+# Add root project directory to sys.path
+sys.path.append(str(Path(__file__).resolve().parent))
+
+from utils.stage_pipeline import Stage, run_pipeline
+
+
+def test_completion_order_and_error_isolation():
+    """Slow items do not hold back fast ones; a failing item skips later stages only for itself"""
+    print("Testing pipeline ordering...")
+    seen_by_last_stage = []
+
+    def convert(item):
+        if item["n"] == 2:
+            raise ValueError("corrupt file")
+        time.sleep(0.3 if item["n"] == 0 else 0.01)
+        item["converted"] = True
+        return item
+
+    def store(item):
+        seen_by_last_stage.append(item["n"])
+        return item
+
+    stats = {}
+    items = [{"n": n, "label": f"file_{n}"} for n in range(5)]
+    results = list(run_pipeline(items, [Stage("convert", convert, 3), Stage("store", store, 1)], queue_size=2, stats=stats))
+
+    assert sorted(r["n"] for r in results) == [0, 1, 2, 3, 4]
+    assert results[-1]["n"] == 0  # the slow file finishes last
+    failed = [r for r in results if "error" in r]
+    assert len(failed) == 1 and failed[0]["n"] == 2 and "convert" in failed[0]["error"]
+    assert 2 not in seen_by_last_stage
+    assert stats["convert"]["errors"] == 1 and stats["store"]["items"] == 4
+    print("pipeline ordering test completed")
+
+
+def test_stage_concurrency_is_bounded():
+    """A stage never runs more items at once than its worker count"""
+    print("Testing stage concurrency...")
+    lock = threading.Lock()
+    active = {"now": 0, "peak": 0}
+
+    def slow(item):
+        with lock:
+            active["now"] += 1
+            active["peak"] = max(active["peak"], active["now"])
+        time.sleep(0.02)
+        with lock:
+            active["now"] -= 1
+        return item
+
+    results = list(run_pipeline(({"n": n} for n in range(20)), [Stage("slow", slow, 3)]))
+    assert len(results) == 20 and active["peak"] <= 3
+    print("stage concurrency test completed")
+
+
+if __name__ == "__main__":
+    print("Starting stage pipeline test...")
+    print("=" * 50)
+
+    try:
+        test_completion_order_and_error_isolation()
+        test_stage_concurrency_is_bounded()
+        print("Test completed successfully!")
+
+    except Exception as e:
+        print(f"Test failed: {e}")
+        import traceback
+        print(f"Error details: {traceback.format_exc()}")
@@ -0,0 +1,167 @@
+"""
+上传文件转换产物缓存（按文件内容寻址）
+
+同一份花名册 .xls 会在不同会话、不同村反复上传。这里以原始文件字节的 SHA-256 + 转换器版本为键，
+把转换结果（清洗后的 txt/HTML、重构后的 CSV、表格结构分析结果）和行数存入本地 SQLite，
+再次上传相同文件时直接取出结果，几乎只剩一次文件复制的开销。
+
+- 默认开启，ARTIFACT_CACHE_ENABLED=0 关闭
+- ARTIFACT_CACHE_PATH: 缓存文件路径（默认 conversations/artifact_cache.sqlite3）
+- ARTIFACT_CACHE_MAX_MB: 总大小上限，超出后按最近访问时间淘汰（默认 1024）
+"""
+
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Optional
+
+
+def file_digest(path: str | Path, block_size: int = 1024 * 1024) -> str:
+    """原始文件字节的 SHA-256"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class FileArtifactCache:
+    """SQLite backed artifact store keyed by (file digest, artifact kind, converter version) with LRU eviction"""
+
+    def __init__(self, db_path: str, max_bytes: int = 1024 * 1024 * 1024):
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        self._conn = sqlite3.connect(str(self.db_path), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS artifacts ("
+            " digest TEXT NOT NULL,"
+            " kind TEXT NOT NULL,"
+            " version TEXT NOT NULL,"
+            " content TEXT NOT NULL,"
+            " row_count INTEGER,"
+            " source_name TEXT,"
+            " size INTEGER NOT NULL,"
+            " created_at REAL NOT NULL,"
+            " last_access REAL NOT NULL,"
+            " PRIMARY KEY (digest, kind, version))"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_artifacts_access ON artifacts(last_access)")
+        self._conn.commit()
+
+    def get(self, digest: str, kind: str, version: str) -> Optional[dict]:
+        """
+        Returns:
+            dict: {"content", "row_count", "source_name"}；未命中返回 None
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT content, row_count, source_name FROM artifacts WHERE digest = ? AND kind = ? AND version = ?",
+                (digest, kind, version),
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self._conn.execute(
+                "UPDATE artifacts SET last_access = ? WHERE digest = ? AND kind = ? AND version = ?",
+                (time.time(), digest, kind, version),
+            )
+            self._conn.commit()
+            self.hits += 1
+            return {"content": row[0], "row_count": row[1], "source_name": row[2]}
+
+    def put(self, digest: str, kind: str, version: str, content: str,
+            row_count: Optional[int] = None, source_name: str = "") -> None:
+        size = len(content.encode("utf-8"))
+        if size > self.max_bytes:
+            return
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO artifacts (digest, kind, version, content, row_count, source_name, size, created_at, last_access)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (digest, kind, version, content, row_count, source_name, size, now, now),
+            )
+            self._evict_locked()
+            self._conn.commit()
+
+    def _evict_locked(self) -> None:
+        total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM artifacts").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        # Least recently used first until we are back under the size budget
+        for digest, kind, version, size in self._conn.execute(
+            "SELECT digest, kind, version, size FROM artifacts ORDER BY last_access ASC"
+        ).fetchall():
+            if total <= self.max_bytes:
+                break
+            self._conn.execute("DELETE FROM artifacts WHERE digest = ? AND kind = ? AND version = ?", (digest, kind, version))
+            total -= size
+            self.evictions += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            entries, total = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM artifacts").fetchone()
+            lookups = self.hits + self.misses
+            return {
+                "path": str(self.db_path),
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "entries": entries,
+                "size_bytes": total,
+                "hit_ratio": round(self.hits / lookups, 3) if lookups else 0.0,
+            }
+
+    def clear(self) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM artifacts")
+            self._conn.commit()
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+# ──────────────────────── 进程级实例 ─────────────────────── #
+
+_cache_instance: Optional[FileArtifactCache] = None
+_instance_lock = threading.Lock()
+
+
+def is_artifact_cache_enabled() -> bool:
+    return os.getenv("ARTIFACT_CACHE_ENABLED", "1").strip().lower() not in ("0", "false", "no", "off")
+
+
+def get_artifact_cache() -> Optional[FileArtifactCache]:
+    """返回进程级产物缓存；关闭时返回 None"""
+    global _cache_instance
+    if not is_artifact_cache_enabled():
+        return None
+    with _instance_lock:
+        if _cache_instance is None:
+            _cache_instance = FileArtifactCache(
+                os.getenv("ARTIFACT_CACHE_PATH", os.path.join("conversations", "artifact_cache.sqlite3")),
+                max_bytes=int(float(os.getenv("ARTIFACT_CACHE_MAX_MB", "1024")) * 1024 * 1024),
+            )
+        return _cache_instance
+
+
+def print_artifact_cache_stats() -> None:
+    """打印产物缓存命中统计"""
+    cache = _cache_instance
+    if cache is None:
+        return
+    stats = cache.stats()
+    print(f"🗃️ 文件转换缓存: 命中 {stats['hits']} | 未命中 {stats['misses']} | 命中率 {stats['hit_ratio']:.0%} | "
+          f"条目 {stats['entries']} | 大小 {stats['size_bytes'] / 1024:.1f}KB")
@@ -0,0 +1,148 @@
+"""
+数据块的紧凑编码
+
+重构后的 CSV 是“表头行+数据行”交替格式，原来拼接数据块时照原样输出：每条数据前都重复一遍完整表头，
+多表合并还把每行包成“文件来源/表头/数据”三段文字。宽表（城保名册、农保名册这类 14 列的花名册）
+表头的 token 数和数据行差不多，一半的提示词都花在重复的表头上。
+
+紧凑编码：
+- 表头在块内只出现一次（连续记录的表头变化时才再输出一次），第一列为“行号”；
+- 每条数据行以稳定的行号开头（R<n>，n 为该记录在源文件/合并序列中的序号，跨块不变）；
+- 可选的列名对照（C1=序号；C2=户主姓名……），表头行改用列编号，适合同一块内出现多种表头的情况。
+
+decode_records 把编码后的文本还原为 (行号, 表头, 数据)；split_row_id 供解析模型输出时去掉行号前缀。
+project_record 只保留记录中需要的列（多表合并只把需要推理的列的依据发给模型）。
+COMPACT_CHUNK_ENCODING=0 恢复原来的逐行重复表头格式。
+"""
+
+import csv
+import io
+import os
+import re
+from typing import Optional
+
+
+ROW_ID_COLUMN = "行号"
+LEGEND_TITLE = "【列名对照】"
+FORMAT_NOTE = "【格式说明】表头只列出一次，之后每行是一条记录；第一列“行号”（如 R12）是记录编号，不是业务数据"
+
+_ROW_ID_PREFIX = re.compile(r"^(R\d+)\s*[,，]\s*")
+_LEGEND_ENTRY = re.compile(r"(C\d+)=(.*)")
+
+
+def compact_encoding_enabled() -> bool:
+    return os.getenv("COMPACT_CHUNK_ENCODING", "1").strip().lower() not in ("0", "false", "no", "off")
+
+
+def column_legend_enabled() -> bool:
+    return os.getenv("CHUNK_COLUMN_LEGEND", "0").strip().lower() in ("1", "true", "yes", "on")
+
+
+def row_id(record_no: int) -> str:
+    """记录序号（从 0 开始）对应的行号"""
+    return f"R{record_no + 1}"
+
+
+def _split_fields(line: str) -> list[str]:
+    return next(csv.reader([line]), [])
+
+
+def _join_fields(fields: list[str]) -> str:
+    buffer = io.StringIO()
+    csv.writer(buffer, lineterminator="").writerow(fields)
+    return buffer.getvalue()
+
+
+def build_column_legend(headers: list[str]) -> dict[str, str]:
+    """按首次出现的顺序给表头中的列名编号 {列名: C<i>}"""
+    legend: dict[str, str] = {}
+    for header in dict.fromkeys(headers):
+        for column in _split_fields(header):
+            if column not in legend:
+                legend[column] = f"C{len(legend) + 1}"
+    return legend
+
+
+def render_legend(legend: dict[str, str]) -> str:
+    return LEGEND_TITLE + "；".join(f"{column_id}={column}" for column, column_id in legend.items())
+
+
+def encode_records(pairs: list[tuple[str, str]], row_ids: Optional[list[str]] = None,
+                   legend: Optional[dict[str, str]] = None) -> str:
+    """
+    把 (表头行, 数据行) 编码为表头只出现一次的 CSV 文本。
+
+    Args:
+        pairs: 记录
+        row_ids: 与 pairs 一一对应的行号；None 时不加行号列
+        legend: 列名对照；给出时表头行使用列编号（对照本身由调用方用 render_legend 输出一次）
+    """
+    lines = []
+    previous_header = None
+    for i, (header, data) in enumerate(pairs):
+        if header != previous_header:
+            header_line = header
+            if legend is not None:
+                header_line = ",".join(legend.get(column, column) for column in _split_fields(header))
+            lines.append(f"{ROW_ID_COLUMN},{header_line}" if row_ids is not None else header_line)
+            previous_header = header
+        lines.append(f"{row_ids[i]},{data}" if row_ids is not None else data)
+    return "\n".join(lines)
+
+
+def _expand_header(header_line: str, legend: dict[str, str]) -> str:
+    if not legend:
+        return header_line
+    return _join_fields([legend.get(column, column) for column in _split_fields(header_line)])
+
+
+def decode_records(text: str) -> list[tuple[Optional[str], str, str]]:
+    """
+    encode_records 的逆过程：返回 [(行号, 表头行, 数据行)]，列编号还原为列名，说明、标题等行被跳过。
+    不带行号列的文本行号为 None，且只把第一行当作表头（无法区分中途变化的表头和数据）。
+    """
+    legend: dict[str, str] = {}
+    records = []
+    header = None
+    has_row_ids = False
+    for line in text.split("\n"):
+        line = line.strip()
+        if not line or line.startswith(("===", "【说明】", "【格式说明】", "---")):
+            continue
+        if line.startswith(LEGEND_TITLE):
+            for entry in line[len(LEGEND_TITLE):].split("；"):
+                match = _LEGEND_ENTRY.fullmatch(entry)
+                if match:
+                    legend[match.group(1)] = match.group(2)
+            continue
+        if line.startswith(ROW_ID_COLUMN + ","):
+            header = _expand_header(line[len(ROW_ID_COLUMN) + 1:], legend)
+            has_row_ids = True
+            continue
+        if header is None:
+            header = _expand_header(line, legend)
+            has_row_ids = False
+            continue
+        if has_row_ids:
+            record_id, data = line.split(",", 1) if "," in line else (line, "")
+            records.append((record_id, header, data))
+        else:
+            records.append((None, header, line))
+    return records
+
+
+def split_row_id(line: str) -> tuple[Optional[str], str]:
+    """模型输出行开头的行号（R12,...）拆出来：返回 (行号, 去掉行号后的行)；没有行号时为 (None, 原行)"""
+    match = _ROW_ID_PREFIX.match(line)
+    if not match:
+        return None, line
+    return match.group(1), line[match.end():]
+
+
+def project_record(header: str, data: str, columns: list[str]) -> tuple[str, str]:
+    """只保留记录中的指定列（按 columns 的顺序，同名列取第一个；表头里没有的列跳过）"""
+    names = [name.strip() for name in _split_fields(header)]
+    fields = _split_fields(data)
+    positions = [names.index(column) for column in columns if column in names]
+    return (_join_fields([names[i] for i in positions]),
+            _join_fields([fields[i] if i < len(fields) else "" for i in positions]))
@@ -0,0 +1,162 @@
+"""
+按 token 预算规划数据分块
+
+固定的 chunk_nums=15 不考虑每块实际有多少 token：宽表会撑爆上下文，窄表又浪费调用次数。
+这里用离线 token 估算器计算每条数据（以及每块共享的提示词/参考数据）的 token 数，
+按模型的 “提示词 + 预期输出” 预算切分连续的数据行，返回分块边界和每块的估算 token 数。
+"""
+
+import os
+from dataclasses import dataclass, field
+from typing import Callable, Optional
+
+from utils.token_estimator import estimate_tokens
+
+
+# 每个模型单次调用的目标 token 预算（提示词 + 预期输出）与最大输出 token 数。
+# 预算远低于上下文窗口：块越小并发越充分，输出也越不容易被截断。
+MODEL_CHUNK_BUDGETS = {
+    "deepseek-ai/DeepSeek-V3": {"budget": 24000, "max_output": 8000},
+    "Pro/deepseek-ai/DeepSeek-V3": {"budget": 24000, "max_output": 8000},
+    "Qwen/Qwen2.5-VL-72B-Instruct": {"budget": 16000, "max_output": 4000},
+    "gpt-4o": {"budget": 32000, "max_output": 12000},
+}
+DEFAULT_CHUNK_BUDGET = {"budget": 16000, "max_output": 4000}
+
+
+def get_chunk_budget(model_name: str) -> dict:
+    """模型的分块预算，可用 CHUNK_TOKEN_BUDGET / CHUNK_MAX_OUTPUT_TOKENS 环境变量统一覆盖"""
+    budget = dict(MODEL_CHUNK_BUDGETS.get(model_name, DEFAULT_CHUNK_BUDGET))
+    if os.getenv("CHUNK_TOKEN_BUDGET"):
+        budget["budget"] = int(os.getenv("CHUNK_TOKEN_BUDGET"))
+    if os.getenv("CHUNK_MAX_OUTPUT_TOKENS"):
+        budget["max_output"] = int(os.getenv("CHUNK_MAX_OUTPUT_TOKENS"))
+    return budget
+
+
+@dataclass
+class ChunkPlan:
+    """分块结果：boundaries[i] = (start, end)，对应 items[start:end]"""
+    boundaries: list[tuple[int, int]] = field(default_factory=list)
+    estimated_prompt_tokens: list[int] = field(default_factory=list)
+    estimated_output_tokens: list[int] = field(default_factory=list)
+    budget: int = 0
+    shared_prompt_tokens: int = 0
+
+    @property
+    def estimated_tokens(self) -> list[int]:
+        """每块预计消耗的总 token（提示词 + 输出）"""
+        return [p + o for p, o in zip(self.estimated_prompt_tokens, self.estimated_output_tokens)]
+
+    def split(self, items: list) -> list[list]:
+        return [items[start:end] for start, end in self.boundaries]
+
+
+def _contiguous_balanced(costs: list[float], chunk_count: int) -> list[tuple[int, int]]:
+    """把连续的 costs 切成 chunk_count 段，使每段总成本尽量接近"""
+    total = sum(costs)
+    boundaries = []
+    start = 0
+    accumulated = 0.0
+    for chunk_index in range(chunk_count - 1):
+        target = total * (chunk_index + 1) / chunk_count
+        end = start
+        # leave at least one item for every remaining chunk
+        max_end = len(costs) - (chunk_count - chunk_index - 1)
+        while end < max_end and (end == start or accumulated + costs[end] / 2 <= target):
+            accumulated += costs[end]
+            end += 1
+        boundaries.append((start, end))
+        start = end
+    boundaries.append((start, len(costs)))
+    return boundaries
+
+
+def plan_chunks(items: list[str], model_name: str, shared_prompt: str = "", shared_prompt_tokens: int = 0,
+                output_ratio: float = 1.0, output_overhead_tokens: int = 600,
+                min_chunks: int = 1, max_chunks: Optional[int] = None, budget: Optional[int] = None,
+                item_tokens: Optional[Callable[[str], int]] = None,
+                item_context: Optional[list[str]] = None) -> ChunkPlan:
+    """
+    Plan contiguous chunks of `items` so that every LLM call stays inside the model's token budget.
+
+    Args:
+        items: 待分块的数据条目（例如 "表头\\n数据" 或合并数据条目），顺序保持不变
+        model_name: 处理这些分块的模型，用于选择分词器系数和预算
+        shared_prompt: 每块都会重复携带的内容（系统提示词、表结构、参考数据等）
+        shared_prompt_tokens: 已知的共享提示词 token 数（与 shared_prompt 累加）
+        output_ratio: 每条数据预期输出 token 数 ≈ 输入 token 数 × output_ratio
+        output_overhead_tokens: 每块固定的输出开销（推理过程、分节标记等）
+        min_chunks: 至少切成多少块（保证并发度），不超过条目数
+        max_chunks: 最多切成多少块；与预算冲突时以预算为准
+        budget: 覆盖模型默认的每块 token 预算
+        item_context: 与 items 一一对应、只进入提示词的附带内容（例如按关联键匹配到的参考数据行），
+                      计入提示词 token，不计入预期输出
+
+    Returns:
+        ChunkPlan: 分块边界及每块估算的提示词/输出 token 数
+    """
+    if not items:
+        return ChunkPlan()
+
+    model_budget = get_chunk_budget(model_name)
+    budget = budget or model_budget["budget"]
+    max_output = model_budget["max_output"]
+    count_tokens = item_tokens or (lambda text: estimate_tokens(text, model_name))
+
+    shared = shared_prompt_tokens + (estimate_tokens(shared_prompt, model_name) if shared_prompt else 0)
+    item_costs = [count_tokens(item) + 1 for item in items]  # +1 for the joining newline
+    output_costs = [cost * output_ratio for cost in item_costs]
+    input_costs = item_costs
+    if item_context is not None:
+        input_costs = [cost + (count_tokens(context) + 1 if context else 0)
+                       for cost, context in zip(item_costs, item_context)]
+
+    available = budget - shared - output_overhead_tokens
+    if available <= 0:
+        print(f"⚠️ 共享提示词约 {shared:,} tokens，已超过 {model_name} 的分块预算 {budget:,}，每块仅放 1 条数据")
+        available = 1
+
+    # 1) Greedy packing: the minimum number of chunks that respects the budget and the output cap
+    greedy = []
+    start = 0
+    chunk_input = chunk_output = 0.0
+    for index, (cost_in, cost_out) in enumerate(zip(input_costs, output_costs)):
+        over_budget = chunk_input + chunk_output + cost_in + cost_out > available
+        over_output = chunk_output + cost_out + output_overhead_tokens > max_output
+        if index > start and (over_budget or over_output):
+            greedy.append((start, index))
+            start = index
+            chunk_input = chunk_output = 0.0
+        chunk_input += cost_in
+        chunk_output += cost_out
+    greedy.append((start, len(items)))
+
+    # 2) Rebalance into evenly sized chunks when parallelism asks for more chunks than the budget needs
+    chunk_count = max(len(greedy), min(min_chunks, len(items)))
+    if max_chunks is not None and chunk_count > max_chunks >= len(greedy):
+        chunk_count = max_chunks
+    boundaries = greedy
+    if chunk_count > 1:
+        costs = [i + o for i, o in zip(input_costs, output_costs)]
+        balanced = _contiguous_balanced(costs, chunk_count)
+        fits = all(
+            sum(costs[s:e]) <= available or e - s == 1
+            for s, e in balanced
+        ) and all(sum(output_costs[s:e]) + output_overhead_tokens <= max_output or e - s == 1 for s, e in balanced)
+        if fits:
+            boundaries = balanced
+
+    if max_chunks is not None and len(boundaries) > max_chunks:
+        print(f"⚠️ 按 token 预算需要 {len(boundaries)} 块，超过上限 {max_chunks}，以预算为准")
+
+    plan = ChunkPlan(budget=budget, shared_prompt_tokens=shared)
+    for s, e in boundaries:
+        plan.boundaries.append((s, e))
+        plan.estimated_prompt_tokens.append(int(shared + sum(input_costs[s:e])))
+        plan.estimated_output_tokens.append(int(output_overhead_tokens + sum(output_costs[s:e])))
+
+    largest = max(plan.estimated_tokens)
+    print(f"📐 分块规划({model_name}): {len(items)} 条数据 -> {len(boundaries)} 块 | "
+          f"共享提示词约 {shared:,} tokens | 单块最大约 {largest:,}/{budget:,} tokens")
+    return plan
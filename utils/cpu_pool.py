@@ -0,0 +1,178 @@
+"""
+CPU 密集型文件处理的共享进程池
+
+HTML 清洗、进程内表格转换、excel_to_csv 的日期清洗都是纯 Python 计算，放在各智能体的线程池里
+会被 GIL 串行化。这里维护一个进程级共享的 ProcessPoolExecutor：
+- 任务函数必须是模块顶层函数，参数和返回值只传路径和小字典（路径进、路径出），大块内容通过文件交换
+- run_cpu_jobs 按 chunksize 批量提交，一个任务失败不影响同批其他任务；任务的异常原样抛给调用方
+  （return_exceptions=True 时放在该任务的结果位置上）
+- 多个线程可以同时提交，进程池把它们分摊到所有核心上
+
+环境变量：
+- CPU_POOL_WORKERS: 进程数（默认 CPU 核数；0 或 1 表示在调用线程内直接执行）
+- CPU_POOL_START_METHOD: 子进程启动方式（默认 spawn，避免在多线程进程里 fork）
+"""
+
+import atexit
+import math
+import multiprocessing
+import os
+import sys
+import threading
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path
+from typing import Any, Callable, Iterable, Optional
+
+
+PROJECT_ROOT = str(Path(__file__).resolve().parent.parent)
+
+
+def _init_worker(project_root: str) -> None:
+    # spawn 出来的子进程需要能 import utils.*
+    if project_root not in sys.path:
+        sys.path.append(project_root)
+
+
+def _run_batch(func: Callable, arg_list: list[tuple]) -> list[tuple[bool, Any]]:
+    """在子进程中执行一批任务，返回 [(是否成功, 返回值或异常)]；一个任务失败不影响同批其他任务"""
+    outcomes = []
+    for args in arg_list:
+        try:
+            outcomes.append((True, func(*args)))
+        except Exception as e:
+            print(f"❌ 进程池任务 {func.__name__}{args} 失败: {e}\n{traceback.format_exc()}")
+            outcomes.append((False, e))
+    return outcomes
+
+
+class CpuPool:
+    """懒启动的共享进程池；进程池损坏（子进程被杀）时自动重建，本批任务退回调用线程执行"""
+
+    def __init__(self, workers: int, start_method: str):
+        self.workers = workers
+        self.start_method = start_method
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._lock = threading.Lock()
+        self.jobs = 0
+        self.inline_jobs = 0
+        self.failures = 0
+        self.busy_seconds = 0.0
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context(self.start_method),
+                    initializer=_init_worker,
+                    initargs=(PROJECT_ROOT,),
+                )
+            return self._executor
+
+    def _reset(self) -> None:
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def _record(self, outcomes: list[tuple[bool, Any]], started: float, inline: bool,
+                return_exceptions: bool) -> list:
+        with self._lock:
+            self.jobs += len(outcomes)
+            if inline:
+                self.inline_jobs += len(outcomes)
+            self.failures += sum(1 for ok, _ in outcomes if not ok)
+            self.busy_seconds += time.perf_counter() - started
+        if not return_exceptions:
+            for ok, value in outcomes:
+                if not ok:
+                    raise value
+        return [value for _, value in outcomes]
+
+    def map(self, func: Callable, arg_list: list[tuple], chunksize: Optional[int] = None,
+            return_exceptions: bool = False) -> list:
+        started = time.perf_counter()
+        if self.workers <= 1 or len(arg_list) == 0:
+            return self._record(_run_batch(func, arg_list), started, True, return_exceptions)
+        if chunksize is None:
+            # A few chunks per worker: amortises pickling without leaving cores idle at the tail
+            chunksize = max(1, math.ceil(len(arg_list) / (self.workers * 4)))
+        try:
+            executor = self._get_executor()
+            futures = [executor.submit(_run_batch, func, arg_list[i:i + chunksize])
+                       for i in range(0, len(arg_list), chunksize)]
+            outcomes = [outcome for future in futures for outcome in future.result()]
+        except BrokenProcessPool as e:
+            print(f"⚠️ 进程池已损坏，重建后本批任务在当前线程执行: {e}")
+            self._reset()
+            return self._record(_run_batch(func, arg_list), started, True, return_exceptions)
+        return self._record(outcomes, started, False, return_exceptions)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "start_method": self.start_method,
+                "started": self._executor is not None,
+                "jobs": self.jobs,
+                "inline_jobs": self.inline_jobs,
+                "failures": self.failures,
+                "busy_seconds": round(self.busy_seconds, 2),
+            }
+
+    def shutdown(self) -> None:
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True, cancel_futures=True)
+
+
+_pool_instance: Optional[CpuPool] = None
+_instance_lock = threading.Lock()
+
+
+def get_cpu_pool() -> CpuPool:
+    """返回进程级 CPU 进程池（子进程在第一次提交任务时才启动）"""
+    global _pool_instance
+    with _instance_lock:
+        if _pool_instance is None:
+            workers = int(os.getenv("CPU_POOL_WORKERS", str(os.cpu_count() or 1)))
+            start_method = os.getenv("CPU_POOL_START_METHOD", "spawn")
+            _pool_instance = CpuPool(max(0, workers), start_method)
+            atexit.register(_pool_instance.shutdown)
+            print(f"🧮 CPU进程池: {workers} 个进程 ({start_method})")
+        return _pool_instance
+
+
+def run_cpu_jobs(func: Callable, arg_list: Iterable[tuple], chunksize: Optional[int] = None,
+                 return_exceptions: bool = False) -> list:
+    """
+    把一批 CPU 密集任务分发到共享进程池，按输入顺序返回结果。
+
+    Args:
+        func: 模块顶层函数（需可 pickle）
+        arg_list: 每个任务的参数元组，只应包含路径、数字等小对象
+        chunksize: 每次发给子进程的任务数（默认按进程数自动计算）
+        return_exceptions: True 时失败任务的异常放在结果里；False 时整批完成后抛出第一个失败任务的异常
+
+    Returns:
+        list: 每个任务的返回值
+    """
+    return get_cpu_pool().map(func, list(arg_list), chunksize, return_exceptions)
+
+
+def run_cpu_job(func: Callable, *args) -> Any:
+    """提交单个任务并等待结果（可在多个线程中同时调用）；任务的异常在这里重新抛出"""
+    return run_cpu_jobs(func, [args])[0]
+
+
+def print_cpu_pool_stats() -> None:
+    """打印进程池统计"""
+    if _pool_instance is None:
+        return
+    stats = _pool_instance.stats()
+    print(f"🧮 CPU进程池: {stats['jobs']} 个任务 (当前线程执行 {stats['inline_jobs']}) | "
+          f"失败 {stats['failures']} | 累计耗时 {stats['busy_seconds']:.1f}秒 | {stats['workers']} 个进程")
@@ -0,0 +1,187 @@
+"""
+CSV 元数据旁路索引（files/{village}/table_files/CSV_files）
+
+多表整合/合并时原来要把每个候选 CSV 整个读进来、split 成行，只为了数行数、判断表头格式、挑出最大的文件。
+reconstruct_csv_with_headers 写出 CSV 时同时写两个旁路文件：
+- <name>.csv.index.json: 行数、列名、是否为“表头行+数据行”交替格式、记录数、内容哈希、文件大小和修改时间
+- <name>.csv.offsets: 每条记录（交替格式为表头行+数据行，标准格式为数据行）的 [起始, 结束) 字节偏移，
+  小端 uint64 对，按记录号直接 seek
+
+行数、格式、记录划分与 detect_csv_format / parse_header_data_pairs 对 content.strip().split('\\n') 的结果一致。
+CSV 的大小或修改时间与索引不符（文件被改写、或是旧版本生成的 CSV）时自动重建索引。
+"""
+
+import array
+import csv
+import hashlib
+import json
+import os
+import sys
+from pathlib import Path
+from typing import Optional, Union
+
+INDEX_VERSION = 1
+
+_OFFSET_TYPECODE = "Q"
+
+
+def index_paths(csv_path: Union[str, Path]) -> tuple[Path, Path]:
+    """(元数据 JSON, 偏移量文件) 路径"""
+    csv_path = Path(csv_path)
+    return csv_path.with_name(csv_path.name + ".index.json"), csv_path.with_name(csv_path.name + ".offsets")
+
+
+def _scan_lines(csv_path: Path) -> tuple[array.array, bytearray, str]:
+    """One pass over the bytes: [start, end) of every '\\n'-separated line, whether it is blank, content hash"""
+    bounds = array.array(_OFFSET_TYPECODE)
+    blank = bytearray()
+    digest = hashlib.sha256()
+    position = 0
+    with open(csv_path, "rb") as f:
+        for line in f:
+            digest.update(line)
+            end = position + len(line)
+            content_end = end - 1 if line.endswith(b"\n") else end
+            bounds.extend((position, content_end))
+            blank.append(not line.decode("utf-8", errors="replace").strip())
+            position = end
+    return bounds, blank, digest.hexdigest()
+
+
+def build_csv_index(csv_path: Union[str, Path]) -> tuple[dict, array.array]:
+    """
+    扫描一遍 CSV，返回 (元数据, 记录偏移量)。内存占用为每行 16 字节 + 1 字节。
+    """
+    csv_path = Path(csv_path)
+    stat = csv_path.stat()
+    bounds, blank, content_hash = _scan_lines(csv_path)
+
+    # content.strip(): leading and trailing blank lines are not lines at all
+    first = next((i for i, is_blank in enumerate(blank) if not is_blank), len(blank))
+    last = next((i for i in range(len(blank) - 1, -1, -1) if not blank[i]), -1)
+    lines = range(first, last + 1)
+
+    with open(csv_path, "rb") as f:
+        def line_text(i: int) -> str:
+            f.seek(bounds[2 * i])
+            return f.read(bounds[2 * i + 1] - bounds[2 * i]).decode("utf-8", errors="replace").strip()
+
+        header = line_text(lines[0]) if lines else ""
+        # Same rule as detect_csv_format: 4+ lines and line 3 repeats line 1
+        repeated_header = len(lines) >= 4 and "," in header and line_text(lines[2]) == header
+
+    records = array.array(_OFFSET_TYPECODE)
+    if repeated_header:
+        # parse_header_data_pairs: lines (0,1), (2,3)... both non-blank
+        for k in range(0, len(lines) - 1, 2):
+            h, d = lines[k], lines[k + 1]
+            if not blank[h] and not blank[d]:
+                records.extend((bounds[2 * h], bounds[2 * d + 1]))
+        row_count = len(lines) // 2
+    else:
+        for i in lines[1:]:
+            if not blank[i]:
+                records.extend((bounds[2 * i], bounds[2 * i + 1]))
+        row_count = len(lines) - 1 if lines else 0
+
+    columns = next(csv.reader([header])) if header else []
+    meta = {
+        "version": INDEX_VERSION,
+        "csv_name": csv_path.name,
+        "size": stat.st_size,
+        "mtime_ns": stat.st_mtime_ns,
+        "content_hash": content_hash,
+        "row_count": row_count,
+        "record_count": len(records) // 2,
+        "repeated_header": repeated_header,
+        "header": header,
+        "columns": columns,
+    }
+    return meta, records
+
+
+def write_csv_index(csv_path: Union[str, Path]) -> dict:
+    """构建并保存索引（先写临时文件再替换，读者不会看到写了一半的索引），返回元数据"""
+    meta, records = build_csv_index(csv_path)
+    meta_path, offsets_path = index_paths(csv_path)
+    if sys.byteorder != "little":
+        records.byteswap()
+    for path, write in ((offsets_path, lambda f: records.tofile(f)),
+                        (meta_path, lambda f: f.write(json.dumps(meta, ensure_ascii=False, indent=2).encode("utf-8")))):
+        temp_path = path.with_name(path.name + ".tmp")
+        with open(temp_path, "wb") as f:
+            write(f)
+        os.replace(temp_path, path)
+    return meta
+
+
+def _is_current(meta: dict, csv_path: Path) -> bool:
+    try:
+        stat = csv_path.stat()
+    except OSError:
+        return False
+    return (meta.get("version") == INDEX_VERSION and meta.get("size") == stat.st_size
+            and meta.get("mtime_ns") == stat.st_mtime_ns)
+
+
+def load_csv_index(csv_path: Union[str, Path], rebuild: bool = True) -> Optional[dict]:
+    """
+    读取 CSV 的索引元数据（O(1)，不读 CSV 本身）。
+
+    Args:
+        csv_path: CSV 文件
+        rebuild: 索引缺失或过期时是否重新构建
+
+    Returns:
+        dict: 元数据；索引不可用且不重建时返回 None
+    """
+    csv_path = Path(csv_path)
+    meta_path, offsets_path = index_paths(csv_path)
+    try:
+        with open(meta_path, "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        if _is_current(meta, csv_path) and offsets_path.exists():
+            return meta
+    except (OSError, ValueError):
+        pass
+    if not rebuild:
+        return None
+    print(f"🗂️ 重建CSV索引: {csv_path.name}")
+    return write_csv_index(csv_path)
+
+
+def read_csv_records(csv_path: Union[str, Path], start: int = 0, stop: Optional[int] = None,
+                     meta: Optional[dict] = None) -> list[tuple[str, str]]:
+    """
+    按记录号读取 [start, stop) 的 (表头行, 数据行)，只 seek 并读取这些记录所在的字节范围。
+    结果与 parse_header_data_pairs 对同样范围的结果一致。
+    """
+    csv_path = Path(csv_path)
+    meta = meta if meta is not None and _is_current(meta, csv_path) else load_csv_index(csv_path)
+    stop = meta["record_count"] if stop is None else min(stop, meta["record_count"])
+    if start >= stop:
+        return []
+
+    _, offsets_path = index_paths(csv_path)
+    item_size = array.array(_OFFSET_TYPECODE).itemsize
+    records = array.array(_OFFSET_TYPECODE)
+    with open(offsets_path, "rb") as f:
+        f.seek(2 * start * item_size)
+        records.fromfile(f, 2 * (stop - start))
+    if sys.byteorder != "little":
+        records.byteswap()
+
+    base = records[0]
+    with open(csv_path, "rb") as f:
+        f.seek(base)
+        block = f.read(records[-1] - base)
+
+    pairs = []
+    for k in range(0, len(records), 2):
+        text = block[records[k] - base:records[k + 1] - base].decode("utf-8", errors="replace")
+        if meta["repeated_header"]:
+            header, data = text.split("\n", 1)
+            pairs.append((header.strip(), data.strip()))
+        else:
+            pairs.append((meta["header"], text.strip()))
+    return pairs
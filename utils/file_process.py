@@ -1,18 +1,36 @@
 from __future__ import annotations
-from bs4 import BeautifulSoup
 from pathlib import Path
 import re
 import os
+import hashlib
 import json
+import asyncio
+import time
 from pathlib import Path
 import subprocess
 import chardet
-from typing import Union, List, Dict
+from typing import Awaitable, Callable, Iterator, Optional, Union, List, Dict
 import pandas as pd
+import numpy as np
 from datetime import datetime
-from concurrent.futures import ThreadPoolExecutor, as_completed
 
-from utils.modelRelated import invoke_model
+from utils.modelRelated import (invoke_model, ainvoke_model_hedged, astream_model, run_async, print_client_pool_stats,
+                                get_hedge_policy, DispatchClock, HEDGE_CHECK_INTERVAL)
+from utils.llm_cache import print_llm_cache_stats
+from utils.chunk_planner import plan_chunks
+from utils.libreoffice_pool import convert_with_libreoffice, print_conversion_pool_stats
+from utils.native_converters import convert_natively, native_converters_enabled, NATIVE_EXTENSIONS
+from utils.html_cleaner import clean_html_file
+from utils.cpu_pool import run_cpu_job, print_cpu_pool_stats
+from utils.stage_pipeline import Stage, run_pipeline
+from utils.artifact_cache import get_artifact_cache, file_digest, print_artifact_cache_stats
+from utils.csv_index import write_csv_index, load_csv_index, read_csv_records
+from utils.chunk_encoding import (compact_encoding_enabled, column_legend_enabled, build_column_legend,
+                                  render_legend, encode_records, row_id, split_row_id, project_record,
+                                  FORMAT_NOTE)
+from utils.reference_join import ReferenceIndex, header_key_types, record_keys, reference_join_enabled
+from utils.token_estimator import estimate_tokens
+from utils.sheet_reader import iter_sheet_rows, count_data_rows, is_blank, NA_STRINGS, STREAMING_EXTENSIONS
 
 from langchain_core.messages import AIMessage, HumanMessage, SystemMessage
 
@@ -153,14 +171,170 @@ def save_original_file(source_path: Path, original_files_dir: Path) -> str:
 
 def convert_document_to_txt(file_path: str) -> str:
     """Convert document to txt file"""
-    soffice = r"D:\LibreOffice\program\soffice.exe"
-    subprocess.run(
-        [soffice, "--headless", "--convert-to", "txt:Text (encoded):UTF8", file_path, "--outdir", "D:\asianInfo\ExcelAssist\agents\output"], check=True)
+    convert_with_libreoffice(file_path, "txt:Text (encoded):UTF8", "D:\asianInfo\ExcelAssist\agents\output")
     return file_path
 
+# Bump when the txt/HTML produced by process_file_to_text or the reconstructed CSV format changes,
+# so cached artifacts from older converters are not reused
+CONVERTER_VERSION = "1"
+CSV_RECONSTRUCT_VERSION = "1"
+# Only conversions whose output depends solely on the file bytes are cached
+# (image / binary placeholders embed the file name)
+_CACHED_CONVERSION_EXTENSIONS = {'.xlsx', '.xls', '.xlsm', '.ods', '.csv', '.docx', '.doc', '.pptx', '.ppt'}
+# Spreadsheets LibreOffice exports to HTML (see process_file_to_text)
+_SOFFICE_HTML_EXTENSIONS = {'.xlsx', '.xls', '.xlsm', '.ods', '.csv'}
+
+
+def _conversion_cache_version() -> str:
+    return f"{CONVERTER_VERSION}-{'native' if native_converters_enabled() else 'soffice'}"
+
+
+def _ingest_stage_workers(name: str, default: int) -> int:
+    return max(1, int(os.getenv(f"INGEST_{name}_WORKERS", str(default))))
+
+
+def iter_ingest_files(file_paths: list[str], staging_dir: Path, original_files_dir: Path = None,
+                      stats: dict = None) -> Iterator[dict]:
+    """
+    Ingest uploads through a bounded pipeline whose stages overlap across files:
+    prepare (copy original + hash + cache lookup) → convert → clean → store.
+    
+    Stage concurrency: INGEST_PREPARE_WORKERS / INGEST_CONVERT_WORKERS / INGEST_CLEAN_WORKERS /
+    INGEST_STORE_WORKERS; INGEST_QUEUE_SIZE bounds the files waiting between two stages.
+    
+    Args:
+        file_paths: Files to ingest
+        staging_dir: Where the .txt versions are written
+        original_files_dir: When given, originals are copied here as part of the first stage
+        stats: Optional dict filled with per-stage counters
+        
+    Yields:
+        dict: {"source_path", "txt_path", "original_path", "cached", "error"} per file, in completion order;
+        txt_path is None when the file failed (error says at which stage)
+    """
+    cache_version = _conversion_cache_version()
+    cpu_count = os.cpu_count() or 1
+    stages = [
+        Stage("prepare", _ingest_prepare, _ingest_stage_workers("PREPARE", 4)),
+        Stage("convert", _ingest_convert, _ingest_stage_workers("CONVERT", max(2, cpu_count))),
+        Stage("clean", _ingest_clean, _ingest_stage_workers("CLEAN", cpu_count)),
+        Stage("store", _ingest_store, _ingest_stage_workers("STORE", 1)),
+    ]
+    jobs = ({
+        "label": Path(file_path).name,
+        "source_path": str(file_path),
+        "txt_path": str(Path(staging_dir) / f"{Path(file_path).stem}.txt"),
+        "original_files_dir": str(original_files_dir) if original_files_dir else "",
+        "original_path": "",
+        "cache_version": cache_version,
+        "digest": "",
+        "cached": False,
+    } for file_path in file_paths)
+    
+    for job in run_pipeline(jobs, stages, queue_size=int(os.getenv("INGEST_QUEUE_SIZE", "8")), stats=stats):
+        yield {
+            "source_path": job["source_path"],
+            "txt_path": None if "error" in job else job["txt_path"],
+            "original_path": job["original_path"],
+            "cached": job["cached"],
+            "error": job.get("error", ""),
+        }
+
+
+def _ingest_prepare(job: dict) -> dict:
+    """Pipeline stage: copy the original, hash it and serve artifact cache hits"""
+    source_path = Path(job["source_path"])
+    if not source_path.exists():
+        raise FileNotFoundError(f"File not found: {source_path}")
+    print(f"🔄 Processing file: {source_path.name}")
+    
+    if job["original_files_dir"]:
+        job["original_path"] = save_original_file(source_path, Path(job["original_files_dir"]))
+    
+    if Path(job["txt_path"]).exists():
+        print(f"⚠️ 处理文件已存在，正在更新内容: {Path(job['txt_path']).name}")
+    
+    # Identical bytes were converted before (any session / village): reuse the cleaned text
+    cache = get_artifact_cache() if source_path.suffix.lower() in _CACHED_CONVERSION_EXTENSIONS else None
+    if cache:
+        job["digest"] = file_digest(source_path)
+        cached = cache.get(job["digest"], "text", job["cache_version"])
+        if cached is not None:
+            print(f"⚡ 命中文件转换缓存: {source_path.name}")
+            Path(job["txt_path"]).write_text(cached["content"], encoding='utf-8')
+            job["cached"] = True
+    return job
+
+
+def _ingest_convert(job: dict) -> dict:
+    """Pipeline stage: in-process conversion on the CPU pool, LibreOffice HTML export, or the single-file path"""
+    if job["cached"]:
+        return job
+    source_path = Path(job["source_path"])
+    extension = source_path.suffix.lower()
+    
+    native_tried = extension in NATIVE_EXTENSIONS and native_converters_enabled()
+    if native_tried:
+        try:
+            if run_cpu_job(_native_conversion_job, str(source_path), job["txt_path"]) != NEEDS_LIBREOFFICE:
+                return job
+        except Exception as e:
+            # Counted as a failure by the CPU pool; LibreOffice still gets a chance at the file
+            print(f"⚠️ 进程内转换失败，改用LibreOffice: {source_path.name}: {e}")
+    
+    if extension in _SOFFICE_HTML_EXTENSIONS:
+        # Exported by the warm LibreOffice pool; the clean stage turns the HTML into the txt
+        import tempfile
+        import shutil
+        job["temp_dir"] = tempfile.mkdtemp(prefix="ingest_")
+        try:
+            job["raw_html_path"] = str(convert_with_libreoffice(source_path, "html", job["temp_dir"]))
+        except Exception:
+            shutil.rmtree(job["temp_dir"], ignore_errors=True)
+            raise
+        return job
+    
+    processed_content = process_file_to_text(source_path, try_native=not native_tried)
+    if processed_content is None:
+        raise ValueError(f"文件内容处理失败: {source_path.name}")
+    Path(job["txt_path"]).write_text(processed_content, encoding='utf-8')
+    return job
+
+
+def _ingest_clean(job: dict) -> dict:
+    """Pipeline stage: clean LibreOffice HTML exports on the CPU pool"""
+    if not job.get("raw_html_path"):
+        return job
+    import shutil
+    try:
+        run_cpu_job(_clean_html_job, job["raw_html_path"], job["txt_path"])
+    finally:
+        shutil.rmtree(job["temp_dir"], ignore_errors=True)
+    return job
+
+
+def _ingest_store(job: dict) -> dict:
+    """Pipeline stage: record the staging txt in the artifact cache"""
+    cache = get_artifact_cache()
+    if cache and job["digest"] and not job["cached"]:
+        processed_content = Path(job["txt_path"]).read_text(encoding='utf-8')
+        cache.put(job["digest"], "text", job["cache_version"], processed_content,
+                  row_count=processed_content.count("<tr"), source_name=Path(job["source_path"]).name)
+    print(f"✅ 文件处理并保存到暂存区: {job['txt_path']}")
+    return job
+
+
+def print_ingest_stats(stats: dict) -> None:
+    """打印上传流水线各阶段的处理数和耗时"""
+    parts = [f"{name} {s['items']}个/{s['busy_seconds']:.1f}秒" + (f"/失败{s['errors']}" if s['errors'] else "")
+             for name, s in stats.items()]
+    print(f"🧵 上传流水线: {' | '.join(parts)}")
+
+
 def retrieve_file_content(file_paths: list[str], session_id: str, output_dir: str = None) -> list[str]:
     """Process files and store them as .txt files in the staging area: conversations/session_id/user_uploaded_files
     This function only handles file processing, not original file saving.
+    Files go through the ingestion pipeline (iter_ingest_files) and are returned in completion order.
     
     Args:
         file_paths: List of file paths to process
@@ -185,48 +359,47 @@ def retrieve_file_content(file_paths: list[str], session_id: str, output_dir: st
         output_dir.mkdir(parents=True, exist_ok=True)
     
     processed_files = []
-    
-    for file_path in file_paths:
-        try:
-            source_path = Path(file_path)
-            if not source_path.exists():
-                print(f"❌ File not found: {file_path}")
-                continue
-                
-            print(f"🔄 Processing file: {source_path.name}")
-            
-            # Process the file content
-            processed_content = process_file_to_text(source_path)
-            
-            if processed_content is not None:
-                # Save processed content as .txt file in staging area
-                txt_file_path = staging_dir / f"{source_path.stem}.txt"
-                
-                if txt_file_path.exists():
-                    print(f"⚠️ 处理文件已存在，正在更新内容: {txt_file_path.name}")
-                
-                txt_file_path.write_text(processed_content, encoding='utf-8')
-                processed_files.append(str(txt_file_path))
-                print(f"✅ 文件处理并保存到暂存区: {txt_file_path}")
-            else:
-                print(f"❌ 文件内容处理失败: {source_path.name}")
-                
-        except Exception as e:
-            print(f"❌ 处理文件时发生意外错误 {file_path}: {e}")
-            continue
+    stats = {}
+    for result in iter_ingest_files(file_paths, staging_dir, stats=stats):
+        if result["txt_path"]:
+            processed_files.append(result["txt_path"])
     
     print(f"🎉 成功处理 {len(processed_files)} 个文件到暂存区")
+    print_ingest_stats(stats)
+    print_conversion_pool_stats()
+    print_cpu_pool_stats()
+    print_artifact_cache_stats()
     
     return processed_files
 
 
-def process_file_to_text(file_path: str | Path) -> str | None:
+NEEDS_LIBREOFFICE = "needs-libreoffice"  # _native_conversion_job result: no native converter for this file
+
+
+def _native_conversion_job(source_path: str, txt_path: str) -> str:
+    """CPU pool job: convert in-process and write the txt; NEEDS_LIBREOFFICE when the file needs LibreOffice"""
+    processed_content = convert_natively(Path(source_path), _read_text_auto)
+    if processed_content is None:
+        return NEEDS_LIBREOFFICE
+    Path(txt_path).write_text(processed_content, encoding='utf-8')
+    return txt_path
+
+
+def _clean_html_job(raw_html_path: str, txt_path: str) -> str:
+    """CPU pool job: clean a LibreOffice HTML export into the txt"""
+    Path(txt_path).write_text(_clean_html_in_memory(Path(raw_html_path)), encoding='utf-8')
+    return txt_path
+
+
+def process_file_to_text(file_path: str | Path, try_native: bool = True) -> str | None:
     """
     Efficiently process a file to readable text content in memory.
     
     This function does: 1 read → process in memory → return text
     Instead of: read → write temp file → read temp file → write final file
     
+    try_native: False when the caller's in-process conversion already failed (go straight to LibreOffice)
+    
     Returns:
         str: The processed text content, or None if processing failed
     """
@@ -240,6 +413,12 @@ def process_file_to_text(file_path: str | Path) -> str | None:
     image_extensions = {'.jpg', '.jpeg', '.png', '.gif', '.bmp', '.tiff', '.tif', '.webp', '.svg'}
     
     try:
+        # Spreadsheets and .docx are converted in-process when possible; LibreOffice is the fallback
+        if try_native and (file_extension in spreadsheet_extensions or file_extension in document_extensions):
+            native_html = convert_natively(source_path, _read_text_auto)
+            if native_html is not None:
+                return native_html
+
         # Handle spreadsheet files
         if file_extension in spreadsheet_extensions:
             return _process_spreadsheet_in_memory(source_path)
@@ -281,18 +460,8 @@ def _process_spreadsheet_in_memory(source_path: Path) -> str:
     with tempfile.TemporaryDirectory() as temp_dir:
         temp_dir_path = Path(temp_dir)
         
-        # LibreOffice export to temp directory
-        soffice = r"D:\LibreOffice\program\soffice.exe"
-        subprocess.run(
-            [soffice, "--headless", "--convert-to", "html", str(source_path),
-             "--outdir", str(temp_dir_path)],
-            check=True
-        )
-        
-        # Read the generated HTML file
-        raw_html_path = temp_dir_path / f"{source_path.stem}.html"
-        if not raw_html_path.exists():
-            raise FileNotFoundError(f"LibreOffice did not create {raw_html_path}")
+        # LibreOffice export to temp directory (warm instance from the shared conversion pool)
+        raw_html_path = convert_with_libreoffice(source_path, "html", temp_dir_path)
         
         # Clean HTML in memory and return the result
         return _clean_html_in_memory(raw_html_path)
@@ -306,18 +475,8 @@ def _process_document_in_memory(source_path: Path) -> str:
     with tempfile.TemporaryDirectory() as temp_dir:
         temp_dir_path = Path(temp_dir)
         
-        # LibreOffice export to temp directory as txt
-        soffice = r"D:\LibreOffice\program\soffice.exe"
-        subprocess.run(
-            [soffice, "--headless", "--convert-to", "txt:Text (encoded):UTF8", str(source_path),
-             "--outdir", str(temp_dir_path)],
-            check=True
-        )
-        
-        # Read the generated TXT file
-        raw_txt_path = temp_dir_path / f"{source_path.stem}.txt"
-        if not raw_txt_path.exists():
-            raise FileNotFoundError(f"LibreOffice did not create {raw_txt_path}")
+        # LibreOffice export to temp directory as txt (warm instance from the shared conversion pool)
+        raw_txt_path = convert_with_libreoffice(source_path, "txt:Text (encoded):UTF8", temp_dir_path)
         
         # Read and return the txt content directly
         return _read_text_auto(raw_txt_path)
@@ -328,77 +487,9 @@ def _clean_html_in_memory(raw_html_path: Path) -> str:
     Clean HTML file in memory and return the clean HTML string.
     This function preserves both table structures and text content while
     removing unnecessary decorative HTML elements.
+    The file is cleaned in a single streaming pass (see utils/html_cleaner.py).
     """
-    # Tags to keep for table structure
-    TABLE_TAGS = {"table", "thead", "tbody", "tfoot", "tr", "td", "th", "col", "colgroup"}
-    
-    # Tags to keep for text content and basic formatting
-    TEXT_TAGS = {"p", "div", "span", "h1", "h2", "h3", "h4", "h5", "h6", 
-                 "br", "strong", "b", "em", "i", "u", "ul", "ol", "li", 
-                 "blockquote", "pre", "code", "a"}
-    
-    # All tags we want to preserve
-    KEEP = TABLE_TAGS | TEXT_TAGS
-    
-    # Attributes to always keep
-    ATTR_ALWAYS = {"rowspan", "colspan"}
-    
-    # Additional attributes for specific tags
-    ATTR_EXTRA = {
-        "colgroup": {"span"},
-        "a": {"href"},  # Keep links
-    }
-
-    html = _read_text_auto(raw_html_path)
-
-    # Drop DOCTYPE / XML prologs
-    html = re.sub(r'<!DOCTYPE[^>]*?>',           '', html, flags=re.I | re.S)
-    html = re.sub(r'<\?xml[^>]*?\?>',            '', html, flags=re.I)
-    html = re.sub(r'<\?mso-application[^>]*?\?>','', html, flags=re.I)
-
-    soup = BeautifulSoup(html, "html.parser")
-
-    # Remove styling and metadata tags
-    for t in soup.find_all(["style", "meta", "link", "script", "noscript"]):
-        t.decompose()
-
-    # Clean up attributes and unwrap unwanted tags
-    for t in soup.find_all(True):
-        if t.name not in KEEP:
-            # Unwrap tags we don't want to keep, but preserve their content
-            t.unwrap()
-            continue
-        
-        # For kept tags, clean up attributes
-        allowed = ATTR_ALWAYS | ATTR_EXTRA.get(t.name, set())
-        
-        # Remove style attributes and other formatting attributes
-        attrs_to_remove = []
-        for attr_name in t.attrs.keys():
-            if attr_name not in allowed:
-                # Remove ALL styling and metadata attributes
-                attrs_to_remove.append(attr_name)
-        
-        for attr in attrs_to_remove:
-            del t.attrs[attr]
-
-    # Build a clean document structure
-    shell = BeautifulSoup("<html><body></body></html>", "html.parser")
-    
-    # Add all content from the body, preserving both text and tables
-    if soup.body:
-        for element in soup.body.children:
-            if element.name or (hasattr(element, 'strip') and element.strip()):
-                # Add both tag elements and non-empty text nodes
-                shell.body.append(element)
-    else:
-        # If no body tag, add all content
-        for element in soup.children:
-            if element.name or (hasattr(element, 'strip') and element.strip()):
-                shell.body.append(element)
-
-    # Return HTML with preserved formatting (keep newlines for bs4 processing)
-    return str(shell)
+    return clean_html_file(raw_html_path)
 
 
 # ──────────────────────── private helpers ─────────────────────── #
@@ -563,57 +654,63 @@ def fetch_files_content(related_files: List[str], base_path: str = r"D:\asianInf
         return files_content
 
 
-def excel_to_csv(excel_file, csv_file, sheet_name=0):
-    """Enhanced Excel to CSV conversion with proper date handling"""
+def excel_to_csv(excel_file, csv_file, sheet_name=0, streaming=None):
+    """
+    Enhanced Excel to CSV conversion with proper date handling
+    
+    streaming: 逐行读取、分批写出，内存占用与行数无关（None 时按文件大小自动选择，见 EXCEL_STREAMING_MIN_MB）
+    """
     import re
+    import io
+    
+    if streaming is None:
+        streaming = use_streaming_reader(excel_file)
+    if streaming:
+        try:
+            rows = stream_excel_to_csv(excel_file, csv_file, sheet_name=sheet_name)
+            print(f"✅ Successfully streamed {rows} rows from {excel_file} to {csv_file}")
+            return
+        except Exception as e:
+            print(f"⚠️ 流式转换失败，改为整表读取: {e}")
     
     try:
-        # Read Excel file
-        df = pd.read_excel(excel_file, sheet_name=sheet_name)
+        # Read Excel file (ID columns as text, like the streaming mode); the workbook is loaded once
+        with pd.ExcelFile(excel_file) as book:
+            df = pd.read_excel(book, sheet_name=sheet_name, dtype=id_column_dtypes(book, sheet_name))
         print(f"📊 Processing {len(df.columns)} columns for date cleaning...")
         
-        # Process each column to handle dates properly
-        for col in df.columns:
-            print(f"🔍 Processing column '{col}' with dtype: {df[col].dtype}")
+        # Process each column to handle dates properly (column-wise, same result as clean_date_string per cell)
+        df = normalise_excel_dates(df)
+        
+        # Convert to CSV (same bytes as df.to_csv(csv_file, ...), but kept in memory for the check below)
+        csv_text = df.to_csv(index=False, lineterminator=os.linesep)
+        
+        # Verify cleaning worked on the first 500 characters (as read back in text mode)
+        if " 00:00:00" in io.StringIO(csv_text[:1000], newline=None).read(500):
+            print(f"⚠️ Warning: Still found '00:00:00' in output, applying post-processing...")
+            # Apply additional cleaning to the entire CSV content
+            content = io.StringIO(csv_text, newline=None).read()
             
-            # Check if column contains datetime-like data
-            if df[col].dtype == 'datetime64[ns]' or any(isinstance(x, pd.Timestamp) for x in df[col].dropna()):
-                print(f"📅 Found datetime column: {col}")
-                # Convert datetime columns to clean date format
-                df[col] = df[col].apply(lambda x: x.strftime('%Y-%m-%d') if pd.notna(x) and hasattr(x, 'strftime') else x)
+            # Clean up the content with regex
+            content = re.sub(r' 00:00:00', '', content)
+            content = re.sub(r'\.00\.00\.00', '', content)
+            content = re.sub(r'\.0+(?=,|$)', '', content)
             
-            else:
-                # Apply aggressive date cleaning to ALL columns (not just object columns)
-                df[col] = df[col].apply(lambda x: clean_date_string(x) if pd.notna(x) else x)
-        
-        # Convert to CSV
-        df.to_csv(csv_file, index=False, encoding='utf-8')
+            # Write the cleaned content
+            with open(csv_file, 'w', encoding='utf-8') as f:
+                f.write(content)
+            print(f"✅ Applied post-processing date cleanup")
+        else:
+            with open(csv_file, 'w', encoding='utf-8', newline='') as f:
+                f.write(csv_text)
         print(f"✅ Successfully converted {excel_file} to {csv_file}")
         
-        # Read back and verify cleaning worked
-        with open(csv_file, 'r', encoding='utf-8') as f:
-            sample_content = f.read()[:500]
-            if " 00:00:00" in sample_content:
-                print(f"⚠️ Warning: Still found '00:00:00' in output, applying post-processing...")
-                # Apply additional cleaning to the entire CSV content
-                with open(csv_file, 'r', encoding='utf-8') as f:
-                    content = f.read()
-                
-                # Clean up the content with regex
-                content = re.sub(r' 00:00:00', '', content)
-                content = re.sub(r'\.00\.00\.00', '', content)
-                content = re.sub(r'\.0+(?=,|$)', '', content)
-                
-                # Write back the cleaned content
-                with open(csv_file, 'w', encoding='utf-8') as f:
-                    f.write(content)
-                print(f"✅ Applied post-processing date cleanup")
-        
     except Exception as e:
         print(f"❌ Error converting Excel to CSV: {e}")
         # Fallback to simple conversion with post-processing
         try:
-            df = pd.read_excel(excel_file, sheet_name=sheet_name)
+            with pd.ExcelFile(excel_file) as book:
+                df = pd.read_excel(book, sheet_name=sheet_name, dtype=id_column_dtypes(book, sheet_name))
             df.to_csv(csv_file, index=False, encoding='utf-8')
             
             # Apply post-processing cleanup
@@ -631,6 +728,236 @@ def excel_to_csv(excel_file, csv_file, sheet_name=0):
             print(f"❌ Fallback conversion also failed: {fallback_error}")
 
 
+# Columns whose values are identifiers even when every value is made of digits
+ID_COLUMN_KEYWORDS = ("身份证", "证号", "号码", "编号", "账号", "卡号", "电话", "手机", "代码", "证件")
+
+
+def id_column_dtypes(book: pd.ExcelFile, sheet_name=0) -> dict:
+    """
+    身份证号、证号等列按文本读取 {列名: str}：pandas 会把整列看起来像数字的文本转成数字，
+    含空值时 18 位身份证号变成 1.1e+17、低保证号 "0012" 变成 12.0。
+    book 是已打开的 pd.ExcelFile，只解析表头行，不会再载入一次工作簿
+    """
+    try:
+        columns = pd.read_excel(book, sheet_name=sheet_name, nrows=0).columns
+    except Exception:
+        return {}
+    return {column: str for column in columns
+            if isinstance(column, str) and any(keyword in column for keyword in ID_COLUMN_KEYWORDS)}
+
+
+def use_streaming_reader(excel_file) -> bool:
+    """文件不小于 EXCEL_STREAMING_MIN_MB（默认 20MB，0 表示总是流式）时用流式读取"""
+    path = Path(excel_file)
+    if path.suffix.lower() not in STREAMING_EXTENSIONS or not path.exists():
+        return False
+    threshold_mb = float(os.getenv("EXCEL_STREAMING_MIN_MB", "20"))
+    return path.stat().st_size >= threshold_mb * 1024 * 1024
+
+
+def _stream_cell_text(value) -> str:
+    """Non-string cell as DataFrame.to_csv writes it after the date cleaning (datetimes as YYYY-MM-DD)"""
+    if is_blank(value):
+        return ""
+    if isinstance(value, datetime):
+        return value.strftime('%Y-%m-%d')
+    return str(value)
+
+
+def _stream_header(row: list) -> list[str]:
+    """Column names as pd.read_excel builds them: blanks become 'Unnamed: i', duplicates get .1/.2 suffixes"""
+    names = [f"Unnamed: {i}" if value is None or value == "" else
+             (value if isinstance(value, str) else _stream_cell_text(value)) for i, value in enumerate(row)]
+    counts = {}
+    for i, name in enumerate(names):
+        count = counts.get(name, 0)
+        while count > 0:
+            counts[name] = count + 1
+            name = f"{name}.{count}"
+            count = counts.get(name, 0)
+        names[i] = name
+        counts[name] = count + 1
+    return names
+
+
+def _write_stream_batch(writer, batch: list[list]) -> None:
+    # Every string cell of the batch goes through the vectorised clean_date_string rules in one call
+    positions = [(r, c) for r, row in enumerate(batch) for c, value in enumerate(row)
+                 if isinstance(value, str) and value not in NA_STRINGS]
+    if positions:
+        cleaned = _normalise_date_strings(pd.Series([batch[r][c] for r, c in positions], dtype=object))
+        for (r, c), text in zip(positions, cleaned.tolist()):
+            batch[r][c] = text
+    writer.writerows([[value if isinstance(value, str) and value not in NA_STRINGS else _stream_cell_text(value)
+                       for value in row] for row in batch])
+
+
+def stream_excel_to_csv(excel_file, csv_file, sheet_name=0, batch_rows: int = 5000) -> int:
+    """
+    逐行把工作表转换为 CSV，内存中最多保留 batch_rows 行。
+    
+    与 excel_to_csv 整表模式的输出基本一致（表头规则、空行、缺失值、日期清洗相同），区别：
+    - 文本单元格保持原文（整表模式只对身份证号、证号等列这样做，见 id_column_dtypes；其他列中看起来像数字的文本会转成数字）
+    - 日期单元格总是写成 YYYY-MM-DD（整表模式下与文本混在一列的日期会带 00:00:00）
+    - 整数值的数字总是写成整数（整表模式下含空值的数字列会写成 3.0）
+    - 比表头宽的数据行不会补齐前面较窄的行
+    
+    Returns:
+        int: 写出的数据行数（不含表头）
+    """
+    import csv
+    import shutil
+    
+    csv_path = Path(csv_file)
+    body_path = csv_path.with_name(csv_path.name + ".part")
+    rows = iter_sheet_rows(excel_file, sheet_name)
+    header = next(rows, [])
+    width = len(header)
+    written = 0
+    
+    try:
+        # The header is written last: a data row wider than the header adds Unnamed columns
+        with open(body_path, 'w', encoding='utf-8', newline='') as body:
+            writer = csv.writer(body, lineterminator=os.linesep)
+            batch = []
+            for row in rows:
+                width = max(width, len(row))
+                batch.append(row + [None] * (width - len(row)))
+                if len(batch) >= batch_rows:
+                    _write_stream_batch(writer, batch)
+                    written += len(batch)
+                    batch = []
+            if batch:
+                _write_stream_batch(writer, batch)
+                written += len(batch)
+        
+        with open(csv_path, 'w', encoding='utf-8', newline='') as out:
+            csv.writer(out, lineterminator=os.linesep).writerow(_stream_header(header + [None] * (width - len(header))))
+            with open(body_path, 'r', encoding='utf-8', newline='') as body:
+                shutil.copyfileobj(body, out)
+    finally:
+        body_path.unlink(missing_ok=True)
+    return written
+
+
+# Date formats clean_date_string tries, in order
+DATE_PATTERNS = [
+    '%Y-%m-%d %H:%M:%S',
+    '%Y-%m-%d',
+    '%Y/%m/%d',
+    '%m/%d/%Y',
+    '%d/%m/%Y',
+    '%Y%m%d'
+]
+
+# Superset of everything strptime can accept for one of DATE_PATTERNS (%m/%d/%H/%M/%S take 1-2 digits,
+# %d may be " 5", a space in the format matches any whitespace run); other strings never parse as dates
+_DATE_CANDIDATE_PATTERN = (r'\d{4}-\d{1,2}- ?\d{1,2}(?:\s+\d{1,2}:\d{1,2}:\d{1,2})?'
+                           r'|\d{4}/\d{1,2}/ ?\d{1,2}'
+                           r'|\d{1,2}/ ?\d{1,2}/\d{4}'
+                           r'|\d{5,6} ?\d{1,2}')
+
+# Zero-padded ASCII shapes (years 1000-9999) where pd.to_datetime(format=...) and datetime.strptime agree; each shape can only be
+# matched by its own pattern in DATE_PATTERNS, so a successful parse is what the strptime cascade returns
+_CANONICAL_DATE_SHAPES = [
+    (r'[1-9][0-9]{3}-[0-9]{2}-[0-9]{2} (?:[01][0-9]|2[0-3]):[0-5][0-9]:[0-5][0-9]', '%Y-%m-%d %H:%M:%S'),
+    (r'[1-9][0-9]{3}-[0-9]{2}-[0-9]{2}', '%Y-%m-%d'),
+    (r'[1-9][0-9]{3}/[0-9]{2}/[0-9]{2}', '%Y/%m/%d'),
+    (r'[0-9]{2}/[0-9]{2}/[1-9][0-9]{3}', '%m/%d/%Y'),
+    (r'[1-9][0-9]{7}', '%Y%m%d'),
+]
+
+
+def _parse_date_patterns(value: str) -> str:
+    """Return value as YYYY-MM-DD if one of DATE_PATTERNS parses it, otherwise unchanged"""
+    try:
+        for pattern in DATE_PATTERNS:
+            try:
+                parsed_date = datetime.strptime(str(value), pattern)
+                return parsed_date.strftime('%Y-%m-%d')  # Return clean date format
+            except ValueError:
+                continue
+    except:
+        pass
+    
+    return value  # Return original if no date pattern matched
+
+
+def _normalise_date_strings(values: pd.Series) -> pd.Series:
+    """clean_date_string for a Series of str, with vectorised string ops and pd.to_datetime cascades"""
+    # object dtype keeps Python re semantics (pyarrow-backed strings would use RE2)
+    values = pd.Series(values.to_numpy(dtype=object), dtype=object)
+    cleaned = (values.str.replace(".00.00.00", "", regex=False)
+                     .str.replace(" 00:00:00", "", regex=False)
+                     .str.replace(r'\.00\.00\.00$', '', regex=True)
+                     .str.replace(r' 00:00:00\.0+$', '', regex=True)
+                     .str.replace(r'\.0+$', '', regex=True))
+    
+    result = cleaned.copy()
+    unresolved = cleaned[cleaned.str.fullmatch(_DATE_CANDIDATE_PATTERN).astype(bool)]
+    for shape, date_format in _CANONICAL_DATE_SHAPES:
+        if unresolved.empty:
+            break
+        subset = unresolved[unresolved.str.fullmatch(shape).astype(bool)]
+        if subset.empty:
+            continue
+        parsed = pd.to_datetime(subset, format=date_format, errors="coerce")
+        parsed = parsed[parsed.notna()]
+        result[parsed.index] = parsed.dt.strftime('%Y-%m-%d')
+        unresolved = unresolved.drop(parsed.index)
+    
+    # Non-canonical candidates (unpadded, unicode digits, out of pandas' range...): exact strptime cascade per distinct value
+    if not unresolved.empty:
+        parsed_values = {value: _parse_date_patterns(value) for value in unresolved.unique()}
+        result[unresolved.index] = unresolved.map(parsed_values)
+    return result
+
+
+def _normalise_date_column(series: pd.Series) -> pd.Series:
+    """One column of excel_to_csv's date cleaning; returns what the per-cell apply used to return"""
+    if pd.api.types.is_datetime64_any_dtype(series.dtype):
+        print(f"📅 Found datetime column: {series.name}")
+        # Convert datetime columns to clean date format
+        return series.dt.strftime('%Y-%m-%d')
+    
+    if not (pd.api.types.is_object_dtype(series.dtype) or pd.api.types.is_string_dtype(series.dtype)):
+        # Numbers / booleans: clean_date_string leaves them untouched
+        return series
+    
+    values = series.to_numpy(dtype=object)
+    present = pd.notna(values)
+    cell_types = {type(value) for value in values[present]}
+    
+    if any(issubclass(t, pd.Timestamp) for t in cell_types):
+        print(f"📅 Found datetime column: {series.name}")
+        dated = present & np.fromiter((hasattr(value, 'strftime') for value in values), bool, len(values))
+        out = values.copy()
+        out[dated] = [value.strftime('%Y-%m-%d') for value in values[dated]]
+        return pd.Series(out, index=series.index, name=series.name, dtype=object)
+    
+    if not any(issubclass(t, str) for t in cell_types):
+        # No strings: clean_date_string is the identity; keep apply for its dtype inference on mixed objects
+        return series.apply(lambda x: x)
+    
+    is_string = np.fromiter((isinstance(value, str) for value in values), bool, len(values))
+    out = values.copy()
+    out[is_string] = _normalise_date_strings(pd.Series(values[is_string], dtype=object)).to_numpy(dtype=object)
+    return pd.Series(out, index=series.index, name=series.name, dtype=object)
+
+
+def normalise_excel_dates(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Column-wise date cleaning used by excel_to_csv: datetime columns become YYYY-MM-DD,
+    every string cell goes through the clean_date_string rules. Same output as applying
+    clean_date_string cell by cell, without per-cell regex / strptime calls.
+    """
+    df = df.copy(deep=False)
+    for position, col in enumerate(df.columns):
+        print(f"🔍 Processing column '{col}' with dtype: {df.iloc[:, position].dtype}")
+        df.isetitem(position, _normalise_date_column(df.iloc[:, position]))
+    return df
+
+
 def clean_date_string(value):
     """Clean up date strings and remove malformed time portions"""
     if not isinstance(value, str):
@@ -650,27 +977,7 @@ def clean_date_string(value):
     value = re.sub(r'\.0+$', '', str(value))  # Remove trailing .000...
     
     # Try to parse and reformat date strings
-    try:
-        # Common date patterns to try
-        date_patterns = [
-            '%Y-%m-%d %H:%M:%S',
-            '%Y-%m-%d',
-            '%Y/%m/%d',
-            '%m/%d/%Y',
-            '%d/%m/%Y',
-            '%Y%m%d'
-        ]
-        
-        for pattern in date_patterns:
-            try:
-                parsed_date = datetime.strptime(str(value), pattern)
-                return parsed_date.strftime('%Y-%m-%d')  # Return clean date format
-            except ValueError:
-                continue
-    except:
-        pass
-    
-    return value  # Return original if no date pattern matched
+    return _parse_date_patterns(value)
 
 def read_relative_files_from_data_json(data_json_path: str = "agents/data.json", headers_mapping: str = None) -> str:
     """
@@ -690,9 +997,8 @@ def find_largest_file(excel_file_paths: list[str]) -> str:
     file_row_counts = {}
     for file_path in excel_file_paths:
         try:
-            df = pd.read_excel(file_path)
-            # Count actual data rows (excluding header)
-            data_rows = len(df.dropna(how='all'))  # Remove completely empty rows
+            # Count actual data rows (excluding header and completely empty rows) without loading the sheet
+            data_rows = count_data_rows(file_path)
             file_row_counts[file_path] = data_rows
             print(f"📊 {Path(file_path).name}: {data_rows} data rows")
         except Exception as e:
@@ -863,10 +1169,12 @@ def create_chunks_from_pairs(pairs: list[tuple[str, str]], chunk_nums: int) -> l
 
 def combine_chunk_content(chunk_pairs: list[tuple[str, str]], largest_structure_info: str, 
                          largest_filename: str, other_files_content: list[str], 
-                         supplement_files_summary: str) -> str:
+                         supplement_files_summary: str, row_ids: Optional[list[str]] = None) -> str:
     """
     Combine chunk content with structure info and other files.
     
+    Args:
+        row_ids: Stable row IDs of chunk_pairs for the compact encoding (default R1..Rn)
     Returns:
         str: Combined content for the chunk
     """
@@ -884,9 +1192,20 @@ def combine_chunk_content(chunk_pairs: list[tuple[str, str]], largest_structure_
         largest_file_chunk_content += f"=== 核心数据源：{largest_filename} ===\n"
         largest_file_chunk_content += "【说明】以下为主要数据源，请优先基于此数据进行合成和填充\n\n"
         
-        # Reconstruct the alternating header+data format
-        for header, data in chunk_pairs:
-            largest_file_chunk_content += f"{header}\n{data}\n"
+        if compact_encoding_enabled():
+            # Header once, rows tagged with their row IDs
+            largest_file_chunk_content += FORMAT_NOTE + "\n"
+            legend = None
+            if column_legend_enabled():
+                legend = build_column_legend([header for header, _ in chunk_pairs])
+                largest_file_chunk_content += render_legend(legend) + "\n"
+            if row_ids is None:
+                row_ids = [row_id(i) for i in range(len(chunk_pairs))]
+            largest_file_chunk_content += encode_records(chunk_pairs, row_ids, legend) + "\n"
+        else:
+            # Reconstruct the alternating header+data format
+            for header, data in chunk_pairs:
+                largest_file_chunk_content += f"{header}\n{data}\n"
         
         chunk_combined.append(largest_file_chunk_content.rstrip())  # Remove trailing newline
     
@@ -931,9 +1250,52 @@ def find_largest_file(csv_files: list[str], row_counts: list[int], largest_file:
     
     return largest_file
 
+def _build_reference_indexes(core_pairs: list[tuple[str, str]], reference_paths: list[str], csv_indexes: dict,
+                             structure_sections: dict) -> tuple[dict, list]:
+    """
+    为可以按关联键筛选的参考文件建立哈希索引。
+
+    Returns:
+        tuple: ({excel_path: ReferenceIndex}, 每条核心记录的关联键取值)；
+               没有共同关联字段或一条都匹配不上的参考文件不在结果中（整份附上）
+    """
+    if not reference_join_enabled() or not reference_paths:
+        return {}, []
+    core_key_types = header_key_types(core_pairs)
+    if not core_key_types:
+        print("🔗 核心数据没有身份类关联字段，参考数据整份附上")
+        return {}, []
+    core_keys = [record_keys(header, data, core_key_types) for header, data in core_pairs]
+    
+    reference_indexes = {}
+    for excel_path in reference_paths:
+        filename = Path(excel_path).name
+        if excel_path not in csv_indexes:
+            continue
+        csv_file_path, csv_index = csv_indexes[excel_path]
+        try:
+            pairs = read_csv_records(csv_file_path, meta=csv_index)
+        except Exception as e:
+            print(f"⚠️ 读取参考文件 {filename} 的记录失败，整份附上: {e}")
+            continue
+        shared_key_types = core_key_types & header_key_types(pairs)
+        if not shared_key_types:
+            print(f"🔗 {filename} 与核心数据没有共同的关联字段，整份附上")
+            continue
+        reference = ReferenceIndex(filename, pairs, csv_index["repeated_header"],
+                                   structure_sections.get(excel_path, ""), shared_key_types)
+        if not reference.match(core_keys):
+            print(f"🔗 {filename} 的关联字段 {sorted(shared_key_types)} 与核心数据一条都没有匹配上，整份附上")
+            continue
+        reference_indexes[excel_path] = reference
+        print(f"🔗 {filename}: 按 {'、'.join(sorted(shared_key_types))} 关联核心数据 ({len(pairs)} 条记录)")
+    return reference_indexes, core_keys
+
+
 def process_excel_files_for_integration(excel_file_paths: list[str], supplement_files_summary: str = "", 
                                       session_id: str = "1", chunk_nums: int = 5, largest_file: str = None,
-                                      data_json_path: str = "agents/data.json", village_name: str = "") -> dict:
+                                      data_json_path: str = "agents/data.json", village_name: str = "",
+                                      model_name: str = "deepseek-ai/DeepSeek-V3", reserved_prompt_tokens: int = 0) -> dict:
     """
     Process Excel files by reading their corresponding pre-generated CSV files,
     finding the one with most rows, chunking the largest file, and combining everything.
@@ -942,14 +1304,18 @@ def process_excel_files_for_integration(excel_file_paths: list[str], supplement_
         excel_file_paths: List of Excel file paths (used to find corresponding CSV files)
         supplement_files_summary: String containing supplement file content (not a list)
         session_id: Session identifier for folder structure
-        chunk_nums: Number of chunks to create (default 5)
+        chunk_nums: Minimum number of chunks for parallelism; more are created if the token budget requires it
         largest_file: Optional pre-specified largest file path
         data_json_path: Path to data.json file containing structure information
         village_name: Name of the village to process
+        model_name: Model that will process the chunks (selects tokenizer and token budget)
+        reserved_prompt_tokens: Tokens of the system prompt sent alongside every chunk
     Returns:
         dict: {
             "combined_chunks": List of strings, each containing combined content of one chunk with other files
             "largest_file_row_count": int, number of data rows in the largest file
+            "largest_file": str, the Excel path whose rows were chunked (row IDs R1..Rn follow its records)
+            "chunk_token_estimates": List of estimated tokens (prompt + output) per chunk
         }
     """
     print(f"🔄 Processing {len(excel_file_paths)} Excel files...")
@@ -965,8 +1331,9 @@ def process_excel_files_for_integration(excel_file_paths: list[str], supplement_
         print(f"❌ CSV files directory not found: {csv_base_dir}")
         return {"combined_chunks": [], "largest_file_row_count": 0}
     
-    # Step 1: Find corresponding CSV files and count rows
-    file_contents = {}  # {original_excel_path: csv_content}
+    # Step 1: Find corresponding CSV files and count rows from their sidecar indexes (no full read)
+    file_contents = {}  # {original_excel_path: content sent as reference data}
+    csv_indexes = {}  # {original_excel_path: (csv_path, index metadata)}
     
     for excel_path in excel_file_paths:
         excel_filename = Path(excel_path).stem  # Get filename without extension
@@ -974,20 +1341,12 @@ def process_excel_files_for_integration(excel_file_paths: list[str], supplement_
         
         if csv_file_path.exists():
             try:
-                # Read CSV content
-                with open(csv_file_path, 'r', encoding='utf-8') as f:
-                    csv_content = f.read()
-                
-                # Count data rows using helper function
-                csv_lines = csv_content.strip().split('\n')
-                is_repeated_header, data_rows = detect_csv_format(csv_lines)
+                csv_index = load_csv_index(csv_file_path)
+                data_rows = csv_index["row_count"]
                 
                 csv_files.append(excel_path)  # Keep original Excel path as key
                 row_counts.append(data_rows)
-                
-                # Store content with proper headers
-                combined_content = f"=== {Path(excel_path).name} 的表格数据 ===\n{csv_content}"
-                file_contents[excel_path] = combined_content
+                csv_indexes[excel_path] = (csv_file_path, csv_index)
                 
                 print(f"✅ Found CSV for {Path(excel_path).name}: {data_rows} data rows")
                 
@@ -1017,79 +1376,119 @@ def process_excel_files_for_integration(excel_file_paths: list[str], supplement_
         except Exception as e:
             print(f"⚠️ Failed to load structure info: {e}")
     
-    # Step 3: Add structure information to file contents
-    for excel_path in list(file_contents.keys()):
+    # Step 3: Find the largest file by row count
+    largest_file = find_largest_file(csv_files, row_counts, largest_file)
+    largest_filename = Path(largest_file).name
+    
+    # Step 4: Read reference files and add structure information
+    structure_sections = {}  # {excel_path: "=== x 的表格结构 ===..." prefix, "" without structure info}
+    for excel_path in csv_files:
+        filename = Path(excel_path).name
+        if excel_path == largest_file:
+            continue
+        if excel_path in csv_indexes:
+            try:
+                csv_file_path, csv_index = csv_indexes[excel_path]
+                if compact_encoding_enabled() and csv_index["repeated_header"]:
+                    # Header once instead of before every row
+                    csv_text = encode_records(read_csv_records(csv_file_path, meta=csv_index)) + "\n"
+                else:
+                    with open(csv_file_path, 'r', encoding='utf-8') as f:
+                        csv_text = f.read()
+                file_contents[excel_path] = f"=== {filename} 的表格数据 ===\n{csv_text}"
+            except Exception as e:
+                print(f"❌ Error reading CSV for {filename}: {e}")
+                file_contents[excel_path] = f"Error reading CSV file: {e}"
+        
         structure_info = extract_structure_info_for_file(excel_path, table_structure_info)
         
         # Update file content to include structure information
         if structure_info:
             original_content = file_contents[excel_path]
-            filename = Path(excel_path).name
             new_content = f"=== {filename} 的表格结构 ===\n{structure_info}=== {filename} 的表格数据 ===\n"
             # Extract the CSV data part
             csv_data = original_content.split(f"=== {filename} 的表格数据 ===\n", 1)[1] if f"=== {filename} 的表格数据 ===" in original_content else original_content
             file_contents[excel_path] = new_content + csv_data
+            structure_sections[excel_path] = f"=== {filename} 的表格结构 ===\n{structure_info}"
             print(f"✅ Added structure info for {filename}")
     
-    # Step 4: Find the largest file by row count
-    largest_file = find_largest_file(csv_files, row_counts, largest_file)
-    
-    # Step 5: Handle the largest file - divide into chunks while preserving header+data pairs
-    largest_file_content = file_contents[largest_file]
-    other_files_content = [content for path, content in file_contents.items() if path != largest_file]
-    
-    # Extract data from the largest file content
-    largest_file_lines = largest_file_content.split('\n')
-    largest_filename = Path(largest_file).name
-    data_header_pattern = f"=== {largest_filename} 的表格数据 ==="
-    
-    # Find where the actual CSV data starts and extract structure info
-    data_section_start = -1
-    for i, line in enumerate(largest_file_lines):
-        if line.strip() == data_header_pattern:
-            data_section_start = i
-            break
-    
-    if data_section_start == -1:
-        print(f"⚠️ Could not find data section separator '{data_header_pattern}', using full content")
-        largest_structure_info = ""
-        largest_data_lines = largest_file_lines
-    else:
-        # Structure is everything before the data header
-        largest_structure_info = '\n'.join(largest_file_lines[:data_section_start])
-        # Data is everything after the data header (excluding the header itself)
-        largest_data_lines = largest_file_lines[data_section_start + 1:]
+    reference_paths = [path for path in csv_files if path != largest_file]
     
-    # Remove empty lines at the beginning and end of data
-    while largest_data_lines and not largest_data_lines[0].strip():
-        largest_data_lines.pop(0)
-    while largest_data_lines and not largest_data_lines[-1].strip():
-        largest_data_lines.pop()
+    # Step 5: Handle the largest file - its header+data pairs come straight from the record offsets
+    largest_structure_info = ""
+    structure_info = extract_structure_info_for_file(largest_file, table_structure_info)
+    if structure_info:
+        # Same text the structure section had when it was split off the combined file content
+        largest_structure_info = "\n".join(f"=== {largest_filename} 的表格结构 ===\n{structure_info}".split("\n")[:-1])
+        print(f"✅ Added structure info for {largest_filename}")
     
-    # Detect format and parse into header+data pairs
-    is_repeated_header, _ = detect_csv_format(largest_data_lines)
-    header_data_pairs = parse_header_data_pairs(largest_data_lines, is_repeated_header)
+    header_data_pairs = []
+    if largest_file in csv_indexes:
+        csv_file_path, csv_index = csv_indexes[largest_file]
+        header_data_pairs = read_csv_records(csv_file_path, meta=csv_index)
     
     if not header_data_pairs:
         print("⚠️ No valid header+data pairs found")
         return {"combined_chunks": [], "largest_file_row_count": 0}
     
-    # Create chunks from pairs (preserving header+data integrity)
-    pair_chunks = create_chunks_from_pairs(header_data_pairs, chunk_nums)
-    
-    if not pair_chunks:
+    # Step 6: Reference rows that share a join key (身份证号码/低保证号/户主姓名) with each core row
+    reference_indexes, core_keys = _build_reference_indexes(
+        header_data_pairs, reference_paths, csv_indexes, structure_sections
+    )
+    item_context = None
+    if reference_indexes:
+        item_context = ["\n".join(reference.render_rows(reference.match([keys])) for reference in reference_indexes.values())
+                        for keys in core_keys]
+    
+    # Create chunks from pairs (preserving header+data integrity), sized by the model's token budget:
+    # structure info, unfiltered reference files and supplement are repeated in every chunk,
+    # filtered reference files only contribute their structure/header there and their matching rows per item
+    shared_content = combine_chunk_content([], largest_structure_info, largest_filename,
+                                           [reference_indexes[path].render([]) if path in reference_indexes else file_contents[path]
+                                            for path in reference_paths],
+                                           supplement_files_summary)
+    if compact_encoding_enabled():
+        # Each row costs its ID and data; the format note and the (distinct) header lines are shared
+        chunk_items = [f"{row_id(i)},{data}" for i, (_, data) in enumerate(header_data_pairs)]
+        shared_content += "\n" + FORMAT_NOTE + "\n" + "\n".join(dict.fromkeys(header for header, _ in header_data_pairs))
+    else:
+        chunk_items = [f"{header}\n{data}" for header, data in header_data_pairs]
+    plan = plan_chunks(
+        chunk_items, model_name,
+        shared_prompt=largest_structure_info + "\n" + shared_content,
+        shared_prompt_tokens=reserved_prompt_tokens,
+        output_ratio=2.0, min_chunks=chunk_nums, item_context=item_context
+    )
+    
+    if not plan.boundaries:
         print("⚠️ No chunks created")
         return {"combined_chunks": [], "largest_file_row_count": 0}
     
-    # Step 6: Combine chunks with other content
+    # Step 7: Combine chunks with other content
     combined_chunks = []
-    for chunk_index, chunk_pairs in enumerate(pair_chunks):
+    for start, end in plan.boundaries:
+        chunk_other_content = [
+            reference_indexes[path].render(reference_indexes[path].match(core_keys[start:end]))
+            if path in reference_indexes else file_contents[path]
+            for path in reference_paths
+        ]
         combined_content = combine_chunk_content(
-            chunk_pairs, largest_structure_info, largest_filename, 
-            other_files_content, supplement_files_summary
+            header_data_pairs[start:end], largest_structure_info, largest_filename, 
+            chunk_other_content, supplement_files_summary,
+            row_ids=[row_id(i) for i in range(start, end)]
         )
         combined_chunks.append(combined_content)
     
+    if reference_indexes:
+        filtered_paths = [path for path in reference_paths if path in reference_indexes]
+        full_tokens = sum(estimate_tokens(file_contents[path], model_name) for path in filtered_paths) * len(combined_chunks)
+        sent_tokens = sum(
+            estimate_tokens(reference_indexes[path].render(reference_indexes[path].match(core_keys[start:end])), model_name)
+            for path in filtered_paths for start, end in plan.boundaries
+        )
+        print(f"🔗 参考数据按关联键筛选: {len(filtered_paths)} 个文件, 共约 {sent_tokens:,} tokens "
+              f"(整份附上约 {full_tokens:,} tokens)")
+    
     print(f"🎉 Successfully created {len(combined_chunks)} combined chunks")
     
     # Return both chunks and largest file row count
@@ -1097,12 +1496,16 @@ def process_excel_files_for_integration(excel_file_paths: list[str], supplement_
     
     return {
         "combined_chunks": combined_chunks,
-        "largest_file_row_count": largest_file_row_count
+        "largest_file_row_count": largest_file_row_count,
+        "largest_file": largest_file,
+        "chunk_token_estimates": plan.estimated_tokens
     }
 
 
 def process_excel_files_for_merge(excel_file_paths: list[str], session_id: str = "1", 
-                                      village_name: str = "", chunk_nums: int = 5) -> dict:
+                                      village_name: str = "", chunk_nums: int = 5,
+                                      model_name: str = "deepseek-ai/DeepSeek-V3", reserved_prompt_tokens: int = 0,
+                                      keep_columns: Optional[dict[str, list[str]]] = None) -> dict:
         """
         处理Excel文件进行合并 - 将所有文件作为核心数据进行合并而不是分为核心和参考数据
         
@@ -1110,11 +1513,16 @@ def process_excel_files_for_merge(excel_file_paths: list[str], session_id: str =
             excel_file_paths: Excel文件路径列表
             session_id: 会话ID
             village_name: 村庄名称
-            chunk_nums: 分块数量
+            chunk_nums: 最少分块数量（保证并发度），token 预算不够时会自动增加
+            model_name: 处理数据块的模型（决定分词器和 token 预算）
+            reserved_prompt_tokens: 每块都会附带的系统提示词 token 数
+            keep_columns: {文件名(不含扩展名): 保留的列}，给出时每行只保留这些列
+                （本地合并后只剩需要推理的列，见 local_merge.build_local_merge 的 context_columns）
         Returns:
             dict: {
                 "combined_chunks": 合并后的数据块列表
                 "total_row_count": 总行数
+                "chunk_token_estimates": 每块估算的 token 数（提示词 + 输出）
             }
         """
         print(f"🔄 合并处理 {len(excel_file_paths)} 个Excel文件...")
@@ -1128,8 +1536,7 @@ def process_excel_files_for_merge(excel_file_paths: list[str], session_id: str =
             print(f"❌ CSV files directory not found: {csv_base_dir}")
             return {"combined_chunks": [], "total_row_count": 0}
         
-        # Step 1: Load all CSV files and their content
-        file_contents = {}  # {original_excel_path: csv_content}
+        # Step 1: Load the header+data pairs of all CSV files
         all_data_rows = []  # 存储所有数据行用于合并
         
         for excel_path in excel_file_paths:
@@ -1138,29 +1545,20 @@ def process_excel_files_for_merge(excel_file_paths: list[str], session_id: str =
             
             if csv_file_path.exists():
                 try:
-                    # Read CSV content
-                    with open(csv_file_path, 'r', encoding='utf-8') as f:
-                        csv_content = f.read()
-                    
-                    # Count data rows using helper function from file_process.py
-                    csv_lines = csv_content.strip().split('\n')
-                    # We need to import the helper functions
-                    from utils.file_process import detect_csv_format, parse_header_data_pairs
-                    
-                    is_repeated_header, data_rows = detect_csv_format(csv_lines)
+                    # Row count and header+data pairs from the sidecar index
+                    csv_index = load_csv_index(csv_file_path)
+                    data_rows = csv_index["row_count"]
                     
                     csv_files.append(excel_path)
                     row_counts.append(data_rows)
                     
-                    # Store content with proper headers
-                    combined_content = f"=== {Path(excel_path).name} 的核心数据 ===\n{csv_content}"
-                    file_contents[excel_path] = combined_content
-                    
                     # Parse header+data pairs for merging
-                    header_data_pairs = parse_header_data_pairs(csv_lines, is_repeated_header)
+                    header_data_pairs = read_csv_records(csv_file_path, meta=csv_index)
                     
                     # Add all data pairs to the combined list with file identifier
                     for header, data in header_data_pairs:
+                        if keep_columns and excel_filename in keep_columns:
+                            header, data = project_record(header, data, keep_columns[excel_filename])
                         all_data_rows.append({
                             'source_file': Path(excel_path).name,
                             'header': header,
@@ -1172,7 +1570,6 @@ def process_excel_files_for_merge(excel_file_paths: list[str], session_id: str =
                     
                 except Exception as e:
                     print(f"❌ 读取CSV文件错误 {Path(excel_path).name}: {e}")
-                    file_contents[excel_path] = f"Error reading CSV file: {e}"
                     csv_files.append(excel_path)
                     row_counts.append(0)
             else:
@@ -1184,23 +1581,51 @@ def process_excel_files_for_merge(excel_file_paths: list[str], session_id: str =
         
         print(f"📊 总共收集到 {len(all_data_rows)} 行数据用于合并")
         
-        # Step 2: Create chunks from all merged data
+        # Step 2: Create chunks from all merged data, sized by the model's token budget
         total_rows = len(all_data_rows)
-        chunk_size = max(1, total_rows // chunk_nums)  # 确保每个chunk至少有1行
+        compact = compact_encoding_enabled()
+        if compact:
+            # Rows keep their position in the merged sequence as a stable row ID;
+            # the source file and header are written once per group of consecutive rows
+            for idx, row_data in enumerate(all_data_rows):
+                row_data['row_id'] = row_id(idx)
+            chunk_items = [f"{row_data['row_id']},{row_data['data']}" for row_data in all_data_rows]
+            shared_prompt = FORMAT_NOTE + "\n" + "\n".join(
+                dict.fromkeys(f"--- 文件来源: {row_data['source_file']} ---\n{row_data['header']}" for row_data in all_data_rows))
+        else:
+            chunk_items = [row_data['combined_entry'] for row_data in all_data_rows]
+            shared_prompt = ""
+        plan = plan_chunks(
+            chunk_items, model_name, shared_prompt=shared_prompt,
+            shared_prompt_tokens=reserved_prompt_tokens, output_ratio=2.0, min_chunks=chunk_nums
+        )
         
         combined_chunks = []
-        for i in range(0, total_rows, chunk_size):
-            chunk_end = min(i + chunk_size, total_rows)
-            chunk_data = all_data_rows[i:chunk_end]
-            
+        for chunk_data in plan.split(all_data_rows):
             # Build chunk content
             chunk_content = f"=== 合并数据块 {len(combined_chunks) + 1} ===\n"
             chunk_content += f"包含 {len(chunk_data)} 行来自 {len(set([row['source_file'] for row in chunk_data]))} 个文件的数据\n\n"
             
-            # Add all data entries in this chunk
-            for idx, row_data in enumerate(chunk_data):
-                chunk_content += f"--- 数据条目 {idx + 1} ---\n"
-                chunk_content += row_data['combined_entry'] + "\n\n"
+            if compact:
+                chunk_content += FORMAT_NOTE + "\n"
+                legend = None
+                if column_legend_enabled():
+                    legend = build_column_legend([row_data['header'] for row_data in chunk_data])
+                    chunk_content += render_legend(legend) + "\n"
+                group_start = 0
+                for idx in range(1, len(chunk_data) + 1):
+                    if idx < len(chunk_data) and chunk_data[idx]['source_file'] == chunk_data[group_start]['source_file']:
+                        continue
+                    group = chunk_data[group_start:idx]
+                    chunk_content += f"\n--- 文件来源: {group[0]['source_file']} ---\n"
+                    chunk_content += encode_records([(row_data['header'], row_data['data']) for row_data in group],
+                                                    [row_data['row_id'] for row_data in group], legend) + "\n"
+                    group_start = idx
+            else:
+                # Add all data entries in this chunk
+                for idx, row_data in enumerate(chunk_data):
+                    chunk_content += f"--- 数据条目 {idx + 1} ---\n"
+                    chunk_content += row_data['combined_entry'] + "\n\n"
             
             combined_chunks.append(chunk_content)
         
@@ -1208,7 +1633,8 @@ def process_excel_files_for_merge(excel_file_paths: list[str], session_id: str =
         
         return {
             "combined_chunks": combined_chunks,
-            "total_row_count": total_rows
+            "total_row_count": total_rows,
+            "chunk_token_estimates": plan.estimated_tokens
         }
 
 
@@ -1255,6 +1681,210 @@ def extract_file_from_recall(response: str) -> list:
     print(f"📁 解析出的相关文件: {related_files}")
     return related_files
 
+class FinalAnswerCSVParser:
+    """
+    Incremental parser for "=== 推理过程 === / === 最终答案 ===" responses.
+
+    Feed it the token stream piece by piece; every time a line of the final-answer
+    section completes it is validated and returned. Only the current partial line is
+    buffered, so reasoning text is dropped as soon as its line ends. A final-answer
+    line with an unclosed quote is held until the quoted field (which may span
+    several lines) is closed.
+    """
+
+    FINAL_ANSWER_MARKER = "=== 最终答案 ==="
+    REASONING_MARKER = "=== 推理过程 ==="
+
+    def __init__(self, strip_row_ids: Optional[bool] = None):
+        self._buffer = ""
+        self._open_record = None  # final-answer line whose quoted field continues on the next line
+        self._in_final_answer = False
+        self.rows_emitted = 0
+        # Rows echoed with the compact encoding's row ID ("R12,...") lose the ID; it is kept in row_ids
+        self.strip_row_ids = compact_encoding_enabled() if strip_row_ids is None else strip_row_ids
+        self.row_ids: list[str | None] = []
+
+    def _consume_line(self, line: str) -> str | None:
+        line = line.strip()
+        
+        # Check if we've reached the final answer section
+        if self.FINAL_ANSWER_MARKER in line:
+            self._in_final_answer = True
+            return None
+        
+        # If we encounter a new reasoning section, stop collecting
+        if self._in_final_answer and self.REASONING_MARKER in line:
+            self._in_final_answer = False
+            return None
+        
+        if not self._in_final_answer or not line or line.startswith("==="):
+            return None
+        if not _is_clean_csv_line(line):
+            return None
+        record_id = None
+        if self.strip_row_ids:
+            record_id, line = split_row_id(line)
+            if not line:
+                return None
+        self.row_ids.append(record_id)
+        self.rows_emitted += 1
+        return line
+
+    def feed(self, text: str) -> list[str]:
+        """Consume a piece of the stream and return the rows completed by it"""
+        self._buffer += text
+        if "\n" not in self._buffer:
+            return []
+        *complete_lines, self._buffer = self._buffer.split("\n")
+        rows = []
+        for line in complete_lines:
+            if self._open_record is not None:
+                line, self._open_record = self._open_record + "\n" + line, None
+            if self._in_final_answer and line.count('"') % 2 == 1:
+                self._open_record = line
+                continue
+            row = self._consume_line(line)
+            if row is not None:
+                rows.append(row)
+        return rows
+
+    def close(self) -> list[str]:
+        """Flush the trailing line (and a record left with an unclosed quote) once the stream has ended"""
+        line, self._buffer = self._buffer, ""
+        if self._open_record is not None:
+            line, self._open_record = self._open_record + "\n" + line, None
+        row = self._consume_line(line)
+        return [row] if row is not None else []
+
+
+async def astream_final_answer_rows(model_name: str, messages: list, temperature: float = 0.2,
+                                    on_row: Callable[[str], None] | None = None, hedge: bool = True,
+                                    strip_row_ids: bool | None = None) -> list[str]:
+    """
+    Stream an LLM response and extract the validated CSV rows of its final-answer section.
+
+    Each row is passed to `on_row` as soon as its line is complete, while the model is
+    still generating. With `hedge=True` a duplicate stream is started when the primary
+    has not produced any row after the learned latency percentile (same budget as
+    ainvoke_model_hedged); the hedge clock starts when the primary is actually sent
+    (after the rate limiter and provider semaphore). Whichever stream emits the first row
+    owns the output; the other one keeps its rows aside and takes over if the owner fails
+    (its rows are then passed to `on_row` from the start), otherwise it is cancelled once
+    the owner has finished. `strip_row_ids` is passed to FinalAnswerCSVParser (False keeps
+    the "R12," prefixes for callers that place rows by ID).
+
+    Returns:
+        list[str]: all rows of the stream that owned the output, in order
+    """
+    policy = get_hedge_policy()
+    buffers: dict[str, list[str]] = {}
+    owner: list[str] = []  # tag of the stream whose rows are returned
+
+    def _forward(new_rows: list[str]) -> None:
+        if on_row is not None:
+            for row in new_rows:
+                on_row(row)
+
+    async def _run(tag: str, stream_model: str, on_dispatch: Callable[[], None] | None = None) -> None:
+        parser = FinalAnswerCSVParser(strip_row_ids=strip_row_ids)
+        rows = buffers.setdefault(tag, [])
+
+        def _emit(new_rows: list[str]) -> None:
+            if not new_rows:
+                return
+            if not owner:
+                owner.append(tag)
+            rows.extend(new_rows)
+            if owner[0] == tag:
+                _forward(new_rows)
+
+        async for piece in astream_model(stream_model, messages, temperature, on_dispatch=on_dispatch):
+            _emit(parser.feed(piece))
+        _emit(parser.close())
+        if not owner:
+            owner.append(tag)  # finished without any valid row: an empty answer is still an answer
+
+    clock = DispatchClock()  # the hedge clock starts when the request is sent, not while it is queued
+    primary = asyncio.create_task(_run("primary", model_name, clock.mark))
+    tasks = {"primary": primary}
+    dispatched = asyncio.create_task(clock.wait())
+    try:
+        while True:
+            threshold = policy.threshold(model_name) if hedge else None
+            elapsed = clock.elapsed()
+            if ("hedge" not in tasks and not owner and clock.dispatched and threshold is not None and elapsed >= threshold
+                    and policy.try_spend()):
+                hedge_model = policy.alternate_for(model_name)
+                print(f"🪁 {model_name} 流式请求 {elapsed:.1f}s 内未产出数据行，发送对冲请求 -> {hedge_model}")
+                tasks["hedge"] = asyncio.create_task(_run("hedge", hedge_model))
+
+            if owner and tasks[owner[0]].done():
+                failed = tasks[owner[0]]
+                if failed.exception() is None:
+                    if owner[0] == "hedge":
+                        policy.record_win()
+                    return buffers[owner[0]]
+                survivors = [tag for tag, task in tasks.items()
+                             if tag != owner[0] and not (task.done() and task.exception() is not None)]
+                if not survivors:
+                    raise failed.exception()
+                print(f"⚠️ {owner[0]} 流式请求在输出 {len(buffers[owner[0]])} 行后失败，改用 {survivors[0]} 的结果: "
+                      f"{failed.exception()}")
+                owner[0] = survivors[0]
+                _forward(buffers.setdefault(owner[0], []))
+                continue
+
+            running = {task for task in tasks.values() if not task.done()}
+            if not running or (primary.done() and primary.exception() is not None and "hedge" not in tasks):
+                raise primary.exception() if primary.exception() is not None else tasks["hedge"].exception()
+            if not clock.dispatched:
+                waiting, wait_for = running | {dispatched}, None
+            else:
+                waiting = running
+                wait_for = HEDGE_CHECK_INTERVAL if threshold is None or "hedge" in tasks else max(threshold - elapsed, 0.05)
+            await asyncio.wait(waiting, timeout=wait_for, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        for task in list(tasks.values()) + [dispatched]:
+            if not task.done():
+                task.cancel()
+
+
+def chunk_retry_attempts() -> int:
+    """CHUNK_RETRY_ATTEMPTS: 失败的数据块再重试几轮（默认 1）"""
+    return max(0, int(os.getenv("CHUNK_RETRY_ATTEMPTS", "1")))
+
+
+async def agather_chunks(process: Callable[[int], Awaitable[object]], count: int,
+                         retries: int | None = None) -> tuple[dict[int, object], list[int]]:
+    """
+    Run `process(i)` for every chunk index concurrently and retry the ones that failed.
+
+    A chunk fails when `process` raises or returns None ("" or [] are valid empty answers).
+
+    Returns:
+        tuple: (results by chunk index, indices still failing after the retries)
+    """
+    results: dict[int, object] = {}
+    pending = list(range(count))
+    attempts = chunk_retry_attempts() if retries is None else retries
+    for attempt in range(attempts + 1):
+        if not pending:
+            break
+        if attempt:
+            print(f"🔁 第 {attempt} 次重试 {len(pending)} 个失败的数据块: {[i + 1 for i in pending]}")
+        outcomes = await asyncio.gather(*(process(i) for i in pending), return_exceptions=True)
+        failed = []
+        for i, outcome in zip(pending, outcomes):
+            if isinstance(outcome, BaseException):
+                print(f"❌ 数据块 {i + 1} 处理出错: {outcome}")
+            if isinstance(outcome, BaseException) or outcome is None:
+                failed.append(i)
+            else:
+                results[i] = outcome
+        pending = failed
+    return results, pending
+
+
 def _clean_csv_data(csv_data: str) -> str:
     """
     Clean up the CSV data by removing the thinking part and only keeping the actual data
@@ -1266,46 +1896,19 @@ def _clean_csv_data(csv_data: str) -> str:
     Returns:
         str: Cleaned CSV data with only the actual data rows
     """
-    csv_data_lines = csv_data.split('\n')
-    
-    # Find the start of the final answer section
-    final_answer_started = False
-    cleaned_lines = []
-    
-    for line in csv_data_lines:
-        line = line.strip()
-        
-        # Check if we've reached the final answer section
-        if "=== 最终答案 ===" in line:
-            final_answer_started = True
-            continue
-        
-        # If we encounter a new reasoning section, stop collecting
-        if final_answer_started and "=== 推理过程 ===" in line:
-            final_answer_started = False
-            continue
-        
-        # If we're in the final answer section, collect the data lines
-        if final_answer_started:
-            # Skip empty lines and lines that look like section headers
-            if line and not line.startswith("==="):
-                cleaned_lines.append(line)
-    
-    # Join the cleaned lines and apply LLM error message cleaning
-    initial_cleaned = '\n'.join(cleaned_lines)
-    
-    # Apply comprehensive error message cleaning
-    final_cleaned = clean_llm_error_messages(initial_cleaned)
-    
-    return final_cleaned
+    parser = FinalAnswerCSVParser()
+    cleaned_lines = parser.feed(csv_data) + parser.close()
+    return '\n'.join(cleaned_lines)
 
-def save_csv_to_output(csv_data_list: list[str], session_id: str = "1") -> str:
+def save_csv_to_output(csv_data_list: list[str], session_id: str = "1", rows_only: bool = False) -> str:
     """
     Save CSV data to session-specific CSV_files folder
     
     Args:
         csv_data_list: List of CSV strings from concurrent processing
         session_id: Session identifier for folder structure
+        rows_only: csv_data_list already holds extracted final-answer rows (streaming workers);
+                   no reasoning is available, so the "with_thinking" file is not written
     
     Returns:
         str: Full path to the saved CSV file
@@ -1344,6 +1947,13 @@ def save_csv_to_output(csv_data_list: list[str], session_id: str = "1") -> str:
     # Join with single newlines
     final_csv = '\n'.join(cleaned_lines)
 
+    if rows_only:
+        with open(filepath_with_only_data, 'w', encoding='utf-8', newline='') as f:
+            f.write(final_csv)
+        print(f"📄 CSV数据已保存到: {filepath_with_only_data}")
+        print(f"📊 清理后包含 {len(cleaned_lines)} 行数据")
+        return None, str(filepath_with_only_data)
+
     # Write to file with thinking process
     with open(filepath_with_thinking, 'w', encoding='utf-8', newline='') as f:
         f.write(final_csv)
@@ -1876,6 +2486,9 @@ def delete_files_from_staging_area(file_paths: list[str]) -> dict[str, list[str]
 
 
 
+RECONSTRUCT_SYSTEM_PROMPT_TOKENS = 2000  # fixed instructions of the reconstruction prompt below
+
+
 def reconstruct_csv_with_headers(analysis_response: str, original_filename: str, 
                                  original_excel_file_path: str = None, village_name: str = None) -> str:
     """
@@ -1896,6 +2509,22 @@ def reconstruct_csv_with_headers(analysis_response: str, original_filename: str,
         csv_output_dir = project_root / "files" / village_name / "table_files" / "CSV_files"
         csv_output_dir.mkdir(parents=True, exist_ok=True)
         
+        # The same original file was reconstructed from the same structure analysis before:
+        # copy the cached CSV instead of re-running the LLM
+        cache = get_artifact_cache()
+        digest = None
+        csv_cache_version = f"{CSV_RECONSTRUCT_VERSION}-{hashlib.sha256(analysis_response.encode('utf-8')).hexdigest()[:16]}"
+        if cache and original_excel_file_path and Path(original_excel_file_path).exists():
+            digest = file_digest(original_excel_file_path)
+            cached = cache.get(digest, "csv", csv_cache_version)
+            if cached is not None:
+                csv_output_path = csv_output_dir / (Path(original_filename).stem + ".csv")
+                with open(csv_output_path, 'w', encoding='utf-8', newline='') as f:
+                    f.write(cached["content"])
+                write_csv_index(csv_output_path)
+                print(f"⚡ 命中CSV重构缓存 ({cached['row_count']} 行数据): {csv_output_path}")
+                return str(csv_output_path)
+        
         # Parse the analysis response to extract table structure
         try:
             if analysis_response.startswith('{') and analysis_response.endswith('}'):
@@ -1930,8 +2559,9 @@ def reconstruct_csv_with_headers(analysis_response: str, original_filename: str,
         from utils.file_process import excel_to_csv
         
         try:
-            # Use the existing helper function to convert Excel to CSV
-            excel_to_csv(str(excel_file_path), str(temp_csv_path))
+            # Use the existing helper function to convert Excel to CSV (date cleaning is CPU bound: run it
+            # on the shared process pool so concurrent table files use all cores)
+            run_cpu_job(excel_to_csv, str(excel_file_path), str(temp_csv_path))
             print(f"📊 Excel文件已转换为CSV: {temp_csv_path}")
         except Exception as e:
             print(f"❌ Excel转CSV失败: {e}")
@@ -1960,24 +2590,20 @@ def reconstruct_csv_with_headers(analysis_response: str, original_filename: str,
         
         print(f"📊 提取到 {len(data_rows)} 行数据")
         
-        # Dynamically adjust chunking based on data size
-        max_chunks = 15  # Maximum number of chunks we want to create
-        total_rows = len(data_rows)
-        
-        if total_rows <= max_chunks:
-            # If we have fewer rows than max chunks, create one chunk per row
-            chunks = [[row] for row in data_rows]
-            print(f"📦 数据行数({total_rows})小于等于最大分块数({max_chunks})，创建 {len(chunks)} 个单行分块")
-        else:
-            # If we have more rows than max chunks, distribute evenly
-            chunk_size = max(1, total_rows // max_chunks)
-            chunks = [data_rows[i:i + chunk_size] for i in range(0, total_rows, chunk_size)]
-            print(f"📦 数据行数({total_rows})大于最大分块数({max_chunks})，创建 {len(chunks)} 个分块，每块约 {chunk_size} 行")
+        # Chunk by token budget: every chunk repeats the system prompt and the structure JSON,
+        # and the model echoes a header line before each data row (output ≈ 2x input)
+        plan = plan_chunks(
+            data_rows, "Pro/deepseek-ai/DeepSeek-V3",
+            shared_prompt=json.dumps(structure_data, ensure_ascii=False, indent=2),
+            shared_prompt_tokens=RECONSTRUCT_SYSTEM_PROMPT_TOKENS,
+            output_ratio=2.0, output_overhead_tokens=200, min_chunks=15
+        )
+        chunks = plan.split(data_rows)
         
         print(f"📏 数据分为 {len(chunks)} 个块进行处理")
         
         # Process chunks with multi-threading
-        def process_chunk(chunk_data: list, chunk_index: int) -> tuple[int, str]:
+        async def process_chunk(chunk_data: list, chunk_index: int) -> tuple[int, str]:
             """Process a single chunk with LLM"""
             try:
                 # Validate chunk data - skip if empty or invalid
@@ -2085,7 +2711,7 @@ def reconstruct_csv_with_headers(analysis_response: str, original_filename: str,
                 print(f"📤 处理块 {chunk_index + 1} (原始: {len(chunk_data)} 行, 有效: {len(valid_data)} 行)")
                 print(f"🔍 重构CSV输入数据块内容\n: {chunk_input}") 
                 # Call LLM
-                response = invoke_model(
+                response = await ainvoke_model_hedged(
                     model_name="Pro/deepseek-ai/DeepSeek-V3",
                     messages=[SystemMessage(content=system_prompt), HumanMessage(content=chunk_input)],
                     temperature=0.2,
@@ -2097,27 +2723,22 @@ def reconstruct_csv_with_headers(analysis_response: str, original_filename: str,
                 
             except Exception as e:
                 print(f"❌ 处理块 {chunk_index + 1} 失败: {e}")
-                return chunk_index, ""
+                return chunk_index, None  # failed, unlike "" (the model found no valid rows)
         
-        # Process all chunks in parallel
-        chunk_results = {}
-        max_workers = min(len(chunks), 15)  # Dynamically adjust workers based on actual chunk count
-        print(f"👥 使用 {max_workers} 个并发工作者处理 {len(chunks)} 个数据块")
+        # Process all chunks concurrently on one event loop (bounded by the per-provider semaphore);
+        # failed chunks are retried and a CSV missing any of them is never written
+        print(f"👥 异步并发处理 {len(chunks)} 个数据块")
         
-        with ThreadPoolExecutor(max_workers=max_workers) as executor:
-            future_to_chunk = {
-                executor.submit(process_chunk, chunk, i): i 
-                for i, chunk in enumerate(chunks)
-            }
-            
-            for future in as_completed(future_to_chunk):
-                chunk_index = future_to_chunk[future]
-                try:
-                    idx, result = future.result()
-                    chunk_results[idx] = result
-                except Exception as e:
-                    print(f"❌ 块 {chunk_index} 处理出错: {e}")
-                    chunk_results[chunk_index] = ""
+        async def process_one(chunk_index: int):
+            _, result = await process_chunk(chunks[chunk_index], chunk_index)
+            return result
+        
+        chunk_results, failed_chunks = run_async(agather_chunks(process_one, len(chunks)))
+        print_client_pool_stats()
+        print_llm_cache_stats()
+        if failed_chunks:
+            print(f"❌ {len(failed_chunks)} 个数据块重试后仍失败，不生成不完整的CSV: {[i + 1 for i in failed_chunks]}")
+            return ""
         
         # Combine results in order, filtering out empty results
         combined_csv = []
@@ -2140,6 +2761,11 @@ def reconstruct_csv_with_headers(analysis_response: str, original_filename: str,
             f.write(final_csv_content)
         
         print(f"💾 重构的CSV文件已保存: {csv_output_path}")
+        # Sidecar index: row count, header format and record offsets for the integration / merge steps
+        csv_index = write_csv_index(csv_output_path)
+        if cache and digest and final_csv_content.strip():
+            cache.put(digest, "csv", csv_cache_version, final_csv_content,
+                      row_count=csv_index["row_count"], source_name=Path(original_excel_file_path).name)
         return str(csv_output_path)
         
     except Exception as e:
@@ -2173,6 +2799,146 @@ def extract_summary_for_each_file(file_content: dict) -> str:
             
             return summary
 
+# Common LLM error messages and artifacts to remove
+_LLM_ARTIFACT_PATTERNS = [re.compile(pattern) for pattern in [
+    # Chinese error messages
+    r'（什么都不输出，完全空白）',
+    r'（什么都不输出，完全空白）',
+    r'完全静默',
+    r'什么都不输出',
+    r'根据规则.*不输出',
+    r'数据不完整.*跳过',
+    r'无有效数据.*跳过',
+    r'根据.*规则.*静默',
+    r'没有.*数据.*输出',
+    r'数据格式.*错误',
+    r'无法.*处理.*跳过',
+    r'遇到.*情况.*静默',
+    r'按照.*要求.*不输出',
+    
+    # English error messages
+    r'(?i)no output',
+    r'(?i)silent mode',
+    r'(?i)skip.*empty.*data',
+    r'(?i)invalid.*data.*format',
+    r'(?i)incomplete.*data.*skip',
+    r'(?i)according.*rules.*silent',
+    r'(?i)data.*incomplete.*skip',
+    r'(?i)no.*valid.*data',
+    r'(?i)error.*processing.*skip',
+    r'(?i)cannot.*process.*skip',
+    
+    # Thinking process artifacts
+    r'=== 推理过程 ===',
+    r'=== 思考过程 ===',
+    r'=== 分析过程 ===',
+    r'=== 处理过程 ===',
+    r'=== 最终答案 ===',
+    r'=== 结果 ===',
+    r'=== THINKING ===',
+    r'=== ANALYSIS ===',
+    r'=== RESULT ===',
+    r'=== FINAL ANSWER ===',
+    
+    # Processing status messages
+    r'正在处理.*',
+    r'处理完成.*',
+    r'开始处理.*',
+    r'跳过.*行',
+    r'添加.*结果',
+    r'生成.*数据',
+    r'Processing.*',
+    r'Completed.*',
+    r'Starting.*',
+    r'Skipping.*',
+    r'Adding.*result',
+    r'Generated.*data',
+    
+    # Markdown artifacts
+    r'```csv',
+    r'```',
+    r'```.*',
+    
+    # Other common artifacts
+    r'数据块.*处理.*异常',
+    r'Error.*processing.*chunk',
+    r'Failed.*to.*process',
+    r'处理失败.*',
+    r'异常.*处理',
+    r'错误.*跳过',
+    r'Warning.*skip',
+    r'⚠️.*',
+    r'❌.*',
+    r'✅.*',
+    r'🔍.*',
+    r'📊.*',
+    r'🎉.*',
+    r'💾.*',
+    r'📄.*',
+    r'🚀.*',
+    r'🔄.*',
+    r'⚡.*',
+    r'📋.*',
+    r'📤.*',
+    r'📥.*',
+    r'🔧.*',
+    r'🛠️.*',
+    r'🔬.*',
+    r'🎯.*',
+    r'💡.*',
+    r'⭐.*',
+    r'🎪.*',
+    r'🎨.*',
+    r'🎭.*',
+    r'🌟.*',
+    r'🔥.*',
+    r'💪.*',
+    r'🚨.*',
+    r'⚠️.*',
+    r'❗.*',
+    r'‼️.*',
+    r'💯.*',
+    r'🎊.*',
+    r'🎈.*',
+    r'🎁.*',
+    r'🎀.*',
+    r'🎂.*',
+    r'🍰.*',
+    r'🎃.*',
+    r'🎄.*',
+    r'🎆.*',
+    r'🎇.*',
+    r'🧨.*',
+    r'✨.*',
+    r'🎉.*',
+    r'🎊.*',
+    r'🎈.*',
+    r'🎁.*',
+    r'🎀.*',
+    r'🎂.*',
+    r'🍰.*',
+    r'🎃.*',
+    r'🎄.*',
+    r'🎆.*',
+    r'🎇.*',
+    r'🧨.*',
+    r'✨.*',
+]]
+
+
+def _is_clean_csv_line(line: str) -> bool:
+    """
+    Check one stripped line: not an LLM error message / artifact, and looks like CSV.
+    """
+    # Check if line matches any error pattern
+    for pattern in _LLM_ARTIFACT_PATTERNS:
+        if pattern.search(line):
+            return False
+    
+    # Additional checks for valid CSV lines
+    return is_valid_csv_line(line)
+
+
 def clean_llm_error_messages(csv_content: str) -> str:
     """
     Clean LLM error messages and artifacts from CSV content.
@@ -2189,132 +2955,6 @@ def clean_llm_error_messages(csv_content: str) -> str:
     if not csv_content or not isinstance(csv_content, str):
         return ""
     
-    # Common LLM error messages and artifacts to remove
-    error_patterns = [
-        # Chinese error messages
-        r'（什么都不输出，完全空白）',
-        r'（什么都不输出，完全空白）',
-        r'完全静默',
-        r'什么都不输出',
-        r'根据规则.*不输出',
-        r'数据不完整.*跳过',
-        r'无有效数据.*跳过',
-        r'根据.*规则.*静默',
-        r'没有.*数据.*输出',
-        r'数据格式.*错误',
-        r'无法.*处理.*跳过',
-        r'遇到.*情况.*静默',
-        r'按照.*要求.*不输出',
-        
-        # English error messages
-        r'(?i)no output',
-        r'(?i)silent mode',
-        r'(?i)skip.*empty.*data',
-        r'(?i)invalid.*data.*format',
-        r'(?i)incomplete.*data.*skip',
-        r'(?i)according.*rules.*silent',
-        r'(?i)data.*incomplete.*skip',
-        r'(?i)no.*valid.*data',
-        r'(?i)error.*processing.*skip',
-        r'(?i)cannot.*process.*skip',
-        
-        # Thinking process artifacts
-        r'=== 推理过程 ===',
-        r'=== 思考过程 ===',
-        r'=== 分析过程 ===',
-        r'=== 处理过程 ===',
-        r'=== 最终答案 ===',
-        r'=== 结果 ===',
-        r'=== THINKING ===',
-        r'=== ANALYSIS ===',
-        r'=== RESULT ===',
-        r'=== FINAL ANSWER ===',
-        
-        # Processing status messages
-        r'正在处理.*',
-        r'处理完成.*',
-        r'开始处理.*',
-        r'跳过.*行',
-        r'添加.*结果',
-        r'生成.*数据',
-        r'Processing.*',
-        r'Completed.*',
-        r'Starting.*',
-        r'Skipping.*',
-        r'Adding.*result',
-        r'Generated.*data',
-        
-        # Markdown artifacts
-        r'```csv',
-        r'```',
-        r'```.*',
-        
-        # Other common artifacts
-        r'数据块.*处理.*异常',
-        r'Error.*processing.*chunk',
-        r'Failed.*to.*process',
-        r'处理失败.*',
-        r'异常.*处理',
-        r'错误.*跳过',
-        r'Warning.*skip',
-        r'⚠️.*',
-        r'❌.*',
-        r'✅.*',
-        r'🔍.*',
-        r'📊.*',
-        r'🎉.*',
-        r'💾.*',
-        r'📄.*',
-        r'🚀.*',
-        r'🔄.*',
-        r'⚡.*',
-        r'📋.*',
-        r'📤.*',
-        r'📥.*',
-        r'🔧.*',
-        r'🛠️.*',
-        r'🔬.*',
-        r'🎯.*',
-        r'💡.*',
-        r'⭐.*',
-        r'🎪.*',
-        r'🎨.*',
-        r'🎭.*',
-        r'🌟.*',
-        r'🔥.*',
-        r'💪.*',
-        r'🚨.*',
-        r'⚠️.*',
-        r'❗.*',
-        r'‼️.*',
-        r'💯.*',
-        r'🎊.*',
-        r'🎈.*',
-        r'🎁.*',
-        r'🎀.*',
-        r'🎂.*',
-        r'🍰.*',
-        r'🎃.*',
-        r'🎄.*',
-        r'🎆.*',
-        r'🎇.*',
-        r'🧨.*',
-        r'✨.*',
-        r'🎉.*',
-        r'🎊.*',
-        r'🎈.*',
-        r'🎁.*',
-        r'🎀.*',
-        r'🎂.*',
-        r'🍰.*',
-        r'🎃.*',
-        r'🎄.*',
-        r'🎆.*',
-        r'🎇.*',
-        r'🧨.*',
-        r'✨.*',
-    ]
-    
     # Split content into lines for processing
     lines = csv_content.split('\n')
     cleaned_lines = []
@@ -2322,23 +2962,8 @@ def clean_llm_error_messages(csv_content: str) -> str:
     for line in lines:
         line = line.strip()
         
-        # Skip empty lines
-        if not line:
-            continue
-        
-        # Check if line matches any error pattern
-        is_error_line = False
-        for pattern in error_patterns:
-            if re.search(pattern, line):
-                is_error_line = True
-                break
-        
-        # Skip error lines
-        if is_error_line:
-            continue
-        
-        # Additional checks for valid CSV lines
-        if is_valid_csv_line(line):
+        # Skip empty lines, error lines and non-CSV lines
+        if line and _is_clean_csv_line(line):
             cleaned_lines.append(line)
     
     # Join cleaned lines
@@ -0,0 +1,234 @@
+"""
+单遍流式 HTML 清洗（替代 BeautifulSoup 版 _clean_html_in_memory）
+
+LibreOffice 导出的表格 HTML 只需要保留表格结构和基本文本标签。旧实现先做三遍全文正则，
+再构建完整的 BeautifulSoup 树、find_all 去属性/解包，最后把 body 内容复制到第二棵树，
+大表格导出时 CPU 占满且内存是文件大小的数倍。
+
+这里直接挂在 html.parser 的事件回调上：只维护当前打开的标签栈和一段待输出文本，
+文件按块解码后喂给解析器，输出与原实现逐字节一致：
+- KEEP 中的标签保留，只留 ATTR_ALWAYS / ATTR_EXTRA 中的属性（按属性名排序，和 bs4 一致）
+- style/meta/link/script/noscript 连同内容丢弃，其他标签解包保留内容
+- 纯 ASCII 空白文本折叠为单个换行或空格（pre/textarea 内除外）
+- 顶层（不在任何保留标签内）只保留非空白文本和注释
+- 结束标签按 bs4 的规则匹配最近的同名打开标签，匹配不到则忽略
+
+唯一的差别：旧实现在遍历 soup.children 时把节点移动到新树，导致紧跟在被移动节点后的顶层兄弟节点被跳过
+（例如概述页 <a href="#table0">Sheet1</a> 后面的 <br>），这里不会丢失这些节点。
+"""
+
+import codecs
+import html
+from html.parser import HTMLParser
+from pathlib import Path
+from typing import Union
+
+try:
+    import chardet
+except ImportError:
+    chardet = None
+
+
+# Tags to keep for table structure
+TABLE_TAGS = {"table", "thead", "tbody", "tfoot", "tr", "td", "th", "col", "colgroup"}
+
+# Tags to keep for text content and basic formatting
+TEXT_TAGS = {"p", "div", "span", "h1", "h2", "h3", "h4", "h5", "h6",
+             "br", "strong", "b", "em", "i", "u", "ul", "ol", "li",
+             "blockquote", "pre", "code", "a"}
+
+# All tags we want to preserve
+KEEP = TABLE_TAGS | TEXT_TAGS
+
+# Attributes to always keep
+ATTR_ALWAYS = {"rowspan", "colspan"}
+
+# Additional attributes for specific tags
+ATTR_EXTRA = {
+    "colgroup": {"span"},
+    "a": {"href"},  # Keep links
+}
+
+# Styling and metadata tags removed together with their content
+DROP_TAGS = {"style", "meta", "link", "script", "noscript"}
+
+# Void elements as html.parser + bs4 treat them: closed immediately, rendered as <br/>
+VOID_TAGS = {"area", "base", "br", "col", "embed", "hr", "img", "input", "keygen", "link", "menuitem",
+             "meta", "param", "source", "track", "wbr", "basefont", "bgsound", "command", "frame",
+             "image", "isindex", "nextid", "spacer"}
+
+# Whitespace-only text is not collapsed inside these
+PRESERVE_WHITESPACE_TAGS = {"pre", "textarea"}
+
+ASCII_SPACES = " \n\t\x0c\r"
+
+# Same order as file_process._read_text_auto
+ENCODINGS = ("utf-8", "utf-8-sig", "gb18030", "gbk", "big5")
+
+
+def _quote_attribute(value: str) -> str:
+    value = html.escape(value, quote=False)
+    if '"' in value:
+        if "'" in value:
+            return '"' + value.replace('"', "&quot;") + '"'
+        return "'" + value + "'"
+    return '"' + value + '"'
+
+
+class StreamingHTMLCleaner(HTMLParser):
+    """html.parser 回调驱动的清洗器：feed() 任意大小的文本块，finish() 取结果"""
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self._out: list[str] = []
+        self._stack: list[tuple[str, bool]] = []  # (tag, kept)
+        self._kept_depth = 0
+        self._dropped_depth = 0
+        self._preserve_depth = 0
+        self._text: list[str] = []
+
+    # ── output helpers ──
+    def _collapse(self, data: str) -> str:
+        if self._preserve_depth or data.strip(ASCII_SPACES):
+            return data
+        return "\n" if "\n" in data else " "
+
+    def _emit_node(self, rendered: str, text: str) -> None:
+        """Text-like node: at top level only non-blank ones survive"""
+        if self._dropped_depth or (not self._kept_depth and not text.strip()):
+            return
+        self._out.append(rendered)
+
+    def _emit_tag(self, rendered: str) -> None:
+        if not self._dropped_depth:
+            self._out.append(rendered)
+
+    def _flush_text(self) -> None:
+        # One text node = everything between two markup events, like bs4's endData
+        if not self._text:
+            return
+        data = self._collapse("".join(self._text))
+        self._text = []
+        self._emit_node(html.escape(data, quote=False), data)
+
+    def _open_tag(self, tag: str, attrs: list[tuple[str, str | None]], self_closing: bool) -> str:
+        allowed = ATTR_ALWAYS | ATTR_EXTRA.get(tag, set())
+        kept_attrs = {}
+        for name, value in attrs:
+            if name in allowed:
+                kept_attrs[name] = "" if value is None else value
+        rendered = "".join(f" {name}={_quote_attribute(value)}" for name, value in sorted(kept_attrs.items()))
+        return f"<{tag}{rendered}/>" if self_closing else f"<{tag}{rendered}>"
+
+    def _pop(self) -> None:
+        tag, kept = self._stack.pop()
+        if tag in DROP_TAGS:
+            self._dropped_depth -= 1
+        if tag in PRESERVE_WHITESPACE_TAGS:
+            self._preserve_depth -= 1
+        if kept:
+            self._kept_depth -= 1
+            self._emit_tag(f"</{tag}>")
+
+    # ── parser callbacks ──
+    def handle_starttag(self, tag, attrs):
+        self._flush_text()
+        if tag in VOID_TAGS:
+            if tag in KEEP:
+                self._emit_tag(self._open_tag(tag, attrs, self_closing=True))
+            return
+        kept = tag in KEEP
+        if kept:
+            self._emit_tag(self._open_tag(tag, attrs, self_closing=False))
+            self._kept_depth += 1
+        if tag in DROP_TAGS:
+            self._dropped_depth += 1
+        if tag in PRESERVE_WHITESPACE_TAGS:
+            self._preserve_depth += 1
+        self._stack.append((tag, kept))
+
+    def handle_endtag(self, tag):
+        self._flush_text()
+        # Close everything down to the most recent open tag of the same name; stray end tags are ignored
+        for index in range(len(self._stack) - 1, -1, -1):
+            if self._stack[index][0] == tag:
+                while len(self._stack) > index:
+                    self._pop()
+                return
+
+    def handle_data(self, data):
+        self._text.append(data)
+
+    def handle_comment(self, data):
+        self._flush_text()
+        data = self._collapse(data)
+        self._emit_node(f"<!--{data}-->", data)
+
+    def handle_decl(self, decl):
+        # DOCTYPE is dropped (html.parser only reports <!DOCTYPE ...> here)
+        pass
+
+    def handle_pi(self, data):
+        # XML / mso-application prologs are dropped, other processing instructions are kept as is
+        if data.endswith("?") and data.lower().startswith(("xml", "mso-application")):
+            return
+        self._flush_text()
+        data = self._collapse(data)
+        self._emit_node(f"<?{data}>", data)
+
+    def unknown_decl(self, data):
+        self._flush_text()
+        if data.upper().startswith("CDATA["):
+            data = self._collapse(data[len("CDATA["):])
+            self._emit_node(f"<![CDATA[{data}]]>", data)
+        else:
+            data = self._collapse(data)
+            self._emit_node(f"<?{data}?>", data)
+
+    def finish(self) -> str:
+        """结束解析，关闭所有未闭合的标签并返回清洗后的 HTML"""
+        self.close()
+        self._flush_text()
+        while self._stack:
+            self._pop()
+        return "<html><body>" + "".join(self._out) + "</body></html>"
+
+
+def clean_html(text: str) -> str:
+    """清洗内存中的 HTML 字符串"""
+    cleaner = StreamingHTMLCleaner()
+    cleaner.feed(text)
+    return cleaner.finish()
+
+
+def _clean_stream(path: Path, encoding: str, errors: str, chunk_size: int) -> str:
+    decoder = codecs.getincrementaldecoder(encoding)(errors)
+    cleaner = StreamingHTMLCleaner()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(chunk_size), b""):
+            cleaner.feed(decoder.decode(block))
+    cleaner.feed(decoder.decode(b"", final=True))
+    return cleaner.finish()
+
+
+def clean_html_file(path: Union[str, Path], chunk_size: int = 1024 * 1024) -> str:
+    """
+    按块读取并清洗 HTML 文件，内存占用与输入大小无关（只与输出大小和标签嵌套深度有关）。
+
+    编码探测顺序与 _read_text_auto 相同；某个编码中途解码失败时换下一个编码重新解析。
+    """
+    path = Path(path)
+    for encoding in ENCODINGS:
+        try:
+            return _clean_stream(path, encoding, "strict", chunk_size)
+        except UnicodeDecodeError:
+            continue
+    if chardet:
+        with open(path, "rb") as f:
+            encoding = chardet.detect(f.read(chunk_size)).get("encoding")
+        if encoding:
+            try:
+                return _clean_stream(path, encoding, "strict", chunk_size)
+            except (UnicodeDecodeError, LookupError):
+                pass
+    return _clean_stream(path, "utf-8", "replace", chunk_size)
@@ -0,0 +1,305 @@
+"""
+常驻 LibreOffice 转换进程池
+
+每次 `soffice --headless --convert-to` 都要冷启动 LibreOffice（数秒），并行转换还会争用同一个用户配置目录。
+这里维护 N 个常驻的 soffice 实例，每个实例使用独立的 -env:UserInstallation 配置目录，
+通过 UNO socket 接收转换请求；空闲实例按先到先得分配，单个文件超时会杀掉并重启该实例，
+实例崩溃后下次使用前自动重启。
+
+当前 Python 解释器无法 import uno 时（例如 Windows 上 LibreOffice 自带独立的 Python），
+退化为每个 worker 用自己的常驻配置目录执行 --convert-to：仍需启动进程，但免去配置目录初始化，
+并且并行转换互不干扰。
+
+环境变量：
+- SOFFICE_PATH: soffice 可执行文件路径（默认 D:\\LibreOffice\\program\\soffice.exe，不存在时从 PATH 查找）
+- LIBREOFFICE_WORKERS: 常驻实例数（默认 min(4, CPU 核数)）
+- LIBREOFFICE_TIMEOUT: 单个文件转换超时秒数（默认 120）
+"""
+
+import atexit
+import os
+import queue
+import shutil
+import socket
+import subprocess
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import Optional
+
+try:
+    import uno
+    from com.sun.star.beans import PropertyValue
+    UNO_AVAILABLE = True
+except ImportError:
+    uno = None
+    UNO_AVAILABLE = False
+
+
+DEFAULT_SOFFICE_PATH = r"D:\LibreOffice\program\soffice.exe"
+WORKER_STARTUP_TIMEOUT = 60.0
+
+# --convert-to 目标格式 -> UNO 导出过滤器 (文档类型: (FilterName, FilterOptions))
+_UNO_FILTERS = {
+    "html": {"calc": ("HTML (StarCalc)", ""), "writer": ("HTML (StarWriter)", "")},
+    "txt": {"calc": ("Text - txt - csv (StarCalc)", "44,34,76"), "writer": ("Text (encoded)", "UTF8")},
+    "csv": {"calc": ("Text - txt - csv (StarCalc)", "44,34,76"), "writer": ("Text (encoded)", "UTF8")},
+    "xlsx": {"calc": ("Calc MS Excel 2007 XML", "")},
+    "docx": {"writer": ("MS Word 2007 XML", "")},
+    "pdf": {"calc": ("calc_pdf_Export", ""), "writer": ("writer_pdf_Export", "")},
+}
+
+
+class LibreOfficeConversionError(RuntimeError):
+    """LibreOffice 转换失败（包括超时和实例崩溃）"""
+
+
+def find_soffice() -> Optional[str]:
+    configured = os.getenv("SOFFICE_PATH")
+    if configured:
+        return configured
+    if Path(DEFAULT_SOFFICE_PATH).exists():
+        return DEFAULT_SOFFICE_PATH
+    return shutil.which("soffice") or shutil.which("libreoffice")
+
+
+def _free_port() -> int:
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _uno_props(**values) -> tuple:
+    props = []
+    for name, value in values.items():
+        prop = PropertyValue()
+        prop.Name = name
+        prop.Value = value
+        props.append(prop)
+    return tuple(props)
+
+
+class LibreOfficeWorker:
+    """One warm soffice instance with a private user profile"""
+
+    def __init__(self, index: int, soffice: str, profile_root: Path):
+        self.index = index
+        self.soffice = soffice
+        self.profile_dir = profile_root / f"worker_{index}"
+        self.profile_url = self.profile_dir.resolve().as_uri()
+        self.process: Optional[subprocess.Popen] = None
+        self.desktop = None
+        self.conversions = 0
+        self.restarts = 0
+
+    @property
+    def alive(self) -> bool:
+        if not UNO_AVAILABLE:
+            return True  # CLI mode keeps only the profile warm
+        return self.process is not None and self.process.poll() is None and self.desktop is not None
+
+    def start(self) -> None:
+        self.profile_dir.mkdir(parents=True, exist_ok=True)
+        if not UNO_AVAILABLE:
+            return
+        port = _free_port()
+        self.process = subprocess.Popen(
+            [self.soffice, f"-env:UserInstallation={self.profile_url}", "--headless", "--invisible",
+             "--nologo", "--norestore", "--nodefault", "--nolockcheck",
+             f"--accept=socket,host=127.0.0.1,port={port};urp;StarOffice.ComponentContext"],
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        )
+        local_context = uno.getComponentContext()
+        resolver = local_context.ServiceManager.createInstanceWithContext(
+            "com.sun.star.bridge.UnoUrlResolver", local_context)
+        deadline = time.monotonic() + WORKER_STARTUP_TIMEOUT
+        while True:
+            try:
+                context = resolver.resolve(
+                    f"uno:socket,host=127.0.0.1,port={port};urp;StarOffice.ComponentContext")
+                break
+            except Exception:
+                if self.process.poll() is not None or time.monotonic() > deadline:
+                    self.stop()
+                    raise LibreOfficeConversionError(f"LibreOffice worker {self.index} failed to start")
+                time.sleep(0.25)
+        self.desktop = context.ServiceManager.createInstanceWithContext("com.sun.star.frame.Desktop", context)
+
+    def stop(self) -> None:
+        self.desktop = None
+        if self.process is not None and self.process.poll() is None:
+            self.process.kill()
+            try:
+                self.process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                pass
+        self.process = None
+
+    def restart(self) -> None:
+        self.stop()
+        self.restarts += 1
+        self.start()
+
+    def convert(self, source: Path, target_format: str, output_dir: Path, timeout: float) -> Path:
+        extension = target_format.split(":", 1)[0]
+        target = output_dir / f"{source.stem}.{extension}"
+        if UNO_AVAILABLE:
+            self._convert_uno(source, extension, target, timeout)
+        else:
+            self._convert_cli(source, target_format, output_dir, timeout)
+        if not target.exists():
+            raise LibreOfficeConversionError(f"LibreOffice did not create {target}")
+        self.conversions += 1
+        return target
+
+    def _convert_cli(self, source: Path, target_format: str, output_dir: Path, timeout: float) -> None:
+        try:
+            subprocess.run(
+                [self.soffice, f"-env:UserInstallation={self.profile_url}", "--headless", "--norestore",
+                 "--convert-to", target_format, str(source), "--outdir", str(output_dir)],
+                check=True, timeout=timeout, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+            )
+        except subprocess.TimeoutExpired:
+            raise LibreOfficeConversionError(f"Converting {source.name} timed out after {timeout}s")
+        except subprocess.CalledProcessError as e:
+            raise LibreOfficeConversionError(f"soffice exited with {e.returncode} for {source.name}")
+
+    def _convert_uno(self, source: Path, extension: str, target: Path, timeout: float) -> None:
+        # A hung conversion cannot be interrupted over UNO: kill the instance, which aborts the call
+        timed_out = threading.Event()
+
+        def _watchdog():
+            timed_out.set()
+            self.stop()
+
+        timer = threading.Timer(timeout, _watchdog)
+        timer.start()
+        try:
+            document = self.desktop.loadComponentFromURL(
+                uno.systemPathToFileUrl(str(source.resolve())), "_blank", 0,
+                _uno_props(Hidden=True, ReadOnly=True))
+            if document is None:
+                raise LibreOfficeConversionError(f"LibreOffice could not open {source.name}")
+            try:
+                kind = "calc" if document.supportsService("com.sun.star.sheet.SpreadsheetDocument") else "writer"
+                filters = _UNO_FILTERS.get(extension, {})
+                if kind not in filters:
+                    raise LibreOfficeConversionError(f"No {extension} export filter for {kind} document {source.name}")
+                filter_name, filter_options = filters[kind]
+                document.storeToURL(uno.systemPathToFileUrl(str(target.resolve())),
+                                    _uno_props(FilterName=filter_name, FilterOptions=filter_options, Overwrite=True))
+            finally:
+                document.close(True)
+        except LibreOfficeConversionError:
+            raise
+        except Exception as e:
+            if timed_out.is_set():
+                raise LibreOfficeConversionError(f"Converting {source.name} timed out after {timeout}s")
+            raise LibreOfficeConversionError(f"LibreOffice failed to convert {source.name}: {e}")
+        finally:
+            timer.cancel()
+
+
+class LibreOfficePool:
+    """Dispatches conversions to idle warm workers; crashed or timed-out workers are restarted"""
+
+    def __init__(self, size: int, soffice: str, timeout: float):
+        self.size = size
+        self.soffice = soffice
+        self.timeout = timeout
+        self._profile_root = Path(tempfile.mkdtemp(prefix="lo_pool_"))
+        self._workers = [LibreOfficeWorker(i, soffice, self._profile_root) for i in range(size)]
+        self._idle: "queue.Queue[LibreOfficeWorker]" = queue.Queue()
+        for worker in self._workers:
+            self._idle.put(worker)
+        self._started: set[int] = set()
+        self._lock = threading.Lock()
+        self.failures = 0
+
+    def convert(self, source_path: str | Path, target_format: str, output_dir: str | Path,
+                timeout: Optional[float] = None) -> Path:
+        """
+        Convert one file with the next idle worker.
+
+        Args:
+            source_path: 待转换文件
+            target_format: 与 --convert-to 相同的格式串，例如 "html" 或 "txt:Text (encoded):UTF8"
+            output_dir: 输出目录，结果文件名为 <原文件名>.<扩展名>
+            timeout: 单文件超时秒数，默认使用 LIBREOFFICE_TIMEOUT
+
+        Returns:
+            Path: 转换结果文件路径
+        """
+        source = Path(source_path)
+        output = Path(output_dir)
+        output.mkdir(parents=True, exist_ok=True)
+        worker = self._idle.get()
+        try:
+            if worker.index not in self._started or not worker.alive:
+                if worker.index in self._started:
+                    print(f"♻️ LibreOffice worker {worker.index} 已退出，正在重启")
+                    worker.restart()
+                else:
+                    worker.start()
+                    self._started.add(worker.index)
+            try:
+                return worker.convert(source, target_format, output, timeout or self.timeout)
+            except LibreOfficeConversionError:
+                with self._lock:
+                    self.failures += 1
+                if UNO_AVAILABLE:
+                    worker.stop()  # restarted lazily before its next conversion
+                raise
+        finally:
+            self._idle.put(worker)
+
+    def stats(self) -> dict:
+        return {
+            "mode": "uno" if UNO_AVAILABLE else "cli",
+            "workers": self.size,
+            "started": len(self._started),
+            "conversions": sum(w.conversions for w in self._workers),
+            "restarts": sum(w.restarts for w in self._workers),
+            "failures": self.failures,
+        }
+
+    def shutdown(self) -> None:
+        for worker in self._workers:
+            worker.stop()
+        shutil.rmtree(self._profile_root, ignore_errors=True)
+
+
+_pool_instance: Optional[LibreOfficePool] = None
+_instance_lock = threading.Lock()
+
+
+def get_conversion_pool() -> LibreOfficePool:
+    """返回进程级转换池（首次调用时创建，实例在第一次转换时才启动）"""
+    global _pool_instance
+    with _instance_lock:
+        if _pool_instance is None:
+            soffice = find_soffice()
+            if soffice is None:
+                raise LibreOfficeConversionError("LibreOffice (soffice) not found; set SOFFICE_PATH")
+            size = int(os.getenv("LIBREOFFICE_WORKERS", str(min(4, os.cpu_count() or 1))))
+            timeout = float(os.getenv("LIBREOFFICE_TIMEOUT", "120"))
+            _pool_instance = LibreOfficePool(max(1, size), soffice, timeout)
+            atexit.register(_pool_instance.shutdown)
+            print(f"🏭 LibreOffice转换池: {size} 个实例 ({'UNO常驻' if UNO_AVAILABLE else '独立配置目录'}) | 单文件超时 {timeout:.0f}秒")
+        return _pool_instance
+
+
+def convert_with_libreoffice(source_path: str | Path, target_format: str, output_dir: str | Path,
+                             timeout: Optional[float] = None) -> Path:
+    """用常驻进程池转换文件，等价于 soffice --headless --convert-to <target_format> --outdir <output_dir>"""
+    return get_conversion_pool().convert(source_path, target_format, output_dir, timeout)
+
+
+def print_conversion_pool_stats() -> None:
+    """打印转换池统计"""
+    if _pool_instance is None:
+        return
+    stats = _pool_instance.stats()
+    print(f"🏭 LibreOffice转换池({stats['mode']}): 转换 {stats['conversions']} 个文件 | "
+          f"已启动实例 {stats['started']}/{stats['workers']} | 重启 {stats['restarts']} 次 | 失败 {stats['failures']} 次")
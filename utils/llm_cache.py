@@ -0,0 +1,326 @@
+"""
+LLM 响应持久化缓存（按内容寻址）
+
+相同的提示词会被反复发送（策略判断、模板分析、文档摘要、同一表格的重复填写），
+这里把 (model, temperature, tool schema, 规范化后的 messages) 哈希成键，
+将响应存入本地 SQLite 文件，重跑同一会话时可以完全跳过网络请求。
+
+- 默认关闭，通过环境变量 LLM_CACHE_ENABLED=1 开启
+- LLM_CACHE_PATH: 缓存文件路径（默认 conversations/llm_cache.sqlite3）
+- LLM_CACHE_MAX_MB: 缓存文件总大小上限，超出后按最近访问时间淘汰
+- LLM_CACHE_MAX_AGE_DAYS: 条目最长保留天数
+- 并发的相同请求只会真正发起一次（single-flight），其余线程等待并共享结果
+"""
+
+import asyncio
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Optional
+
+from langchain_core.messages import BaseMessage, convert_to_messages
+from langchain_core.utils.function_calling import convert_to_openai_tool
+
+
+CACHE_SCHEMA_VERSION = 1
+
+
+def _canonical_message(message: BaseMessage) -> dict:
+    """只保留影响模型输出的字段（忽略 id、response_metadata 等运行时信息）"""
+    canonical = {"type": message.type, "content": message.content}
+    tool_calls = getattr(message, "tool_calls", None)
+    if tool_calls:
+        canonical["tool_calls"] = [{"name": c.get("name"), "args": c.get("args")} for c in tool_calls]
+    tool_call_id = getattr(message, "tool_call_id", None)
+    if tool_call_id:
+        canonical["tool_call_id"] = tool_call_id
+    return canonical
+
+
+def make_cache_key(model_name: str, messages: Any, temperature: float, tools: Optional[list] = None) -> str:
+    """
+    Build the content address of one LLM request.
+
+    Args:
+        model_name: 模型名称
+        messages: BaseMessage 列表 / (role, content) 元组 / dict，与 invoke_model 接受的格式一致
+        temperature: 采样温度
+        tools: 绑定的工具（可选），按 OpenAI tool schema 参与哈希
+
+    Returns:
+        str: SHA-256 十六进制字符串
+    """
+    payload = {
+        "v": CACHE_SCHEMA_VERSION,
+        "model": model_name,
+        "temperature": temperature,
+        "messages": [_canonical_message(m) for m in convert_to_messages(messages)],
+        "tools": [convert_to_openai_tool(t) for t in tools] if tools else None,
+    }
+    serialized = json.dumps(payload, ensure_ascii=False, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(serialized.encode("utf-8")).hexdigest()
+
+
+class _InFlight:
+    """One pending computation shared by every caller asking for the same key"""
+
+    def __init__(self, loop: Optional[asyncio.AbstractEventLoop] = None):
+        self.event = threading.Event()  # waiters in other threads / event loops
+        self.loop = loop
+        self.done: Optional[asyncio.Future] = loop.create_future() if loop is not None else None  # waiters on the leader's loop
+        self.value: Optional[str] = None
+        self.error: Optional[BaseException] = None
+        self.abandoned = False  # the leader was cancelled: a waiter takes over
+
+    def result(self) -> str:
+        if self.error is not None:
+            raise self.error
+        return self.value
+
+
+class LLMResponseCache:
+    """SQLite backed response cache with size/age eviction and single-flight"""
+
+    def __init__(self, db_path: str, max_bytes: int = 512 * 1024 * 1024, max_age_seconds: float = 30 * 24 * 3600):
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.max_age_seconds = max_age_seconds
+
+        self._lock = threading.Lock()
+        self._in_flight: dict[str, _InFlight] = {}
+        self.hits = 0
+        self.misses = 0
+        self.shared = 0  # requests collapsed into an identical in-flight call
+        self.evictions = 0
+
+        self._conn = sqlite3.connect(str(self.db_path), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            " key TEXT PRIMARY KEY,"
+            " model TEXT,"
+            " value TEXT NOT NULL,"
+            " size INTEGER NOT NULL,"
+            " created_at REAL NOT NULL,"
+            " last_access REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_responses_access ON responses(last_access)")
+        self._conn.commit()
+        with self._lock:
+            self._evict_locked()
+
+    # ── storage ──────────────────────────────────────────────
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            return self._get_locked(key)
+
+    def _get_locked(self, key: str) -> Optional[str]:
+        row = self._conn.execute("SELECT value, created_at FROM responses WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        value, created_at = row
+        now = time.time()
+        if now - created_at > self.max_age_seconds:
+            self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+            self._conn.commit()
+            self.evictions += 1
+            return None
+        self._conn.execute("UPDATE responses SET last_access = ? WHERE key = ?", (now, key))
+        self._conn.commit()
+        return value
+
+    def put(self, key: str, value: str, model_name: str = "") -> None:
+        size = len(value.encode("utf-8"))
+        if size > self.max_bytes:
+            return
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, model, value, size, created_at, last_access) VALUES (?, ?, ?, ?, ?, ?)",
+                (key, model_name, value, size, now, now),
+            )
+            self._evict_locked()
+            self._conn.commit()
+
+    def _evict_locked(self) -> None:
+        cursor = self._conn.execute("DELETE FROM responses WHERE created_at < ?", (time.time() - self.max_age_seconds,))
+        self.evictions += max(cursor.rowcount, 0)
+        total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if total <= self.max_bytes:
+            self._conn.commit()
+            return
+        # Least recently used first until we are back under the size budget
+        for key, size in self._conn.execute("SELECT key, size FROM responses ORDER BY last_access ASC").fetchall():
+            if total <= self.max_bytes:
+                break
+            self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+            total -= size
+            self.evictions += 1
+        self._conn.commit()
+
+    # ── single-flight lookup ─────────────────────────────────
+    def _join(self, key: str, loop: Optional[asyncio.AbstractEventLoop] = None
+              ) -> tuple[Optional[str], Optional[_InFlight], bool]:
+        """
+        Return (cached value, in-flight record, is_leader) for `key`.
+
+        One locked section: a leader stores its value before leaving _in_flight, so a key
+        that is neither in flight nor stored has not been computed yet.
+        """
+        with self._lock:
+            flight = self._in_flight.get(key)
+            if flight is not None:
+                self.shared += 1
+                return None, flight, False
+            value = self._get_locked(key)
+            if value is not None:
+                self.hits += 1
+                return value, None, False
+            flight = _InFlight(loop)
+            self._in_flight[key] = flight
+            self.misses += 1
+            return None, flight, True
+
+    def _finish(self, key: str, flight: _InFlight, error: Optional[BaseException] = None) -> None:
+        # A cancelled leader is not a failure of the request: its waiters retry instead of looking cancelled
+        if isinstance(error, asyncio.CancelledError):
+            flight.abandoned = True
+        elif error is not None:
+            flight.error = error
+        with self._lock:
+            self._in_flight.pop(key, None)
+        flight.event.set()
+        if flight.done is not None and not flight.done.done():
+            flight.done.set_result(None)
+
+    def get_or_compute(self, key: str, compute: Callable[[], str], model_name: str = "") -> tuple[str, bool]:
+        """
+        Return the cached value for `key`, computing (and storing) it at most once.
+
+        Returns:
+            tuple: (value, from_cache)
+        """
+        while True:
+            value, flight, leader = self._join(key)
+            if flight is None:
+                return value, True
+            if leader:
+                break
+            flight.event.wait()
+            if not flight.abandoned:
+                return flight.result(), True
+
+        error = None
+        try:
+            flight.value = compute()
+            self.put(key, flight.value, model_name)
+            return flight.value, False
+        except BaseException as e:
+            error = e
+            raise
+        finally:
+            self._finish(key, flight, error)
+
+    async def aget_or_compute(self, key: str, compute: Callable[[], Awaitable[str]], model_name: str = "") -> tuple[str, bool]:
+        """
+        Async variant of get_or_compute; waiters never block the event loop.
+        Waiters on the leader's loop await a future; only waiters on another thread / loop use an executor thread.
+        """
+        loop = asyncio.get_running_loop()
+        while True:
+            value, flight, leader = self._join(key, loop)
+            if flight is None:
+                return value, True
+            if leader:
+                break
+            if flight.loop is loop:
+                await asyncio.shield(flight.done)
+            else:
+                await loop.run_in_executor(None, flight.event.wait)
+            if not flight.abandoned:
+                return flight.result(), True
+
+        error = None
+        try:
+            flight.value = await compute()
+            self.put(key, flight.value, model_name)
+            return flight.value, False
+        except BaseException as e:
+            error = e
+            raise
+        finally:
+            self._finish(key, flight, error)
+
+    def stats(self) -> dict:
+        with self._lock:
+            entries, total = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses").fetchone()
+            lookups = self.hits + self.misses + self.shared
+            return {
+                "path": str(self.db_path),
+                "hits": self.hits,
+                "misses": self.misses,
+                "shared_in_flight": self.shared,
+                "evictions": self.evictions,
+                "entries": entries,
+                "size_bytes": total,
+                "hit_ratio": round((self.hits + self.shared) / lookups, 3) if lookups else 0.0,
+            }
+
+    def clear(self) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM responses")
+            self._conn.commit()
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+# ──────────────────────── 进程级实例 ─────────────────────── #
+
+_cache_instance: Optional[LLMResponseCache] = None
+_cache_enabled_override: Optional[bool] = None
+_instance_lock = threading.Lock()
+
+
+def is_llm_cache_enabled() -> bool:
+    if _cache_enabled_override is not None:
+        return _cache_enabled_override
+    return os.getenv("LLM_CACHE_ENABLED", "").strip().lower() in ("1", "true", "yes", "on")
+
+
+def set_llm_cache_enabled(enabled: Optional[bool]) -> None:
+    """在代码中开启/关闭缓存；传入 None 则恢复为读取环境变量"""
+    global _cache_enabled_override
+    _cache_enabled_override = enabled
+
+
+def get_llm_cache() -> Optional[LLMResponseCache]:
+    """返回进程级缓存实例；未开启时返回 None"""
+    global _cache_instance
+    if not is_llm_cache_enabled():
+        return None
+    with _instance_lock:
+        if _cache_instance is None:
+            _cache_instance = LLMResponseCache(
+                os.getenv("LLM_CACHE_PATH", os.path.join("conversations", "llm_cache.sqlite3")),
+                max_bytes=int(float(os.getenv("LLM_CACHE_MAX_MB", "512")) * 1024 * 1024),
+                max_age_seconds=float(os.getenv("LLM_CACHE_MAX_AGE_DAYS", "30")) * 24 * 3600,
+            )
+            print(f"💾 LLM响应缓存已启用: {_cache_instance.db_path}")
+        return _cache_instance
+
+
+def print_llm_cache_stats() -> None:
+    """打印缓存命中统计"""
+    cache = _cache_instance
+    if cache is None:
+        return
+    stats = cache.stats()
+    print(f"💾 LLM缓存: 命中 {stats['hits']} | 未命中 {stats['misses']} | 合并并发请求 {stats['shared_in_flight']} | "
+          f"命中率 {stats['hit_ratio']:.0%} | 条目 {stats['entries']} | 大小 {stats['size_bytes'] / 1024:.1f}KB")
@@ -0,0 +1,412 @@
+"""
+LLM 请求录制 / 回放（cassette）
+
+在共享的 httpx 连接池下挂一层传输层，对所有 invoke_model* / ainvoke_model* / astream_model 调用生效：
+
+- LLM_TRANSPORT_MODE=live（默认）：直接访问服务商
+- LLM_TRANSPORT_MODE=record：照常访问服务商，同时把请求/响应（含工具调用、token 用量、
+  流式分片及其到达时间）追加写入 gzip 压缩的 JSONL 文件
+- LLM_TRANSPORT_MODE=replay：完全不联网，按请求内容从 cassette 中取出响应返回
+
+其他配置：
+- LLM_CASSETTE_PATH: cassette 路径（默认 conversations/llm_cassette.jsonl.gz）
+- LLM_REPLAY_LATENCY: recorded（按录制时的耗时与分片节奏回放，默认）| sampled（从同一模型录制到的
+  耗时分布中随机抽样）| none（立即返回）
+- LLM_REPLAY_LATENCY_SCALE: 回放耗时缩放系数（默认 1.0）
+- LLM_REPLAY_SEED: sampled 模式的随机种子
+
+回放时 SQLite 响应缓存仍然生效，做端到端性能分析时建议同时设置 LLM_CACHE_ENABLED=0。
+"""
+
+import asyncio
+import atexit
+import gzip
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Iterator, AsyncIterator, Optional
+
+import httpx
+
+
+TRANSPORT_MODES = ("live", "record", "replay")
+REPLAY_LATENCY_MODES = ("recorded", "sampled", "none")
+
+# 回放时不还原的响应头（由 httpx 根据回放内容重新计算，或与会话无关）
+_DROPPED_RESPONSE_HEADERS = {"content-length", "content-encoding", "transfer-encoding", "connection",
+                             "set-cookie", "date", "keep-alive"}
+
+
+def get_transport_mode() -> str:
+    mode = os.getenv("LLM_TRANSPORT_MODE", "live").strip().lower()
+    if mode not in TRANSPORT_MODES:
+        print(f"⚠️ 未知的 LLM_TRANSPORT_MODE={mode}，使用 live")
+        return "live"
+    return mode
+
+
+def make_request_key(request: httpx.Request) -> str:
+    """Content address of one HTTP request: method + path + canonical JSON body (headers are ignored)"""
+    body = request.content
+    try:
+        canonical = json.dumps(json.loads(body), ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+    except (ValueError, UnicodeDecodeError):
+        canonical = body.decode("utf-8", errors="surrogateescape")
+    raw = f"{request.method} {request.url.path}\n{canonical}"
+    return hashlib.sha256(raw.encode("utf-8", errors="surrogateescape")).hexdigest()
+
+
+def _request_model(request: httpx.Request) -> str:
+    try:
+        return json.loads(request.content).get("model", "")
+    except (ValueError, UnicodeDecodeError, AttributeError):
+        return ""
+
+
+class LLMCassette:
+    """
+    gzip JSONL 格式的请求/响应记录。
+
+    每行一条记录：
+        {"key", "model", "method", "url", "request", "status", "headers",
+         "headers_at", "chunks": [[秒, 结束字节偏移], ...], "body", "recorded_at"}
+    同一请求录制了多次时按录制顺序依次回放，用完后重复最后一条。
+    """
+
+    def __init__(self, path: str, mode: str, latency_mode: str = "recorded", latency_scale: float = 1.0,
+                 seed: Optional[int] = None):
+        self.path = Path(path)
+        self.mode = mode
+        self.latency_mode = latency_mode if latency_mode in REPLAY_LATENCY_MODES else "recorded"
+        self.latency_scale = latency_scale
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._entries: dict[str, list[dict]] = {}
+        self._cursors: dict[str, int] = {}
+        self._latencies: dict[str, list[float]] = {}
+        self._writer = None
+        self.hits = 0
+        self.misses = 0
+        self.recorded = 0
+        if mode == "replay":
+            self._load()
+
+    def _load(self) -> None:
+        if not self.path.exists():
+            print(f"⚠️ 回放文件不存在: {self.path}")
+            return
+        count = 0
+        try:
+            with gzip.open(self.path, "rt", encoding="utf-8", errors="surrogateescape") as f:
+                for line in f:
+                    if not line.strip():
+                        continue
+                    entry = json.loads(line)
+                    self._entries.setdefault(entry["key"], []).append(entry)
+                    self._latencies.setdefault(entry.get("model", ""), []).append(self._total_latency(entry))
+                    count += 1
+        except (EOFError, gzip.BadGzipFile, json.JSONDecodeError) as e:
+            # a recording interrupted mid-write leaves a truncated last member; keep what was read
+            print(f"⚠️ 回放文件末尾不完整，已读取 {count} 条记录: {e}")
+        print(f"📼 LLM回放模式: 从 {self.path} 加载 {count} 条记录（{len(self._entries)} 个不同请求）")
+
+    @staticmethod
+    def _total_latency(entry: dict) -> float:
+        chunks = entry.get("chunks") or []
+        return chunks[-1][0] if chunks else entry.get("headers_at", 0.0)
+
+    # ---------- record ----------
+
+    def record(self, request: httpx.Request, response: httpx.Response, headers_at: float,
+               chunks: list[tuple[float, bytes]]) -> None:
+        body = b"".join(chunk for _, chunk in chunks)
+        offsets, end = [], 0
+        for at, chunk in chunks:
+            end += len(chunk)
+            offsets.append([round(at, 4), end])
+        try:
+            request_body = json.loads(request.content)
+        except (ValueError, UnicodeDecodeError):
+            request_body = request.content.decode("utf-8", errors="surrogateescape")
+        entry = {
+            "key": make_request_key(request),
+            "model": _request_model(request),
+            "method": request.method,
+            "url": str(request.url),
+            "request": request_body,
+            "status": response.status_code,
+            "headers": {k: v for k, v in response.headers.items() if k.lower() not in _DROPPED_RESPONSE_HEADERS},
+            "headers_at": round(headers_at, 4),
+            "chunks": offsets,
+            "body": body.decode("utf-8", errors="surrogateescape"),
+            "recorded_at": datetime.now().isoformat(timespec="seconds"),
+        }
+        line = json.dumps(entry, ensure_ascii=False) + "\n"
+        with self._lock:
+            if self._writer is None:
+                self.path.parent.mkdir(parents=True, exist_ok=True)
+                # append mode starts a new gzip member; concatenated members read back as one stream
+                self._writer = gzip.open(self.path, "at", encoding="utf-8", errors="surrogateescape")
+                atexit.register(self.close)
+                print(f"📼 LLM录制模式: 写入 {self.path}")
+            self._writer.write(line)
+            self._writer.flush()
+            self.recorded += 1
+
+    # ---------- replay ----------
+
+    def lookup(self, request: httpx.Request) -> Optional[dict]:
+        key = make_request_key(request)
+        with self._lock:
+            entries = self._entries.get(key)
+            if not entries:
+                self.misses += 1
+                return None
+            cursor = self._cursors.get(key, 0)
+            self._cursors[key] = cursor + 1
+            self.hits += 1
+            return entries[min(cursor, len(entries) - 1)]
+
+    def schedule(self, entry: dict) -> tuple[float, list[tuple[float, bytes]]]:
+        """回放节奏：(响应头延迟, [(分片到达时间, 分片内容), ...])，均为相对请求开始的秒数"""
+        body = entry["body"].encode("utf-8", errors="surrogateescape")
+        offsets = entry.get("chunks") or [[entry.get("headers_at", 0.0), len(body)]]
+        if self.latency_mode == "none":
+            return 0.0, [(0.0, body)]
+
+        scale = self.latency_scale
+        if self.latency_mode == "sampled":
+            recorded = self._total_latency(entry)
+            with self._lock:
+                population = self._latencies.get(entry.get("model", "")) or [recorded]
+                sampled = self._random.choice(population)
+            if recorded > 0:
+                scale *= sampled / recorded
+
+        chunks, start = [], 0
+        for at, end in offsets:
+            chunks.append((at * scale, body[start:end]))
+            start = end
+        if start < len(body):
+            chunks.append((chunks[-1][0] if chunks else 0.0, body[start:]))
+        return entry.get("headers_at", 0.0) * scale, chunks
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"mode": self.mode, "path": str(self.path), "recorded": self.recorded,
+                    "hits": self.hits, "misses": self.misses}
+
+    def close(self) -> None:
+        with self._lock:
+            if self._writer is not None:
+                self._writer.close()
+                self._writer = None
+
+
+def _miss_response(request: httpx.Request) -> httpx.Response:
+    """回放未命中：返回 404，openai 客户端不会重试，调用方直接得到明确的错误"""
+    message = f"LLM cassette miss for {request.method} {request.url.path} (key {make_request_key(request)[:12]})"
+    print(f"📼 ❌ {message}")
+    return httpx.Response(404, json={"error": {"message": message, "type": "cassette_miss"}}, request=request)
+
+
+def _replay_headers(entry: dict) -> dict:
+    return {k: v for k, v in entry.get("headers", {}).items() if k.lower() not in _DROPPED_RESPONSE_HEADERS}
+
+
+class _RecordingStream(httpx.SyncByteStream):
+    def __init__(self, stream: httpx.SyncByteStream, started: float, on_complete):
+        self._stream = stream
+        self._started = started
+        self._on_complete = on_complete
+        self._chunks: list[tuple[float, bytes]] = []
+        self._complete = False
+
+    def __iter__(self) -> Iterator[bytes]:
+        for chunk in self._stream:
+            self._chunks.append((time.perf_counter() - self._started, chunk))
+            yield chunk
+        self._complete = True
+
+    def close(self) -> None:
+        self._stream.close()
+        # only fully read bodies are recorded (a cancelled hedge loser would leave a truncated response)
+        if self._complete:
+            self._on_complete(self._chunks)
+
+
+class _AsyncRecordingStream(httpx.AsyncByteStream):
+    def __init__(self, stream: httpx.AsyncByteStream, started: float, on_complete):
+        self._stream = stream
+        self._started = started
+        self._on_complete = on_complete
+        self._chunks: list[tuple[float, bytes]] = []
+        self._complete = False
+
+    async def __aiter__(self) -> AsyncIterator[bytes]:
+        async for chunk in self._stream:
+            self._chunks.append((time.perf_counter() - self._started, chunk))
+            yield chunk
+        self._complete = True
+
+    async def aclose(self) -> None:
+        await self._stream.aclose()
+        if self._complete:
+            self._on_complete(self._chunks)
+
+
+class _ReplayStream(httpx.SyncByteStream):
+    def __init__(self, chunks: list[tuple[float, bytes]], started: float):
+        self._chunks = chunks
+        self._started = started
+
+    def __iter__(self) -> Iterator[bytes]:
+        for at, chunk in self._chunks:
+            delay = at - (time.perf_counter() - self._started)
+            if delay > 0:
+                time.sleep(delay)
+            yield chunk
+
+
+class _AsyncReplayStream(httpx.AsyncByteStream):
+    def __init__(self, chunks: list[tuple[float, bytes]], started: float):
+        self._chunks = chunks
+        self._started = started
+
+    async def __aiter__(self) -> AsyncIterator[bytes]:
+        for at, chunk in self._chunks:
+            delay = at - (time.perf_counter() - self._started)
+            if delay > 0:
+                await asyncio.sleep(delay)
+            yield chunk
+
+
+class CassetteTransport(httpx.BaseTransport):
+    """Record/replay wrapper around the pooled httpx.HTTPTransport"""
+
+    def __init__(self, inner: httpx.BaseTransport, cassette: LLMCassette):
+        self._inner = inner
+        self._cassette = cassette
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        started = time.perf_counter()
+        if self._cassette.mode == "replay":
+            request.read()
+            entry = self._cassette.lookup(request)
+            if entry is None:
+                return _miss_response(request)
+            headers_at, chunks = self._cassette.schedule(entry)
+            delay = headers_at - (time.perf_counter() - started)
+            if delay > 0:
+                time.sleep(delay)
+            return httpx.Response(entry["status"], headers=_replay_headers(entry),
+                                  stream=_ReplayStream(chunks, started), request=request)
+
+        # record: ask for an uncompressed body so the cassette stays readable
+        request.headers["accept-encoding"] = "identity"
+        request.read()
+        response = self._inner.handle_request(request)
+        headers_at = time.perf_counter() - started
+        if response.is_stream_consumed:
+            # already-buffered responses (e.g. httpx.MockTransport) never stream through the wrapper
+            self._cassette.record(request, response, headers_at, [(headers_at, response.content)])
+            return response
+        response.stream = _RecordingStream(
+            response.stream, started,
+            lambda chunks: self._cassette.record(request, response, headers_at, chunks),
+        )
+        return response
+
+    def close(self) -> None:
+        self._inner.close()
+
+
+class AsyncCassetteTransport(httpx.AsyncBaseTransport):
+    """Record/replay wrapper around the pooled httpx.AsyncHTTPTransport"""
+
+    def __init__(self, inner: httpx.AsyncBaseTransport, cassette: LLMCassette):
+        self._inner = inner
+        self._cassette = cassette
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        started = time.perf_counter()
+        if self._cassette.mode == "replay":
+            await request.aread()
+            entry = self._cassette.lookup(request)
+            if entry is None:
+                return _miss_response(request)
+            headers_at, chunks = self._cassette.schedule(entry)
+            delay = headers_at - (time.perf_counter() - started)
+            if delay > 0:
+                await asyncio.sleep(delay)
+            return httpx.Response(entry["status"], headers=_replay_headers(entry),
+                                  stream=_AsyncReplayStream(chunks, started), request=request)
+
+        request.headers["accept-encoding"] = "identity"
+        await request.aread()
+        response = await self._inner.handle_async_request(request)
+        headers_at = time.perf_counter() - started
+        if response.is_stream_consumed:
+            # already-buffered responses (e.g. httpx.MockTransport) never stream through the wrapper
+            self._cassette.record(request, response, headers_at, [(headers_at, response.content)])
+            return response
+        response.stream = _AsyncRecordingStream(
+            response.stream, started,
+            lambda chunks: self._cassette.record(request, response, headers_at, chunks),
+        )
+        return response
+
+    async def aclose(self) -> None:
+        await self._inner.aclose()
+
+
+_cassette_instance: Optional[LLMCassette] = None
+_instance_lock = threading.Lock()
+
+
+def get_cassette() -> Optional[LLMCassette]:
+    """返回进程级 cassette；live 模式返回 None"""
+    global _cassette_instance
+    mode = get_transport_mode()
+    if mode == "live":
+        return None
+    with _instance_lock:
+        if _cassette_instance is None or _cassette_instance.mode != mode:
+            seed = os.getenv("LLM_REPLAY_SEED")
+            _cassette_instance = LLMCassette(
+                os.getenv("LLM_CASSETTE_PATH", os.path.join("conversations", "llm_cassette.jsonl.gz")),
+                mode,
+                latency_mode=os.getenv("LLM_REPLAY_LATENCY", "recorded").strip().lower(),
+                latency_scale=float(os.getenv("LLM_REPLAY_LATENCY_SCALE", "1.0")),
+                seed=int(seed) if seed else None,
+            )
+        return _cassette_instance
+
+
+def wrap_transport(transport: httpx.BaseTransport) -> httpx.BaseTransport:
+    """按 LLM_TRANSPORT_MODE 给同步连接池套上录制/回放层"""
+    cassette = get_cassette()
+    return transport if cassette is None else CassetteTransport(transport, cassette)
+
+
+def wrap_async_transport(transport: httpx.AsyncBaseTransport) -> httpx.AsyncBaseTransport:
+    """按 LLM_TRANSPORT_MODE 给异步连接池套上录制/回放层"""
+    cassette = get_cassette()
+    return transport if cassette is None else AsyncCassetteTransport(transport, cassette)
+
+
+def print_cassette_stats() -> None:
+    """打印录制/回放统计"""
+    cassette = _cassette_instance
+    if cassette is None:
+        return
+    stats = cassette.stats()
+    if stats["mode"] == "record":
+        print(f"📼 LLM录制: 已写入 {stats['recorded']} 条请求 -> {stats['path']}")
+    else:
+        print(f"📼 LLM回放: 命中 {stats['hits']} | 未命中 {stats['misses']} ({stats['path']})")
@@ -0,0 +1,242 @@
+"""
+LLM 调用指标收集
+
+每次 invoke_model* 调用都会记录：模型、调用所在的图节点、提示/输出/推理 token、
+首 token 延迟（仅流式调用）、总耗时、HTTP 重试次数与 429 次数、是否命中缓存。
+会话结束时在 conversations/<session_id>/ 下生成 JSON + CSV 报告，
+按模型和节点统计 p50/p95/p99，方便定位耗时和成本最高的阶段。
+"""
+
+import contextvars
+import csv
+import inspect
+import json
+import os
+import threading
+import time
+from dataclasses import dataclass, asdict, field
+from datetime import datetime
+from pathlib import Path
+from typing import Optional
+
+
+@dataclass
+class LLMCallMetrics:
+    """一次 LLM 调用的指标"""
+    model: str
+    node: str
+    session_id: str
+    started_at: str
+    prompt_tokens: int = 0
+    output_tokens: int = 0
+    reasoning_tokens: int = 0
+    ttft: Optional[float] = None
+    latency: float = 0.0
+    http_attempts: int = 0
+    rate_limited: int = 0
+    cached: bool = False
+    success: bool = True
+    cancelled: bool = False
+    _start: float = field(default=0.0, repr=False)
+
+    @property
+    def retries(self) -> int:
+        return max(self.http_attempts - 1, 0)
+
+    def mark_first_token(self) -> None:
+        if self.ttft is None:
+            self.ttft = time.perf_counter() - self._start
+
+    def set_usage(self, usage: Optional[dict]) -> None:
+        """从 langchain 的 usage_metadata 提取 token 用量"""
+        if not usage:
+            return
+        self.prompt_tokens = usage.get("input_tokens", 0) or 0
+        self.output_tokens = usage.get("output_tokens", 0) or 0
+        details = usage.get("output_token_details") or {}
+        self.reasoning_tokens = details.get("reasoning", 0) or 0
+
+    def note_http_status(self, status_code: int) -> None:
+        self.http_attempts += 1
+        if status_code == 429:
+            self.rate_limited += 1
+
+    def finish(self, success: bool = True, cached: bool = False, cancelled: bool = False) -> None:
+        self.latency = time.perf_counter() - self._start
+        self.success = success
+        self.cached = cached
+        self.cancelled = cancelled
+        _REGISTRY.record(self)
+
+    def to_row(self) -> dict:
+        row = {k: v for k, v in asdict(self).items() if not k.startswith("_")}
+        row["retries"] = self.retries
+        return row
+
+
+def metrics_max_calls() -> int:
+    """LLM_METRICS_MAX_CALLS: 进程内最多保留的调用记录数（默认 50000，超出后丢弃最早的）"""
+    return max(1, int(os.getenv("LLM_METRICS_MAX_CALLS", "50000")))
+
+
+class LLMMetricsRegistry:
+    """Thread-safe store of finished call metrics (the oldest are dropped beyond metrics_max_calls)"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: list[LLMCallMetrics] = []
+
+    def record(self, call: LLMCallMetrics) -> None:
+        with self._lock:
+            self._calls.append(call)
+            overflow = len(self._calls) - metrics_max_calls()
+            if overflow > 0:
+                del self._calls[:overflow]
+
+    def calls(self, session_id: Optional[str] = None) -> list[LLMCallMetrics]:
+        with self._lock:
+            return [c for c in self._calls if session_id is None or c.session_id == session_id]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._calls.clear()
+
+
+_REGISTRY = LLMMetricsRegistry()
+_current_call: contextvars.ContextVar[Optional[LLMCallMetrics]] = contextvars.ContextVar("current_llm_call", default=None)
+# 同时运行的会话（不同线程 / 协程）各自标注；线程池工作线程需用 contextvars.copy_context().run 继承
+_session_id: contextvars.ContextVar[str] = contextvars.ContextVar("llm_metrics_session", default="default")
+
+
+def set_metrics_session(session_id: str) -> None:
+    """设置当前上下文（线程 / 协程）的会话ID"""
+    _session_id.set(str(session_id))
+
+
+def get_metrics_registry() -> LLMMetricsRegistry:
+    return _REGISTRY
+
+
+def _detect_node() -> str:
+    """确定调用所在的 LangGraph 节点"""
+    try:
+        from langgraph.config import get_config
+        node = get_config().get("metadata", {}).get("langgraph_node")
+        if node:
+            return node
+    except Exception:
+        pass
+
+    # 线程池 / 异步任务中拿不到 LangGraph 配置：沿调用栈找到 agents 目录下的函数，
+    # 嵌套函数的 qualname 形如 "FilloutTableAgent._generate_CSV_based_on_combined_data.<locals>.process_single_chunk"
+    frame = inspect.currentframe()
+    try:
+        while frame is not None:
+            code = frame.f_code
+            if Path(code.co_filename).parent.name in ("agents", "utils") and not code.co_filename.endswith(("modelRelated.py", "llm_metrics.py")):
+                qualname = getattr(code, "co_qualname", code.co_name)
+                return qualname.split(".<locals>")[0]
+            frame = frame.f_back
+    finally:
+        del frame
+    return "unknown"
+
+
+def start_llm_call(model_name: str) -> LLMCallMetrics:
+    """开始记录一次调用，并设为当前上下文中的活动调用（供 HTTP 钩子统计重试/429）"""
+    call = LLMCallMetrics(
+        model=model_name,
+        node=_detect_node(),
+        session_id=_session_id.get(),
+        started_at=datetime.now().isoformat(timespec="milliseconds"),
+        _start=time.perf_counter(),
+    )
+    _current_call.set(call)
+    return call
+
+
+def note_http_response(status_code: int) -> None:
+    """httpx 响应钩子调用：统计当前调用的 HTTP 尝试次数和 429 次数"""
+    call = _current_call.get()
+    if call is not None:
+        call.note_http_status(status_code)
+
+
+def _percentile(values: list[float], pct: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = (len(ordered) - 1) * pct / 100
+    low = int(rank)
+    high = min(low + 1, len(ordered) - 1)
+    return round(ordered[low] + (ordered[high] - ordered[low]) * (rank - low), 3)
+
+
+def _summarize(calls: list[LLMCallMetrics]) -> dict:
+    latencies = [c.latency for c in calls]
+    ttfts = [c.ttft for c in calls if c.ttft is not None]
+    return {
+        "calls": len(calls),
+        "failed": sum(1 for c in calls if not c.success and not c.cancelled),
+        "cancelled": sum(1 for c in calls if c.cancelled),
+        "cached": sum(1 for c in calls if c.cached),
+        "prompt_tokens": sum(c.prompt_tokens for c in calls),
+        "output_tokens": sum(c.output_tokens for c in calls),
+        "reasoning_tokens": sum(c.reasoning_tokens for c in calls),
+        "retries": sum(c.retries for c in calls),
+        "rate_limited": sum(c.rate_limited for c in calls),
+        "total_latency": round(sum(latencies), 3),
+        "latency_p50": _percentile(latencies, 50),
+        "latency_p95": _percentile(latencies, 95),
+        "latency_p99": _percentile(latencies, 99),
+        "ttft_p50": _percentile(ttfts, 50),
+        "ttft_p95": _percentile(ttfts, 95),
+        "ttft_p99": _percentile(ttfts, 99),
+    }
+
+
+def build_session_report(session_id: str) -> dict:
+    """按模型、按节点汇总指定会话的调用指标"""
+    calls = _REGISTRY.calls(session_id)
+    by_model: dict[str, list] = {}
+    by_node: dict[str, list] = {}
+    for call in calls:
+        by_model.setdefault(call.model, []).append(call)
+        by_node.setdefault(call.node, []).append(call)
+    return {
+        "session_id": session_id,
+        "generated_at": datetime.now().isoformat(timespec="seconds"),
+        "overall": _summarize(calls),
+        "by_model": {model: _summarize(items) for model, items in by_model.items()},
+        "by_node": {node: _summarize(items) for node, items in by_node.items()},
+    }
+
+
+def write_session_report(session_id: str, base_dir: str = "conversations") -> Optional[Path]:
+    """
+    将会话指标写入 conversations/<session_id>/llm_metrics.json 与 llm_metrics.csv
+
+    Returns:
+        Path: JSON 报告路径；该会话没有任何调用时返回 None
+    """
+    calls = _REGISTRY.calls(session_id)
+    if not calls:
+        return None
+    output_dir = Path(base_dir) / str(session_id)
+    output_dir.mkdir(parents=True, exist_ok=True)
+
+    report = build_session_report(session_id)
+    json_path = output_dir / "llm_metrics.json"
+    json_path.write_text(json.dumps(report, ensure_ascii=False, indent=2), encoding="utf-8")
+
+    rows = [c.to_row() for c in calls]
+    with open(output_dir / "llm_metrics.csv", "w", newline="", encoding="utf-8-sig") as f:
+        writer = csv.DictWriter(f, fieldnames=list(rows[0].keys()))
+        writer.writeheader()
+        writer.writerows(rows)
+
+    overall = report["overall"]
+    print(f"📈 LLM调用指标已保存: {json_path} (调用 {overall['calls']} 次 | "
+          f"输入 {overall['prompt_tokens']:,} / 输出 {overall['output_tokens']:,} tokens | "
+          f"p95耗时 {overall['latency_p95']}s)")
+    return json_path
@@ -0,0 +1,388 @@
+"""
+多表整合的本地填充：按表头映射直接从重构后的 CSV 取值
+
+RecallFilesAgent._determine_the_mapping_of_headers 给出的表头映射里，大部分字段都是“文件: 字段”的直接来源，
+例如 "城保名册.xls/农保名册.xls: 户主姓名"；原来这些列也交给模型逐行逐列推理、照抄一遍。
+这里解析表头映射，把每个“文件: 字段”来源对应到 files/{village}/table_files/CSV_files 下重构后的 CSV：
+- 来源是核心数据文件（决定行数的最大文件）的列：逐行直接复制；
+- 来源是其他文件的列：按共同的身份类字段（身份证号码 > 低保证号 > 户主姓名）做键关联（pandas map），
+  没有共同关联字段时交给模型；
+- “规则”是算式的列（如 "重点保障人数 + 残疾人数"，见 rule_formula）：不交给模型，拼好整行后按列计算；
+- 其余“推理规则”、空来源、找不到文件或字段的列：交给模型，提示词里只保留这些列的映射，
+  模型输出的每行以核心数据的行号（R<n>）开头，再按行号和本地填好的列拼成完整的行。
+
+LOCAL_FILL_ENABLED=0 关闭（所有列都交给模型）。
+"""
+
+import csv
+import io
+import json
+import os
+import re
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Optional, Union
+
+import pandas as pd
+
+from utils.chunk_encoding import compact_encoding_enabled, row_id, split_row_id
+from utils.csv_index import load_csv_index, read_csv_records
+from utils.reference_join import JOIN_KEY_TYPES, key_type_of, normalise_key
+from utils.rule_formula import compile_formula, try_compile_formula
+
+
+RULE_PREFIX = "推理规则"
+
+_SOURCE_SEPARATORS = re.compile(r"\s*[/,，、;；]\s*")
+_FILE_SOURCE = re.compile(r"(.+?\.(?:xlsx|xlsm|xls|csv|txt))\s*(?:[:：]\s*(.*))?$", re.I)
+_RULE_NAME_END = re.compile(r"[(（\-—:：,，。=＝]")
+_COLUMN_NOISE = re.compile(r"[\s　]+")
+
+
+def local_fill_enabled() -> bool:
+    return os.getenv("LOCAL_FILL_ENABLED", "1").strip().lower() not in ("0", "false", "no", "off")
+
+
+@dataclass
+class MappedColumn:
+    """目标表格的一列：名称、直接来源 [(文件名, 字段名)]、推理规则、“规则”算式，以及映射里的原始写法（交给模型时原样给出）"""
+    name: str
+    sources: list[tuple[str, str]] = field(default_factory=list)
+    rule: str = ""
+    raw: object = None
+    formula: str = ""
+
+
+def parse_source(text: str) -> list[tuple[str, str]]:
+    """
+    "城保名册.xls/农保名册.xls: 户主姓名" -> [("城保名册.xls", "户主姓名"), ("农保名册.xls", "户主姓名")]
+    推理规则或无法识别的写法返回 []。
+    """
+    text = text.strip()
+    if not text or text.startswith(RULE_PREFIX):
+        return []
+    sources: list[tuple[str, str]] = []
+    pending_files: list[str] = []
+    for segment in _SOURCE_SEPARATORS.split(text):
+        match = _FILE_SOURCE.match(segment)
+        if match:
+            pending_files.append(match.group(1).strip())
+            if match.group(2):
+                sources += [(file_name, match.group(2).strip()) for file_name in pending_files]
+                pending_files = []
+        elif sources and not pending_files:
+            # A separator inside the field name ("城保/农保"): glue it back on
+            last_field = sources[-1][1]
+            sources = [(file_name, f"{source_field}/{segment}" if source_field == last_field else source_field)
+                       for file_name, source_field in sources]
+        else:
+            return []
+    return sources
+
+
+def _field_leaf(field_name: str) -> str:
+    """保障人数.分解.重点保障人数 -> 重点保障人数"""
+    return field_name.split(".")[-1].strip() or field_name.strip()
+
+
+def _rule_name(text: str) -> str:
+    """推理规则: 居民类型(城保/农保) - 根据文件名判断 -> 居民类型"""
+    body = text.split(":", 1)[-1].split("：", 1)[-1].strip()
+    return _RULE_NAME_END.split(body, 1)[0].strip() or body
+
+
+def _leaf_columns(name: str, value) -> list[MappedColumn]:
+    """字段名 -> 来源（字符串或字符串列表）"""
+    items = [value] if isinstance(value, str) else [item for item in value if isinstance(item, str) and item.strip()]
+    if not items:
+        return [MappedColumn(name, raw=value)]
+    parsed = [parse_source(item) for item in items]
+    fields = {_field_leaf(source_field) for sources in parsed for _, source_field in sources}
+    if len(items) == 1 or (all(parsed) and len(fields) == 1):
+        # One target column, possibly with alternative sources
+        rules = [item for item, sources in zip(items, parsed) if not sources]
+        return [MappedColumn(name, [source for sources in parsed for source in sources], "；".join(rules), value)]
+    # A group whose items are the columns themselves ("基本信息": ["城保名册.xls: 序号", ...])
+    columns = []
+    for item, sources in zip(items, parsed):
+        if sources:
+            columns.append(MappedColumn(_field_leaf(sources[0][1]), sources, raw=item))
+        else:
+            columns.append(MappedColumn(_rule_name(item), rule=item, raw=item))
+    return columns
+
+
+def _walk_structure(node: dict) -> list[MappedColumn]:
+    columns = []
+    for name, value in node.items():
+        if isinstance(value, dict) and ("值" in value or "分解" in value or "规则" in value):
+            # Parent field: a column only when it has a value source or a rule (same rule as the fill-out prompt)
+            parent_value = value.get("值") or []
+            rule = value.get("规则") or ""
+            if parent_value or rule:
+                parent = _leaf_columns(name, parent_value)[0] if parent_value else MappedColumn(name, raw=value)
+                parent.formula = rule
+                parent.raw = {"值": parent_value, "规则": rule}
+                columns.append(parent)
+            if isinstance(value.get("分解"), dict):
+                columns += _walk_structure(value["分解"])
+        elif isinstance(value, dict):
+            columns += _walk_structure(value)
+        elif isinstance(value, (str, list)):
+            columns += _leaf_columns(name, value)
+    return columns
+
+
+def parse_headers_mapping(headers_mapping: Union[str, dict]) -> list[MappedColumn]:
+    """把表头映射（JSON 字符串或 dict）展开为目标表格的列，顺序与映射的自然顺序一致；无法解析时返回 []"""
+    if isinstance(headers_mapping, str):
+        text = headers_mapping.strip()
+        match = re.search(r"\{.*\}", text, re.S)
+        if not match:
+            return []
+        try:
+            headers_mapping = json.loads(match.group())
+        except json.JSONDecodeError:
+            return []
+    if not isinstance(headers_mapping, dict):
+        return []
+    structure = headers_mapping.get("表格结构", headers_mapping)
+    return _walk_structure(structure) if isinstance(structure, dict) else []
+
+
+def load_csv_frame(csv_path: Union[str, Path]) -> pd.DataFrame:
+    """重构后的 CSV 读成全字符串的 DataFrame（不做类型推断，身份证号等原样保留），行顺序与 read_csv_records 一致"""
+    records = []
+    parsed_headers = {}
+    for header, data in read_csv_records(csv_path, meta=load_csv_index(csv_path)):
+        if header not in parsed_headers:
+            parsed_headers[header] = [column.strip() for column in next(csv.reader([header]), [])]
+        columns = parsed_headers[header]
+        fields = next(csv.reader([data]), [])
+        record = {}
+        for i, column in enumerate(columns):
+            if column not in record:  # duplicate header cells: the first one wins
+                record[column] = fields[i].strip() if i < len(fields) else ""
+        records.append(record)
+    return pd.DataFrame.from_records(records).fillna("").astype(object) if records else pd.DataFrame()
+
+
+def _normalise_column(name: str) -> str:
+    return _COLUMN_NOISE.sub("", name).replace("（", "(").replace("）", ")")
+
+
+def resolve_field(field_name: str, columns: list[str]) -> Optional[str]:
+    """映射里的字段名对应到 CSV 的列名（原样、去掉“父字段.分解.”前缀、忽略空白和全半角括号）"""
+    normalised = {_normalise_column(column): column for column in reversed(columns)}
+    for candidate in dict.fromkeys((field_name.strip(), _field_leaf(field_name))):
+        if candidate in columns:
+            return candidate
+        if _normalise_column(candidate) in normalised:
+            return normalised[_normalise_column(candidate)]
+    return None
+
+
+def _key_series(frame: pd.DataFrame, key_type: str) -> Optional[pd.Series]:
+    column = next((column for column in frame.columns if key_type_of(column) == key_type), None)
+    if column is None:
+        return None
+    return frame[column].map(lambda value: normalise_key(str(value)))
+
+
+def match_rows(core: pd.DataFrame, reference: pd.DataFrame) -> Optional[pd.Series]:
+    """
+    核心表每行在参考表中的行位置（按关联键优先级逐级补齐，同键取第一条；匹配不上为 -1）。
+    两表没有共同关联字段时返回 None。
+    """
+    positions = pd.Series(-1, index=core.index)
+    shared = False
+    for key_type in JOIN_KEY_TYPES:
+        core_keys, reference_keys = _key_series(core, key_type), _key_series(reference, key_type)
+        if core_keys is None or reference_keys is None:
+            continue
+        shared = True
+        reference_keys = reference_keys.reset_index(drop=True)
+        lookup = pd.Series(reference_keys.index, index=reference_keys)
+        lookup = lookup[lookup.index.notna() & ~lookup.index.duplicated()]
+        unmatched = positions < 0
+        positions[unmatched] = core_keys[unmatched].map(lookup).fillna(-1).astype(int)
+    return positions if shared else None
+
+
+def _file_key(file_name: str) -> str:
+    return Path(file_name.replace("\\", "/")).stem
+
+
+def build_local_fill(headers_mapping: Union[str, dict], core_file: str, excel_file_paths: list[str],
+                     village_name: str) -> dict:
+    """
+    按表头映射在本地填好能直接取值的列。
+
+    Args:
+        headers_mapping: 表头映射
+        core_file: 核心数据文件（process_excel_files_for_integration 选出的最大文件），决定行数和行号
+        excel_file_paths: 参与整合的文件
+        village_name: 村名（定位 CSV_files 目录）
+
+    Returns:
+        dict: {
+            "columns": 目标列名, "rows": 每行各列的值（交给模型的列为 None）, "row_ids": 行号,
+            "llm_columns": 交给模型的列名, "llm_mapping": 只含这些列的表头映射（JSON 字符串）,
+            "computed": {列名: 算式}（整行拼好后计算）
+        }；表头映射无法解析或一列都填不了时返回 {}
+    """
+    if not local_fill_enabled() or not core_file:
+        return {}
+    started = time.perf_counter()
+    columns = parse_headers_mapping(headers_mapping)
+    if not columns:
+        print("⚠️ 本地填充: 表头映射无法解析，全部交给模型")
+        return {}
+
+    csv_dir = Path(f"files/{village_name}/table_files/CSV_files")
+    core_key = _file_key(core_file)
+    wanted = {core_key} | {_file_key(path) for path in excel_file_paths} | \
+             {_file_key(file_name) for column in columns for file_name, _ in column.sources}
+    frames = {}
+    for key in wanted:
+        csv_path = csv_dir / f"{key}.csv"
+        if csv_path.exists():
+            try:
+                frames[key] = load_csv_frame(csv_path)
+            except Exception as e:
+                print(f"⚠️ 本地填充: 读取 {csv_path.name} 失败: {e}")
+    core = frames.get(core_key)
+    if core is None or core.empty:
+        print(f"⚠️ 本地填充: 没有找到核心数据 {core_key}.csv，全部交给模型")
+        return {}
+
+    names = [column.name for column in columns]
+    row_positions = {}  # {file key: Series of reference row positions per core row, None without a shared key}
+    values: dict[str, list] = {}
+    computed: dict[str, str] = {}  # {column: formula}, evaluated once the rows are complete
+    llm_columns: list[MappedColumn] = []
+    for column in columns:
+        filled = None
+        # The core file first, then the other sources in the order the mapping lists them
+        for file_name, field_name in sorted(column.sources, key=lambda source: _file_key(source[0]) != core_key):
+            key = _file_key(file_name)
+            frame = frames.get(key)
+            source_column = resolve_field(field_name, list(frame.columns)) if frame is not None else None
+            if source_column is None:
+                continue
+            if key == core_key:
+                candidate = frame[source_column].reset_index(drop=True)
+            else:
+                if key not in row_positions:
+                    row_positions[key] = match_rows(core, frame)
+                positions = row_positions[key]
+                if positions is None:
+                    continue
+                source_values = frame[source_column].to_numpy()
+                candidate = pd.Series([source_values[p] if p >= 0 else None for p in positions], dtype=object)
+            filled = candidate if filled is None else filled.where(filled.notna(), candidate)
+        if filled is not None and not column.rule:
+            values[column.name] = filled.tolist()
+            continue
+        # No direct source: a 规则 (or 推理规则) that is a plain formula over other columns is computed locally
+        formula = next((compiled for text in (column.formula, column.rule) if text
+                        for compiled in [try_compile_formula(text, names, column.name)] if compiled is not None), None)
+        if formula is not None:
+            computed[column.name] = formula.text
+        else:
+            llm_columns.append(column)
+
+    if not values and not computed:
+        print("⚠️ 本地填充: 没有可以直接取值或按规则计算的列，全部交给模型")
+        return {}
+    if llm_columns and not compact_encoding_enabled():
+        # Model rows are placed by row ID, which only the compact encoding carries
+        print("⚠️ 本地填充: 未启用紧凑编码，数据块没有行号，全部交给模型")
+        return {}
+
+    row_count = len(core)
+    rows = [[values[name][i] if name in values else None for name in names] for i in range(row_count)]
+    llm_mapping = json.dumps({"表格结构": {column.name: column.raw if column.raw is not None else []
+                                           for column in llm_columns}}, ensure_ascii=False, indent=2)
+    unmatched = sum(1 for name in values for value in values[name] if value is None)
+    print(f"⚡ 本地填充 {len(values)}/{len(columns)} 列 × {row_count} 行 ({(time.perf_counter() - started) * 1000:.0f}ms)"
+          f"{f', {unmatched} 个单元格关联不到' if unmatched else ''}"
+          f"{f'; 按规则计算: {list(computed)}' if computed else ''}"
+          f"{f'; 交给模型: {[column.name for column in llm_columns]}' if llm_columns else '; 无需调用模型'}")
+    return {
+        "columns": names,
+        "rows": rows,
+        "row_ids": [row_id(i) for i in range(row_count)],
+        "llm_columns": [column.name for column in llm_columns],
+        "llm_mapping": llm_mapping,
+        "computed": computed,
+    }
+
+
+def local_fill_prompt_note(local_fill: dict) -> str:
+    """交给模型的部分列时附在表头映射后的说明"""
+    filled = [name for name in local_fill["columns"] if name not in local_fill["llm_columns"]]
+    return (f"\n【程序已填列】{'、'.join(filled)} 已由程序填好（直接取自数据源或按规则计算），不要输出这些列。\n"
+            f"【输出要求补充】最终答案只输出上面映射中的 {len(local_fill['llm_columns'])} 列"
+            f"（{'、'.join(local_fill['llm_columns'])}），"
+            f"每行以数据中对应记录的行号开头，例如 R12,值1,值2；行号必须与数据中的一致。")
+
+
+def _format_row(values: list) -> str:
+    buffer = io.StringIO()
+    csv.writer(buffer, lineterminator="").writerow(["" if value is None else value for value in values])
+    return buffer.getvalue()
+
+
+def merge_llm_rows(local_fill: dict, llm_rows: list[str]) -> list[str]:
+    """
+    把模型输出的行（只含交给模型的列，以行号开头）按行号拼进本地填好的行，返回完整的 CSV 行。
+    只按行号放置：不带行号、行号未知或重复的行丢弃，没有收到结果的行交给模型的列留空，两者都打印出来。
+    """
+    row_index = {record_id: i for i, record_id in enumerate(local_fill["row_ids"])}
+    llm_positions = [local_fill["columns"].index(name) for name in local_fill["llm_columns"]]
+    answers: dict[int, list[str]] = {}
+    extra = []
+    for row in llm_rows:
+        record_id, rest = split_row_id(row.strip())
+        i = row_index.get(record_id)
+        if i is None or i in answers:
+            extra.append(record_id or rest[:20])
+        else:
+            answers[i] = next(csv.reader([rest]), [])
+    if extra:
+        print(f"⚠️ 本地填充: {len(extra)} 行模型输出的行号缺失、未知或重复，已丢弃: {extra[:10]}")
+
+    table = []
+    for i, values in enumerate(local_fill["rows"]):
+        values = list(values)
+        fields = answers.get(i, [])
+        for k, position in enumerate(llm_positions):
+            values[position] = fields[k] if k < len(fields) else ""
+        table.append(values)
+    missing = [record_id for i, record_id in enumerate(local_fill["row_ids"]) if i not in answers]
+    if missing and llm_positions:
+        print(f"⚠️ 本地填充: {len(missing)} 行没有收到模型输出，交给模型的列留空: {missing[:10]}")
+    if local_fill.get("computed") and table:
+        apply_formulas(local_fill["columns"], table, local_fill["computed"])
+    return [_format_row(values) for values in table]
+
+
+def apply_formulas(columns: list[str], table: list[list], computed: dict[str, str]) -> None:
+    """按依赖顺序整列计算规则列，结果写回 table（引用成环的列留空）"""
+    frame = pd.DataFrame({name: ["" if row[columns.index(name)] is None else row[columns.index(name)] for row in table]
+                          for name in dict.fromkeys(columns)}, dtype=object)
+    pending = dict(computed)
+    while pending:
+        ready = [(name, compile_formula(text, columns, name)) for name, text in pending.items()]
+        ready = [(name, formula) for name, formula in ready if not set(formula.references) & set(pending)]
+        if not ready:
+            print(f"⚠️ 规则互相引用，无法计算: {list(pending)}")
+            break
+        for name, formula in ready:
+            frame[name] = formula.evaluate(frame).to_numpy()
+            position = columns.index(name)
+            for row, value in zip(table, frame[name]):
+                row[position] = value
+            del pending[name]
@@ -0,0 +1,193 @@
+"""
+多表合并的本地执行：按表头映射在本地把各文件的行上下拼接
+
+多表合并时输出行数就是各文件行数之和，列的对应关系也已经写在映射的“文件1/文件2: 字段”里，
+原来却把每个文件的每一行都写成一段文字交给模型逐行改写。这里直接在本地完成：
+- 有直接来源的列：每个文件取自己的那一列（映射没列出的文件按同名字段对齐，没有该字段的留空；
+  映射列出的文件里找不到该字段时整列交给模型）；
+- 按文件名判断的推理规则（如 "居民类型(城保/农保) - 城保名册.xls对应'城保'，农保名册.xls对应'农保'"）：
+  每个文件的行填同一个值；
+- “规则”算式列：拼好整行后按列计算（rule_formula）；
+- 其余真正需要推理的列才交给模型，数据块里每行只带这些列用得到的字段（context_columns），紧凑编码、带行号。
+
+返回值与 local_fill.build_local_fill 相同，生成 CSV 时同样用 merge_llm_rows 按行号拼回完整的行。
+LOCAL_MERGE_ENABLED=0 关闭（恢复整行交给模型合并）。
+"""
+
+import json
+import os
+import re
+import time
+from pathlib import Path
+from typing import Optional, Union
+
+import pandas as pd
+
+from utils.chunk_encoding import compact_encoding_enabled, row_id
+from utils.local_fill import (MappedColumn, _file_key, _normalise_column, load_csv_frame, parse_headers_mapping,
+                              resolve_field)
+from utils.reference_join import key_type_of
+from utils.rule_formula import try_compile_formula
+
+
+_QUOTE_OPEN = "'\"‘“「"
+_QUOTE_CLOSE = "'\"’”」"
+# "城保名册.xls对应'城保'" / "农保名册.xlsx 中的记录为“农保”"
+_FILE_VALUE = re.compile(rf"([^\s,，;；、:：()（）{_QUOTE_OPEN}{_QUOTE_CLOSE}]+?)\.(?:xlsx|xlsm|xls|csv|txt)"
+                         rf"[^,，;；。{_QUOTE_OPEN}]*?[{_QUOTE_OPEN}]([^{_QUOTE_OPEN}{_QUOTE_CLOSE}]+)[{_QUOTE_CLOSE}]", re.I)
+_QUOTED = re.compile(rf"[{_QUOTE_OPEN}]([^{_QUOTE_OPEN}{_QUOTE_CLOSE}]+)[{_QUOTE_CLOSE}]")
+_OPTIONS = re.compile(r"[(（]([^()（）]+?[/／][^()（）]+?)[)）]")
+
+
+def local_merge_enabled() -> bool:
+    return os.getenv("LOCAL_MERGE_ENABLED", "1").strip().lower() not in ("0", "false", "no", "off")
+
+
+def file_rule_values(rule: str, file_keys: list[str]) -> Optional[dict[str, str]]:
+    """
+    按文件名判断的推理规则 -> {文件名(不含扩展名): 值}；不是这类规则或有文件判断不出时返回 None。
+
+    先找 "文件名.xls 对应 '值'" 的写法，其余文件取规则中的候选值（"(城保/农保)" 或引号里的值）
+    里唯一被文件名包含的那个。
+    """
+    if not rule or not file_keys:
+        return None
+    pairs = {_file_key(f"{stem}.xls"): value.strip() for stem, value in _FILE_VALUE.findall(rule)}
+    if not pairs and "文件" not in rule and not any(key in rule for key in file_keys):
+        return None
+    options = [option.strip() for group in _OPTIONS.findall(rule) for option in re.split(r"[/／]", group)]
+    options += [value.strip() for value in _QUOTED.findall(rule)]
+    values = {}
+    for key in file_keys:
+        if key in pairs:
+            values[key] = pairs[key]
+            continue
+        found = {option for option in options if option and option in key}
+        if len(found) != 1:
+            return None
+        values[key] = found.pop()
+    return values
+
+
+def _source_column(column: MappedColumn, key: str, frame: pd.DataFrame) -> Optional[str]:
+    """列在这个文件中的来源字段：映射列出的本文件来源优先，其次按其他文件的同名字段对齐"""
+    own = [field_name for file_name, field_name in column.sources if _file_key(file_name) == key]
+    others = [field_name for file_name, field_name in column.sources if _file_key(file_name) != key]
+    for field_name in own + others:
+        source_column = resolve_field(field_name, list(frame.columns))
+        if source_column is not None:
+            return source_column
+    return None
+
+
+def _context_columns(llm_columns: list[MappedColumn], key: str, frame: pd.DataFrame) -> Optional[list[str]]:
+    """交给模型的列在这个文件里用得到的字段（身份类字段 + 来源字段 + 规则里提到的字段）；找不到依据时返回 None（整行都给）"""
+    mentioned = _normalise_column(json.dumps([column.raw for column in llm_columns], ensure_ascii=False))
+    used = []
+    for column in llm_columns:
+        source_column = _source_column(column, key, frame) if column.sources else None
+        if source_column is not None:
+            used.append(source_column)
+    used += [name for name in frame.columns if name and _normalise_column(name) in mentioned]
+    if not used:
+        return None
+    keys = [name for name in frame.columns if key_type_of(name)]
+    return list(dict.fromkeys(keys + used))
+
+
+def build_local_merge(headers_mapping: Union[str, dict], excel_file_paths: list[str], village_name: str) -> dict:
+    """
+    按表头映射在本地把各文件的行拼接成目标表格。
+
+    Args:
+        headers_mapping: 表头映射
+        excel_file_paths: 参与合并的文件，行按文件顺序、文件内原顺序排列（与 process_excel_files_for_merge 的行号一致）
+        village_name: 村名（定位 CSV_files 目录）
+
+    Returns:
+        dict: build_local_fill 的各项，另加
+            "context_columns": {文件名(不含扩展名): 交给模型的列用得到的字段}（传给 process_excel_files_for_merge 的 keep_columns）
+        表头映射无法解析、没有数据或一列都填不了时返回 {}
+    """
+    if not local_merge_enabled():
+        return {}
+    started = time.perf_counter()
+    columns = parse_headers_mapping(headers_mapping)
+    if not columns:
+        print("⚠️ 本地合并: 表头映射无法解析，全部交给模型")
+        return {}
+
+    csv_dir = Path(f"files/{village_name}/table_files/CSV_files")
+    frames = {}  # same files, same order as process_excel_files_for_merge
+    for excel_path in excel_file_paths:
+        key = _file_key(excel_path)
+        csv_path = csv_dir / f"{key}.csv"
+        if key in frames or not csv_path.exists():
+            continue
+        try:
+            frames[key] = load_csv_frame(csv_path)
+        except Exception as e:
+            print(f"⚠️ 本地合并: 读取 {csv_path.name} 失败，全部交给模型: {e}")
+            return {}
+    if not any(len(frame) for frame in frames.values()):
+        print("⚠️ 本地合并: 没有找到可合并的数据，全部交给模型")
+        return {}
+
+    names = [column.name for column in columns]
+    values: dict[str, list] = {}
+    file_rules: list[str] = []
+    computed: dict[str, str] = {}
+    llm_columns: list[MappedColumn] = []
+    for column in columns:
+        if column.sources and not column.rule:
+            sources = {key: _source_column(column, key, frame) for key, frame in frames.items()}
+            listed = {_file_key(file_name) for file_name, _ in column.sources} & set(frames)
+            # A file the mapping names as a source but without the field needs the model to align it
+            if any(sources.values()) and all(sources[key] for key in listed):
+                values[column.name] = [value for key, frame in frames.items()
+                                       for value in (frame[sources[key]].tolist() if sources[key] else [""] * len(frame))]
+                continue
+        per_file = file_rule_values(column.rule, list(frames))
+        if per_file is not None:
+            values[column.name] = [per_file[key] for key, frame in frames.items() for _ in range(len(frame))]
+            file_rules.append(column.name)
+            continue
+        formula = next((compiled for text in (column.formula, column.rule) if text
+                        for compiled in [try_compile_formula(text, names, column.name)] if compiled is not None), None)
+        if formula is not None:
+            computed[column.name] = formula.text
+        else:
+            llm_columns.append(column)
+
+    if not values and not computed:
+        print("⚠️ 本地合并: 没有可以直接取值、按文件名或按规则计算的列，全部交给模型")
+        return {}
+    if llm_columns and not compact_encoding_enabled():
+        # Model rows are placed by row ID, which only the compact encoding carries
+        print("⚠️ 本地合并: 未启用紧凑编码，数据块没有行号，全部交给模型")
+        return {}
+
+    row_count = sum(len(frame) for frame in frames.values())
+    rows = [[values[name][i] if name in values else None for name in names] for i in range(row_count)]
+    context_columns = {}
+    if llm_columns:
+        for key, frame in frames.items():
+            context = _context_columns(llm_columns, key, frame)
+            if context is not None:
+                context_columns[key] = context
+    llm_mapping = json.dumps({"表格结构": {column.name: column.raw if column.raw is not None else []
+                                           for column in llm_columns}}, ensure_ascii=False, indent=2)
+    print(f"⚡ 本地合并 {len(frames)} 个文件 {row_count} 行，{len(values)}/{len(columns)} 列直接填好 "
+          f"({(time.perf_counter() - started) * 1000:.0f}ms)"
+          f"{f'; 按文件名判断: {file_rules}' if file_rules else ''}"
+          f"{f'; 按规则计算: {list(computed)}' if computed else ''}"
+          f"{f'; 交给模型: {[column.name for column in llm_columns]}' if llm_columns else '; 无需调用模型'}")
+    return {
+        "columns": names,
+        "rows": rows,
+        "row_ids": [row_id(i) for i in range(row_count)],
+        "llm_columns": [column.name for column in llm_columns],
+        "llm_mapping": llm_mapping,
+        "computed": computed,
+        "context_columns": context_columns,
+    }
@@ -0,0 +1,347 @@
+"""
+本地 OpenAI 兼容的替身服务（压测用）
+
+实现 /v1/chat/completions（流式 / 非流式 / 工具调用），可以配置：
+- 首 token 延迟（对数正态抖动）与输出速度 tokens/s
+- 429 注入：按概率随机返回，或按 RPM 限额真实限流，均带 retry-after 与 x-ratelimit-* 响应头
+- 脚本化回复：内置 filloutTable / fileProcessAgent / recallFilesAgent 各提示词的合理回复，
+  也可以用 --script 指定 JSON 文件追加规则 [{"match": "正则", "content": "..."} 或 {"match": ..., "tool_calls": [...]}]
+
+启动：
+    python -m utils.mock_llm_server --port 8001 --ttft 0.8 --tps 40 --rate-429 0.02
+
+让 invoke_model* 指向它（所有服务商共用，或分别设置 OPENAI_BASE_URL / SILICONFLOW_BASE_URL）：
+    LLM_BASE_URL=http://127.0.0.1:8001/v1
+
+GET /stats 返回请求数、429 次数和并发峰值。
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import re
+import sys
+import threading
+import time
+import uuid
+from collections import deque
+from pathlib import Path
+from typing import Optional
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+# Allow running as a plain script as well as `python -m utils.mock_llm_server`
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+
+from utils.token_estimator import estimate_messages_tokens, estimate_tokens
+
+
+# ──────────────────────── 脚本化回复 ─────────────────────── #
+
+_FILE_NAME_PATTERN = re.compile(r"[\w一-鿿（）()\-]+\.(?:xlsx|xls|xlsm|csv|docx|doc|pdf|txt)")
+
+
+def _message_text(message: dict) -> str:
+    content = message.get("content") or ""
+    if isinstance(content, list):
+        return "\n".join(part.get("text", "") for part in content if isinstance(part, dict))
+    return content
+
+
+def _section(text: str, start_marker: str, end_marker: Optional[str] = None) -> str:
+    start = text.find(start_marker)
+    if start == -1:
+        return ""
+    start += len(start_marker)
+    end = text.find(end_marker, start) if end_marker else -1
+    return text[start:end if end != -1 else len(text)]
+
+
+def _reply_file_classification(system: str, user: str, tools: list) -> dict:
+    content = _section(system, "文件内容:", "请严格按照以下JSON格式回复")
+    rows = content.count("<tr")
+    if rows == 0:
+        classification = "supplement-文档"
+    elif rows <= 4:
+        classification = "template"
+    else:
+        classification = "supplement-表格"
+    return {"content": json.dumps({"classification": classification}, ensure_ascii=False)}
+
+
+def _reply_document_summary(system: str, user: str, tools: list) -> dict:
+    return {"content": json.dumps({"文件名": "补贴标准为每人每月 500 元，适用于低保户家庭成员。"}, ensure_ascii=False)}
+
+
+def _reply_template_complexity(system: str, user: str, tools: list) -> dict:
+    return {"content": "[Simple]"}
+
+
+def _reply_recall_files(system: str, user: str, tools: list) -> dict:
+    candidates = list(dict.fromkeys(_FILE_NAME_PATTERN.findall(_section(system, "文件摘要列表：", "历史对话记录："))))[:5]
+    history = _section(system, "历史对话记录：", "请开始执行").strip()
+    if not history and any(t.get("function", {}).get("name") == "request_user_clarification" for t in tools):
+        question = f"我初步筛选了以下文件用于填写模板：{'、'.join(candidates)}，请确认是否合适？"
+        return {"tool_calls": [{"name": "request_user_clarification", "arguments": {"question": question}}]}
+    return {"content": json.dumps(candidates, ensure_ascii=False)}
+
+
+def _reply_header_mapping(system: str, user: str, tools: list) -> dict:
+    template = _section(system, "**模板表格结构**：", "- **相关数据文件内容**").strip()
+    return {"content": template or "{}"}
+
+
+def _reply_reconstruct_csv(system: str, user: str, tools: list) -> dict:
+    structure_text = _section(user, "=== 表格结构 ===", "=== CSV数据 ===").strip()
+    try:
+        structure = json.loads(structure_text)
+        fields = list(next(iter(structure.values())).get("表格结构", {}).keys())
+    except (ValueError, StopIteration, AttributeError):
+        fields = []
+    lines = []
+    for row in _section(user, "=== CSV数据 ===").strip().splitlines():
+        if "," in row:
+            values = row.split(",")
+            header = fields or [f"字段{i + 1}" for i in range(len(values))]
+            lines.append(",".join(header))
+            lines.append(row)
+    return {"content": "\n".join(lines)}
+
+
+def _reply_fillout_csv(system: str, user: str, tools: list) -> dict:
+    """filloutTable: reasoning section, then one CSV row per core data entry"""
+    if "--- 数据条目" in user:
+        entries = re.findall(r"数据:\s*(.+)", user)
+    else:
+        core = _section(user, "核心数据源", "参考数据源") or user
+        data_lines = [line.strip() for line in core.splitlines() if line.count(",") >= 1]
+        entries = data_lines[1::2]  # alternating header / data lines
+    reasoning = ["=== 推理过程 ===", f"步骤1：核心数据源共 {len(entries)} 条，生成同样数量的CSV行。"]
+    reasoning += [f"【数据行 {i + 1} 的处理】→ 逐列匹配表头映射" for i in range(len(entries))]
+    return {"content": "\n".join(reasoning + ["", "=== 最终答案 ==="] + entries)}
+
+
+BUILTIN_SCRIPTS = [
+    ("fileProcessAgent.classify", re.compile(r"需要分析用户上传的文件内容并进行分类"), _reply_file_classification),
+    ("fileProcessAgent.summary", re.compile(r"具备法律与政策解读能力"), _reply_document_summary),
+    ("fileProcessAgent.complexity", re.compile(r"判断这个表格模板是复杂模板还是简单模板"), _reply_template_complexity),
+    ("recallFilesAgent.recall", re.compile(r"挑选出可能用于填写模板的相关文件"), _reply_recall_files),
+    ("recallFilesAgent.mapping", re.compile(r"分析模板表格与多个数据文件之间的表头映射关系"), _reply_header_mapping),
+    ("file_process.reconstruct", re.compile(r"表格结构分析与数据重构专家"), _reply_reconstruct_csv),
+    ("filloutTable.generate", re.compile(r"=== 最终答案 ==="), _reply_fillout_csv),
+]
+
+
+def load_script_file(path: str) -> list:
+    """读取 --script 指定的 JSON 规则，优先于内置规则匹配"""
+    rules = []
+    for rule in json.loads(Path(path).read_text(encoding="utf-8")):
+        reply = {key: rule[key] for key in ("content", "tool_calls") if key in rule}
+        rules.append((f"script:{rule['match']}", re.compile(rule["match"], re.S), lambda s, u, t, reply=reply: reply))
+    return rules
+
+
+# ──────────────────────── 服务 ─────────────────────── #
+
+class MockLLMConfig:
+    def __init__(self, ttft: float = 0.5, ttft_jitter: float = 0.3, tps: float = 50.0,
+                 rate_429: float = 0.0, retry_after: float = 1.0, rpm: int = 0, seed: Optional[int] = None,
+                 scripts: Optional[list] = None):
+        self.ttft = ttft
+        self.ttft_jitter = ttft_jitter
+        self.tps = tps
+        self.rate_429 = rate_429
+        self.retry_after = retry_after
+        self.rpm = rpm
+        self.scripts = (scripts or []) + BUILTIN_SCRIPTS
+        self.random = random.Random(seed)
+
+
+class _ServerStats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.rate_limited = 0
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.by_script: dict[str, int] = {}
+        self.window: deque = deque()
+
+    def snapshot(self) -> dict:
+        with self.lock:
+            return {"requests": self.requests, "rate_limited": self.rate_limited,
+                    "in_flight": self.in_flight, "peak_in_flight": self.peak_in_flight,
+                    "by_script": dict(self.by_script)}
+
+
+def _pick_reply(config: MockLLMConfig, messages: list, tools: list) -> tuple[str, dict]:
+    system = "\n".join(_message_text(m) for m in messages if m.get("role") == "system")
+    user = "\n".join(_message_text(m) for m in messages if m.get("role") != "system")
+    prompt = system + "\n" + user
+    for name, pattern, responder in config.scripts:
+        if pattern.search(prompt):
+            return name, responder(system, user, tools)
+    return "default", {"content": "好的，已收到。"}
+
+
+def _tool_call_payload(tool_calls: list) -> list:
+    return [{
+        "id": f"call_{uuid.uuid4().hex[:12]}",
+        "type": "function",
+        "function": {"name": call["name"], "arguments": json.dumps(call.get("arguments", {}), ensure_ascii=False)},
+    } for call in tool_calls]
+
+
+def create_app(config: MockLLMConfig) -> FastAPI:
+    app = FastAPI(title="Mock OpenAI-compatible LLM")
+    stats = _ServerStats()
+
+    def _rate_limit_headers(remaining: int) -> dict:
+        headers = {"x-ratelimit-reset-requests": "60s"}
+        if config.rpm:
+            headers["x-ratelimit-limit-requests"] = str(config.rpm)
+            headers["x-ratelimit-remaining-requests"] = str(max(remaining, 0))
+        return headers
+
+    def _admit() -> tuple[bool, dict]:
+        """按 RPM 滑动窗口与随机注入决定是否返回 429"""
+        now = time.monotonic()
+        with stats.lock:
+            stats.requests += 1
+            while stats.window and now - stats.window[0] > 60:
+                stats.window.popleft()
+            remaining = config.rpm - len(stats.window) if config.rpm else 0
+            if config.rpm and remaining <= 0:
+                retry_after = max(60 - (now - stats.window[0]), 0.1)
+                stats.rate_limited += 1
+                return False, {**_rate_limit_headers(0), "retry-after": f"{retry_after:.1f}"}
+            if config.random.random() < config.rate_429:
+                stats.rate_limited += 1
+                return False, {**_rate_limit_headers(remaining), "retry-after": f"{config.retry_after:.1f}"}
+            stats.window.append(now)
+            return True, _rate_limit_headers(remaining - 1)
+
+    def _ttft() -> float:
+        with stats.lock:
+            jitter = config.random.lognormvariate(0, config.ttft_jitter) if config.ttft_jitter else 1.0
+        return config.ttft * jitter
+
+    @app.get("/v1/models")
+    async def list_models():
+        return {"object": "list", "data": [{"id": "mock", "object": "model", "owned_by": "local"}]}
+
+    @app.get("/stats")
+    async def server_stats():
+        return stats.snapshot()
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        admitted, headers = _admit()
+        if not admitted:
+            return JSONResponse(status_code=429, headers=headers, content={
+                "error": {"message": "Rate limit reached (mock)", "type": "rate_limit_exceeded", "code": "rate_limit_exceeded"}
+            })
+
+        model = body.get("model", "mock")
+        messages = body.get("messages", [])
+        script_name, reply = _pick_reply(config, messages, body.get("tools") or [])
+        with stats.lock:
+            stats.by_script[script_name] = stats.by_script.get(script_name, 0) + 1
+        content = reply.get("content")
+        tool_calls = _tool_call_payload(reply["tool_calls"]) if reply.get("tool_calls") else None
+        prompt_tokens = estimate_messages_tokens(messages, model)
+        output_text = content if content is not None else json.dumps(tool_calls, ensure_ascii=False)
+        completion_tokens = max(1, estimate_tokens(output_text, model))
+        usage = {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                 "total_tokens": prompt_tokens + completion_tokens}
+        completion_id = f"chatcmpl-{uuid.uuid4().hex[:16]}"
+        created = int(time.time())
+        finish_reason = "tool_calls" if tool_calls else "stop"
+
+        with stats.lock:
+            stats.in_flight += 1
+            stats.peak_in_flight = max(stats.peak_in_flight, stats.in_flight)
+
+        def _done():
+            with stats.lock:
+                stats.in_flight -= 1
+
+        if not body.get("stream"):
+            try:
+                await asyncio.sleep(_ttft() + completion_tokens / config.tps)
+            finally:
+                _done()
+            message = {"role": "assistant", "content": content}
+            if tool_calls:
+                message["tool_calls"] = tool_calls
+            return JSONResponse(headers=headers, content={
+                "id": completion_id, "object": "chat.completion", "created": created, "model": model,
+                "choices": [{"index": 0, "message": message, "finish_reason": finish_reason}],
+                "usage": usage,
+            })
+
+        include_usage = (body.get("stream_options") or {}).get("include_usage", False)
+
+        def _chunk(delta: dict, finish: Optional[str] = None) -> str:
+            payload = {"id": completion_id, "object": "chat.completion.chunk", "created": created, "model": model,
+                       "choices": [{"index": 0, "delta": delta, "finish_reason": finish}]}
+            return f"data: {json.dumps(payload, ensure_ascii=False)}\n\n"
+
+        async def _events():
+            try:
+                await asyncio.sleep(_ttft())
+                yield _chunk({"role": "assistant", "content": ""})
+                if tool_calls:
+                    for index, call in enumerate(tool_calls):
+                        yield _chunk({"tool_calls": [{"index": index, **call}]})
+                else:
+                    # ~4 tokens per event, paced at the configured tokens/s
+                    piece = max(1, int(len(content) * 4 / completion_tokens))
+                    for start in range(0, len(content), piece):
+                        text = content[start:start + piece]
+                        await asyncio.sleep(estimate_tokens(text, model) / config.tps)
+                        yield _chunk({"content": text})
+                yield _chunk({}, finish_reason)
+                if include_usage:
+                    payload = {"id": completion_id, "object": "chat.completion.chunk", "created": created,
+                               "model": model, "choices": [], "usage": usage}
+                    yield f"data: {json.dumps(payload)}\n\n"
+                yield "data: [DONE]\n\n"
+            finally:
+                _done()
+
+        return StreamingResponse(_events(), media_type="text/event-stream", headers=headers)
+
+    app.state.mock_stats = stats
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local OpenAI-compatible stand-in for load testing")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--ttft", type=float, default=0.5, help="平均首 token 延迟（秒）")
+    parser.add_argument("--ttft-jitter", type=float, default=0.3, help="首 token 延迟的对数正态 sigma，0 表示固定")
+    parser.add_argument("--tps", type=float, default=50.0, help="每个请求的输出速度 tokens/s")
+    parser.add_argument("--rate-429", type=float, default=0.0, help="随机返回 429 的概率")
+    parser.add_argument("--retry-after", type=float, default=1.0, help="随机 429 的 retry-after 秒数")
+    parser.add_argument("--rpm", type=int, default=0, help="每分钟请求上限，0 表示不限")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--script", default=None, help="追加的脚本化回复规则（JSON 文件）")
+    args = parser.parse_args()
+
+    import uvicorn
+    config = MockLLMConfig(ttft=args.ttft, ttft_jitter=args.ttft_jitter, tps=args.tps, rate_429=args.rate_429,
+                           retry_after=args.retry_after, rpm=args.rpm, seed=args.seed,
+                           scripts=load_script_file(args.script) if args.script else None)
+    print(f"🧪 本地LLM替身服务: http://{args.host}:{args.port}/v1 "
+          f"(首token {args.ttft}s | {args.tps} tokens/s | 429概率 {args.rate_429:.0%} | RPM {args.rpm or '不限'})")
+    print(f"   设置 LLM_BASE_URL=http://{args.host}:{args.port}/v1 即可让 invoke_model 使用该服务")
+    uvicorn.run(create_app(config), host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
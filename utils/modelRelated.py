@@ -1,6 +1,6 @@
-from typing import Dict, List, Optional, Any, TypedDict, Annotated
+from typing import Callable, Dict, List, Optional, Any, TypedDict, Annotated, AsyncIterator
 from langchain_openai import ChatOpenAI
-from langchain_core.messages import BaseMessage, HumanMessage, SystemMessage
+from langchain_core.messages import BaseMessage, HumanMessage, SystemMessage, message_to_dict, messages_from_dict
 import os
 import time
 import random
@@ -8,8 +8,735 @@ from pathlib import Path
 import base64
 from openai import RateLimitError, APIError
 import requests
+import threading
+import hashlib
+import httpx
+import json
+import asyncio
+import weakref
+import re
+import contextvars
+from collections import deque
 
 from utils.screen_shot import ExcelTableScreenshot
+from utils.llm_cache import get_llm_cache, make_cache_key
+from utils.llm_metrics import start_llm_call, note_http_response
+from utils.token_estimator import estimate_messages_tokens, get_token_estimator
+from utils.llm_cassette import wrap_transport, wrap_async_transport, print_cassette_stats
+
+
+# ──────────────────────── LLM 客户端连接池 ─────────────────────── #
+# 每次调用都新建 ChatOpenAI 会重新建立 HTTP 连接（TLS 握手 + 客户端构造），
+# 这里维护一个进程级的客户端注册表，按 (base_url, api_key, model, temperature, streaming)
+# 复用 ChatOpenAI 实例，同一 provider 下的所有实例共享一个 keep-alive 的 httpx 连接池。
+
+LLM_REQUEST_TIMEOUT = 200  # network timeout
+LLM_STREAM_MAX_RETRIES = 6
+DEFAULT_POOL_MAX_CONNECTIONS = int(os.getenv("LLM_POOL_MAX_CONNECTIONS", "20"))
+
+# 异步调用时每个服务商允许的最大并发请求数
+DEFAULT_PROVIDER_CONCURRENCY = {"openai": 50, "siliconflow": 100}
+
+
+def get_provider_concurrency(provider: str) -> int:
+    """读取服务商并发上限，可通过 LLM_MAX_CONCURRENCY_<PROVIDER> 环境变量覆盖"""
+    env_value = os.getenv(f"LLM_MAX_CONCURRENCY_{provider.upper()}")
+    if env_value:
+        return max(1, int(env_value))
+    return DEFAULT_PROVIDER_CONCURRENCY.get(provider, 50)
+
+
+DEFAULT_BASE_URLS = {
+    "openai": "https://api.openai.com/v1",
+    "siliconflow": "https://api.siliconflow.cn/v1",
+}
+
+
+def _resolve_provider(model_name: str) -> tuple[str, str, str]:
+    """
+    根据模型名确定调用的服务商。
+    服务地址可通过 <PROVIDER>_BASE_URL（如 OPENAI_BASE_URL）单独覆盖，
+    或用 LLM_BASE_URL 把所有服务商指向同一个 OpenAI 兼容服务（例如 utils/mock_llm_server.py）。
+
+    Returns:
+        tuple: (provider, base_url, api_key)
+    """
+    if model_name.startswith("gpt-"):  # ChatGPT 系列模型
+        provider = "openai"
+    else:
+        # 其他模型，例如 deepseek, siliconflow...
+        provider = "siliconflow"
+    base_url = os.getenv("LLM_BASE_URL") or os.getenv(f"{provider.upper()}_BASE_URL") or DEFAULT_BASE_URLS[provider]
+    api_key = os.getenv(f"{provider.upper()}_API_KEY")
+    if not api_key and base_url != DEFAULT_BASE_URLS[provider]:
+        api_key = "sk-local"  # local stand-ins accept any key
+    return provider, base_url.rstrip("/"), api_key
+
+
+class _ConnectionPoolStats:
+    """Thread-safe counters for one shared HTTP connection pool"""
+
+    def __init__(self, provider: str, base_url: str, max_connections: int):
+        self.provider = provider
+        self.base_url = base_url
+        self.max_connections = max_connections
+        self.requests = 0
+        self.new_connections = 0
+        self.tls_handshakes = 0
+        self._lock = threading.Lock()
+
+    def _trace(self, event_name: str, info: dict) -> None:
+        # httpcore trace extension: only fires connect/TLS events for brand-new connections
+        if event_name == "connection.connect_tcp.complete":
+            with self._lock:
+                self.new_connections += 1
+        elif event_name == "connection.start_tls.complete":
+            with self._lock:
+                self.tls_handshakes += 1
+
+    def on_request(self, request: httpx.Request) -> None:
+        with self._lock:
+            self.requests += 1
+        request.extensions["trace"] = self._trace
+
+    # httpx.AsyncClient requires coroutine hooks / trace callbacks
+    async def _atrace(self, event_name: str, info: dict) -> None:
+        self._trace(event_name, info)
+
+    async def aon_request(self, request: httpx.Request) -> None:
+        with self._lock:
+            self.requests += 1
+        request.extensions["trace"] = self._atrace
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            reused = max(self.requests - self.new_connections, 0)
+            return {
+                "provider": self.provider,
+                "base_url": self.base_url,
+                "max_connections": self.max_connections,
+                "requests": self.requests,
+                "new_connections": self.new_connections,
+                "tls_handshakes": self.tls_handshakes,
+                "reused_connections": reused,
+                "reuse_ratio": round(reused / self.requests, 3) if self.requests else 0.0,
+            }
+
+
+class _ReleasingStream(httpx.SyncByteStream):
+    """Response body wrapper: reports to the transport once the body is closed"""
+
+    def __init__(self, stream: httpx.SyncByteStream, release: Callable[[], None]):
+        self._stream = stream
+        self._release = release
+        self._released = False
+
+    def __iter__(self):
+        yield from self._stream
+
+    def close(self) -> None:
+        try:
+            self._stream.close()
+        finally:
+            if not self._released:
+                self._released = True
+                self._release()
+
+
+class _DrainingTransport(httpx.BaseTransport):
+    """
+    Counts requests whose response body is still open. A transport retired by
+    LLMClientPool.ensure_capacity closes its connections once the last one is released.
+    """
+
+    def __init__(self, transport: httpx.BaseTransport):
+        self._transport = transport
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        self.retired = False
+        self.closed = False
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        with self._lock:
+            self.in_flight += 1
+        try:
+            response = self._transport.handle_request(request)
+        except BaseException:
+            self._release()
+            raise
+        response.stream = _ReleasingStream(response.stream, self._release)
+        return response
+
+    def _release(self) -> None:
+        with self._lock:
+            self.in_flight -= 1
+            drained = self.retired and self.in_flight == 0
+        if drained:
+            self.close()
+
+    def retire(self) -> None:
+        """No new requests will be routed here: close now if idle, else when the last response is closed"""
+        with self._lock:
+            self.retired = True
+            idle = self.in_flight == 0
+        if idle:
+            self.close()
+
+    def close(self) -> None:
+        with self._lock:
+            if self.closed:
+                return
+            self.closed = True
+        self._transport.close()
+
+
+class LLMClientPool:
+    """
+    Process-wide registry of ChatOpenAI clients.
+
+    - ChatOpenAI 实例按 (base_url, api_key, model, temperature, streaming) 缓存复用
+    - 同一 (base_url, api_key) 共享一个 httpx.Client，连接池大小与线程池并发数匹配
+    - 所有方法都可以在各智能体已有的 ThreadPoolExecutor 中并发调用
+    """
+
+    def __init__(self, max_connections: int = DEFAULT_POOL_MAX_CONNECTIONS):
+        self.max_connections = max_connections
+        self._lock = threading.Lock()
+        self._http_clients: dict[tuple[str, str], httpx.Client] = {}
+        self._chat_models: dict[tuple, ChatOpenAI] = {}
+        self._stats: dict[tuple[str, str], _ConnectionPoolStats] = {}
+        self._transports: dict[tuple[str, str], _DrainingTransport] = {}
+        self._retired_transports: list[_DrainingTransport] = []  # closed once their in-flight requests finish
+        # Async clients / semaphores are bound to the event loop that created them
+        self._async_state: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, dict]" = weakref.WeakKeyDictionary()
+
+    @staticmethod
+    def _key_fingerprint(api_key: str | None) -> str:
+        """Never keep raw api keys in registry keys / stats output"""
+        return hashlib.sha256((api_key or "").encode("utf-8")).hexdigest()[:12]
+
+    def ensure_capacity(self, workers: int) -> None:
+        """
+        Grow the connection pools so that `workers` concurrent calls never wait for a free connection.
+        Existing pools keep serving in-flight requests and are closed as soon as those finish;
+        new calls go through the resized pools.
+        """
+        with self._lock:
+            if workers <= self.max_connections:
+                return
+            print(f"🔧 扩容LLM连接池: {self.max_connections} -> {workers}")
+            self.max_connections = workers
+            retired = list(self._transports.values())
+            self._transports.clear()
+            self._http_clients.clear()
+            self._chat_models.clear()
+            self._retired_transports = [transport for transport in self._retired_transports if not transport.closed]
+            self._retired_transports.extend(retired)
+            for stats in self._stats.values():
+                stats.max_connections = workers
+        for transport in retired:
+            transport.retire()
+
+    def _get_http_client(self, provider: str, base_url: str, api_key: str | None) -> httpx.Client:
+        # caller holds self._lock
+        pool_key = (base_url, self._key_fingerprint(api_key))
+        client = self._http_clients.get(pool_key)
+        if client is None:
+            stats = self._stats.get(pool_key)
+            if stats is None:
+                stats = _ConnectionPoolStats(provider, base_url, self.max_connections)
+                self._stats[pool_key] = stats
+            # limits live on the transport; LLM_TRANSPORT_MODE may wrap it with record/replay
+            transport = _DrainingTransport(wrap_transport(httpx.HTTPTransport(
+                limits=httpx.Limits(max_connections=self.max_connections,
+                                    max_keepalive_connections=self.max_connections,
+                                    keepalive_expiry=60.0))))
+            self._transports[pool_key] = transport
+            client = httpx.Client(
+                transport=transport,
+                timeout=httpx.Timeout(LLM_REQUEST_TIMEOUT),
+                event_hooks={"request": [stats.on_request], "response": [_on_llm_response]},
+            )
+            self._http_clients[pool_key] = client
+        return client
+
+    def get_chat_model(self, model_name: str, temperature: float = 0.2, streaming: bool = False) -> ChatOpenAI:
+        """返回可复用的 ChatOpenAI 实例（线程安全）"""
+        provider, base_url, api_key = _resolve_provider(model_name)
+        registry_key = (base_url, self._key_fingerprint(api_key), model_name, temperature, streaming)
+        with self._lock:
+            llm = self._chat_models.get(registry_key)
+            if llm is None:
+                llm = ChatOpenAI(
+                    model=model_name,
+                    api_key=api_key,
+                    base_url=base_url,
+                    streaming=streaming,
+                    temperature=temperature,
+                    timeout=LLM_REQUEST_TIMEOUT,
+                    http_client=self._get_http_client(provider, base_url, api_key),
+                )
+                self._chat_models[registry_key] = llm
+            return llm
+
+    def _loop_state(self) -> dict:
+        # caller holds self._lock
+        loop = asyncio.get_running_loop()
+        state = self._async_state.get(loop)
+        if state is None:
+            state = {"http_clients": {}, "chat_models": {}, "semaphores": {}}
+            self._async_state[loop] = state
+        return state
+
+    def get_async_chat_model(self, model_name: str, temperature: float = 0.2, streaming: bool = False) -> ChatOpenAI:
+        """返回绑定到当前事件循环的 ChatOpenAI 实例（使用共享的 httpx.AsyncClient 连接池）"""
+        provider, base_url, api_key = _resolve_provider(model_name)
+        pool_key = (base_url, self._key_fingerprint(api_key))
+        registry_key = pool_key + (model_name, temperature, streaming)
+        with self._lock:
+            state = self._loop_state()
+            llm = state["chat_models"].get(registry_key)
+            if llm is not None:
+                return llm
+            client = state["http_clients"].get(pool_key)
+            if client is None:
+                stats = self._stats.get(pool_key)
+                if stats is None:
+                    stats = _ConnectionPoolStats(provider, base_url, self.max_connections)
+                    self._stats[pool_key] = stats
+                max_connections = max(self.max_connections, get_provider_concurrency(provider))
+                client = httpx.AsyncClient(
+                    transport=wrap_async_transport(httpx.AsyncHTTPTransport(
+                        limits=httpx.Limits(max_connections=max_connections,
+                                            max_keepalive_connections=max_connections,
+                                            keepalive_expiry=60.0))),
+                    timeout=httpx.Timeout(LLM_REQUEST_TIMEOUT),
+                    event_hooks={"request": [stats.aon_request], "response": [_aon_llm_response]},
+                )
+                state["http_clients"][pool_key] = client
+            llm = ChatOpenAI(
+                model=model_name,
+                api_key=api_key,
+                base_url=base_url,
+                streaming=streaming,
+                temperature=temperature,
+                timeout=LLM_REQUEST_TIMEOUT,
+                http_async_client=client,
+            )
+            state["chat_models"][registry_key] = llm
+            return llm
+
+    def provider_semaphore(self, provider: str) -> asyncio.Semaphore:
+        """每个服务商在当前事件循环内共享一个 asyncio.Semaphore"""
+        with self._lock:
+            semaphores = self._loop_state()["semaphores"]
+            semaphore = semaphores.get(provider)
+            if semaphore is None:
+                semaphore = asyncio.Semaphore(get_provider_concurrency(provider))
+                semaphores[provider] = semaphore
+            return semaphore
+
+    async def aclose_loop_clients(self) -> None:
+        """关闭当前事件循环创建的异步连接池（在事件循环结束前调用）"""
+        with self._lock:
+            state = self._async_state.pop(asyncio.get_running_loop(), None)
+        if state:
+            for client in state["http_clients"].values():
+                await client.aclose()
+
+    def stats(self) -> dict:
+        """Connection reuse statistics for every shared pool"""
+        with self._lock:
+            pools = [stats.snapshot() for stats in self._stats.values()]
+            cached_clients = len(self._chat_models)
+        return {"cached_chat_models": cached_clients, "pools": pools}
+
+    def close(self) -> None:
+        with self._lock:
+            for client in list(self._http_clients.values()):
+                try:
+                    client.close()
+                except Exception:
+                    pass
+            for transport in self._retired_transports:
+                try:
+                    transport.close()
+                except Exception:
+                    pass
+            self._http_clients.clear()
+            self._transports.clear()
+            self._retired_transports.clear()
+            self._chat_models.clear()
+
+
+_CLIENT_POOL = LLMClientPool()
+
+
+def get_chat_model(model_name: str, temperature: float = 0.2, streaming: bool = False) -> ChatOpenAI:
+    """从进程级连接池获取 ChatOpenAI 客户端"""
+    return _CLIENT_POOL.get_chat_model(model_name, temperature, streaming)
+
+
+def ensure_client_pool_capacity(workers: int) -> None:
+    """在启动并发线程池之前调用，保证连接池大小不小于并发工作者数量"""
+    _CLIENT_POOL.ensure_capacity(workers)
+
+
+def get_client_pool_stats() -> dict:
+    """返回连接池统计信息（请求数 / 新建连接数 / 连接复用率）"""
+    return _CLIENT_POOL.stats()
+
+
+def get_async_chat_model(model_name: str, temperature: float = 0.2, streaming: bool = False) -> ChatOpenAI:
+    """从进程级连接池获取绑定当前事件循环的 ChatOpenAI 客户端"""
+    return _CLIENT_POOL.get_async_chat_model(model_name, temperature, streaming)
+
+
+def run_async(coro):
+    """
+    在同步代码（LangGraph 节点、线程池工作线程）中运行协程。
+
+    当前线程没有事件循环时直接 asyncio.run；已有运行中的事件循环时在独立线程中运行，
+    结束前关闭该事件循环上创建的异步连接池。
+    """
+    async def _runner():
+        try:
+            return await coro
+        finally:
+            await _CLIENT_POOL.aclose_loop_clients()
+
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(_runner())
+
+    from concurrent.futures import ThreadPoolExecutor
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        # copy_context: the worker thread keeps the caller's metrics session
+        return executor.submit(contextvars.copy_context().run, asyncio.run, _runner()).result()
+
+
+def print_client_pool_stats() -> None:
+    """打印连接池统计信息"""
+    stats = get_client_pool_stats()
+    print(f"🔌 LLM连接池: 已缓存客户端 {stats['cached_chat_models']} 个")
+    for pool in stats["pools"]:
+        print(f"   - {pool['provider']} ({pool['base_url']}): 请求 {pool['requests']} 次 | "
+              f"新建连接 {pool['new_connections']} | TLS握手 {pool['tls_handshakes']} | "
+              f"复用率 {pool['reuse_ratio']:.0%} | 连接上限 {pool['max_connections']}")
+    limiter = get_rate_limiter_stats()
+    if limiter["delayed_calls"]:
+        print(f"🚦 主动限流: 延迟 {limiter['delayed_calls']} 次调用，累计等待 {limiter['total_delay_seconds']:.1f}秒")
+    hedging = get_hedge_stats()
+    if hedging["hedges"]:
+        print(f"🪁 对冲请求: {hedging['hedges']} 次 (占比 {hedging['hedge_ratio']:.1%})，其中 {hedging['hedge_wins']} 次先于主请求完成")
+    print_cassette_stats()
+
+
+# ──────────────────────── 主动限流（令牌桶） ─────────────────────── #
+# 各线程池/协程在发请求前先向进程级限流器预约 RPM/TPM 配额，超出时提前等待，
+# 避免 15 个数据块同时撞上 429 后再集体长时间退避。
+# 限额初始值可以通过 LLM_RPM_<PROVIDER> / LLM_TPM_<PROVIDER> 配置，运行中会根据
+# 服务端返回的 x-ratelimit-* 与 retry-after 响应头自动修正。
+
+DEFAULT_RATE_LIMITS = {
+    "openai": {"rpm": 500, "tpm": 30000},
+    "siliconflow": {"rpm": 1000, "tpm": 50000},
+}
+
+# 当前线程/协程正在进行的 LLM 调用 (provider, model)，供 httpx 响应钩子读取限流响应头
+_current_rate_limit_key: contextvars.ContextVar[Optional[tuple[str, str]]] = contextvars.ContextVar(
+    "current_rate_limit_key", default=None
+)
+
+
+def _parse_reset_duration(value: Optional[str]) -> Optional[float]:
+    """Parse OpenAI style reset durations such as '1s', '6m0s', '120ms' or plain seconds"""
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    seconds = 0.0
+    matched = False
+    for amount, unit in re.findall(r"(\d+(?:\.\d+)?)(ms|h|m|s)", value):
+        matched = True
+        seconds += float(amount) * {"ms": 0.001, "s": 1, "m": 60, "h": 3600}[unit]
+    return seconds if matched else None
+
+
+class _TokenBucket:
+    """Reserve-then-wait token bucket: reservations may drive the balance negative"""
+
+    def __init__(self, per_minute: float):
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.tokens = float(per_minute)
+        self.updated_at = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def reserve(self, amount: float, now: float) -> float:
+        """预约 amount 个配额，返回需要等待的秒数"""
+        self._refill(now)
+        self.tokens -= amount
+        return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+    def set_limit(self, per_minute: float, now: float) -> None:
+        self._refill(now)
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.tokens = min(self.tokens, self.capacity)
+
+    def cap_remaining(self, remaining: float, now: float) -> None:
+        self._refill(now)
+        self.tokens = min(self.tokens, remaining)
+
+
+class LLMRateLimiter:
+    """Process-wide RPM/TPM limiter keyed by (provider, model)"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._buckets: dict[tuple[str, str], dict] = {}
+        self.delayed_calls = 0
+        self.total_delay = 0.0
+
+    @staticmethod
+    def _default_limits(provider: str) -> tuple[float, float]:
+        defaults = DEFAULT_RATE_LIMITS.get(provider, {"rpm": 500, "tpm": 30000})
+        rpm = float(os.getenv(f"LLM_RPM_{provider.upper()}", defaults["rpm"]))
+        tpm = float(os.getenv(f"LLM_TPM_{provider.upper()}", defaults["tpm"]))
+        return rpm, tpm
+
+    def _state(self, key: tuple[str, str]) -> dict:
+        # caller holds self._lock
+        state = self._buckets.get(key)
+        if state is None:
+            rpm, tpm = self._default_limits(key[0])
+            state = {"rpm": _TokenBucket(rpm), "tpm": _TokenBucket(tpm), "blocked_until": 0.0}
+            self._buckets[key] = state
+        return state
+
+    def reserve(self, provider: str, model_name: str, estimated_tokens: int) -> float:
+        """为一次请求预约配额，返回发请求前应等待的秒数"""
+        now = time.monotonic()
+        with self._lock:
+            state = self._state((provider, model_name))
+            wait = max(
+                state["rpm"].reserve(1, now),
+                state["tpm"].reserve(estimated_tokens, now),
+                state["blocked_until"] - now,
+            )
+            if wait > 0:
+                self.delayed_calls += 1
+                self.total_delay += wait
+            return max(wait, 0.0)
+
+    def reconcile(self, provider: str, model_name: str, estimated_tokens: int, actual_tokens: int) -> None:
+        """用真实 token 用量修正预约时的估算值"""
+        if actual_tokens <= 0:
+            return
+        with self._lock:
+            self._state((provider, model_name))["tpm"].tokens -= actual_tokens - estimated_tokens
+
+    def observe_headers(self, provider: str, model_name: str, headers: httpx.Headers, status_code: int) -> None:
+        """从 x-ratelimit-* / retry-after 响应头学习服务端实际限额"""
+        now = time.monotonic()
+        with self._lock:
+            state = self._state((provider, model_name))
+            for kind, bucket in (("requests", state["rpm"]), ("tokens", state["tpm"])):
+                limit = headers.get(f"x-ratelimit-limit-{kind}")
+                if limit:
+                    try:
+                        limit_value = float(limit)
+                        if limit_value > 0 and limit_value != bucket.capacity:
+                            bucket.set_limit(limit_value, now)
+                    except ValueError:
+                        pass
+                remaining = headers.get(f"x-ratelimit-remaining-{kind}")
+                if remaining:
+                    try:
+                        bucket.cap_remaining(float(remaining), now)
+                    except ValueError:
+                        pass
+            if status_code == 429:
+                retry_after = _parse_reset_duration(headers.get("retry-after")) \
+                    or _parse_reset_duration(headers.get("x-ratelimit-reset-requests")) \
+                    or _parse_reset_duration(headers.get("x-ratelimit-reset-tokens")) \
+                    or 1.0
+                # Every caller of this model pauses, not only the one that received the 429
+                state["blocked_until"] = max(state["blocked_until"], now + retry_after)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "delayed_calls": self.delayed_calls,
+                "total_delay_seconds": round(self.total_delay, 2),
+                "limits": {f"{provider}/{model}": {"rpm": state["rpm"].capacity, "tpm": state["tpm"].capacity}
+                           for (provider, model), state in self._buckets.items()},
+            }
+
+
+_RATE_LIMITER = LLMRateLimiter()
+
+
+def get_rate_limiter_stats() -> dict:
+    """返回限流器统计（被延迟的调用数、累计等待秒数、当前学习到的限额）"""
+    return _RATE_LIMITER.stats()
+
+
+def _on_llm_response(response: httpx.Response) -> None:
+    """httpx 响应钩子：学习限流响应头，并统计当前调用的 HTTP 尝试/429 次数"""
+    note_http_response(response.status_code)
+    key = _current_rate_limit_key.get()
+    if key is not None:
+        _RATE_LIMITER.observe_headers(key[0], key[1], response.headers, response.status_code)
+
+
+async def _aon_llm_response(response: httpx.Response) -> None:
+    _on_llm_response(response)
+
+
+def _acquire_rate_limit(model_name: str, messages: Any, silent_mode: bool = False) -> int:
+    """发请求前预约配额并在需要时等待；返回预估的提示词 token 数"""
+    provider, _, _ = _resolve_provider(model_name)
+    estimated_tokens = estimate_messages_tokens(messages, model_name)
+    wait = _RATE_LIMITER.reserve(provider, model_name, estimated_tokens)
+    if wait > 0:
+        if not silent_mode:
+            print(f"🚦 主动限流: {model_name} 等待 {wait:.1f}s 后发送请求 (预估 {estimated_tokens:,} tokens)")
+        time.sleep(wait)
+    _current_rate_limit_key.set((provider, model_name))
+    return estimated_tokens
+
+
+async def _aacquire_rate_limit(model_name: str, messages: Any, silent_mode: bool = False) -> int:
+    """_acquire_rate_limit 的异步版本"""
+    provider, _, _ = _resolve_provider(model_name)
+    estimated_tokens = estimate_messages_tokens(messages, model_name)
+    wait = _RATE_LIMITER.reserve(provider, model_name, estimated_tokens)
+    if wait > 0:
+        if not silent_mode:
+            print(f"🚦 主动限流: {model_name} 等待 {wait:.1f}s 后发送请求 (预估 {estimated_tokens:,} tokens)")
+        await asyncio.sleep(wait)
+    _current_rate_limit_key.set((provider, model_name))
+    return estimated_tokens
+
+
+def _reconcile_rate_limit(model_name: str, estimated_tokens: int, usage: Optional[dict]) -> None:
+    """用真实用量修正限流器预约，并校准离线 token 估算器"""
+    usage = usage or {}
+    provider, _, _ = _resolve_provider(model_name)
+    _RATE_LIMITER.reconcile(provider, model_name, estimated_tokens, usage.get("total_tokens", 0))
+    get_token_estimator().observe(model_name, estimated_tokens, usage.get("input_tokens", 0))
+
+
+# ──────────────────────── 对冲请求 ─────────────────────── #
+# 根据近期调用延迟学习一个分位数阈值；主请求超过阈值仍未完成时发送副本请求。
+# 副本数量受预算限制：累计对冲次数不超过 LLM_HEDGE_BUDGET × 调用次数（外加 1 次初始额度）。
+
+HEDGE_CHECK_INTERVAL = 1.0   # 样本不足时重新检查阈值的间隔（秒）
+HEDGE_MIN_SAMPLES = 5        # 至少需要这么多次成功调用才开始对冲
+HEDGE_WINDOW = 200           # 每个模型保留的最近延迟样本数
+
+
+class HedgePolicy:
+    """Learns per-model latency percentiles and enforces the hedging budget"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._latencies: dict[str, "deque[float]"] = {}
+        self.percentile = float(os.getenv("LLM_HEDGE_PERCENTILE", "95"))
+        self.budget = float(os.getenv("LLM_HEDGE_BUDGET", "0.05"))
+        self.calls = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+
+    def observe(self, model_name: str, latency: float) -> None:
+        with self._lock:
+            self.calls += 1
+            window = self._latencies.get(model_name)
+            if window is None:
+                window = deque(maxlen=HEDGE_WINDOW)
+                self._latencies[model_name] = window
+            window.append(latency)
+
+    def threshold(self, model_name: str) -> Optional[float]:
+        """当前模型的对冲触发阈值（秒）；样本不足时返回 None"""
+        with self._lock:
+            window = self._latencies.get(model_name)
+            if not window or len(window) < HEDGE_MIN_SAMPLES:
+                return None
+            ordered = sorted(window)
+        index = min(int(round((len(ordered) - 1) * self.percentile / 100)), len(ordered) - 1)
+        return ordered[index]
+
+    def record_win(self) -> None:
+        with self._lock:
+            self.hedge_wins += 1
+
+    def try_spend(self) -> bool:
+        with self._lock:
+            if self.hedges + 1 > self.budget * self.calls + 1:
+                return False
+            self.hedges += 1
+            return True
+
+    @staticmethod
+    def alternate_for(model_name: str) -> str:
+        """LLM_HEDGE_ALTERNATES='{"deepseek-ai/DeepSeek-V3": "Pro/deepseek-ai/DeepSeek-V3"}'"""
+        try:
+            alternates = json.loads(os.getenv("LLM_HEDGE_ALTERNATES", "{}"))
+        except json.JSONDecodeError:
+            alternates = {}
+        return alternates.get(model_name, model_name)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"calls": self.calls, "hedges": self.hedges, "hedge_wins": self.hedge_wins,
+                    "hedge_ratio": round(self.hedges / self.calls, 3) if self.calls else 0.0}
+
+
+_HEDGE_POLICY = HedgePolicy()
+
+
+class DispatchClock:
+    """
+    对冲计时：从请求真正发出（拿到限流配额和并发槽位之后）开始计时，和延迟样本的口径一致；
+    排队等待不计入，限流重试再次发出时重新计时。把 mark 作为 on_dispatch 传给 ainvoke_model / astream_model。
+    """
+
+    def __init__(self):
+        self.dispatched_at: Optional[float] = None
+        self._event = asyncio.Event()
+
+    def mark(self) -> None:
+        self.dispatched_at = time.monotonic()
+        self._event.set()
+
+    @property
+    def dispatched(self) -> bool:
+        return self.dispatched_at is not None
+
+    def elapsed(self) -> float:
+        return 0.0 if self.dispatched_at is None else time.monotonic() - self.dispatched_at
+
+    async def wait(self) -> None:
+        await self._event.wait()
+
+
+def get_hedge_policy() -> HedgePolicy:
+    """进程级对冲策略（供流式调用等自定义对冲逻辑复用）"""
+    return _HEDGE_POLICY
+
+
+def get_hedge_stats() -> dict:
+    """返回对冲统计（调用数、对冲次数、对冲请求胜出次数）"""
+    return _HEDGE_POLICY.stats()
 
 
 def _handle_rate_limit_with_backoff(func, max_retries: int = 6, base_delay: float = 1.0, max_delay: float = 60.0, silent_mode: bool = False):
@@ -36,43 +763,9 @@ def _handle_rate_limit_with_backoff(func, max_retries: int = 6, base_delay: floa
             return func()
         except Exception as e:
             last_exception = e
-            
-            # Check if this is a rate limit error
-            is_rate_limit_error = False
-            retry_after = None
-            
-            # Handle different types of rate limit errors
-            if hasattr(e, 'status_code') and e.status_code == 429:
-                is_rate_limit_error = True
-                # Try to extract retry-after header
-                if hasattr(e, 'response') and hasattr(e.response, 'headers'):
-                    retry_after = e.response.headers.get('retry-after')
-            elif 'rate limit' in str(e).lower() or '429' in str(e) or 'too many requests' in str(e).lower():
-                is_rate_limit_error = True
-            elif isinstance(e, RateLimitError):
-                is_rate_limit_error = True
-                
-            if not is_rate_limit_error or attempt >= max_retries:
-                # Not a rate limit error or max retries reached
+            delay = _rate_limit_retry_delay(e, attempt, max_retries, base_delay, max_delay, silent_mode)
+            if delay is None:
                 break
-                
-            # Calculate delay with exponential backoff
-            if retry_after:
-                try:
-                    delay = float(retry_after)
-                    if not silent_mode:
-                        print(f"⏳ Rate limit hit, server requested {delay}s wait (attempt {attempt + 1}/{max_retries + 1})")
-                except (ValueError, TypeError):
-                    delay = min(base_delay * (2 ** attempt), max_delay)
-            else:
-                # Exponential backoff with jitter
-                delay = min(base_delay * (2 ** attempt), max_delay)
-                # Add jitter to prevent thundering herd
-                delay += random.uniform(0, delay * 0.1)
-                
-            if not silent_mode:
-                print(f"⏳ Rate limit detected, waiting {delay:.1f}s before retry (attempt {attempt + 1}/{max_retries + 1})")
-                
             time.sleep(delay)
     
     # All retries failed, raise the last exception
@@ -81,33 +774,91 @@ def _handle_rate_limit_with_backoff(func, max_retries: int = 6, base_delay: floa
     raise last_exception
 
 
+def _rate_limit_retry_delay(e: Exception, attempt: int, max_retries: int, base_delay: float, max_delay: float, silent_mode: bool) -> Optional[float]:
+    """
+    Decide whether an exception should be retried and how long to wait.
+
+    Returns:
+        Optional[float]: 等待秒数；None 表示不再重试
+    """
+    # Check if this is a rate limit error
+    is_rate_limit_error = False
+    retry_after = None
+    
+    # Handle different types of rate limit errors
+    if hasattr(e, 'status_code') and e.status_code == 429:
+        is_rate_limit_error = True
+        # Try to extract retry-after header
+        if hasattr(e, 'response') and hasattr(e.response, 'headers'):
+            retry_after = e.response.headers.get('retry-after')
+    elif 'rate limit' in str(e).lower() or '429' in str(e) or 'too many requests' in str(e).lower():
+        is_rate_limit_error = True
+    elif isinstance(e, RateLimitError):
+        is_rate_limit_error = True
+        
+    if not is_rate_limit_error or attempt >= max_retries:
+        # Not a rate limit error or max retries reached
+        return None
+        
+    # Calculate delay with exponential backoff
+    if retry_after:
+        try:
+            delay = float(retry_after)
+            if not silent_mode:
+                print(f"⏳ Rate limit hit, server requested {delay}s wait (attempt {attempt + 1}/{max_retries + 1})")
+        except (ValueError, TypeError):
+            delay = min(base_delay * (2 ** attempt), max_delay)
+    else:
+        # Exponential backoff with jitter
+        delay = min(base_delay * (2 ** attempt), max_delay)
+        # Add jitter to prevent thundering herd
+        delay += random.uniform(0, delay * 0.1)
+        
+    if not silent_mode:
+        print(f"⏳ Rate limit detected, waiting {delay:.1f}s before retry (attempt {attempt + 1}/{max_retries + 1})")
+    return delay
+
+
+async def _ahandle_rate_limit_with_backoff(coro_func, max_retries: int = 6, base_delay: float = 1.0, max_delay: float = 60.0, silent_mode: bool = False):
+    """
+    Async version of _handle_rate_limit_with_backoff: waits with asyncio.sleep so the event loop keeps running.
+
+    Args:
+        coro_func: 无参数的协程函数，每次重试都会重新调用
+    """
+    last_exception = None
+
+    for attempt in range(max_retries + 1):
+        try:
+            return await coro_func()
+        except Exception as e:
+            last_exception = e
+            delay = _rate_limit_retry_delay(e, attempt, max_retries, base_delay, max_delay, silent_mode)
+            if delay is None:
+                break
+            await asyncio.sleep(delay)
+
+    if not silent_mode:
+        print(f"❌ All {max_retries + 1} attempts failed due to rate limiting")
+    raise last_exception
+
+
 def invoke_model(model_name : str, messages : List[BaseMessage], temperature: float = 0.2, silent_mode: bool = False) -> str:
     """调用大模型 with automatic rate limit retry"""
     if not silent_mode:
         print(f"🚀 开始调用LLM: {model_name} (temperature={temperature})")
+    call_metrics = start_llm_call(model_name)
     
     def _make_api_call():
+        estimated_tokens = _acquire_rate_limit(model_name, messages, silent_mode)
         start_time = time.time()
         
-        if model_name.startswith("gpt-"):  # ChatGPT 系列模型
-            if not silent_mode:
-                print("🔍 使用 OpenAI ChatGPT 模型")
-            base_url = "https://api.openai.com/v1"
-            api_key = os.getenv("OPENAI_API_KEY")
-        else:  # 其他模型，例如 deepseek, siliconflow...
-            if not silent_mode:
-                print("🔍 使用 SiliconFlow 模型")
-            base_url = "https://api.siliconflow.cn/v1"
-            api_key = os.getenv("SILICONFLOW_API_KEY")
+        if not silent_mode:
+            provider, _, _ = _resolve_provider(model_name)
+            print("🔍 使用 OpenAI ChatGPT 模型" if provider == "openai" else "🔍 使用 SiliconFlow 模型")
         
-        llm = ChatOpenAI(
-            model = model_name,
-            api_key=api_key, 
-            base_url=base_url,
-            streaming=not silent_mode,  # Disable streaming in silent mode
-            temperature=temperature,
-            timeout=200  # network timeout
-        )
+        # Pooled client: reuses keep-alive connections across calls and threads
+        llm = get_chat_model(model_name, temperature, streaming=not silent_mode)  # Disable streaming in silent mode
 
         full_response = ""
         total_tokens_used = {"input": 0, "output": 0, "total": 0}
@@ -120,6 +871,7 @@ def invoke_model(model_name : str, messages : List[BaseMessage], temperature: fl
             # Extract token usage from response
             if hasattr(response, 'usage_metadata') and response.usage_metadata:
                 usage = response.usage_metadata
+                call_metrics.set_usage(usage)
                 total_tokens_used["input"] = usage.get('input_tokens', 0)
                 total_tokens_used["output"] = usage.get('output_tokens', 0)
                 total_tokens_used["total"] = usage.get('total_tokens', 0)
@@ -127,12 +879,15 @@ def invoke_model(model_name : str, messages : List[BaseMessage], temperature: fl
             # Normal mode: use streaming
             for chunk in llm.stream(messages):
                 chunk_content = chunk.content
+                if chunk_content:
+                    call_metrics.mark_first_token()
                 print(chunk_content, end="", flush=True)
                 full_response += chunk_content
                 
                 # Extract token usage if available in chunk
                 if hasattr(chunk, 'usage_metadata') and chunk.usage_metadata:
                     usage = chunk.usage_metadata
+                    call_metrics.set_usage(usage)
                     total_tokens_used["input"] = usage.get('input_tokens', 0)
                     total_tokens_used["output"] = usage.get('output_tokens', 0)
                     total_tokens_used["total"] = usage.get('total_tokens', 0)
@@ -140,6 +895,8 @@ def invoke_model(model_name : str, messages : List[BaseMessage], temperature: fl
         end_time = time.time()
         execution_time = end_time - start_time
         
+        _reconcile_rate_limit(model_name, estimated_tokens, {"input_tokens": total_tokens_used["input"], "total_tokens": total_tokens_used["total"]})
+        
         # Print timing and token usage only if not in silent mode
         if not silent_mode:
             print(f"\n⏱️ LLM调用完成，耗时: {execution_time:.2f}秒")
@@ -150,37 +907,108 @@ def invoke_model(model_name : str, messages : List[BaseMessage], temperature: fl
     
     # Use rate limit retry wrapper
     try:
-        return _handle_rate_limit_with_backoff(_make_api_call, silent_mode=silent_mode)
+        cache = get_llm_cache()
+        if cache is None:
+            full_response = _handle_rate_limit_with_backoff(_make_api_call, silent_mode=silent_mode)
+            call_metrics.finish()
+            return full_response
+
+        cache_key = make_cache_key(model_name, messages, temperature)
+        full_response, from_cache = cache.get_or_compute(
+            cache_key,
+            lambda: _handle_rate_limit_with_backoff(_make_api_call, silent_mode=silent_mode),
+            model_name,
+        )
+        call_metrics.finish(cached=from_cache)
+        if from_cache and not silent_mode:
+            print("💾 命中LLM响应缓存，跳过网络请求")
+            print(full_response)
+        return full_response
     except Exception as e:
+        call_metrics.finish(success=False)
         if not silent_mode:
             print(f"\n❌ LLM调用最终失败，错误: {e}")
         raise
 
 
+def _report_tool_response(response: Any, start_time: float) -> None:
+    """打印带工具调用的 LLM 响应内容、工具调用详情与 Token 使用情况"""
+    # 打印响应内容（如果有）
+    if response.content:
+        print(f"\n💬 LLM回复内容:")
+        print(response.content)
+    
+    # Extract token usage information
+    token_usage = {"input": 0, "output": 0, "total": 0, "reasoning": 0}
+    if hasattr(response, 'usage_metadata') and response.usage_metadata:
+        usage = response.usage_metadata
+        token_usage["input"] = usage.get('input_tokens', 0)
+        token_usage["output"] = usage.get('output_tokens', 0)
+        token_usage["total"] = usage.get('total_tokens', 0)
+        
+        # Check for reasoning tokens (for reasoning models like Qwen3-32B)
+        if 'output_token_details' in usage and usage['output_token_details']:
+            token_usage["reasoning"] = usage['output_token_details'].get('reasoning', 0)
+    
+    # 检查是否有工具调用
+    if hasattr(response, 'tool_calls') and response.tool_calls:
+        print(f"\n🔧 检测到 {len(response.tool_calls)} 个工具调用:")
+        
+        # 打印每个工具调用的详细信息
+        for i, tool_call in enumerate(response.tool_calls):
+            print(f"\n📋 工具调用 {i+1}:")
+            print(f"   🔧 工具名称: {tool_call.get('name', 'unknown')}")
+            
+            # 提取工具参数
+            args = tool_call.get('args', {})
+            print(f"   📝 参数: {args}")
+            
+            # 如果是用户交互工具，特别显示问题
+            if tool_call.get('name') == 'request_user_clarification':
+                question = args.get('question', '')
+                context = args.get('context', '')
+                if question:
+                    print(f"\n💬 ⭐ 用户问题: {question}")
+                    if context:
+                        print(f"📖 上下文: {context}")
+            elif tool_call.get('name') == '_collect_user_input':
+                print(f"\n🔄 将收集用户输入信息")
+                session_id = args.get('session_id', '')
+                if session_id:
+                    print(f"📋 会话ID: {session_id}")
+        
+        end_time = time.time()
+        execution_time = end_time - start_time
+        print(f"\n⏱️ LLM调用完成(带工具调用)，耗时: {execution_time:.2f}秒")
+    else:
+        end_time = time.time()
+        execution_time = end_time - start_time
+        print(f"\n⏱️ LLM调用完成(无工具调用)，耗时: {execution_time:.2f}秒")
+    
+    # Print token usage information
+    if token_usage["total"] > 0:
+        print(f"📊 Token使用: 输入={token_usage['input']:,} | 输出={token_usage['output']:,} | 总计={token_usage['total']:,}")
+        if token_usage["reasoning"] > 0:
+            print(f"🧠 推理Token: {token_usage['reasoning']:,} (内部推理过程)")
+            visible_output = token_usage["output"] - token_usage["reasoning"]
+            print(f"👀 可见输出Token: {visible_output:,}")
+    else:
+        print("⚠️ 未能获取Token使用信息")
+
+
 def invoke_model_with_tools(model_name : str, messages : List[BaseMessage], tools : List[str], temperature: float = 0.2) -> Any:
     """调用大模型并使用工具 with automatic rate limit retry"""
     print(f"🚀 开始调用LLM(带工具): {model_name} (temperature={temperature})")
+    call_metrics = start_llm_call(model_name)
     
     def _make_api_call_with_tools():
+        estimated_tokens = _acquire_rate_limit(model_name, messages)
         start_time = time.time()
         
-        if model_name.startswith("gpt-"):  # ChatGPT 系列模型
-            print("🔍 使用 OpenAI ChatGPT 模型")
-            base_url = "https://api.openai.com/v1"
-            api_key = os.getenv("OPENAI_API_KEY")
-        else:  # 其他模型，例如 deepseek, siliconflow...
-            print("🔍 使用 SiliconFlow 模型")
-            base_url = "https://api.siliconflow.cn/v1"
-            api_key = os.getenv("SILICONFLOW_API_KEY")
-
-        llm = ChatOpenAI(
-            model=model_name,
-            api_key=api_key,
-            base_url=base_url,
-            streaming=False,
-            temperature=temperature,
-            timeout=200
-        )
+        provider, _, _ = _resolve_provider(model_name)
+        print("🔍 使用 OpenAI ChatGPT 模型" if provider == "openai" else "🔍 使用 SiliconFlow 模型")
+
+        llm = get_chat_model(model_name, temperature, streaming=False)
         
         # 绑定工具到模型
         llm_with_tools = llm.bind_tools(tools)
@@ -190,76 +1018,294 @@ def invoke_model_with_tools(model_name : str, messages : List[BaseMessage], tool
         response = llm_with_tools.invoke(messages)
         
         print("📥 LLM响应接收完成")
-        
-        # 打印响应内容（如果有）
-        if response.content:
-            print(f"\n💬 LLM回复内容:")
-            print(response.content)
-        
-        # Extract token usage information
-        token_usage = {"input": 0, "output": 0, "total": 0, "reasoning": 0}
-        if hasattr(response, 'usage_metadata') and response.usage_metadata:
-            usage = response.usage_metadata
-            token_usage["input"] = usage.get('input_tokens', 0)
-            token_usage["output"] = usage.get('output_tokens', 0)
-            token_usage["total"] = usage.get('total_tokens', 0)
-            
-            # Check for reasoning tokens (for reasoning models like Qwen3-32B)
-            if 'output_token_details' in usage and usage['output_token_details']:
-                token_usage["reasoning"] = usage['output_token_details'].get('reasoning', 0)
-        
-        # 检查是否有工具调用
-        if hasattr(response, 'tool_calls') and response.tool_calls:
-            print(f"\n🔧 检测到 {len(response.tool_calls)} 个工具调用:")
-            
-            # 打印每个工具调用的详细信息
-            for i, tool_call in enumerate(response.tool_calls):
-                print(f"\n📋 工具调用 {i+1}:")
-                print(f"   🔧 工具名称: {tool_call.get('name', 'unknown')}")
-                
-                # 提取工具参数
-                args = tool_call.get('args', {})
-                print(f"   📝 参数: {args}")
-                
-                # 如果是用户交互工具，特别显示问题
-                if tool_call.get('name') == 'request_user_clarification':
-                    question = args.get('question', '')
-                    context = args.get('context', '')
-                    if question:
-                        print(f"\n💬 ⭐ 用户问题: {question}")
-                        if context:
-                            print(f"📖 上下文: {context}")
-                elif tool_call.get('name') == '_collect_user_input':
-                    print(f"\n🔄 将收集用户输入信息")
-                    session_id = args.get('session_id', '')
-                    if session_id:
-                        print(f"📋 会话ID: {session_id}")
-            
-            end_time = time.time()
-            execution_time = end_time - start_time
-            print(f"\n⏱️ LLM调用完成(带工具调用)，耗时: {execution_time:.2f}秒")
-        else:
-            end_time = time.time()
-            execution_time = end_time - start_time
-            print(f"\n⏱️ LLM调用完成(无工具调用)，耗时: {execution_time:.2f}秒")
-        
-        # Print token usage information
-        if token_usage["total"] > 0:
-            print(f"📊 Token使用: 输入={token_usage['input']:,} | 输出={token_usage['output']:,} | 总计={token_usage['total']:,}")
-            if token_usage["reasoning"] > 0:
-                print(f"🧠 推理Token: {token_usage['reasoning']:,} (内部推理过程)")
-                visible_output = token_usage["output"] - token_usage["reasoning"]
-                print(f"👀 可见输出Token: {visible_output:,}")
-        else:
-            print("⚠️ 未能获取Token使用信息")
+        call_metrics.set_usage(response.usage_metadata)
+        _reconcile_rate_limit(model_name, estimated_tokens, response.usage_metadata)
+        _report_tool_response(response, start_time)
         
         # 返回完整响应以便调用者处理
         return response
     
     # Use rate limit retry wrapper
     try:
-        return _handle_rate_limit_with_backoff(_make_api_call_with_tools, silent_mode=False)
+        cache = get_llm_cache()
+        if cache is None:
+            response = _handle_rate_limit_with_backoff(_make_api_call_with_tools, silent_mode=False)
+            call_metrics.finish()
+            return response
+
+        cache_key = make_cache_key(model_name, messages, temperature, tools=tools)
+        serialized, from_cache = cache.get_or_compute(
+            cache_key,
+            lambda: json.dumps(message_to_dict(_handle_rate_limit_with_backoff(_make_api_call_with_tools, silent_mode=False)),
+                               ensure_ascii=False),
+            model_name,
+        )
+        call_metrics.finish(cached=from_cache)
+        response = messages_from_dict([json.loads(serialized)])[0]
+        if from_cache:
+            print(f"💾 命中LLM响应缓存，跳过网络请求 (工具调用 {len(response.tool_calls or [])} 个)")
+        return response
+    except Exception as e:
+        call_metrics.finish(success=False)
+        print(f"\n❌ LLM调用最终失败，错误: {e}")
+        import traceback
+        traceback.print_exc()
+        raise
+
+
+async def ainvoke_model(model_name : str, messages : List[BaseMessage], temperature: float = 0.2, silent_mode: bool = False,
+                        use_cache: bool = True, on_dispatch: Optional[Callable[[], None]] = None) -> str:
+    """
+    异步调用大模型 with automatic rate limit retry.
+
+    与 invoke_model 行为一致，但使用异步 HTTP 客户端：
+    - 同一服务商的并发请求数由 asyncio.Semaphore 限制（LLM_MAX_CONCURRENCY_<PROVIDER>）
+    - 限流退避使用 asyncio.sleep，不会占用线程
+    - use_cache=False 时跳过响应缓存（对冲请求需要真正发出第二个请求）
+    - on_dispatch 在拿到限流配额和并发槽位、请求真正发出时调用（每次重试都会调用）
+    """
+    if not silent_mode:
+        print(f"🚀 开始异步调用LLM: {model_name} (temperature={temperature})")
+
+    provider, _, _ = _resolve_provider(model_name)
+    call_metrics = start_llm_call(model_name)
+
+    async def _make_api_call():
+        estimated_tokens = await _aacquire_rate_limit(model_name, messages, silent_mode)
+        llm = get_async_chat_model(model_name, temperature, streaming=not silent_mode)
+
+        full_response = ""
+        total_tokens_used = {"input": 0, "output": 0, "total": 0}
+
+        # Only hold a concurrency slot while the request is actually in flight (not while backing off)
+        async with _CLIENT_POOL.provider_semaphore(provider):
+            # Latency samples (and the hedge clock) start here, after the limiter and semaphore waits
+            start_time = time.time()
+            if on_dispatch is not None:
+                on_dispatch()
+            if silent_mode:
+                response = await llm.ainvoke(messages)
+                full_response = response.content
+                usage_source = [response]
+            else:
+                usage_source = []
+                async for chunk in llm.astream(messages):
+                    if chunk.content:
+                        call_metrics.mark_first_token()
+                    print(chunk.content, end="", flush=True)
+                    full_response += chunk.content
+                    usage_source.append(chunk)
+
+        for message in usage_source:
+            if hasattr(message, 'usage_metadata') and message.usage_metadata:
+                usage = message.usage_metadata
+                call_metrics.set_usage(usage)
+                total_tokens_used["input"] = usage.get('input_tokens', 0)
+                total_tokens_used["output"] = usage.get('output_tokens', 0)
+                total_tokens_used["total"] = usage.get('total_tokens', 0)
+        _reconcile_rate_limit(model_name, estimated_tokens, {"input_tokens": total_tokens_used["input"], "total_tokens": total_tokens_used["total"]})
+        _HEDGE_POLICY.observe(model_name, time.time() - start_time)
+
+        if not silent_mode:
+            print(f"\n⏱️ LLM调用完成，耗时: {time.time() - start_time:.2f}秒")
+            if total_tokens_used["total"] > 0:
+                print(f"📊 Token使用: 输入={total_tokens_used['input']:,} | 输出={total_tokens_used['output']:,} | 总计={total_tokens_used['total']:,}")
+
+        return full_response
+
+    try:
+        cache = get_llm_cache() if use_cache else None
+        if cache is None:
+            full_response = await _ahandle_rate_limit_with_backoff(_make_api_call, silent_mode=silent_mode)
+            call_metrics.finish()
+            return full_response
+
+        cache_key = make_cache_key(model_name, messages, temperature)
+        full_response, from_cache = await cache.aget_or_compute(
+            cache_key,
+            lambda: _ahandle_rate_limit_with_backoff(_make_api_call, silent_mode=silent_mode),
+            model_name,
+        )
+        call_metrics.finish(cached=from_cache)
+        if from_cache and not silent_mode:
+            print("💾 命中LLM响应缓存，跳过网络请求")
+            print(full_response)
+        return full_response
+    except asyncio.CancelledError:
+        # e.g. the losing side of a hedged request
+        call_metrics.finish(success=False, cancelled=True)
+        raise
+    except Exception as e:
+        call_metrics.finish(success=False)
+        if not silent_mode:
+            print(f"\n❌ LLM调用最终失败，错误: {e}")
+        raise
+
+
+async def ainvoke_model_hedged(model_name : str, messages : List[BaseMessage], temperature: float = 0.2, silent_mode: bool = True,
+                               alternate_model: Optional[str] = None) -> str:
+    """
+    对冲调用：主请求超过近期延迟分位数仍未返回时，再发一个副本请求（同模型或备用模型），
+    取先完成的结果并取消另一个，用于削减分块并发时个别慢请求造成的长尾。
+
+    Args:
+        alternate_model: 副本请求使用的模型，默认读取 LLM_HEDGE_ALTERNATES 映射，未配置则使用同一模型
+    """
+    hedge_model = alternate_model or _HEDGE_POLICY.alternate_for(model_name)
+
+    async def _race() -> str:
+        clock = DispatchClock()  # queued behind the rate limiter or semaphore does not count as slow
+        primary = asyncio.create_task(ainvoke_model(model_name, messages, temperature, silent_mode, use_cache=False,
+                                                    on_dispatch=clock.mark))
+        dispatched = asyncio.create_task(clock.wait())
+        hedge = None
+        try:
+            while True:
+                threshold = _HEDGE_POLICY.threshold(model_name)
+                elapsed = clock.elapsed()
+                if (hedge is None and clock.dispatched and threshold is not None and elapsed >= threshold
+                        and _HEDGE_POLICY.try_spend()):
+                    print(f"🪁 {model_name} 请求已耗时 {elapsed:.1f}s (超过P{_HEDGE_POLICY.percentile:g}={threshold:.1f}s)，"
+                          f"发送对冲请求 -> {hedge_model}")
+                    hedge = asyncio.create_task(ainvoke_model(hedge_model, messages, temperature, silent_mode, use_cache=False))
+
+                running = {task for task in (primary, hedge) if task is not None and not task.done()}
+                if not running:
+                    # both sides failed
+                    raise primary.exception()
+                if not clock.dispatched:
+                    # Still queued: wake up when the request is sent (or finishes)
+                    waiting, wait_for = running | {dispatched}, None
+                else:
+                    waiting = running
+                    wait_for = HEDGE_CHECK_INTERVAL if threshold is None or hedge is not None else max(threshold - elapsed, 0.05)
+                done, _ = await asyncio.wait(waiting, timeout=wait_for, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task is not dispatched and task.exception() is None:
+                        if task is hedge:
+                            _HEDGE_POLICY.record_win()
+                        return task.result()
+                # a failed hedge leaves the primary running; a failed primary without a hedge is final
+                if primary.done() and hedge is None:
+                    raise primary.exception()
+        finally:
+            for task in (primary, hedge, dispatched):
+                if task is not None and not task.done():
+                    task.cancel()
+
+    cache = get_llm_cache()
+    if cache is None:
+        return await _race()
+    response, _ = await cache.aget_or_compute(make_cache_key(model_name, messages, temperature), _race, model_name)
+    return response
+
+
+async def astream_model(model_name : str, messages : List[BaseMessage], temperature: float = 0.2,
+                        on_dispatch: Optional[Callable[[], None]] = None) -> AsyncIterator[str]:
+    """
+    异步流式调用大模型，逐段产出输出文本，调用方可以边生成边处理，不必在内存中保留完整响应。
+
+    - 与 ainvoke_model 共享限流器、服务商并发信号量、连接池与调用指标（记录首 token 延迟）
+    - 在产出第一段文本之前遇到限流会按退避策略重试；已经产出内容后出错则直接抛出
+    - 开启响应缓存时：命中则一次性产出缓存内容，未命中则在结束后写入缓存
+    - on_dispatch 在拿到限流配额和并发槽位、请求真正发出时调用（同 ainvoke_model）
+    """
+    provider, _, _ = _resolve_provider(model_name)
+    call_metrics = start_llm_call(model_name)
+    cache = get_llm_cache()
+    cache_key = make_cache_key(model_name, messages, temperature) if cache is not None else None
+    if cache is not None:
+        cached = cache.get(cache_key)
+        if cached is not None:
+            call_metrics.finish(cached=True)
+            yield cached
+            return
+    collected = [] if cache is not None else None
+
+    yielded_any = False
+    try:
+        for attempt in range(LLM_STREAM_MAX_RETRIES + 1):
+            estimated_tokens = await _aacquire_rate_limit(model_name, messages, silent_mode=True)
+            llm = get_async_chat_model(model_name, temperature, streaming=True)
+            stream_usage = None
+            try:
+                async with _CLIENT_POOL.provider_semaphore(provider):
+                    start_time = time.time()
+                    if on_dispatch is not None:
+                        on_dispatch()
+                    async for chunk in llm.astream(messages, stream_usage=True):
+                        if chunk.usage_metadata:
+                            call_metrics.set_usage(chunk.usage_metadata)
+                            stream_usage = chunk.usage_metadata
+                        if chunk.content:
+                            call_metrics.mark_first_token()
+                            yielded_any = True
+                            if collected is not None:
+                                collected.append(chunk.content)
+                            yield chunk.content
+            except Exception as e:
+                delay = None if yielded_any else _rate_limit_retry_delay(e, attempt, LLM_STREAM_MAX_RETRIES, 1.0, 60.0, True)
+                if delay is None:
+                    raise
+                await asyncio.sleep(delay)
+                continue
+            _reconcile_rate_limit(model_name, estimated_tokens, stream_usage)
+            _HEDGE_POLICY.observe(model_name, time.time() - start_time)
+            break
+    except (asyncio.CancelledError, GeneratorExit):
+        call_metrics.finish(success=False, cancelled=True)
+        raise
+    except Exception:
+        call_metrics.finish(success=False)
+        raise
+
+    call_metrics.finish()
+    if collected is not None:
+        cache.put(cache_key, "".join(collected), model_name)
+
+
+async def ainvoke_model_with_tools(model_name : str, messages : List[BaseMessage], tools : List[str], temperature: float = 0.2) -> Any:
+    """异步调用大模型并使用工具 with automatic rate limit retry"""
+    print(f"🚀 开始异步调用LLM(带工具): {model_name} (temperature={temperature})")
+
+    provider, _, _ = _resolve_provider(model_name)
+    call_metrics = start_llm_call(model_name)
+
+    async def _make_api_call_with_tools():
+        estimated_tokens = await _aacquire_rate_limit(model_name, messages)
+        llm_with_tools = get_async_chat_model(model_name, temperature, streaming=False).bind_tools(tools)
+
+        print("📤 正在调用LLM...")
+        async with _CLIENT_POOL.provider_semaphore(provider):
+            # Timed from dispatch, after the limiter and semaphore waits (as in ainvoke_model)
+            start_time = time.time()
+            response = await llm_with_tools.ainvoke(messages)
+        print("📥 LLM响应接收完成")
+        call_metrics.set_usage(response.usage_metadata)
+        _reconcile_rate_limit(model_name, estimated_tokens, response.usage_metadata)
+        _report_tool_response(response, start_time)
+        return response
+
+    async def _serialized_call():
+        response = await _ahandle_rate_limit_with_backoff(_make_api_call_with_tools, silent_mode=False)
+        return json.dumps(message_to_dict(response), ensure_ascii=False)
+
+    try:
+        cache = get_llm_cache()
+        if cache is None:
+            response = await _ahandle_rate_limit_with_backoff(_make_api_call_with_tools, silent_mode=False)
+            call_metrics.finish()
+            return response
+
+        cache_key = make_cache_key(model_name, messages, temperature, tools=tools)
+        serialized, from_cache = await cache.aget_or_compute(cache_key, _serialized_call, model_name)
+        call_metrics.finish(cached=from_cache)
+        response = messages_from_dict([json.loads(serialized)])[0]
+        if from_cache:
+            print(f"💾 命中LLM响应缓存，跳过网络请求 (工具调用 {len(response.tool_calls or [])} 个)")
+        return response
     except Exception as e:
+        call_metrics.finish(success=False)
         print(f"\n❌ LLM调用最终失败，错误: {e}")
         import traceback
         traceback.print_exc()
@@ -0,0 +1,293 @@
+"""
+进程内文件转换（不经过 LibreOffice）
+
+直接把 .xlsx/.xlsm（openpyxl）、.xls（xlrd）、.csv（csv 模块）、.docx（python-docx）
+转换成与 _clean_html_in_memory 相同风格的精简 HTML：只保留 table/tr/td 结构和 rowspan/colspan，
+没有样式和属性，省去一次 soffice 子进程和两遍 HTML 解析。
+
+无法处理的格式或转换出错时返回 None，由调用方回退到 LibreOffice。
+设置 NATIVE_CONVERTERS=0 可整体关闭。
+"""
+
+import csv
+import html
+import io
+import os
+import re
+from datetime import date, datetime, time
+from decimal import ROUND_HALF_UP, Decimal
+from pathlib import Path
+from typing import Callable, Optional
+
+try:
+    import openpyxl
+except ImportError:
+    openpyxl = None
+
+try:
+    import xlrd
+except ImportError:
+    xlrd = None
+
+try:
+    import docx
+    from docx.table import Table as DocxTable
+    from docx.text.paragraph import Paragraph as DocxParagraph
+except ImportError:
+    docx = None
+
+
+# Quoted text, [colour]/[condition] blocks, escaped characters and padding in a number format
+_FORMAT_LITERALS = re.compile(r'"[^"]*"|\[[^\]]*\]|\\.|_.|\*.')
+_FORMAT_NUMBER = re.compile(r"[#0,]*[#0](?:\.(0*)[#?]*)?")
+
+
+def _fixed_format(number_format: str) -> Optional[tuple[int, bool, bool]]:
+    """
+    "0.00" / "#,##0.0" / "0.00%" 这类定点格式 -> (小数位数, 千位分隔, 百分比)；
+    常规、文本、科学计数等其他格式返回 None
+    """
+    section = _FORMAT_LITERALS.sub("", number_format.split(";")[0])
+    match = _FORMAT_NUMBER.search(section)
+    if match is None or "E" in section.upper():
+        return None
+    integer_part = match.group(0).split(".")[0]
+    return len(match.group(1) or ""), "," in integer_part, "%" in section
+
+
+def _format_value(value, number_format: str = "General") -> str:
+    """
+    按单元格显示习惯格式化值（整数不带 .0，日期不带零点时间，百分比格式乘 100），
+    定点数字格式按格式的小数位数和千位分隔显示（"0.00" 下 3 显示为 3.00，与 LibreOffice 导出一致）
+    """
+    if value is None:
+        return ""
+    if isinstance(value, bool):
+        return "TRUE" if value else "FALSE"
+    if isinstance(value, datetime):
+        if value.time() == time(0, 0):
+            return value.strftime("%Y-%m-%d")
+        return value.strftime("%Y-%m-%d %H:%M:%S")
+    if isinstance(value, (date, time)):
+        return value.isoformat()
+    if isinstance(value, (int, float)):
+        fixed = _fixed_format(number_format)
+        if fixed is not None:
+            decimals, thousands, percent = fixed
+            # Half away from zero, as spreadsheets round (f-strings round 2.5 to 2)
+            number = (Decimal(repr(value)) * (100 if percent else 1)).quantize(Decimal(1).scaleb(-decimals), ROUND_HALF_UP)
+            return f"{number:{',' if thousands else ''}.{decimals}f}{'%' if percent else ''}"
+    if isinstance(value, float):
+        if "%" in number_format:
+            return f"{value * 100:.10g}%"
+        if value.is_integer():
+            return str(int(value))
+        return f"{value:.15g}"
+    return str(value)
+
+
+def _cell_html(text: str, rowspan: int = 1, colspan: int = 1) -> str:
+    attrs = ""
+    if colspan > 1:
+        attrs += f' colspan="{colspan}"'
+    if rowspan > 1:
+        attrs += f' rowspan="{rowspan}"'
+    content = html.escape(text.strip(), quote=False).replace("\r\n", "\n").replace("\n", "<br/>")
+    return f"<td{attrs}>{content}</td>"
+
+
+def _grid_to_table(grid: list[list[str]], merges: list[tuple[int, int, int, int]]) -> str:
+    """
+    grid: 行列文本（0 起始）；merges: (起始行, 起始列, 结束行, 结束列)，闭区间。
+    被合并覆盖的单元格不输出，左上角单元格带 rowspan/colspan。
+    """
+    spans = {}
+    covered = set()
+    for r1, c1, r2, c2 in merges:
+        spans[(r1, c1)] = (r2 - r1 + 1, c2 - c1 + 1)
+        for r in range(r1, r2 + 1):
+            for c in range(c1, c2 + 1):
+                if (r, c) != (r1, c1):
+                    covered.add((r, c))
+
+    rows = []
+    for r, values in enumerate(grid):
+        cells = []
+        for c, text in enumerate(values):
+            if (r, c) in covered:
+                continue
+            rowspan, colspan = spans.get((r, c), (1, 1))
+            cells.append(_cell_html(text, rowspan, colspan))
+        rows.append("<tr>\n" + "\n".join(cells) + "\n</tr>")
+    return "<table>\n" + "\n".join(rows) + "\n</table>"
+
+
+def _trim_grid(grid: list[list[str]], merges: list[tuple[int, int, int, int]]) -> list[list[str]]:
+    """去掉尾部的空行空列（格式化过但没有内容的单元格会撑大 max_row/max_column）"""
+    last_row = max([r for r, row in enumerate(grid) if any(v.strip() for v in row)] + [r2 for _, _, r2, _ in merges] + [-1])
+    last_col = max([c for row in grid for c, v in enumerate(row) if v.strip()] + [c2 for _, _, _, c2 in merges] + [-1])
+    return [row[:last_col + 1] + [""] * (last_col + 1 - len(row)) for row in grid[:last_row + 1]]
+
+
+def _sheet_section(index: int, name: str, table: str) -> str:
+    return f"<h1>Sheet {index + 1}: <em>{html.escape(name, quote=False)}</em></h1>\n{table}"
+
+
+def _wrap_document(parts: list[str]) -> str:
+    return "<html><body>" + "\n".join(parts) + "</body></html>"
+
+
+def convert_xlsx(path: Path) -> str:
+    """openpyxl：公式取 Excel 保存时缓存的计算结果"""
+    workbook = openpyxl.load_workbook(path, data_only=True)
+    try:
+        sections = []
+        for index, sheet in enumerate(workbook.worksheets):
+            if sheet.sheet_state != "visible":
+                continue
+            merges = [(m.min_row - 1, m.min_col - 1, m.max_row - 1, m.max_col - 1) for m in sheet.merged_cells.ranges]
+            grid = [[_format_value(cell.value, cell.number_format) for cell in row] for row in sheet.iter_rows()]
+            sections.append(_sheet_section(index, sheet.title, _grid_to_table(_trim_grid(grid, merges), merges)))
+        return _wrap_document(sections)
+    finally:
+        workbook.close()
+
+
+def convert_xls(path: Path) -> str:
+    workbook = xlrd.open_workbook(str(path), formatting_info=True)
+    try:
+        sections = []
+        for index in range(workbook.nsheets):
+            sheet = workbook.sheet_by_index(index)
+            if sheet.visibility != 0:
+                continue
+            merges = [(r1, c1, r2 - 1, c2 - 1) for r1, r2, c1, c2 in sheet.merged_cells]
+            grid = []
+            for r in range(sheet.nrows):
+                row = []
+                for c in range(sheet.ncols):
+                    cell = sheet.cell(r, c)
+                    if cell.ctype == xlrd.XL_CELL_DATE:
+                        value = xlrd.xldate_as_datetime(cell.value, workbook.datemode)
+                    elif cell.ctype == xlrd.XL_CELL_BOOLEAN:
+                        value = bool(cell.value)
+                    elif cell.ctype == xlrd.XL_CELL_ERROR:
+                        value = xlrd.error_text_from_code.get(cell.value, "#ERR")
+                    elif cell.ctype == xlrd.XL_CELL_EMPTY or cell.ctype == xlrd.XL_CELL_BLANK:
+                        value = None
+                    else:
+                        value = cell.value
+                    number_format = "General"
+                    if cell.ctype == xlrd.XL_CELL_NUMBER:
+                        format_key = workbook.xf_list[cell.xf_index].format_key
+                        number_format = workbook.format_map[format_key].format_str if format_key in workbook.format_map else "General"
+                    row.append(_format_value(value, number_format))
+                grid.append(row)
+            sections.append(_sheet_section(index, sheet.name, _grid_to_table(_trim_grid(grid, merges), merges)))
+        return _wrap_document(sections)
+    finally:
+        workbook.release_resources()
+
+
+def convert_csv(path: Path, text_loader: Callable[[Path], str]) -> str:
+    text = text_loader(path)
+    try:
+        dialect = csv.Sniffer().sniff(text[:4096], delimiters=",\t;|")
+    except csv.Error:
+        dialect = csv.excel
+    rows = [row for row in csv.reader(io.StringIO(text), dialect)]
+    width = max((len(row) for row in rows), default=0)
+    grid = [row + [""] * (width - len(row)) for row in rows]
+    return _wrap_document([_sheet_section(0, path.stem, _grid_to_table(_trim_grid(grid, []), []))])
+
+
+def _docx_table_html(table) -> str:
+    """python-docx 表格：gridSpan -> colspan，vMerge(restart/continue) -> rowspan"""
+    # Lay every <w:tc> out on the grid first so vertical merges can be matched by column
+    layout = []  # per row: list of (grid_col, tc)
+    for tr in table._tbl.tr_lst:
+        col = getattr(tr, "grid_before", 0)
+        cells = []
+        for tc in tr.tc_lst:
+            cells.append((col, tc))
+            col += tc.grid_span
+        layout.append(cells)
+
+    rows = []
+    for r, cells in enumerate(layout):
+        html_cells = []
+        for col, tc in cells:
+            if tc.vMerge == "continue":
+                continue
+            rowspan = 1
+            if tc.vMerge == "restart":
+                for below in layout[r + 1:]:
+                    match = next((t for c, t in below if c == col), None)
+                    if match is None or match.vMerge != "continue":
+                        break
+                    rowspan += 1
+            text = "\n".join(DocxParagraph(p, table).text for p in tc.p_lst)
+            html_cells.append(_cell_html(text, rowspan, tc.grid_span))
+        rows.append("<tr>\n" + "\n".join(html_cells) + "\n</tr>")
+    return "<table>\n" + "\n".join(rows) + "\n</table>"
+
+
+def convert_docx(path: Path) -> str:
+    """段落按原顺序输出为 <p>/<hN>，表格输出为带合并单元格的 <table>"""
+    document = docx.Document(str(path))
+    parts = []
+    for child in document.element.body.iterchildren():
+        tag = child.tag.rsplit("}", 1)[-1]
+        if tag == "p":
+            paragraph = DocxParagraph(child, document)
+            text = paragraph.text.strip()
+            if not text:
+                continue
+            style = paragraph.style.name if paragraph.style is not None else ""
+            level = style.rsplit(" ", 1)[-1] if style.startswith("Heading") else ""
+            tag_name = f"h{level}" if level.isdigit() and 1 <= int(level) <= 6 else "p"
+            parts.append(f"<{tag_name}>{html.escape(text, quote=False)}</{tag_name}>")
+        elif tag == "tbl":
+            parts.append(_docx_table_html(DocxTable(child, document)))
+    return _wrap_document(parts)
+
+
+# Extensions convert_natively can handle (given the optional dependency is installed)
+NATIVE_EXTENSIONS = {".xlsx", ".xlsm", ".xls", ".csv", ".docx"}
+
+
+def native_converters_enabled() -> bool:
+    return os.getenv("NATIVE_CONVERTERS", "1").strip().lower() not in ("0", "false", "no", "off")
+
+
+def convert_natively(path: Path, text_loader: Callable[[Path], str]) -> Optional[str]:
+    """
+    在进程内把文件转换为精简 HTML。
+
+    Args:
+        path: 源文件
+        text_loader: 带编码探测的文本读取函数（用于 .csv）
+
+    Returns:
+        str: 精简 HTML；不支持的格式、缺少依赖或转换失败时返回 None（调用方回退到 LibreOffice）
+    """
+    if not native_converters_enabled():
+        return None
+    extension = path.suffix.lower()
+    converters = {
+        ".xlsx": (openpyxl, convert_xlsx),
+        ".xlsm": (openpyxl, convert_xlsx),
+        ".xls": (xlrd, convert_xls),
+        ".csv": (csv, lambda p: convert_csv(p, text_loader)),
+        ".docx": (docx, convert_docx),
+    }
+    if extension not in converters:
+        return None
+    dependency, converter = converters[extension]
+    if dependency is None:
+        return None
+    try:
+        return converter(path)
+    except Exception as e:
+        print(f"⚠️ 进程内转换 {path.name} 失败，回退到 LibreOffice: {e}")
+        return None
@@ -0,0 +1,134 @@
+"""
+按关联键筛选每个数据块的参考数据
+
+多表整合时，最大的文件（核心数据）被切成十几块，其他文件（参考数据）原来整份附在每一块后面：
+提示词 token ≈ 块数 × 参考数据总量，而每块只用得到参考数据里与本块核心行对应的那一小部分。
+
+这里在核心表和参考表之间识别共同的身份类字段（身份证号码、低保证号、户主姓名……），
+为每个参考文件建立 {字段类型: {取值: [记录号]}} 的哈希索引，每块只附上与本块核心行关联键相同的参考记录，
+外加该文件的表格结构和表头（共享部分很小）。没有共同关联字段、或整体一条都匹配不上的参考文件仍整份附上，
+宁可多给也不能让模型缺数据。
+
+REFERENCE_JOIN_FILTER=0 关闭筛选（每块附上完整参考数据）。
+"""
+
+import csv
+import os
+import re
+from functools import lru_cache
+from typing import Optional
+
+from utils.chunk_encoding import compact_encoding_enabled, encode_records
+
+
+# 关联键类型 -> 列名中包含的关键字（按优先级；一列只归入第一个匹配的类型）
+JOIN_KEY_TYPES = {
+    "身份证号码": ("身份证", "身份号码", "公民身份"),
+    "低保证号": ("低保证", "保障证号", "低保编号", "救助证号"),
+    "户主姓名": ("姓名",),
+}
+
+_KEY_SPACES = re.compile(r"[\s　]+")
+
+
+def reference_join_enabled() -> bool:
+    return os.getenv("REFERENCE_JOIN_FILTER", "1").strip().lower() not in ("0", "false", "no", "off")
+
+
+def key_type_of(column: str) -> Optional[str]:
+    """列名对应的关联键类型（不是身份类字段返回 None）"""
+    for key_type, keywords in JOIN_KEY_TYPES.items():
+        if any(keyword in column for keyword in keywords):
+            return key_type
+    return None
+
+
+def normalise_key(value: str) -> Optional[str]:
+    """去掉空白、统一大写（身份证末位 x/X），空值返回 None"""
+    value = _KEY_SPACES.sub("", value or "").upper()
+    return value or None
+
+
+@lru_cache(maxsize=1024)
+def _header_key_positions(header: str) -> tuple[tuple[str, int], ...]:
+    """Key columns of one header line: ((key_type, column position), ...)"""
+    columns = next(csv.reader([header]), [])
+    return tuple((key_type, i) for i, column in enumerate(columns)
+                 if (key_type := key_type_of(column.strip())) is not None)
+
+
+def record_keys(header: str, data: str, key_types: Optional[set] = None) -> dict[str, set[str]]:
+    """一条 (表头行, 数据行) 的关联键取值 {类型: {取值}}"""
+    positions = _header_key_positions(header)
+    if not positions:
+        return {}
+    fields = next(csv.reader([data]), [])
+    keys: dict[str, set[str]] = {}
+    for key_type, i in positions:
+        if key_types is not None and key_type not in key_types:
+            continue
+        value = normalise_key(fields[i]) if i < len(fields) else None
+        if value:
+            keys.setdefault(key_type, set()).add(value)
+    return keys
+
+
+def header_key_types(pairs: list[tuple[str, str]]) -> set[str]:
+    return {key_type for header in {header for header, _ in pairs} for key_type, _ in _header_key_positions(header)}
+
+
+class ReferenceIndex:
+    """一个参考文件的记录及其关联键哈希索引"""
+
+    def __init__(self, filename: str, pairs: list[tuple[str, str]], repeated_header: bool,
+                 structure_section: str, key_types: set[str]):
+        """
+        Args:
+            filename: 参考文件名（用于分节标题）
+            pairs: 全部 (表头行, 数据行)
+            repeated_header: 原文件是否为“表头行+数据行”交替格式（决定输出格式）
+            structure_section: 每块都附带的表格结构部分（可为空）
+            key_types: 与核心表共有的关联键类型
+        """
+        self.filename = filename
+        self.pairs = pairs
+        self.repeated_header = repeated_header
+        self.structure_section = structure_section
+        self.key_types = key_types
+        self.index: dict[str, dict[str, list[int]]] = {key_type: {} for key_type in key_types}
+        for record_no, (header, data) in enumerate(pairs):
+            for key_type, values in record_keys(header, data, key_types).items():
+                for value in values:
+                    self.index[key_type].setdefault(value, []).append(record_no)
+
+    def match(self, keys_list: list[dict[str, set[str]]]) -> list[int]:
+        """与任一核心行的任一共有关联键取值相同的记录号（升序、去重）"""
+        matched = set()
+        for keys in keys_list:
+            for key_type, values in keys.items():
+                postings = self.index.get(key_type)
+                if postings is None:
+                    continue
+                for value in values:
+                    matched.update(postings.get(value, ()))
+        return sorted(matched)
+
+    def render_rows(self, record_nos: list[int]) -> str:
+        """按原文件格式输出这些记录（交替格式逐条带表头、紧凑编码时合并相同表头，标准格式表头只出现一次；没有记录时只输出表头）"""
+        if not record_nos:
+            return self.pairs[0][0] if self.pairs else ""
+        if self.repeated_header:
+            if compact_encoding_enabled():
+                return encode_records([self.pairs[n] for n in record_nos])
+            return "\n".join(f"{self.pairs[n][0]}\n{self.pairs[n][1]}" for n in record_nos)
+        return "\n".join([self.pairs[record_nos[0]][0]] + [self.pairs[n][1] for n in record_nos])
+
+    def render(self, record_nos: list[int]) -> str:
+        """本块的参考内容：表格结构 + 关联说明 + 匹配到的记录"""
+        key_names = "、".join(key_type for key_type in JOIN_KEY_TYPES if key_type in self.key_types)
+        if record_nos:
+            note = f"【关联筛选】按{key_names}关联，仅列出与本块核心数据匹配的 {len(record_nos)}/{len(self.pairs)} 条记录"
+        else:
+            note = f"【关联筛选】按{key_names}关联，本块核心数据在此文件中没有匹配记录（共 {len(self.pairs)} 条）"
+        content = f"{self.structure_section}=== {self.filename} 的表格数据 ===\n{note}\n"
+        return content + self.render_rows(record_nos)
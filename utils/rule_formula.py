@@ -0,0 +1,386 @@
+"""
+表头映射中“规则”公式的本地计算
+
+模板结构里的“规则”多是明确的算式，例如 "重点保障人数 + 残疾人数"、
+"家庭补差 + 重点救助60元 + 重点救助100元 + 残疾人救助"，原来也交给模型逐行心算。
+这里把规则编译成表达式树，在行数据生成之后对 DataFrame 的列整列计算（numpy 向量运算），结果精确且不花 token。
+
+支持的写法（不使用 eval，只认识下面这些）：
+- 字段引用：目标表格中的列名（可含数字和括号，如 重点救助60元、领款人签字(章)），按最长匹配识别
+- 运算：+ - * /（以及 × ÷ − 等全角写法）、括号、负号、常数（含 10% 这样的百分数）、"字符串"
+- 比较：> < >= <= == !=（以及 ≥ ≤ ＝ ≠），逻辑：且 / 或 / 非
+- 条件：如果 条件 则 值 否则 值；条件 ? 值 : 值；IF(条件, 值, 值)
+- 函数：SUM、MAX、MIN、ABS、ROUND(值, 位数)
+- 可以写成 "保障人数 = 重点保障人数 + 残疾人数"（左边为本列名）
+
+参与计算的单元格去掉千分位逗号和“元”后按数值处理，空单元格按 0；无法转成数值的单元格结果为空。
+"""
+
+import re
+from dataclasses import dataclass, field
+from decimal import Decimal, ROUND_HALF_UP
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+
+
+class FormulaError(ValueError):
+    """规则不是可以本地计算的算式（含未知字段、无法识别的符号或语法错误）"""
+
+
+# Full-width and typographic spellings of the operators
+_OPERATOR_ALIASES = {
+    "＋": "+", "－": "-", "−": "-", "–": "-", "—": "-", "×": "*", "✕": "*", "＊": "*", "÷": "/", "／": "/",
+    "（": "(", "）": ")", "，": ",", "？": "?", "：": ":", "＞": ">", "＜": "<", "≥": ">=", "≤": "<=",
+    "＝": "==", "=": "==", "≠": "!=", "<>": "!=", "&&": "且", "||": "或", "!": "非",
+    "or": "或", "and": "且", "not": "非",
+}
+_OPERATORS = sorted({alias for alias in _OPERATOR_ALIASES if not alias.isalpha()} |
+                    {"+", "-", "*", "/", "(", ")", ",", "?", ":", ">", "<", ">=", "<=", "==", "!="},
+                    key=len, reverse=True)
+_KEYWORDS = {"如果": "if", "若": "if", "则": "then", "那么": "then", "否则": "else",
+             "并且": "且", "而且": "且", "且": "且", "或者": "或", "或": "或", "非": "非"}
+_KEYWORD_ORDER = sorted(_KEYWORDS, key=len, reverse=True)
+_FUNCTIONS = {"IF", "SUM", "MAX", "MIN", "ABS", "ROUND"}
+
+_NUMBER = re.compile(r"\d+(?:\.\d+)?%?")
+_STRING = re.compile(r"\"([^\"]*)\"|'([^']*)'|“([^”]*)”|‘([^’]*)’")
+_WORD = re.compile(r"[A-Za-z_]+")
+_UNKNOWN = re.compile(r"[^\s+\-*/×÷()（）<>=!,，?？:：\"'“”]+")
+_NUMERIC_NOISE = re.compile(r"[,，\s元]")
+
+
+@dataclass
+class CompiledFormula:
+    """编译后的规则：原文、引用到的列名、表达式树"""
+    text: str
+    references: list[str] = field(default_factory=list)
+    tree: tuple = ()
+
+    def evaluate(self, frame: pd.DataFrame) -> pd.Series:
+        """对 frame 整列计算，返回字符串列（数值去掉多余的小数位，无法计算的单元格为空字符串）"""
+        kind, value = _evaluate(self.tree, frame)
+        if kind == "num":
+            return _format_numbers(value)
+        if kind == "bool":
+            return value.map({True: "是", False: "否"}).astype(object)
+        return value.fillna("").astype(object)
+
+
+def _tokenize(text: str, names: list[str]) -> list[tuple[str, str]]:
+    # Column names match with either kind of brackets; longest first so 重点救助100元 is not read as 重点救助10...
+    variants = {}
+    for name in names:
+        for variant in (name, name.replace("(", "（").replace(")", "）"), name.replace("（", "(").replace("）", ")")):
+            variants.setdefault(variant, name)
+    candidates = sorted(variants, key=len, reverse=True)
+    tokens = []
+    i = 0
+    while i < len(text):
+        if text[i].isspace():
+            i += 1
+            continue
+        name = next((candidate for candidate in candidates if text.startswith(candidate, i)), None)
+        if name is not None:
+            tokens.append(("name", variants[name]))
+            i += len(name)
+            continue
+        keyword = next((word for word in _KEYWORD_ORDER if text.startswith(word, i)), None)
+        if keyword is not None:
+            tokens.append(("op", _KEYWORDS[keyword]))
+            i += len(keyword)
+            continue
+        number = _NUMBER.match(text, i)
+        if number:
+            tokens.append(("num", number.group()))
+            i = number.end()
+            continue
+        string = _STRING.match(text, i)
+        if string:
+            tokens.append(("str", next(group for group in string.groups() if group is not None)))
+            i = string.end()
+            continue
+        word = _WORD.match(text, i)
+        if word:
+            if word.group().upper() in _FUNCTIONS:
+                tokens.append(("func", word.group().upper()))
+            elif word.group().lower() in _OPERATOR_ALIASES:
+                tokens.append(("op", _OPERATOR_ALIASES[word.group().lower()]))
+            else:
+                raise FormulaError(f"未知字段或符号: {word.group()}")
+            i = word.end()
+            continue
+        operator = next((op for op in _OPERATORS if text.startswith(op, i)), None)
+        if operator is not None:
+            tokens.append(("op", _OPERATOR_ALIASES.get(operator, operator)))
+            i += len(operator)
+            continue
+        unknown = _UNKNOWN.match(text, i)
+        raise FormulaError(f"未知字段或符号: {unknown.group() if unknown else text[i]}")
+    return tokens
+
+
+class _Parser:
+    """Recursive descent over the token list; builds ("kind", ...) tuples"""
+
+    def __init__(self, tokens: list[tuple[str, str]]):
+        self.tokens = tokens
+        self.position = 0
+
+    def peek(self, value: Optional[str] = None) -> bool:
+        if self.position >= len(self.tokens):
+            return False
+        kind, token = self.tokens[self.position]
+        return value is None or (kind == "op" and token == value)
+
+    def take(self, value: Optional[str] = None) -> tuple[str, str]:
+        if not self.peek(value):
+            found = self.tokens[self.position][1] if self.position < len(self.tokens) else "结尾"
+            raise FormulaError(f"语法错误: 期望 {value or '表达式'}，遇到 {found}")
+        token = self.tokens[self.position]
+        self.position += 1
+        return token
+
+    def parse(self) -> tuple:
+        tree = self.expression()
+        if self.position != len(self.tokens):
+            raise FormulaError(f"语法错误: 多余的 {self.tokens[self.position][1]}")
+        return tree
+
+    def expression(self) -> tuple:
+        if self.peek("if"):
+            self.take("if")
+            condition = self.logical_or()
+            self.take("then")
+            then_value = self.expression()
+            self.take("else")
+            return ("if", condition, then_value, self.expression())
+        condition = self.logical_or()
+        if self.peek("?"):
+            self.take("?")
+            then_value = self.expression()
+            self.take(":")
+            return ("if", condition, then_value, self.expression())
+        return condition
+
+    def logical_or(self) -> tuple:
+        tree = self.logical_and()
+        while self.peek("或"):
+            self.take()
+            tree = ("or", tree, self.logical_and())
+        return tree
+
+    def logical_and(self) -> tuple:
+        tree = self.comparison()
+        while self.peek("且"):
+            self.take()
+            tree = ("and", tree, self.comparison())
+        return tree
+
+    def comparison(self) -> tuple:
+        if self.peek("非"):
+            self.take()
+            return ("not", self.comparison())
+        tree = self.additive()
+        for operator in (">=", "<=", "==", "!=", ">", "<"):
+            if self.peek(operator):
+                self.take()
+                return ("cmp", operator, tree, self.additive())
+        return tree
+
+    def additive(self) -> tuple:
+        tree = self.multiplicative()
+        while self.peek("+") or self.peek("-"):
+            operator = self.take()[1]
+            tree = ("arith", operator, tree, self.multiplicative())
+        return tree
+
+    def multiplicative(self) -> tuple:
+        tree = self.unary()
+        while self.peek("*") or self.peek("/"):
+            operator = self.take()[1]
+            tree = ("arith", operator, tree, self.unary())
+        return tree
+
+    def unary(self) -> tuple:
+        if self.peek("-"):
+            self.take()
+            return ("neg", self.unary())
+        if self.peek("+"):
+            self.take()
+            return self.unary()
+        return self.primary()
+
+    def primary(self) -> tuple:
+        kind, token = self.take()
+        if kind == "num":
+            return ("const", float(token[:-1]) / 100 if token.endswith("%") else float(token))
+        if kind == "str":
+            return ("text", token)
+        if kind == "name":
+            return ("ref", token)
+        if kind == "func":
+            self.take("(")
+            arguments = [self.expression()]
+            while self.peek(","):
+                self.take()
+                arguments.append(self.expression())
+            self.take(")")
+            if token == "IF":
+                if len(arguments) != 3:
+                    raise FormulaError("IF 需要 3 个参数")
+                return ("if", *arguments)
+            if token == "ROUND" and len(arguments) not in (1, 2):
+                raise FormulaError("ROUND 需要 1 或 2 个参数")
+            if token == "ABS" and len(arguments) != 1:
+                raise FormulaError("ABS 需要 1 个参数")
+            return ("func", token, arguments)
+        if kind == "op" and token == "(":
+            tree = self.expression()
+            self.take(")")
+            return tree
+        raise FormulaError(f"语法错误: 意外的 {token}")
+
+
+def _references(tree: tuple) -> list[str]:
+    if tree[0] == "ref":
+        return [tree[1]]
+    found = []
+    for part in tree[1:]:
+        if isinstance(part, tuple):
+            found += _references(part)
+        elif isinstance(part, list):
+            for item in part:
+                found += _references(item)
+    return list(dict.fromkeys(found))
+
+
+def compile_formula(text: str, names: list[str], target: Optional[str] = None) -> CompiledFormula:
+    """
+    编译一条规则。
+
+    Args:
+        text: 规则原文（可带“推理规则:”前缀、可写成 "本列 = 算式"）
+        names: 可以引用的列名
+        target: 本列列名（不能引用自己）
+
+    Raises:
+        FormulaError: 规则含未知字段、无法识别的符号或语法错误
+    """
+    expression = re.sub(r"^\s*(?:推理规则|规则|计算规则|公式)\s*[:：]\s*", "", text.strip())
+    if target:
+        expression = re.sub(rf"^\s*{re.escape(target)}\s*(?:=|＝)\s*", "", expression)
+    if not expression:
+        raise FormulaError("规则为空")
+    allowed = [name for name in names if name and name != target]
+    tree = _Parser(_tokenize(expression, allowed)).parse()
+    references = _references(tree)
+    if not references:
+        raise FormulaError("规则没有引用任何字段")
+    return CompiledFormula(expression, references, tree)
+
+
+def try_compile_formula(text: str, names: list[str], target: Optional[str] = None) -> Optional[CompiledFormula]:
+    """compile_formula；不是可计算的算式时返回 None"""
+    try:
+        return compile_formula(text, names, target)
+    except FormulaError:
+        return None
+
+
+def _as_number(kind: str, value) -> pd.Series:
+    if kind == "num":
+        return value
+    if kind == "bool":
+        return value.astype(float)
+    text = value.fillna("").astype(str).str.replace(_NUMERIC_NOISE, "", regex=True)
+    numbers = pd.to_numeric(text.where(text != "", "0"), errors="coerce")
+    return numbers.astype(float)
+
+
+def _as_text(kind: str, value) -> pd.Series:
+    if kind == "num":
+        return _format_numbers(value)
+    if kind == "bool":
+        return value.map({True: "是", False: "否"}).astype(object)
+    return value.fillna("").astype(str).str.strip().astype(object)
+
+
+def _as_bool(kind: str, value) -> pd.Series:
+    if kind == "bool":
+        return value
+    if kind == "num":
+        return value.fillna(0) != 0
+    return ~value.fillna("").astype(str).str.strip().isin(("", "0", "否", "无"))
+
+
+def _evaluate(tree: tuple, frame: pd.DataFrame) -> tuple[str, pd.Series]:
+    node = tree[0]
+    index = frame.index
+    if node == "const":
+        return "num", pd.Series(tree[1], index=index, dtype=float)
+    if node == "text":
+        return "str", pd.Series(tree[1], index=index, dtype=object)
+    if node == "ref":
+        return "ref", frame[tree[1]]
+    if node == "neg":
+        return "num", -_as_number(*_evaluate(tree[1], frame))
+    if node == "arith":
+        left, right = _as_number(*_evaluate(tree[2], frame)), _as_number(*_evaluate(tree[3], frame))
+        if tree[1] == "+":
+            return "num", left + right
+        if tree[1] == "-":
+            return "num", left - right
+        if tree[1] == "*":
+            return "num", left * right
+        return "num", (left / right.where(right != 0)).replace([np.inf, -np.inf], np.nan)
+    if node == "cmp":
+        operator, left, right = tree[1], _evaluate(tree[2], frame), _evaluate(tree[3], frame)
+        if operator in ("==", "!=") and "str" in (left[0], right[0]):
+            equal = _as_text(*left) == _as_text(*right)
+            return "bool", equal if operator == "==" else ~equal
+        left_number, right_number = _as_number(*left), _as_number(*right)
+        result = {">": left_number > right_number, "<": left_number < right_number,
+                  ">=": left_number >= right_number, "<=": left_number <= right_number,
+                  "==": left_number == right_number, "!=": left_number != right_number}[operator]
+        return "bool", result
+    if node in ("and", "or"):
+        left, right = _as_bool(*_evaluate(tree[1], frame)), _as_bool(*_evaluate(tree[2], frame))
+        return "bool", (left & right) if node == "and" else (left | right)
+    if node == "not":
+        return "bool", ~_as_bool(*_evaluate(tree[1], frame))
+    if node == "if":
+        condition = _as_bool(*_evaluate(tree[1], frame))
+        then_value, else_value = _evaluate(tree[2], frame), _evaluate(tree[3], frame)
+        kinds = {then_value[0], else_value[0]}
+        if "str" not in kinds and kinds & {"num", "bool"}:
+            return "num", _as_number(*then_value).where(condition, _as_number(*else_value))
+        return "str", _as_text(*then_value).where(condition, _as_text(*else_value))
+    if node == "func":
+        name, arguments = tree[1], [_evaluate(argument, frame) for argument in tree[2]]
+        numbers = [_as_number(*argument) for argument in arguments]
+        if name == "SUM":
+            return "num", sum(numbers[1:], numbers[0])
+        if name == "MAX":
+            return "num", pd.concat(numbers, axis=1).max(axis=1, skipna=False)
+        if name == "MIN":
+            return "num", pd.concat(numbers, axis=1).min(axis=1, skipna=False)
+        if name == "ABS":
+            return "num", numbers[0].abs()
+        digits = int(numbers[1].iloc[0]) if len(numbers) > 1 and len(numbers[1]) else 0
+        return "num", numbers[0].map(lambda value: value if pd.isna(value) else
+                                     float(Decimal(repr(value)).quantize(Decimal(1).scaleb(-digits), ROUND_HALF_UP)))
+    raise FormulaError(f"无法计算的节点: {node}")
+
+
+def _format_numbers(values: pd.Series) -> pd.Series:
+    """数值列转文本：1.0 -> 1，0.30000000000000004 -> 0.3，NaN -> 空字符串"""
+    def _format(value: float) -> str:
+        if pd.isna(value):
+            return ""
+        value = round(float(value), 10)
+        if value == int(value):
+            return str(int(value))
+        return f"{value:.10f}".rstrip("0").rstrip(".")
+    return values.map(_format).astype(object)
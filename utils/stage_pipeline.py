@@ -0,0 +1,96 @@
+"""
+有界多阶段流水线
+
+每个阶段有自己的线程数，阶段之间用有界队列连接：前一个文件还在转换时，后一个文件已经在复制/计算哈希，
+队列满时上游阶段阻塞，内存中同时存在的任务数有上限。
+
+- 任务是 dict，阶段函数接收并返回同一个 dict（可以原地修改）
+- 某个阶段抛出异常时，任务记录 error 字段并跳过后续阶段，不影响其他任务
+- 结果按完成顺序产出
+"""
+
+import queue
+import threading
+import time
+from typing import Callable, Iterable, Iterator, NamedTuple, Optional
+
+
+class Stage(NamedTuple):
+    name: str
+    func: Callable[[dict], dict]
+    workers: int = 1
+
+
+_STOP = object()
+
+
+def run_pipeline(items: Iterable[dict], stages: list[Stage], queue_size: int = 8,
+                 stats: Optional[dict] = None) -> Iterator[dict]:
+    """
+    Args:
+        items: 任务（dict），按需从迭代器中取出
+        stages: 依次执行的阶段
+        queue_size: 阶段之间队列的容量
+        stats: 传入 dict 时按阶段名填充 {"items", "errors", "busy_seconds"}
+
+    Yields:
+        dict: 完成（或失败，带 "error" 字段）的任务，按完成顺序
+    """
+    stats = {} if stats is None else stats
+    for stage in stages:
+        stats[stage.name] = {"items": 0, "errors": 0, "busy_seconds": 0.0}
+    stats_lock = threading.Lock()
+
+    # queues[i] feeds stages[i]; the last queue is the output and never blocks the final stage
+    queues = [queue.Queue(maxsize=max(1, queue_size)) for _ in stages] + [queue.Queue()]
+    remaining = [max(1, stage.workers) for stage in stages]
+    remaining_lock = threading.Lock()
+
+    def feed():
+        try:
+            for item in items:
+                queues[0].put(item)
+        finally:
+            for _ in range(remaining[0]):
+                queues[0].put(_STOP)
+
+    def work(index: int):
+        stage = stages[index]
+        inbox, outbox = queues[index], queues[index + 1]
+        while True:
+            item = inbox.get()
+            if item is _STOP:
+                break
+            if "error" not in item:
+                started = time.perf_counter()
+                try:
+                    item = stage.func(item)
+                except Exception as e:
+                    item["error"] = f"{stage.name}: {e}"
+                    print(f"❌ {item.get('label', '')} 在阶段 {stage.name} 失败: {e}")
+                with stats_lock:
+                    stage_stats = stats[stage.name]
+                    stage_stats["items"] += 1
+                    stage_stats["errors"] += 1 if "error" in item else 0
+                    stage_stats["busy_seconds"] += time.perf_counter() - started
+            outbox.put(item)
+        # The last worker of this stage to finish tells the next stage (or the consumer) to stop
+        with remaining_lock:
+            remaining[index] -= 1
+            last = remaining[index] == 0
+        if last:
+            for _ in range(remaining[index + 1] if index + 1 < len(stages) else 1):
+                outbox.put(_STOP)
+
+    threads = [threading.Thread(target=feed, name="pipeline-feed", daemon=True)]
+    for index, stage in enumerate(stages):
+        threads += [threading.Thread(target=work, args=(index,), name=f"pipeline-{stage.name}-{n}", daemon=True)
+                    for n in range(remaining[index])]
+    for thread in threads:
+        thread.start()
+
+    while True:
+        item = queues[-1].get()
+        if item is _STOP:
+            break
+        yield item
@@ -0,0 +1,137 @@
+"""
+离线 token 估算器
+
+不依赖在线下载的 BPE 词表：把文本按字符类别（中日韩汉字、全角标点、英文单词、数字、
+ASCII 标点、空白、其他）切分，按各模型家族分词器的经验系数折算 token 数。
+调用结束后可以用服务端返回的真实 prompt_tokens 校准（每个模型维护一个指数滑动平均的缩放系数），
+估算会越用越准。
+"""
+
+import json
+import re
+import threading
+from typing import Any
+
+
+# 每类字符折算成 token 的系数（按各家分词器在中文表格数据上的表现标定）
+#   cjk:            每个汉字的 token 数
+#   cjk_punct:      每个全角标点的 token 数
+#   letters:        每个英文字母的 token 数（约 4 个字母 1 个 token，每个单词至少 1 个）
+#   digits:         每个数字的 token 数（GPT/DeepSeek 三位一组，Qwen 逐位切分）
+#   punct:          每个 ASCII 标点的 token 数
+#   whitespace_run: 每段连续空白的 token 数
+#   other:          其他字符（emoji 等）
+TOKENIZER_PROFILES = {
+    "deepseek": {"cjk": 0.62, "cjk_punct": 1.0, "letters": 0.25, "digits": 1 / 3, "punct": 0.9, "whitespace_run": 0.3, "other": 1.5},
+    "qwen":     {"cjk": 0.68, "cjk_punct": 1.0, "letters": 0.25, "digits": 1.0,   "punct": 0.9, "whitespace_run": 0.3, "other": 1.5},
+    "gpt":      {"cjk": 0.75, "cjk_punct": 1.0, "letters": 0.25, "digits": 1 / 3, "punct": 0.9, "whitespace_run": 0.3, "other": 1.5},
+    # 未知模型按偏保守的系数估算，宁可多估也不要撑爆上下文
+    "default":  {"cjk": 1.0,  "cjk_punct": 1.0, "letters": 0.3,  "digits": 1.0,   "punct": 1.0, "whitespace_run": 0.5, "other": 2.0},
+}
+
+MESSAGE_OVERHEAD_TOKENS = 4  # role / separators per chat message
+
+_TOKEN_CLASSES = re.compile(
+    r"(?P<cjk>[㐀-䶿一-鿿豈-﫿]+)"
+    r"|(?P<cjk_punct>[　-〿＀-￯‘-‟…]+)"
+    r"|(?P<letters>[A-Za-z]+)"
+    r"|(?P<digits>[0-9]+)"
+    r"|(?P<whitespace>\s+)"
+    r"|(?P<punct>[!-/:-@\[-`{-~]+)"
+    r"|(?P<other>.)",
+    re.S,
+)
+
+
+def tokenizer_family(model_name: str) -> str:
+    """根据模型名判断分词器家族"""
+    name = model_name.lower()
+    if "deepseek" in name:
+        return "deepseek"
+    if "qwen" in name or "qwq" in name:
+        return "qwen"
+    if name.startswith(("gpt-", "o1", "o3", "o4")):
+        return "gpt"
+    return "default"
+
+
+def _raw_estimate(text: str, profile: dict) -> float:
+    tokens = 0.0
+    for match in _TOKEN_CLASSES.finditer(text):
+        kind = match.lastgroup
+        length = match.end() - match.start()
+        if kind == "letters":
+            tokens += max(1.0, length * profile["letters"])
+        elif kind == "digits":
+            tokens += max(1.0, length * profile["digits"])
+        elif kind == "whitespace":
+            tokens += profile["whitespace_run"]
+        else:
+            tokens += length * profile[kind]
+    return tokens
+
+
+class TokenEstimator:
+    """Character-class token estimator with per-model online calibration"""
+
+    def __init__(self, smoothing: float = 0.2):
+        self.smoothing = smoothing
+        self._lock = threading.Lock()
+        self._scales: dict[str, float] = {}
+
+    def scale(self, model_name: str) -> float:
+        with self._lock:
+            return self._scales.get(model_name, 1.0)
+
+    def estimate_text(self, text: str, model_name: str = "") -> int:
+        """估算一段文本的 token 数"""
+        if not text:
+            return 0
+        profile = TOKENIZER_PROFILES[tokenizer_family(model_name)]
+        return int(round(_raw_estimate(text, profile) * self.scale(model_name)))
+
+    def estimate_messages(self, messages: Any, model_name: str = "") -> int:
+        """估算一组聊天消息（BaseMessage / (role, content) / dict / str）的 prompt token 数"""
+        if isinstance(messages, str):
+            messages = [messages]
+        total = 0
+        for message in messages:
+            if hasattr(message, "content"):
+                content = message.content
+            elif isinstance(message, (tuple, list)) and len(message) == 2:
+                content = message[1]
+            elif isinstance(message, dict):
+                content = message.get("content", "")
+            else:
+                content = message
+            text = content if isinstance(content, str) else json.dumps(content, ensure_ascii=False)
+            total += self.estimate_text(text, model_name) + MESSAGE_OVERHEAD_TOKENS
+        return total
+
+    def observe(self, model_name: str, estimated_tokens: int, actual_tokens: int) -> None:
+        """用服务端返回的真实 prompt token 数校准该模型的缩放系数"""
+        if estimated_tokens <= 0 or actual_tokens <= 0:
+            return
+        with self._lock:
+            current = self._scales.get(model_name, 1.0)
+            # estimated already includes the current scale; recover the unscaled ratio
+            ratio = actual_tokens / (estimated_tokens / current)
+            ratio = min(max(ratio, 0.25), 4.0)
+            self._scales[model_name] = current + self.smoothing * (ratio - current)
+
+
+_ESTIMATOR = TokenEstimator()
+
+
+def get_token_estimator() -> TokenEstimator:
+    return _ESTIMATOR
+
+
+def estimate_tokens(text: str, model_name: str = "") -> int:
+    """估算文本 token 数（进程级估算器，已包含在线校准）"""
+    return _ESTIMATOR.estimate_text(text, model_name)
+
+
+def estimate_messages_tokens(messages: Any, model_name: str = "") -> int:
+    """估算聊天消息的 prompt token 数"""
+    return _ESTIMATOR.estimate_messages(messages, model_name)